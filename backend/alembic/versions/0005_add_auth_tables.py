@@ -1,7 +1,7 @@
 """Add auth tables
 
 Revision ID: 0005
-Revises: 0004_create_apikey
+Revises: 0004
 Create Date: 2025-09-26
 
 """
@@ -12,7 +12,7 @@ import sqlmodel
 
 # revision identifiers, used by Alembic.
 revision = '0005'
-down_revision = '0004_create_apikey'
+down_revision = '0004'
 branch_labels = None
 depends_on = None
 
@@ -0,0 +1,68 @@
+"""Create semantic cache table with pgvector HNSW index
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-18
+
+Postgres only: requires the `vector` extension (docker-compose runs
+ankane/pgvector). On SQLite the semantic cache uses the in-process NumPy
+index instead, so this migration is a no-op there.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0007'
+down_revision = '0006'
+branch_labels = None
+depends_on = None
+
+
+def _dim() -> int:
+    try:
+        from app.settings import settings
+        return int(settings.SEMANTIC_CACHE_DIM)
+    except Exception:
+        return 256
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    if bind.dialect.name != 'postgresql':
+        return
+    op.execute('CREATE EXTENSION IF NOT EXISTS vector')
+    op.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS semantic_cache_entries (
+            id BIGSERIAL PRIMARY KEY,
+            namespace VARCHAR(255) NOT NULL,
+            prompt_hash VARCHAR(64) NOT NULL,
+            embedding vector({_dim()}) NOT NULL,
+            response BYTEA NOT NULL,
+            status_code INTEGER NOT NULL DEFAULT 200,
+            content_type VARCHAR(255),
+            content_encoding VARCHAR(64),
+            hits INTEGER NOT NULL DEFAULT 0,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            last_hit_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            expires_at TIMESTAMPTZ NOT NULL,
+            CONSTRAINT uq_semantic_cache_ns_hash UNIQUE (namespace, prompt_hash)
+        )
+        """
+    )
+    op.execute(
+        'CREATE INDEX IF NOT EXISTS ix_semantic_cache_embedding_hnsw '
+        'ON semantic_cache_entries USING hnsw (embedding vector_cosine_ops)'
+    )
+    op.execute(
+        'CREATE INDEX IF NOT EXISTS ix_semantic_cache_ns_last_hit '
+        'ON semantic_cache_entries (namespace, last_hit_at)'
+    )
+    op.execute('CREATE INDEX IF NOT EXISTS ix_semantic_cache_expires ON semantic_cache_entries (expires_at)')
+
+
+def downgrade() -> None:
+    bind = op.get_bind()
+    if bind.dialect.name != 'postgresql':
+        return
+    op.drop_table('semantic_cache_entries')
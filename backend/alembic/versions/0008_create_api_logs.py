@@ -0,0 +1,51 @@
+"""Create api_logs table for gateway usage events
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-18
+
+Migration 0002 assumed this table; it is created here with `source` and
+the `ck_api_logs_source_enum` check constraint already in place.
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+# revision identifiers, used by Alembic.
+revision = '0008'
+down_revision = '0007'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    if 'api_logs' in inspect(bind).get_table_names():
+        return
+    op.create_table(
+        'api_logs',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('connection_id', sa.Integer(), nullable=True),
+        sa.Column('org_id', sa.String(length=255), nullable=True),
+        sa.Column('provider', sa.String(length=64), nullable=True),
+        sa.Column('model', sa.String(length=255), nullable=True),
+        sa.Column('prompt_tokens', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('completion_tokens', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('total_tokens', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('cost', sa.Float(), nullable=False, server_default='0'),
+        sa.Column('saved_cost', sa.Float(), nullable=False, server_default='0'),
+        sa.Column('latency_ms', sa.Float(), nullable=False, server_default='0'),
+        sa.Column('status_code', sa.Integer(), nullable=True),
+        sa.Column('source', sa.String(length=16), nullable=True),
+        sa.Column('cache_hit', sa.Boolean(), nullable=False, server_default=sa.false()),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.CheckConstraint("source IN ('dev','prod','billing')", name='ck_api_logs_source_enum'),
+    )
+    op.create_index('ix_api_logs_connection_id', 'api_logs', ['connection_id'])
+    op.create_index('ix_api_logs_created_at', 'api_logs', ['created_at'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_api_logs_created_at', table_name='api_logs')
+    op.drop_index('ix_api_logs_connection_id', table_name='api_logs')
+    op.drop_table('api_logs')
@@ -0,0 +1,39 @@
+"""Index api_logs by (connection_id, created_at) and connections by provider
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2026-10-18
+
+The composite index lets GET /v1/providers/connections resolve last_used for
+a whole page with one grouped MAX(created_at); it supersedes the
+single-column connection_id index.
+"""
+from alembic import op
+from sqlalchemy import inspect
+
+# revision identifiers, used by Alembic.
+revision = '0009'
+down_revision = '0008'
+branch_labels = None
+depends_on = None
+
+
+def _indexes(bind, table):
+    return {ix['name'] for ix in inspect(bind).get_indexes(table)}
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    existing = _indexes(bind, 'api_logs')
+    if 'ix_api_logs_connection_created' not in existing:
+        op.create_index('ix_api_logs_connection_created', 'api_logs', ['connection_id', 'created_at'])
+    if 'ix_api_logs_connection_id' in existing:
+        op.drop_index('ix_api_logs_connection_id', table_name='api_logs')
+    if 'ix_providerconnection_provider_id' not in _indexes(bind, 'providerconnection'):
+        op.create_index('ix_providerconnection_provider_id', 'providerconnection', ['provider_id'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_providerconnection_provider_id', table_name='providerconnection')
+    op.create_index('ix_api_logs_connection_id', 'api_logs', ['connection_id'])
+    op.drop_index('ix_api_logs_connection_created', table_name='api_logs')
@@ -0,0 +1,61 @@
+"""Create provider_metrics_{hourly,daily,monthly} rollup tables and rollup_state
+
+Revision ID: 0010
+Revises: 0009
+Create Date: 2026-10-18
+
+Populated incrementally by app.workers.rollups from api_logs and invoice.
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+# revision identifiers, used by Alembic.
+revision = '0010'
+down_revision = '0009'
+branch_labels = None
+depends_on = None
+
+RESOLUTIONS = ('hourly', 'daily', 'monthly')
+
+
+def upgrade() -> None:
+    existing = inspect(op.get_bind()).get_table_names()
+    for res in RESOLUTIONS:
+        table = f'provider_metrics_{res}'
+        if table in existing:
+            continue
+        op.create_table(
+            table,
+            sa.Column('id', sa.Integer(), primary_key=True),
+            sa.Column('bucket_start', sa.DateTime(), nullable=False),
+            sa.Column('connection_id', sa.Integer(), nullable=True),
+            sa.Column('provider', sa.String(length=64), nullable=False),
+            sa.Column('model', sa.String(length=255), nullable=True),
+            sa.Column('category', sa.String(length=16), nullable=False, server_default='ai'),
+            sa.Column('source', sa.String(length=16), nullable=False),
+            sa.Column('requests', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('prompt_tokens', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('completion_tokens', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('total_tokens', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('cost', sa.Float(), nullable=False, server_default='0'),
+            sa.Column('saved_cost', sa.Float(), nullable=False, server_default='0'),
+            sa.Column('cache_hits', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('latency_ms_sum', sa.Float(), nullable=False, server_default='0'),
+            sa.CheckConstraint("source IN ('dev','prod','billing')", name=f'ck_{table}_source_enum'),
+        )
+        op.create_index(f'ix_{table}_bucket', table, ['bucket_start', 'provider'])
+    if 'rollup_state' not in existing:
+        op.create_table(
+            'rollup_state',
+            sa.Column('name', sa.String(length=64), primary_key=True),
+            sa.Column('last_id', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('updated_at', sa.DateTime(), nullable=False),
+        )
+
+
+def downgrade() -> None:
+    op.drop_table('rollup_state')
+    for res in RESOLUTIONS:
+        op.drop_index(f'ix_provider_metrics_{res}_bucket', table_name=f'provider_metrics_{res}')
+        op.drop_table(f'provider_metrics_{res}')
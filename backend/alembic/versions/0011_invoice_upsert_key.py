@@ -0,0 +1,35 @@
+"""Unique (provider, provider_invoice_id) on invoice for idempotent ingest
+
+Revision ID: 0011
+Revises: 0010
+Create Date: 2026-10-18
+
+Bulk ingest upserts on this key. Existing duplicates (same provider and
+provider invoice id) are collapsed onto the most recently ingested row first.
+Rows without a provider_invoice_id are left alone; NULLs never conflict.
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+# revision identifiers, used by Alembic.
+revision = '0011'
+down_revision = '0010'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    if 'ux_invoice_provider_invoice_id' in {ix['name'] for ix in inspect(bind).get_indexes('invoice')}:
+        return
+    op.execute(sa.text(
+        "DELETE FROM invoice WHERE provider_invoice_id IS NOT NULL AND id NOT IN ("
+        " SELECT keep_id FROM (SELECT MAX(id) AS keep_id FROM invoice"
+        " WHERE provider_invoice_id IS NOT NULL GROUP BY provider, provider_invoice_id) AS latest)"
+    ))
+    op.create_index('ux_invoice_provider_invoice_id', 'invoice', ['provider', 'provider_invoice_id'], unique=True)
+
+
+def downgrade() -> None:
+    op.drop_index('ux_invoice_provider_invoice_id', table_name='invoice')
@@ -0,0 +1,40 @@
+"""Create ingest_checkpoint for resumable billing file imports
+
+Revision ID: 0012
+Revises: 0011
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+# revision identifiers, used by Alembic.
+revision = '0012'
+down_revision = '0011'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    if 'ingest_checkpoint' in inspect(op.get_bind()).get_table_names():
+        return
+    op.create_table(
+        'ingest_checkpoint',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('file_key', sa.String(length=64), nullable=False),
+        sa.Column('path', sa.String(length=1024), nullable=False),
+        sa.Column('provider', sa.String(length=64), nullable=False),
+        sa.Column('status', sa.String(length=16), nullable=False, server_default='running'),
+        sa.Column('next_row', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('rows_ingested', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('rows_rejected', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('error', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+    )
+    op.create_index('ix_ingest_checkpoint_file_key', 'ingest_checkpoint', ['file_key'], unique=True)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_ingest_checkpoint_file_key', table_name='ingest_checkpoint')
+    op.drop_table('ingest_checkpoint')
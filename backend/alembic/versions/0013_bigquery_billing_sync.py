@@ -0,0 +1,51 @@
+"""Create gcp_billing_daily and bigquery_sync_state for local billing export copies
+
+Revision ID: 0013
+Revises: 0012
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+# revision identifiers, used by Alembic.
+revision = '0013'
+down_revision = '0012'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    existing = inspect(op.get_bind()).get_table_names()
+    if 'gcp_billing_daily' not in existing:
+        op.create_table(
+            'gcp_billing_daily',
+            sa.Column('id', sa.Integer(), primary_key=True),
+            sa.Column('connection_id', sa.Integer(), nullable=False),
+            sa.Column('day', sa.Date(), nullable=False),
+            sa.Column('service', sa.String(length=255), nullable=False, server_default=''),
+            sa.Column('sku', sa.String(length=255), nullable=False, server_default=''),
+            sa.Column('currency', sa.String(length=16), nullable=False, server_default='USD'),
+            sa.Column('cost', sa.Float(), nullable=False, server_default='0'),
+            sa.Column('usage_amount', sa.Float(), nullable=False, server_default='0'),
+            sa.Column('tokens', sa.Float(), nullable=False, server_default='0'),
+            sa.Column('rows', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('updated_at', sa.DateTime(), nullable=False),
+        )
+        op.create_index('ux_gcp_billing_daily_key', 'gcp_billing_daily', ['connection_id', 'day', 'service', 'sku'], unique=True)
+    if 'bigquery_sync_state' not in existing:
+        op.create_table(
+            'bigquery_sync_state',
+            sa.Column('connection_id', sa.Integer(), primary_key=True),
+            sa.Column('export_watermark', sa.DateTime(), nullable=True),
+            sa.Column('rows_synced', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('status', sa.String(length=16), nullable=False, server_default='never'),
+            sa.Column('error', sa.Text(), nullable=True),
+            sa.Column('last_run_at', sa.DateTime(), nullable=True),
+        )
+
+
+def downgrade() -> None:
+    op.drop_table('bigquery_sync_state')
+    op.drop_index('ux_gcp_billing_daily_key', table_name='gcp_billing_daily')
+    op.drop_table('gcp_billing_daily')
@@ -0,0 +1,36 @@
+"""Create sync_schedule for the adaptive provider sync scheduler
+
+Revision ID: 0014
+Revises: 0013
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+# revision identifiers, used by Alembic.
+revision = '0014'
+down_revision = '0013'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    if 'sync_schedule' in inspect(op.get_bind()).get_table_names():
+        return
+    op.create_table(
+        'sync_schedule',
+        sa.Column('connection_id', sa.Integer(), primary_key=True),
+        sa.Column('provider', sa.String(length=64), nullable=False),
+        sa.Column('next_run_at', sa.DateTime(), nullable=False),
+        sa.Column('interval_seconds', sa.Integer(), nullable=False),
+        sa.Column('activity_per_hour', sa.Float(), nullable=False, server_default='0'),
+        sa.Column('last_run_at', sa.DateTime(), nullable=True),
+        sa.Column('failures', sa.Integer(), nullable=False, server_default='0'),
+    )
+    op.create_index('ix_sync_schedule_next_run_at', 'sync_schedule', ['next_run_at'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_sync_schedule_next_run_at', table_name='sync_schedule')
+    op.drop_table('sync_schedule')
@@ -0,0 +1,30 @@
+"""Create usage_sync_state for provider usage API syncs
+
+Revision ID: 0015
+Revises: 0014
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+# revision identifiers, used by Alembic.
+revision = '0015'
+down_revision = '0014'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    if 'usage_sync_state' in inspect(op.get_bind()).get_table_names():
+        return
+    op.create_table(
+        'usage_sync_state',
+        sa.Column('connection_id', sa.Integer(), primary_key=True),
+        sa.Column('usage_through', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('usage_sync_state')
@@ -0,0 +1,65 @@
+"""Create backfill_job and backfill_chunk for resumable historical imports
+
+Revision ID: 0016
+Revises: 0015
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+# revision identifiers, used by Alembic.
+revision = '0016'
+down_revision = '0015'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    existing = inspect(op.get_bind()).get_table_names()
+    if 'backfill_job' not in existing:
+        op.create_table(
+            'backfill_job',
+            sa.Column('id', sa.Integer(), primary_key=True),
+            sa.Column('connection_id', sa.Integer(), nullable=False),
+            sa.Column('provider', sa.String(length=64), nullable=False),
+            sa.Column('range_start', sa.DateTime(), nullable=False),
+            sa.Column('range_end', sa.DateTime(), nullable=False),
+            sa.Column('chunk_days', sa.Integer(), nullable=False),
+            sa.Column('status', sa.String(length=16), nullable=False, server_default='queued'),
+            sa.Column('chunks_total', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('chunks_done', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('rows', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('error', sa.Text(), nullable=True),
+            sa.Column('created_at', sa.DateTime(), nullable=False),
+            sa.Column('started_at', sa.DateTime(), nullable=True),
+            sa.Column('finished_at', sa.DateTime(), nullable=True),
+        )
+        op.create_index('ix_backfill_job_status', 'backfill_job', ['status'])
+        op.create_index('ix_backfill_job_connection', 'backfill_job', ['connection_id'])
+    if 'backfill_chunk' not in existing:
+        op.create_table(
+            'backfill_chunk',
+            sa.Column('id', sa.Integer(), primary_key=True),
+            sa.Column('job_id', sa.Integer(), nullable=False),
+            sa.Column('idx', sa.Integer(), nullable=False),
+            sa.Column('chunk_start', sa.DateTime(), nullable=False),
+            sa.Column('chunk_end', sa.DateTime(), nullable=False),
+            sa.Column('status', sa.String(length=16), nullable=False, server_default='pending'),
+            sa.Column('attempts', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('rows', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('lease_until', sa.DateTime(), nullable=True),
+            sa.Column('error', sa.Text(), nullable=True),
+            sa.Column('finished_at', sa.DateTime(), nullable=True),
+        )
+        op.create_index('ux_backfill_chunk_job_idx', 'backfill_chunk', ['job_id', 'idx'], unique=True)
+        op.create_index('ix_backfill_chunk_job_status', 'backfill_chunk', ['job_id', 'status'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_backfill_chunk_job_status', table_name='backfill_chunk')
+    op.drop_index('ux_backfill_chunk_job_idx', table_name='backfill_chunk')
+    op.drop_table('backfill_chunk')
+    op.drop_index('ix_backfill_job_connection', table_name='backfill_job')
+    op.drop_index('ix_backfill_job_status', table_name='backfill_job')
+    op.drop_table('backfill_job')
@@ -0,0 +1,51 @@
+"""Store API keys as SHA-256 digests with a unique lookup index
+
+Revision ID: 0017
+Revises: 0016
+Create Date: 2026-10-18
+
+Existing plaintext keys are hashed into key_hash and then cleared; the
+plaintext column stays (nullable) so older rows keep their ids.
+"""
+import hashlib
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+# revision identifiers, used by Alembic.
+revision = '0017'
+down_revision = '0016'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    columns = {c['name'] for c in inspect(bind).get_columns('apikey')}
+    with op.batch_alter_table('apikey') as batch:
+        if 'key_hash' not in columns:
+            batch.add_column(sa.Column('key_hash', sa.String(length=64), nullable=True))
+        if 'key_prefix' not in columns:
+            batch.add_column(sa.Column('key_prefix', sa.String(length=16), nullable=True))
+        if 'revoked_at' not in columns:
+            batch.add_column(sa.Column('revoked_at', sa.DateTime(), nullable=True))
+        batch.alter_column('key', existing_type=sa.String(length=255), nullable=True)
+
+    rows = bind.execute(sa.text("SELECT id, key FROM apikey WHERE key IS NOT NULL AND key_hash IS NULL")).all()
+    for key_id, key in rows:
+        bind.execute(
+            sa.text("UPDATE apikey SET key_hash = :h, key_prefix = :p, key = NULL WHERE id = :id"),
+            {"h": hashlib.sha256(key.encode("utf-8")).hexdigest(), "p": key[:8], "id": key_id},
+        )
+    if 'ux_apikey_key_hash' not in {ix['name'] for ix in inspect(bind).get_indexes('apikey')}:
+        op.create_index('ux_apikey_key_hash', 'apikey', ['key_hash'], unique=True)
+
+
+def downgrade() -> None:
+    # Plaintext keys cannot be recovered from their digests
+    op.drop_index('ux_apikey_key_hash', table_name='apikey')
+    with op.batch_alter_table('apikey') as batch:
+        batch.drop_column('revoked_at')
+        batch.drop_column('key_prefix')
+        batch.drop_column('key_hash')
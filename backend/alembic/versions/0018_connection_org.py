@@ -0,0 +1,33 @@
+"""Record the owning org on provider connections
+
+Revision ID: 0018
+Revises: 0017
+Create Date: 2026-10-18
+
+The gateway only injects a stored connection's credentials for API keys of
+the org that owns it. Existing connections have no owner until one is set.
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+# revision identifiers, used by Alembic.
+revision = '0018'
+down_revision = '0017'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    if 'org_id' not in {c['name'] for c in inspect(bind).get_columns('providerconnection')}:
+        with op.batch_alter_table('providerconnection') as batch:
+            batch.add_column(sa.Column('org_id', sa.String(), nullable=True))
+    if 'ix_providerconnection_org_id' not in {ix['name'] for ix in inspect(bind).get_indexes('providerconnection')}:
+        op.create_index('ix_providerconnection_org_id', 'providerconnection', ['org_id'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_providerconnection_org_id', table_name='providerconnection')
+    with op.batch_alter_table('providerconnection') as batch:
+        batch.drop_column('org_id')
@@ -0,0 +1,35 @@
+"""Track the last successful billing export sync separately from the last run
+
+Revision ID: 0019
+Revises: 0018
+Create Date: 2026-10-18
+
+The usage endpoint serves local data only once a sync has succeeded; a
+failed first sync must keep it on live BigQuery.
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+# revision identifiers, used by Alembic.
+revision = '0019'
+down_revision = '0018'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    if 'last_success_at' not in {c['name'] for c in inspect(bind).get_columns('bigquery_sync_state')}:
+        with op.batch_alter_table('bigquery_sync_state') as batch:
+            batch.add_column(sa.Column('last_success_at', sa.DateTime(), nullable=True))
+    # Runs that succeeded, or failed after an earlier success moved the watermark
+    bind.execute(sa.text(
+        "UPDATE bigquery_sync_state SET last_success_at = last_run_at "
+        "WHERE last_success_at IS NULL AND (status = 'ok' OR export_watermark IS NOT NULL)"
+    ))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('bigquery_sync_state') as batch:
+        batch.drop_column('last_success_at')
@@ -0,0 +1,43 @@
+"""Add org_id to the provider_metrics_* rollups
+
+Revision ID: 0020
+Revises: 0019
+Create Date: 2026-10-18
+
+Spend trends are filtered by the caller's org. Existing buckets carry no
+org, so they are dropped together with the rollup marks and the next
+rollup run rebuilds every bucket from api_logs and invoice.
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+# revision identifiers, used by Alembic.
+revision = '0020'
+down_revision = '0019'
+branch_labels = None
+depends_on = None
+
+RESOLUTIONS = ('hourly', 'daily', 'monthly')
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    insp = inspect(bind)
+    for res in RESOLUTIONS:
+        table = f'provider_metrics_{res}'
+        if 'org_id' not in {c['name'] for c in insp.get_columns(table)}:
+            with op.batch_alter_table(table) as batch:
+                batch.add_column(sa.Column('org_id', sa.String(length=255), nullable=True))
+        if f'ix_{table}_org_bucket' not in {i['name'] for i in insp.get_indexes(table)}:
+            op.create_index(f'ix_{table}_org_bucket', table, ['org_id', 'bucket_start'])
+        bind.execute(sa.text(f"DELETE FROM {table}"))
+    bind.execute(sa.text("DELETE FROM rollup_state"))
+
+
+def downgrade() -> None:
+    for res in RESOLUTIONS:
+        table = f'provider_metrics_{res}'
+        op.drop_index(f'ix_{table}_org_bucket', table_name=table)
+        with op.batch_alter_table(table) as batch:
+            batch.drop_column('org_id')
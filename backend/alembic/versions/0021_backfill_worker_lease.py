@@ -0,0 +1,29 @@
+"""Add a worker lease to backfill_job
+
+Revision ID: 0021
+Revises: 0020
+Create Date: 2026-10-18
+
+The scheduler's backfill resume re-dispatches a job only once its workers
+have let this lease lapse.
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+# revision identifiers, used by Alembic.
+revision = '0021'
+down_revision = '0020'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    if 'worker_lease_until' not in {c['name'] for c in inspect(op.get_bind()).get_columns('backfill_job')}:
+        with op.batch_alter_table('backfill_job') as batch:
+            batch.add_column(sa.Column('worker_lease_until', sa.DateTime(), nullable=True))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('backfill_job') as batch:
+        batch.drop_column('worker_lease_until')
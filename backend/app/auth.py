@@ -1,14 +1,29 @@
-"""JWT authentication utilities."""
+"""JWT authentication utilities.
+
+``get_current_user`` keeps two in-process caches so authenticated requests
+skip signature verification and the user lookup:
+
+- verified tokens, keyed by the token's SHA-256 digest and kept until the
+  token's own ``exp`` (a cached token is never accepted past its expiry);
+- users, for ``AUTH_USER_CACHE_TTL_SECONDS``. Updates to a ``User`` row made
+  through the ORM in this process (e.g. ``is_active``) and logout drop the
+  entry at once; the TTL bounds staleness for changes made elsewhere.
+"""
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta, timezone
-from typing import Optional
+from typing import Any, Dict, Optional, Tuple
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from starlette.concurrency import run_in_threadpool
 from sqlmodel import Session, select
+from sqlalchemy import event
+from .core import metrics
 from .settings import settings
 from .models import User
-from .db_sa import get_db
 import hashlib
 
 # Password hashing
@@ -64,9 +79,89 @@ def decode_access_token(token: str) -> dict:
         return {}
 
 
+_CACHE_LOOKUPS = metrics.counter("bimo_auth_cache_lookups_total", "Auth cache lookups", ["cache", "result"])
+
+
+class _ExpiringLRU:
+    """Bounded LRU whose entries carry their own wall-clock expiry."""
+
+    def __init__(self, max_entries: int) -> None:
+        self.max_entries = max_entries
+        self._data: "OrderedDict[Any, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Any) -> Optional[Any]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            if item[0] <= time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return item[1]
+
+    def set(self, key: Any, value: Any, expires_at: float) -> None:
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def pop(self, key: Any) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+_token_cache = _ExpiringLRU(settings.AUTH_TOKEN_CACHE_MAX_ENTRIES)
+_user_cache = _ExpiringLRU(settings.AUTH_USER_CACHE_MAX_ENTRIES)
+_USER_FIELDS = ("id", "email", "hashed_password", "is_active", "is_admin", "created_at", "updated_at")
+
+
+def verified_payload(token: str) -> dict:
+    """``decode_access_token`` through the verified-token cache."""
+    digest = hashlib.sha256(token.encode("utf-8")).hexdigest()
+    payload = _token_cache.get(digest)
+    if payload is not None:
+        _CACHE_LOOKUPS.labels(cache="token", result="hit").inc()
+        return payload
+    _CACHE_LOOKUPS.labels(cache="token", result="miss").inc()
+    payload = decode_access_token(token)
+    exp = payload.get("exp")
+    if payload and isinstance(exp, (int, float)):
+        _token_cache.set(digest, payload, float(exp))
+    return payload
+
+
+def _load_user(user_id: int) -> Optional[Dict[str, Any]]:
+    from .db import get_session
+    db = get_session()
+    try:
+        user = db.get(User, user_id)
+        return {f: getattr(user, f) for f in _USER_FIELDS} if user is not None else None
+    finally:
+        db.close()
+
+
+def invalidate_user(user_id: Optional[int] = None) -> None:
+    """Drop one cached user, or all of them when ``user_id`` is None."""
+    if user_id is None:
+        _user_cache.clear()
+    else:
+        _user_cache.pop(int(user_id))
+
+
+@event.listens_for(User, "after_update")
+def _user_updated(mapper, connection, target) -> None:
+    invalidate_user(target.id)
+
+
 async def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
 ) -> User:
     """Dependency to get current authenticated user from JWT token."""
     token = credentials.credentials
@@ -76,18 +171,28 @@ async def get_current_user(
         headers={"WWW-Authenticate": "Bearer"},
     )
     
-    payload = decode_access_token(token)
-    user_id: int = payload.get("sub")
+    payload = verified_payload(token)
+    user_id = payload.get("sub")
     if user_id is None:
         raise credentials_exception
-    
-    user = db.get(User, user_id)
-    if user is None:
+    try:
+        user_id = int(user_id)
+    except (TypeError, ValueError):
         raise credentials_exception
-    if not user.is_active:
+
+    fields = _user_cache.get(user_id)
+    if fields is not None:
+        _CACHE_LOOKUPS.labels(cache="user", result="hit").inc()
+    else:
+        _CACHE_LOOKUPS.labels(cache="user", result="miss").inc()
+        fields = await run_in_threadpool(_load_user, user_id)
+        if fields is None:
+            raise credentials_exception
+        _user_cache.set(user_id, fields, time.time() + settings.AUTH_USER_CACHE_TTL_SECONDS)
+    if not fields["is_active"]:
         raise HTTPException(status_code=400, detail="Inactive user")
-    
-    return user
+    # A fresh detached instance per request, so callers can't mutate the cached copy
+    return User(**fields)
 
 
 async def get_current_admin_user(
@@ -111,3 +216,17 @@ def authenticate_user(db: Session, email: str, password: str) -> Optional[User]:
     if not verify_password(password, user.hashed_password):
         return None
     return user
+
+
+async def aauthenticate_user(db: Session, email: str, password: str, ip: Optional[str] = None) -> Optional[User]:
+    """``authenticate_user`` with the lookup in the threadpool and PBKDF2 in the hashing pool.
+
+    Raises ``services.passwords.HashingBusy`` when the pool sheds the request.
+    """
+    from .services.passwords import verify_password as verify_in_pool
+    user = await run_in_threadpool(lambda: db.exec(select(User).where(User.email == email)).first())
+    if not user:
+        return None
+    if not await verify_in_pool(password, user.hashed_password, ip=ip, email=email):
+        return None
+    return user
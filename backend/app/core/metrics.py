@@ -0,0 +1,61 @@
+"""Lazily registered Prometheus metrics shared across modules.
+
+prometheus_client refuses to register the same metric name twice, so metrics
+are created on first use and cached here. When prometheus_client is missing
+or ``ENABLE_PROMETHEUS`` is off the helpers return a no-op object, letting
+callers record metrics unconditionally.
+"""
+from typing import Dict, Sequence
+
+from ..settings import settings
+
+
+class _NoopMetric:
+    def labels(self, *args, **kwargs):
+        return self
+
+    def inc(self, amount: float = 1.0) -> None:
+        pass
+
+    def dec(self, amount: float = 1.0) -> None:
+        pass
+
+    def set(self, value: float) -> None:
+        pass
+
+    def observe(self, value: float) -> None:
+        pass
+
+
+_NOOP = _NoopMetric()
+_METRICS: Dict[str, object] = {}
+
+
+def _get(kind: str, name: str, documentation: str, labelnames: Sequence[str], **kwargs):
+    metric = _METRICS.get(name)
+    if metric is not None:
+        return metric
+    if not settings.ENABLE_PROMETHEUS:
+        return _NOOP
+    try:
+        import prometheus_client  # type: ignore
+        cls = getattr(prometheus_client, kind)
+        metric = cls(name, documentation, list(labelnames), **kwargs)
+    except Exception:
+        metric = _NOOP
+    _METRICS[name] = metric
+    return metric
+
+
+def counter(name: str, documentation: str, labelnames: Sequence[str] = ()):
+    return _get("Counter", name, documentation, labelnames)
+
+
+def gauge(name: str, documentation: str, labelnames: Sequence[str] = ()):
+    return _get("Gauge", name, documentation, labelnames)
+
+
+def histogram(name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = ()):
+    if buckets:
+        return _get("Histogram", name, documentation, labelnames, buckets=list(buckets))
+    return _get("Histogram", name, documentation, labelnames)
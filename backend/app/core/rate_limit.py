@@ -0,0 +1,251 @@
+"""Token-bucket rate limiting shared across workers.
+
+Limits are strings such as ``"100/minute"``, ``"10 per second"`` or
+``"5000/h"`` (``ApiKey.rate_limit``, ``RATE_LIMIT_DEFAULT``); each distinct
+string is parsed once. A limit of N per period is a bucket of N tokens that
+refills continuously at N/period tokens per second.
+
+With ``REDIS_URL`` set the buckets live in Redis and are updated by a Lua
+script (atomic, using the Redis clock), so every uvicorn worker and node
+draws from the same bucket. To keep checks at in-process cost, a worker
+takes a small *lease* of tokens from Redis and spends it locally. A lease
+starts at one token and doubles each time it is used up within
+``LEASE_SECONDS``, up to ``RATE_LIMIT_LEASE_FRACTION`` of the bucket, so
+busy keys rarely touch Redis while sparse traffic never strands more than a
+token or two in an idle worker.
+
+Without Redis (or while it is unreachable) buckets are kept per process.
+
+Per-IP limits key on ``client_ip``: the socket peer, or - when that peer is
+one of ``TRUSTED_PROXIES`` - the nearest untrusted address in
+``X-Forwarded-For``. Forwarded headers from anyone else are ignored, so a
+client cannot pick its own bucket.
+"""
+import functools
+import ipaddress
+import logging
+import math
+import re
+import threading
+import time
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from . import metrics
+from ..settings import settings
+
+logger = logging.getLogger(__name__)
+
+_UNITS = {
+    "s": 1, "sec": 1, "second": 1, "seconds": 1,
+    "m": 60, "min": 60, "minute": 60, "minutes": 60,
+    "h": 3600, "hr": 3600, "hour": 3600, "hours": 3600,
+    "d": 86400, "day": 86400, "days": 86400,
+}
+_RATE_RE = re.compile(r"^\s*(\d+)\s*(?:/|per)\s*(\d*)\s*([a-z]+)\s*$")
+
+LEASE_SECONDS = 1.0
+
+_LIMITED = metrics.counter("bimo_rate_limited_total", "Requests rejected by the rate limiter", ["scope"])
+_SHARED = metrics.counter("bimo_rate_limit_shared_calls_total", "Token leases requested from the shared store", ["result"])
+
+
+class Rate(NamedTuple):
+    limit: int
+    period: float
+
+    @property
+    def per_second(self) -> float:
+        return self.limit / self.period
+
+    def __str__(self) -> str:
+        return f"{self.limit}/{self.period:g}s"
+
+
+@functools.lru_cache(maxsize=1024)
+def parse_rate(raw: Optional[str]) -> Optional[Rate]:
+    """``"100/minute"`` -> ``Rate(100, 60.0)``; ``None`` for empty or malformed limits."""
+    m = _RATE_RE.match((raw or "").lower())
+    if not m or m.group(3) not in _UNITS:
+        return None
+    limit = int(m.group(1))
+    period = float(int(m.group(2) or 1) * _UNITS[m.group(3)])
+    return Rate(limit, period) if limit > 0 else None
+
+
+class LocalBuckets:
+    """Per-process buckets: ``key -> [tokens, updated_at]``; O(1) per check."""
+
+    def __init__(self, max_keys: int = 100000, clock=time.monotonic) -> None:
+        self.max_keys = max_keys
+        self.clock = clock
+        self._buckets: Dict[str, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def grant(self, key: str, rate: Rate, want: int = 1) -> Tuple[int, float]:
+        """Take up to ``want`` tokens; returns (granted, seconds until one is available)."""
+        now = self.clock()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                if len(self._buckets) >= self.max_keys:
+                    # Drop the oldest bucket; a full bucket is what it would refill to anyway
+                    self._buckets.pop(next(iter(self._buckets)))
+                bucket = self._buckets[key] = [float(rate.limit), now]
+            tokens = min(float(rate.limit), bucket[0] + (now - bucket[1]) * rate.per_second)
+            bucket[1] = now
+            if tokens < 1:
+                bucket[0] = tokens
+                return 0, (1 - tokens) / rate.per_second
+            granted = min(int(want), int(tokens))
+            bucket[0] = tokens - granted
+            return granted, 0.0
+
+
+_LUA = """
+local capacity = tonumber(ARGV[1])
+local refill = tonumber(ARGV[2])
+local want = tonumber(ARGV[3])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1])
+local ts = tonumber(state[2])
+if tokens == nil then
+  tokens = capacity
+  ts = now
+end
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * refill)
+local granted = 0
+local retry_ms = 0
+if tokens >= 1 then
+  granted = math.min(want, math.floor(tokens))
+  tokens = tokens - granted
+else
+  retry_ms = math.ceil((1 - tokens) / refill * 1000)
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / refill * 1000) + 1000)
+return {granted, retry_ms}
+"""
+
+
+class RedisBuckets:
+    """Buckets in Redis hashes, updated atomically by ``_LUA``."""
+
+    PREFIX = "bimo:rl:"
+
+    def __init__(self, url: str) -> None:
+        import redis.asyncio as aioredis  # type: ignore
+        self._client = aioredis.from_url(url, socket_timeout=0.05, socket_connect_timeout=0.2)
+        self._script = self._client.register_script(_LUA)
+
+    async def grant(self, key: str, rate: Rate, want: int = 1) -> Tuple[int, float]:
+        granted, retry_ms = await self._script(keys=[self.PREFIX + key], args=[rate.limit, rate.per_second, int(want)])
+        return int(granted), int(retry_ms) / 1000.0
+
+
+class RateLimiter:
+    BACKOFF_SECONDS = 30.0
+
+    def __init__(self, shared: Optional[RedisBuckets] = None, lease_fraction: float = 0.05,
+                 max_keys: int = 100000, clock=time.monotonic) -> None:
+        self.shared = shared
+        self.lease_fraction = lease_fraction
+        self.max_keys = max_keys
+        self.clock = clock
+        self.local = LocalBuckets(max_keys=max_keys, clock=clock)
+        # key -> [tokens left, lease expiry, size of the last lease]
+        self._leases: Dict[str, List[float]] = {}
+        self._down_until = 0.0
+
+    async def check(self, key: str, limit: str) -> float:
+        """0.0 if the request may proceed, else the seconds to wait (``Retry-After``)."""
+        rate = parse_rate(limit)
+        if rate is None:
+            return 0.0
+        key = f"{key}:{rate}"
+        now = self.clock()
+        lease = self._leases.get(key)
+        if lease is not None and lease[0] >= 1 and lease[1] > now:
+            lease[0] -= 1
+            return 0.0
+        if self.shared is None or now < self._down_until:
+            granted, retry = self.local.grant(key, rate)
+            return 0.0 if granted else retry
+        cap = max(1, int(rate.limit * self.lease_fraction))
+        # Grow the lease only when the previous one was spent before expiring
+        size = 1 if lease is None or lease[1] <= now else min(cap, int(lease[2]) * 2)
+        try:
+            granted, retry = await self.shared.grant(key, rate, size)
+        except Exception as e:
+            self._down_until = now + self.BACKOFF_SECONDS
+            _SHARED.labels(result="error").inc()
+            logger.warning("shared store unavailable, limiting per process: %s", e)
+            granted, retry = self.local.grant(key, rate)
+            return 0.0 if granted else retry
+        _SHARED.labels(result="granted" if granted else "empty").inc()
+        if not granted:
+            self._leases.pop(key, None)
+            return max(retry, 0.001)
+        if key not in self._leases and len(self._leases) >= self.max_keys:
+            self._leases.pop(next(iter(self._leases)))
+        self._leases[key] = [granted - 1, now + LEASE_SECONDS, granted]
+        return 0.0
+
+
+@functools.lru_cache(maxsize=8)
+def _trusted_networks(raw: str) -> Tuple[ipaddress._BaseNetwork, ...]:
+    return tuple(ipaddress.ip_network(p.strip(), strict=False) for p in raw.split(",") if p.strip())
+
+
+def _trusted(addr: Optional[str]) -> bool:
+    networks = _trusted_networks(settings.TRUSTED_PROXIES or "")
+    if not addr or not networks:
+        return False
+    try:
+        ip = ipaddress.ip_address(addr)
+    except ValueError:
+        return False
+    return any(ip in net for net in networks)
+
+
+def client_ip(request) -> Optional[str]:
+    """The caller's address, looking through ``X-Forwarded-For`` set by trusted proxies."""
+    peer = request.client.host if request.client else None
+    if not _trusted(peer):
+        return peer
+    hops = [h.strip() for h in ",".join(request.headers.getlist("x-forwarded-for")).split(",") if h.strip()]
+    # Walk back from the hop our proxy appended; earlier entries are client-supplied
+    for hop in reversed(hops):
+        if not _trusted(hop):
+            return hop
+    return hops[0] if hops else peer
+
+
+def too_many_requests(retry_after: float, limit: str, scope: str = "api_key"):
+    """429 in the stable error shape, with ``Retry-After`` in whole seconds."""
+    from fastapi.responses import JSONResponse
+    _LIMITED.labels(scope=scope).inc()
+    payload = {"error": {"code": "RATE_LIMITED", "message": "rate limit exceeded",
+                         "details": {"limit": limit, "retry_after": round(retry_after, 3)}}}
+    return JSONResponse(status_code=429, content=payload,
+                        headers={"Retry-After": str(max(1, math.ceil(retry_after)))})
+
+
+_limiter: Optional[RateLimiter] = None
+_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter() -> RateLimiter:
+    global _limiter
+    if _limiter is None:
+        with _limiter_lock:
+            if _limiter is None:
+                shared = None
+                if settings.REDIS_URL:
+                    try:
+                        shared = RedisBuckets(settings.REDIS_URL)
+                    except Exception as e:
+                        logger.warning("redis unavailable, limiting per process: %s", e)
+                _limiter = RateLimiter(shared, lease_fraction=settings.RATE_LIMIT_LEASE_FRACTION)
+    return _limiter
@@ -43,6 +43,7 @@ recommendations = _import_router('recommendations')
 cli = _import_router('cli')
 env = _import_router('env')
 gateway = _import_router('gateway')
+jobs = _import_router('jobs')
 auth = _import_router('auth')
 # If the full auth router failed to import (e.g. missing optional deps in prod),
 # try to import a lightweight fallback router that provides /v1/auth endpoints
@@ -55,16 +56,6 @@ if auth is None:
     except Exception:
         auth = None
 from .db_sa import engine, Base
-import os
-
-ENABLE_RATE_LIMIT = os.getenv("ENABLE_RATE_LIMIT", "false").lower() == "true"
-if ENABLE_RATE_LIMIT:
-    try:
-        from slowapi import Limiter
-        from slowapi.util import get_remote_address
-        from slowapi.errors import RateLimitExceeded
-    except Exception:
-        ENABLE_RATE_LIMIT = False
 
 app = FastAPI(
     title="bimo API",
@@ -100,7 +91,7 @@ async def http_exception_handler(request: Request, exc: FastAPIHTTPException):
         code = f"HTTP_{exc.status_code}"
 
     payload = {"error": {"code": code, "message": message, "details": details}}
-    return JSONResponse(status_code=exc.status_code, content=payload)
+    return JSONResponse(status_code=exc.status_code, content=payload, headers=getattr(exc, "headers", None))
 
 
 @app.exception_handler(Exception)
@@ -122,17 +113,23 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-if ENABLE_RATE_LIMIT:
-    limiter = Limiter(key_func=get_remote_address)
+try:
+    # Correlation ids and API key resolution (role/org on scope["extensions"])
+    from .middleware import CorrelationIdMiddleware
+    app.add_middleware(CorrelationIdMiddleware)
+except Exception as e:
+    print(f">>> Failed to install CorrelationIdMiddleware: {e}")
+
+if settings.ENABLE_RATE_LIMIT:
     @app.middleware("http")
-    async def rate_limit_middleware(request, call_next):
-        try:
-            # default limit, can be refined per-route later
-            with limiter.limit("100/minute"):
-                response = await call_next(request)
-                return response
-        except Exception:
-            return await call_next(request)
+    async def rate_limit_middleware(request: Request, call_next):
+        # Per-client-IP token bucket (RATE_LIMIT_DEFAULT), shared across workers via Redis
+        from .core.rate_limit import client_ip, get_rate_limiter, too_many_requests
+        client = client_ip(request) or "unknown"
+        retry_after = await get_rate_limiter().check(f"ip:{client}", settings.RATE_LIMIT_DEFAULT)
+        if retry_after:
+            return too_many_requests(retry_after, settings.RATE_LIMIT_DEFAULT, scope="ip")
+        return await call_next(request)
 
 if health is not None:
     app.include_router(health.router, prefix="/v1")
@@ -152,6 +149,8 @@ if gateway is not None:
     app.include_router(gateway.router, prefix="/v1")
 if auth is not None:
     app.include_router(auth.router, prefix="/v1")
+if jobs is not None:
+    app.include_router(jobs.router, prefix="/v1")
 
 
 @app.on_event("startup")
@@ -179,6 +178,33 @@ def on_startup():
         from .settings import settings
         if not settings.DATABASE_URL or settings.DATABASE_URL.startswith("sqlite"):
             Base.metadata.create_all(engine)
+    # Periodic provider syncs; with Celery, beat drives the same scheduler
+    try:
+        if settings.SYNC_SCHEDULER_ENABLED and not settings.CELERY_ENABLED:
+            from .workers.scheduler import start_scheduler
+            start_scheduler()
+    except Exception as e:
+        print(f"Warning: Could not start sync scheduler: {e}")
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    # Close pooled upstream gateway connections
+    try:
+        from .services.upstream import pool as _upstream_pool
+        await _upstream_pool.aclose()
+    except Exception as e:
+        print(f"Warning: Could not close upstream pool: {e}")
+    # Flush buffered usage events so nothing is lost on restart
+    try:
+        from .services.usage import drain_usage_buffer
+        drain_usage_buffer()
+    except Exception as e:
+        print(f"Warning: Could not drain usage buffer: {e}")
+    try:
+        from .services.passwords import shutdown as _shutdown_password_pool
+        _shutdown_password_pool()
+    except Exception as e:
+        print(f"Warning: Could not stop password hashing pool: {e}")
 
 @app.middleware("http")
 async def _metrics_middleware(request: Request, call_next):
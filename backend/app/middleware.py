@@ -3,12 +3,8 @@ import uuid
 import logging
 from typing import Callable
 from starlette.types import ASGIApp, Receive, Scope, Send
-from ..settings import settings
-from slowapi import Limiter
-from slowapi.util import get_remote_address
-from slowapi.errors import RateLimitExceeded
-from fastapi import HTTPException
-from starlette.requests import Request
+from .settings import settings
+from .core.rate_limit import get_rate_limiter, too_many_requests
 
 
 class CorrelationIdMiddleware:
@@ -45,35 +41,27 @@ class CorrelationIdMiddleware:
             if api_key:
                 try:
                     api_key = api_key.decode('latin-1').replace('Bearer ', '')
-                    # resolve key to role from DB (best-effort)
-                    from .db_sa import get_db
-                    db = next(get_db())
-                    from .models import ApiKey
-                    rec = db.query(ApiKey).filter(ApiKey.key == api_key).first()
+                    # resolve key to role (cached; misses do one indexed lookup off the event loop)
+                    from .services.api_keys import get_api_key_resolver
+                    rec = await get_api_key_resolver().aresolve(api_key)
                     if rec:
                         # attach role and org to scope state for downstream use
+                        scope.setdefault('extensions', {})['api_key_id'] = rec.id
                         scope.setdefault('extensions', {})['api_key_role'] = rec.role
                         scope.setdefault('extensions', {})['api_key_org'] = rec.org_id
                         scope.setdefault('extensions', {})['api_key_rate_limit'] = rec.rate_limit
                 except Exception:
                     pass
-            # Rate limiting: if enabled and a per-key limit exists, apply it
-            rate_limit = scope.get('extensions', {}).get('api_key_rate_limit')
+            # Rate limiting: per-key limits share one bucket per org (or per key without an org)
+            ext = scope.get('extensions') or {}
+            rate_limit = ext.get('api_key_rate_limit')
             if rate_limit and settings.APP_ENV != 'dev':
-                try:
-                    limiter = Limiter(key_func=get_remote_address)
-                    # This is a best-effort synchronous check; slowapi normally decorates routes.
-                    with limiter.limit(rate_limit):
-                        await self.app(scope, receive, send_wrapper)
-                except RateLimitExceeded:
-                    # Convert to HTTP 429
-                    response = { 'status': 'rate_limited' }
-                    await send_wrapper({ 'type': 'http.response.start', 'status': 429, 'headers': [] })
-                    await send_wrapper({ 'type': 'http.response.body', 'body': b'Rate limit exceeded' })
-                except Exception:
-                    await self.app(scope, receive, send_wrapper)
-            else:
-                await self.app(scope, receive, send_wrapper)
+                bucket = f"org:{ext['api_key_org']}" if ext.get('api_key_org') else f"key:{ext.get('api_key_id')}"
+                retry_after = await get_rate_limiter().check(bucket, rate_limit)
+                if retry_after:
+                    await too_many_requests(retry_after, rate_limit)(scope, receive, send_wrapper)
+                    return
+            await self.app(scope, receive, send_wrapper)
         finally:
             # Minimal structured log line
             elapsed_ms = round((time.perf_counter() - start) * 1000)
@@ -1,11 +1,12 @@
 from sqlmodel import SQLModel, Field
+from sqlalchemy import Index
 from typing import Optional
-from datetime import datetime
+from datetime import date, datetime
 
 
 class ProviderConnection(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
-    provider_id: str
+    provider_id: str = Field(index=True)
     encrypted_credentials: str
     status: str = "connected"
     created_at: datetime = Field(default_factory=datetime.utcnow)
@@ -18,6 +19,8 @@ class ProviderConnection(SQLModel, table=True):
     display_name: Optional[str] = None
     # User association
     user_id: Optional[int] = Field(default=None, foreign_key="user.id")
+    # Org whose API keys may use this connection through the gateway
+    org_id: Optional[str] = Field(default=None, index=True)
 
 
 class IdempotencyKey(SQLModel, table=True):
@@ -45,7 +48,13 @@ class Invoice(SQLModel, table=True):
 
     This table is intentionally conservative: nullable fields where external
     providers may omit values, and a `source` column to mark `billing` origin.
+    `(provider, provider_invoice_id)` is unique so re-ingesting an invoice
+    updates it in place.
     """
+    __table_args__ = (
+        Index("ux_invoice_provider_invoice_id", "provider", "provider_invoice_id", unique=True),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     provider: str
     provider_invoice_id: Optional[str] = None
@@ -61,17 +70,27 @@ class ApiKey(SQLModel, table=True):
     """API key records for RBAC and per-key rate limiting.
 
     Fields:
-    - key: the API key string presented by clients
+    - key_hash: SHA-256 hex digest of the key presented by clients (the
+      plaintext is only returned once, at creation)
+    - key_prefix: first characters of the key, to tell keys apart
     - org_id: optional org identifier
     - role: one of owner|admin|analyst
     - rate_limit: optional custom rate limit string (e.g. "100/minute")
+    - revoked_at: set when the key is revoked; revoked keys never resolve
     """
+    __table_args__ = (
+        Index("ux_apikey_key_hash", "key_hash", unique=True),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
-    key: str
+    key: Optional[str] = None  # legacy plaintext column, emptied by migration 0017
+    key_hash: Optional[str] = None
+    key_prefix: Optional[str] = None
     org_id: Optional[str] = None
     role: str = "analyst"
     rate_limit: Optional[str] = None
     created_at: datetime = Field(default_factory=datetime.utcnow)
+    revoked_at: Optional[datetime] = None
 
 
 class User(SQLModel, table=True):
@@ -94,4 +113,230 @@ class DeviceToken(SQLModel, table=True):
     status: str = "pending"  # pending, approved, expired
     access_token: Optional[str] = None
     created_at: datetime = Field(default_factory=datetime.utcnow)
-    expires_at: datetime
\ No newline at end of file
+    expires_at: datetime
+
+class ApiLog(SQLModel, table=True):
+    """One row per gateway/usage event.
+
+    `source` follows the dev|prod|billing attribution rules. `cache_hit` marks
+    responses served from the gateway caches; for those `cost` is what was
+    actually paid (zero) and `saved_cost` is the estimated upstream cost avoided.
+    """
+    __tablename__ = "api_logs"
+    __table_args__ = (
+        # Serves per-connection "last used" and time-range lookups
+        Index("ix_api_logs_connection_created", "connection_id", "created_at"),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    connection_id: Optional[int] = None
+    org_id: Optional[str] = None
+    provider: Optional[str] = None
+    model: Optional[str] = None
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    total_tokens: int = 0
+    cost: float = 0.0
+    saved_cost: float = 0.0
+    latency_ms: float = 0.0
+    status_code: Optional[int] = None
+    source: Optional[str] = Field(default="prod")
+    cache_hit: bool = False
+    created_at: datetime = Field(default_factory=datetime.utcnow, index=True)
+
+
+class MetricsBucket(SQLModel):
+    """Columns shared by the provider_metrics_* rollup tables.
+
+    One row per (bucket_start, org, connection, provider, model, source). Rows
+    are rebuilt by `workers.rollups`, never edited in place. `org_id` is None
+    for spend not attributed to an org (invoices, keyless gateway traffic).
+    """
+    id: Optional[int] = Field(default=None, primary_key=True)
+    bucket_start: datetime
+    org_id: Optional[str] = None
+    connection_id: Optional[int] = None
+    provider: str
+    model: Optional[str] = None
+    category: str = "ai"
+    source: str = "prod"
+    requests: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    total_tokens: int = 0
+    cost: float = 0.0
+    saved_cost: float = 0.0
+    cache_hits: int = 0
+    latency_ms_sum: float = 0.0
+
+
+class ProviderMetricsHourly(MetricsBucket, table=True):
+    __tablename__ = "provider_metrics_hourly"
+    __table_args__ = (
+        Index("ix_provider_metrics_hourly_bucket", "bucket_start", "provider"),
+        Index("ix_provider_metrics_hourly_org_bucket", "org_id", "bucket_start"),
+    )
+
+
+class ProviderMetricsDaily(MetricsBucket, table=True):
+    __tablename__ = "provider_metrics_daily"
+    __table_args__ = (
+        Index("ix_provider_metrics_daily_bucket", "bucket_start", "provider"),
+        Index("ix_provider_metrics_daily_org_bucket", "org_id", "bucket_start"),
+    )
+
+
+class ProviderMetricsMonthly(MetricsBucket, table=True):
+    __tablename__ = "provider_metrics_monthly"
+    __table_args__ = (
+        Index("ix_provider_metrics_monthly_bucket", "bucket_start", "provider"),
+        Index("ix_provider_metrics_monthly_org_bucket", "org_id", "bucket_start"),
+    )
+
+
+class RollupState(SQLModel, table=True):
+    """High-water marks (last processed id) per rollup input stream."""
+    __tablename__ = "rollup_state"
+
+    name: str = Field(primary_key=True)
+    last_id: int = 0
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class IngestCheckpoint(SQLModel, table=True):
+    """Progress of a billing export file import (see `workers.billing_files`).
+
+    `next_row` is the number of source records whose chunks have all been
+    committed, so a resumed import skips exactly that many records.
+    """
+    __tablename__ = "ingest_checkpoint"
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    file_key: str = Field(unique=True, index=True)
+    path: str
+    provider: str
+    status: str = "running"  # running | done | failed
+    next_row: int = 0
+    rows_ingested: int = 0
+    rows_rejected: int = 0
+    error: Optional[str] = None
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class GcpBillingDaily(SQLModel, table=True):
+    """Local copy of a connection's GCP billing export, aggregated per day and SKU.
+
+    Filled incrementally by `workers.bigquery_sync`; the usage endpoint reads
+    this instead of querying BigQuery.
+    """
+    __tablename__ = "gcp_billing_daily"
+    __table_args__ = (
+        Index("ux_gcp_billing_daily_key", "connection_id", "day", "service", "sku", unique=True),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    connection_id: int
+    day: date
+    service: str = ""
+    sku: str = ""
+    currency: str = "USD"
+    cost: float = 0.0
+    usage_amount: float = 0.0
+    tokens: float = 0.0
+    rows: int = 0
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class BigQuerySyncState(SQLModel, table=True):
+    """Per-connection `export_time` watermark of the billing export sync."""
+    __tablename__ = "bigquery_sync_state"
+
+    connection_id: int = Field(primary_key=True)
+    export_watermark: Optional[datetime] = None
+    rows_synced: int = 0
+    status: str = "never"  # never | ok | failed
+    error: Optional[str] = None
+    last_run_at: Optional[datetime] = None
+    # Set only by successful runs; local data is served once this is set
+    last_success_at: Optional[datetime] = None
+
+
+class SyncSchedule(SQLModel, table=True):
+    """When each connection's usage sync is next due (workers/scheduler.py).
+
+    `interval_seconds` adapts to `activity_per_hour`, a smoothed rate of
+    usage events seen between syncs.
+    """
+    __tablename__ = "sync_schedule"
+    __table_args__ = (
+        Index("ix_sync_schedule_next_run_at", "next_run_at"),
+    )
+
+    connection_id: int = Field(primary_key=True)
+    provider: str
+    next_run_at: datetime
+    interval_seconds: int
+    activity_per_hour: float = 0.0
+    last_run_at: Optional[datetime] = None
+    failures: int = 0
+
+
+class UsageSyncState(SQLModel, table=True):
+    """How far provider usage-API buckets have been copied into `api_logs`
+    for a connection (see `workers.usage_fetchers`)."""
+    __tablename__ = "usage_sync_state"
+
+    connection_id: int = Field(primary_key=True)
+    usage_through: Optional[datetime] = None
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class BackfillJob(SQLModel, table=True):
+    """Historical usage import for one connection, split into `backfill_chunk`s
+    (see `workers.backfill`)."""
+    __tablename__ = "backfill_job"
+    __table_args__ = (
+        Index("ix_backfill_job_status", "status"),
+        Index("ix_backfill_job_connection", "connection_id"),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    connection_id: int
+    provider: str
+    range_start: datetime
+    range_end: datetime
+    chunk_days: int
+    status: str = "queued"  # queued | running | done | failed
+    chunks_total: int = 0
+    chunks_done: int = 0
+    rows: int = 0
+    error: Optional[str] = None
+    # Renewed on dispatch and on every chunk claim; resume only re-dispatches
+    # jobs whose workers have let it lapse
+    worker_lease_until: Optional[datetime] = None
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+
+class BackfillChunk(SQLModel, table=True):
+    """One date range of a backfill job; `lease_until` lets a crashed
+    worker's chunk be claimed again."""
+    __tablename__ = "backfill_chunk"
+    __table_args__ = (
+        Index("ux_backfill_chunk_job_idx", "job_id", "idx", unique=True),
+        Index("ix_backfill_chunk_job_status", "job_id", "status"),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    job_id: int
+    idx: int
+    chunk_start: datetime
+    chunk_end: datetime
+    status: str = "pending"  # pending | running | done | failed
+    attempts: int = 0
+    rows: int = 0
+    lease_until: Optional[datetime] = None
+    error: Optional[str] = None
+    finished_at: Optional[datetime] = None
@@ -8,7 +8,8 @@ avoid large refactors in this repair step, expose the expected symbols from
 from .models import ProviderConnection as ProviderConnectionSA  # type: ignore
 from .models import IdempotencyKey as IdempotencyKeySA  # type: ignore
 from .models import AuditLog as AuditLogSA  # type: ignore
+from .models import ApiLog as ApiLog  # type: ignore
 
-__all__ = ["ProviderConnectionSA", "IdempotencyKeySA", "AuditLogSA"]
+__all__ = ["ProviderConnectionSA", "IdempotencyKeySA", "AuditLogSA", "ApiLog"]
 
 
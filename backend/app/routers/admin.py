@@ -1,13 +1,14 @@
 from fastapi import APIRouter, HTTPException, Header, Response, Depends
-from pydantic import BaseModel
+from datetime import date, datetime
+from pydantic import BaseModel, Field
 from ..config import enable_default_ai_model, get_default_ai_model
 from ..settings import settings
 from sqlalchemy.orm import Session
 from ..db_sa import get_db
 from ..models_sa import ProviderConnectionSA
 from ..models_sa_audit import AuditLog
-from ..workers.tasks import sync_openai_usage
-from ..workers.billing_ingest import ingest_invoice
+from ..workers.tasks import sync_openai_usage, rollup_provider_metrics
+from ..workers.billing_ingest import ingest_invoice, ingest_invoices
 from ..models import ApiKey
 import uuid
 
@@ -59,6 +60,17 @@ async def admin_sync_openai(x_admin_token: str | None = Header(default=None)):
     return {"enqueued": True}
 
 
+@router.post("/admin/rollups/run")
+def admin_run_rollups(x_admin_token: str | None = Header(default=None)):
+    """Advance the provider_metrics_* rollups now and return what was rebuilt."""
+    if x_admin_token != settings.ADMIN_API_KEY:
+        raise HTTPException(status_code=401, detail="unauthorized")
+    try:
+        return rollup_provider_metrics.run()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 class IngestInvoiceRequest(BaseModel):
     provider: str
     invoice: dict
@@ -81,18 +93,93 @@ async def admin_ingest_invoice(req: IngestInvoiceRequest, x_admin_token: str | N
         raise HTTPException(status_code=500, detail=str(e))
 
 
+class IngestInvoicesRequest(BaseModel):
+    provider: str
+    invoices: list[dict]
+    source: str = "billing"
+
+
+@router.post('/admin/ingest/invoices')
+def admin_ingest_invoices(req: IngestInvoicesRequest, x_admin_token: str | None = Header(default=None)):
+    """Admin-only bulk ingest: upsert many invoices for one provider.
+
+    Invoices are matched on (provider, invoice id); the response reports how
+    many were inserted, updated and rejected (with the first validation errors).
+    """
+    if x_admin_token != settings.ADMIN_API_KEY:
+        raise HTTPException(status_code=401, detail="unauthorized")
+    if req.source not in ("dev", "prod", "billing"):
+        raise HTTPException(status_code=400, detail={"code": "INVALID_SOURCE", "message": "source must be dev, prod or billing"})
+    if len(req.invoices) > 50000:
+        raise HTTPException(status_code=413, detail={"code": "BATCH_TOO_LARGE", "message": "at most 50000 invoices per request"})
+    return ingest_invoices(req.provider, req.invoices, source=req.source)
+
+
+class CreateBackfillRequest(BaseModel):
+    connection_id: int
+    start: date = Field(alias="from")
+    end: date | None = Field(default=None, alias="to")
+    chunk_days: int | None = None
+    workers: int | None = None
+
+
+@router.post('/admin/backfills', status_code=202)
+def admin_create_backfill(req: CreateBackfillRequest, x_admin_token: str | None = Header(default=None)):
+    """Start a resumable historical usage import for one connection.
+
+    The range is imported in chunks by parallel workers; poll
+    ``GET /admin/backfills/{id}`` for progress.
+    """
+    if x_admin_token != settings.ADMIN_API_KEY:
+        raise HTTPException(status_code=401, detail="unauthorized")
+    from ..workers import backfill
+    start = datetime.combine(req.start, datetime.min.time())
+    end = datetime.combine(req.end, datetime.min.time()) if req.end else None
+    try:
+        job = backfill.create_job(req.connection_id, start, end, chunk_days=req.chunk_days)
+    except LookupError:
+        raise HTTPException(status_code=404, detail={"code": "CONNECTION_NOT_FOUND", "message": "connection not found"})
+    except backfill.BackfillActive as e:
+        raise HTTPException(status_code=409, detail={"code": "BACKFILL_ACTIVE", "message": str(e)})
+    except backfill.BackfillError as e:
+        raise HTTPException(status_code=400, detail={"code": "INVALID_BACKFILL", "message": str(e)})
+    job["workers"] = backfill.start_job(job["id"], req.workers)
+    return job
+
+
+@router.get('/admin/backfills/{job_id}')
+def admin_get_backfill(job_id: int, x_admin_token: str | None = Header(default=None)):
+    """Backfill progress: chunks done, rows imported, elapsed time and ETA."""
+    if x_admin_token != settings.ADMIN_API_KEY:
+        raise HTTPException(status_code=401, detail="unauthorized")
+    from ..workers.backfill import progress
+    job = progress(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail={"code": "BACKFILL_NOT_FOUND", "message": "backfill not found"})
+    return job
+
+
 @router.post('/admin/apikeys')
 def create_api_key(req: CreateApiKeyRequest, x_admin_token: str | None = Header(default=None)):
-    """Create a new API key with role/org/rate_limit. Returns plaintext key."""
+    """Create a new API key with role/org/rate_limit. Returns plaintext key.
+
+    Only the key's SHA-256 digest is stored, so this response is the only
+    place the plaintext ever appears.
+    """
     if x_admin_token != settings.ADMIN_API_KEY:
         raise HTTPException(status_code=401, detail="unauthorized")
+    from ..services.api_keys import hash_key, invalidate_api_key
     key_val = uuid.uuid4().hex
+    key_hash = hash_key(key_val)
+    db = next(get_db())
     try:
-        db = next(get_db())
-        ak = ApiKey(key=key_val, org_id=(req.org_id or None), role=(req.role or 'analyst'), rate_limit=(req.rate_limit or None))
+        ak = ApiKey(key_hash=key_hash, key_prefix=key_val[:8], org_id=(req.org_id or None),
+                    role=(req.role or 'analyst'), rate_limit=(req.rate_limit or None))
         db.add(ak)
         db.commit()
         db.refresh(ak)
+        # Drop a cached "unknown key" answer for this digest
+        invalidate_api_key(key_hash)
         return {"id": ak.id, "key": key_val, "role": ak.role, "org_id": ak.org_id, "rate_limit": ak.rate_limit}
     except Exception as e:
         try:
@@ -100,6 +187,25 @@ def create_api_key(req: CreateApiKeyRequest, x_admin_token: str | None = Header(
         except Exception:
             pass
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        db.close()
+
+
+@router.delete('/admin/apikeys/{key_id}', status_code=204)
+def revoke_api_key(key_id: int, x_admin_token: str | None = Header(default=None), db: Session = Depends(get_db)):
+    """Revoke an API key; it stops resolving in this process immediately."""
+    if x_admin_token != settings.ADMIN_API_KEY:
+        raise HTTPException(status_code=401, detail="unauthorized")
+    from ..services.api_keys import invalidate_api_key
+    ak = db.get(ApiKey, key_id)
+    if ak is None:
+        raise HTTPException(status_code=404, detail={"code": "API_KEY_NOT_FOUND", "message": "api key not found"})
+    if ak.revoked_at is None:
+        ak.revoked_at = datetime.utcnow()
+        db.add(AuditLog(actor="admin", action="api_key_revoke", entity=f"apikey:{ak.id}"))
+        db.commit()
+    invalidate_api_key(ak.key_hash)
+    return Response(status_code=204)
 
 
 @router.delete("/admin/connections/{conn_id}", status_code=204)
@@ -1,18 +1,20 @@
 """Authentication endpoints for signup, login, and token management."""
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from pydantic import BaseModel, EmailStr
 from sqlmodel import Session, select
+from starlette.concurrency import run_in_threadpool
 from datetime import timedelta
 from ..models import User
 from ..db_sa import get_db
 from ..auth import (
-    get_password_hash,
-    authenticate_user,
+    aauthenticate_user,
     create_access_token,
     ACCESS_TOKEN_EXPIRE_MINUTES,
     get_current_user,
     decode_access_token,
+    invalidate_user,
 )
+from ..services.passwords import HashingBusy, hash_password, http_error
 try:
     from ..models import RefreshToken
 except Exception:
@@ -49,27 +51,38 @@ class UserResponse(BaseModel):
     is_admin: bool
 
 
+def _client_ip(request: Request) -> str | None:
+    from ..core.rate_limit import client_ip
+    return client_ip(request)
+
+
 @router.post("/signup", response_model=TokenResponse)
-def signup(body: SignupRequest, db: Session = Depends(get_db)):
+async def signup(body: SignupRequest, request: Request, db: Session = Depends(get_db)):
     """Create a new user account."""
     # Check if user already exists
     statement = select(User).where(User.email == body.email)
-    existing_user = db.exec(statement).first()
+    existing_user = await run_in_threadpool(lambda: db.exec(statement).first())
     if existing_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Email already registered"
         )
     
-    # Create new user
-    hashed_password = get_password_hash(body.password)
+    # Create new user; PBKDF2 runs in the hashing pool, not the request threadpool
+    try:
+        hashed_password = await hash_password(body.password, ip=_client_ip(request), email=body.email)
+    except HashingBusy as e:
+        raise http_error(e)
     user = User(
         email=body.email,
         hashed_password=hashed_password
     )
-    db.add(user)
-    db.commit()
-    db.refresh(user)
+
+    def _save():
+        db.add(user)
+        db.commit()
+        db.refresh(user)
+    await run_in_threadpool(_save)
     
     # Create access token
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
@@ -81,9 +94,12 @@ def signup(body: SignupRequest, db: Session = Depends(get_db)):
 
 
 @router.post("/login", response_model=TokenResponse)
-def login(body: LoginRequest, db: Session = Depends(get_db)):
+async def login(body: LoginRequest, request: Request, db: Session = Depends(get_db)):
     """Login with email and password."""
-    user = authenticate_user(db, body.email, body.password)
+    try:
+        user = await aauthenticate_user(db, body.email, body.password, ip=_client_ip(request))
+    except HashingBusy as e:
+        raise http_error(e)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -106,7 +122,7 @@ def login(body: LoginRequest, db: Session = Depends(get_db)):
         if RefreshToken is not None:
             rt = RefreshToken(token=refresh_token, user_id=user.id, revoked=False)
             db.add(rt)
-            db.commit()
+            await run_in_threadpool(db.commit)
     except Exception:
         # If table missing or other transient error, proceed with access token only
         refresh_token = None
@@ -164,4 +180,5 @@ def logout(current_user: User = Depends(get_current_user)):
             db.close()
     except Exception:
         pass
+    invalidate_user(current_user.id)
     return {"status": "ok"}
@@ -3,6 +3,7 @@ from fastapi.responses import RedirectResponse
 from pydantic import BaseModel
 from typing import Optional
 from sqlmodel import Session
+from starlette.concurrency import run_in_threadpool
 import uuid
 import time
 import random
@@ -10,6 +11,8 @@ from datetime import datetime, timedelta
 from ..models import DeviceToken, User
 from ..db_sa import get_db
 from ..auth import create_access_token, ACCESS_TOKEN_EXPIRE_MINUTES
+from ..services import device_waiters
+from ..settings import settings
 
 router = APIRouter(prefix="/cli", tags=["cli"])
 
@@ -27,6 +30,9 @@ class DeviceStartResponse(BaseModel):
 
 class DevicePollRequest(BaseModel):
     device_code: str
+    # Long poll: hold a pending request up to this many seconds (capped by
+    # DEVICE_POLL_MAX_WAIT_SECONDS) and answer as soon as the device is approved
+    wait: Optional[float] = None
 
 class DevicePollResponse(BaseModel):
     status: str  # "pending", "approved", "expired"
@@ -65,10 +71,38 @@ def device_start(db: Session = Depends(get_db)):
     )
 
 @router.post("/device/poll", response_model=DevicePollResponse)
-def device_poll(request: DevicePollRequest, db: Session = Depends(get_db)):
-    """Poll for device authentication status"""
-    device_code = request.device_code
-    
+async def device_poll(request: DevicePollRequest, db: Session = Depends(get_db)):
+    """Poll for device authentication status.
+
+    With ``wait`` set, a pending device holds the request until it is approved
+    (on any node) or the wait runs out, instead of the CLI re-polling every
+    ``interval`` seconds.
+    """
+    wait = min(float(request.wait or 0), settings.DEVICE_POLL_MAX_WAIT_SECONDS)
+    waiter = None
+    if wait > 0:
+        device_waiters.ensure_listener()
+        # Registered before the read so an approval landing in between still wakes us
+        waiter = device_waiters.get_device_waiters().register(request.device_code)
+    try:
+        res = await run_in_threadpool(_poll_and_release, request.device_code, db)
+        if waiter is not None and res.status == "pending" and await waiter.wait(wait):
+            res = await run_in_threadpool(_poll_and_release, request.device_code, db)
+        return res
+    finally:
+        if waiter is not None:
+            device_waiters.get_device_waiters().discard(waiter)
+
+
+def _poll_and_release(device_code: str, db: Session) -> DevicePollResponse:
+    try:
+        return _poll_once(device_code, db)
+    finally:
+        # Hand the connection back to the pool before a long poll waits
+        db.close()
+
+
+def _poll_once(device_code: str, db: Session) -> DevicePollResponse:
     # Fetch from database
     device_token = db.query(DeviceToken).filter(
         DeviceToken.device_code == device_code
@@ -123,7 +157,7 @@ def device_poll(request: DevicePollRequest, db: Session = Depends(get_db)):
     )
 
 @router.post("/device/approve")
-def device_approve(body: DeviceApproveRequest, db: Session = Depends(get_db)):
+def device_approve(body: DeviceApproveRequest, request: Request, db: Session = Depends(get_db)):
     """Approve a pending device using user_code or device_code.
 
     Intended to be called by the dashboard after a user signs up/logs in.
@@ -155,10 +189,16 @@ def device_approve(body: DeviceApproveRequest, db: Session = Depends(get_db)):
     temp_email = f"cli-user-{device_token.user_code}@bimo.com"
     user = db.query(User).filter(User.email == temp_email).first()
     if not user:
-        from ..auth import get_password_hash
+        from ..core.rate_limit import client_ip
+        from ..services.passwords import HashingBusy, hash_password_sync, http_error
+        try:
+            # Offloaded to the hashing pool; this thread waits without holding the GIL
+            hashed_password = hash_password_sync(str(uuid.uuid4()), ip=client_ip(request))
+        except HashingBusy as e:
+            raise http_error(e)
         user = User(
             email=temp_email,
-            hashed_password=get_password_hash(str(uuid.uuid4()))
+            hashed_password=hashed_password
         )
         db.add(user)
         db.commit()
@@ -171,10 +211,13 @@ def device_approve(body: DeviceApproveRequest, db: Session = Depends(get_db)):
     )
     
     # Update device token
+    device_code = device_token.device_code
     device_token.status = "approved"
     device_token.user_id = user.id
     device_token.access_token = access_token
     db.commit()
+    # Wake long polls for this device (here and, through Redis, on other nodes)
+    device_waiters.notify(device_code)
     
     return {"status": "approved", "access_token": access_token}
 
@@ -0,0 +1,405 @@
+"""Production gateway: proxies provider API calls through bimo.
+
+``/v1/gateway/{provider}/{path}`` forwards the request to the provider's API
+over the pooled clients in ``services.upstream``. Request and response bodies
+are passed through as raw bytes (no JSON decode/encode on the hot path) and
+``text/event-stream`` responses are streamed chunk by chunk.
+
+Credentials are either taken from the caller's own auth headers or, when the
+``X-BIMO-CONNECTION-ID`` header is present, injected from the stored provider
+connection. Stored credentials are only used for callers with a bimo API key
+of the org that owns the connection, and then only against the connection's
+own endpoint.
+
+Generation calls are first looked up in the exact-match response cache
+(``services.response_cache``). ``/v1/optimize`` additionally consults the
+semantic cache (``services.semantic_cache``) before going upstream. Every
+call, cached or not, emits a `prod` usage event into `api_logs`.
+"""
+import hashlib
+import json
+import logging
+import time
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlencode
+
+import httpx
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import Response, StreamingResponse
+from starlette.background import BackgroundTask, BackgroundTasks
+
+from ..crypto import decrypt_json
+from ..db_sa import get_db
+from ..models_sa import ProviderConnectionSA
+from ..services import response_cache, upstream
+from ..services.usage import build_usage_event, record_usage
+from ..settings import settings
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(tags=["gateway"])
+
+# Decrypted connection credentials cached briefly so the hot path does not
+# hit the DB and Fernet on every proxied call. Keyed by (connection, org) so
+# an entry is only ever served to the org it was checked for.
+_CREDENTIALS_TTL_SECONDS = 60.0
+_CREDENTIALS_MAX_ENTRIES = 1024
+_credentials_cache: Dict[Tuple[int, str], Tuple[float, Optional[dict]]] = {}
+
+# Returned for a connection owned by another org; carries no secrets
+_FORBIDDEN: dict = {"_forbidden": True}
+
+
+def _load_connection_credentials(connection_id: int, org_id: str) -> Optional[dict]:
+    db = next(get_db())
+    try:
+        conn = db.get(ProviderConnectionSA, connection_id)
+        if not conn:
+            return None
+        if conn.org_id != org_id:
+            # Checked before decrypting: another org's secrets never leave the DB
+            return _FORBIDDEN
+        try:
+            creds = json.loads(decrypt_json(conn.encrypted_credentials))
+        except Exception:
+            creds = {}
+        if not isinstance(creds, dict):
+            creds = {}
+        creds["_provider_id"] = (conn.provider_id or "").lower()
+        creds["_connection_type"] = conn.connection_type
+        return creds
+    finally:
+        db.close()
+
+
+async def get_connection_credentials(connection_id: int, org_id: str) -> Optional[dict]:
+    """Decrypted credentials of ``org_id``'s connection, cached for a short TTL.
+
+    ``None`` if the connection does not exist, ``_FORBIDDEN`` if another org owns it.
+    """
+    now = time.monotonic()
+    key = (connection_id, org_id)
+    hit = _credentials_cache.get(key)
+    if hit is not None and hit[0] > now:
+        return hit[1]
+    creds = await run_in_threadpool(_load_connection_credentials, connection_id, org_id)
+    if len(_credentials_cache) >= _CREDENTIALS_MAX_ENTRIES:
+        _credentials_cache.clear()
+    _credentials_cache[key] = (now + _CREDENTIALS_TTL_SECONDS, creds)
+    return creds
+
+
+def invalidate_connection_credentials(connection_id: Optional[int] = None) -> None:
+    if connection_id is None:
+        _credentials_cache.clear()
+    else:
+        for key in [k for k in _credentials_cache if k[0] == connection_id]:
+            _credentials_cache.pop(key, None)
+
+
+def _inject_auth(provider: str, headers: Dict[str, str], api_key: str) -> None:
+    """Replace caller auth headers with the stored provider key."""
+    for h in ("authorization", "x-api-key", "api-key", "x-goog-api-key"):
+        for k in [k for k in headers if k.lower() == h]:
+            headers.pop(k)
+    if provider == "openai":
+        headers["Authorization"] = f"Bearer {api_key}"
+    elif provider == "claude":
+        headers["x-api-key"] = api_key
+        if not any(k.lower() == "anthropic-version" for k in headers):
+            headers["anthropic-version"] = "2023-06-01"
+    elif provider == "gemini":
+        headers["x-goog-api-key"] = api_key
+    elif provider == "azure":
+        headers["api-key"] = api_key
+
+
+def _gateway_error(status_code: int, code: str, message: str) -> HTTPException:
+    return HTTPException(status_code=status_code, detail={"code": code, "message": message})
+
+
+def _drop_bimo_key(request: Request, headers: Dict[str, str]) -> None:
+    """Remove the caller's Bimo API key so it never reaches the provider.
+
+    The middleware resolves ``X-API-Key`` (or, without it, ``Authorization``);
+    that header is dropped only when it resolved to a Bimo key, so a Claude
+    caller's own ``x-api-key`` still goes through.
+    """
+    if not (request.scope.get("extensions") or {}).get("api_key_id"):
+        return
+    carrier = "x-api-key" if "x-api-key" in request.headers else "authorization"
+    for k in [k for k in headers if k.lower() == carrier]:
+        headers.pop(k)
+
+
+async def _prepare_upstream(provider: str, request: Request) -> Tuple[str, Dict[str, str], Optional[int]]:
+    """Resolve the upstream base URL and forwardable headers for a request.
+
+    The third item is the connection id once it has been checked against the
+    caller's org (``None`` when the caller brings its own credentials).
+    """
+    headers = upstream.filter_headers(request.headers, drop_prefixes=("x-bimo-", "x-admin-token", "x-correlation-id"))
+    _drop_bimo_key(request, headers)
+
+    creds: Optional[dict] = None
+    connection_id: Optional[int] = None
+    conn_header = request.headers.get("X-BIMO-CONNECTION-ID")
+    if conn_header:
+        try:
+            connection_id = int(conn_header)
+        except ValueError:
+            raise _gateway_error(400, "INVALID_CONNECTION", "X-BIMO-CONNECTION-ID must be an integer")
+        org_id = (request.scope.get("extensions") or {}).get("api_key_org")
+        if not org_id:
+            raise _gateway_error(401, "UNAUTHORIZED", "an org API key (X-API-Key) is required to use a stored connection")
+        creds = await get_connection_credentials(connection_id, org_id)
+        if creds is None:
+            raise _gateway_error(404, "CONNECTION_NOT_FOUND", "connection not found")
+        if creds is _FORBIDDEN:
+            raise _gateway_error(403, "CONNECTION_FORBIDDEN", "connection belongs to another org")
+        if creds.get("_provider_id") != provider:
+            raise _gateway_error(400, "PROVIDER_MISMATCH", "connection does not belong to this provider")
+        api_key = creds.get("api_key")
+        if not api_key:
+            raise _gateway_error(400, "MISSING_API_KEY", "connection has no api_key")
+        _inject_auth(provider, headers, api_key)
+
+    azure_endpoint = None
+    if provider == "azure":
+        if creds is not None:
+            # A stored key only ever goes to the endpoint stored with it
+            azure_endpoint = creds.get("endpoint")
+            if not azure_endpoint:
+                raise _gateway_error(400, "MISSING_ENDPOINT", "azure connection has no endpoint")
+        else:
+            azure_endpoint = request.headers.get("X-BIMO-AZURE-ENDPOINT")
+    base_url = upstream.resolve_base_url(provider, azure_endpoint)
+    if not base_url:
+        raise _gateway_error(404, "UNSUPPORTED_PROVIDER", f"gateway does not support provider '{provider}'")
+    return base_url, headers, connection_id
+
+
+async def _send_upstream(provider: str, base_url: str, method: str, url: str, headers: Dict[str, str], body: bytes) -> httpx.Response:
+    client = upstream.pool.client_for(base_url)
+    upstream_req = client.build_request(method, url, headers=headers, content=body)
+    try:
+        return await client.send(upstream_req, stream=True)
+    except httpx.TimeoutException:
+        raise _gateway_error(504, "UPSTREAM_TIMEOUT", f"{provider} did not respond in time")
+    except httpx.RequestError as e:
+        raise _gateway_error(502, "UPSTREAM_UNAVAILABLE", f"{provider} request failed: {e.__class__.__name__}")
+
+
+async def _relay(upstream_resp: httpx.Response) -> Tuple[Response, Optional[bytes]]:
+    """Turn an upstream response into a client response.
+
+    Event streams are relayed chunk by chunk; anything else is read fully
+    (still as raw, possibly compressed, bytes) and those bytes are returned
+    alongside so callers can cache them.
+    """
+    resp_headers = upstream.filter_headers(upstream_resp.headers)
+    content_type = upstream_resp.headers.get("content-type", "")
+    if content_type.startswith("text/event-stream"):
+        streaming = StreamingResponse(
+            upstream_resp.aiter_raw(),
+            status_code=upstream_resp.status_code,
+            headers=resp_headers,
+            background=BackgroundTask(upstream_resp.aclose),
+        )
+        return streaming, None
+
+    try:
+        raw = b"".join([chunk async for chunk in upstream_resp.aiter_raw()])
+    finally:
+        await upstream_resp.aclose()
+    return Response(content=raw, status_code=upstream_resp.status_code, headers=resp_headers), raw
+
+
+def _cache_scope(request: Request, connection_id: Optional[int] = None) -> str:
+    """Namespace for cached responses: org, else connection, else caller key.
+
+    ``connection_id`` must come from ``_prepare_upstream``, i.e. already be
+    checked against the caller; the raw header is never trusted here. Falling
+    back to a digest of the caller's credentials keeps one anonymous caller
+    from reading responses cached for another.
+    """
+    ext = request.scope.get("extensions") or {}
+    if ext.get("api_key_org"):
+        return f"org:{ext['api_key_org']}"
+    if connection_id is not None:
+        return f"conn:{connection_id}"
+    cred = "".join(request.headers.get(h, "") for h in ("authorization", "x-api-key", "api-key", "x-goog-api-key"))
+    return "key:" + hashlib.sha256(cred.encode("utf-8")).hexdigest()[:32]
+
+
+def _json_object(body: bytes) -> Optional[dict]:
+    try:
+        payload = json.loads(body or b"{}")
+    except ValueError:
+        return None
+    return payload if isinstance(payload, dict) else None
+
+
+def _emit_usage(provider: str, request: Request, started: float, raw: Optional[bytes], content_encoding: Optional[str],
+                status_code: int, request_model: Optional[str] = None, cache_hit: bool = False) -> BackgroundTask:
+    """Build a background task that records the usage event after the response is sent."""
+    conn = request.headers.get("X-BIMO-CONNECTION-ID")
+    source = "dev" if (request.headers.get("X-BIMO-SOURCE") or "").lower() == "dev" else "prod"
+    kwargs = dict(
+        provider=provider,
+        raw=raw,
+        content_encoding=content_encoding,
+        request_model=request_model,
+        connection_id=int(conn) if conn and conn.isdigit() else None,
+        org_id=(request.scope.get("extensions") or {}).get("api_key_org"),
+        latency_ms=(time.perf_counter() - started) * 1000.0,
+        status_code=status_code,
+        source=source,
+        cache_hit=cache_hit,
+    )
+    return BackgroundTask(lambda: record_usage(build_usage_event(**kwargs)))
+
+
+def _with_background(response: Response, task: BackgroundTask) -> Response:
+    tasks = BackgroundTasks([response.background] if response.background is not None else [])
+    tasks.tasks.append(task)
+    response.background = tasks
+    return response
+
+
+def _cached_reply(provider: str, request: Request, started: float, cached, label: str,
+                  request_model: Optional[str], extra_headers: Optional[Dict[str, str]] = None) -> Response:
+    headers = dict(cached.headers)
+    headers["X-BIMO-Cache"] = label
+    headers.update(extra_headers or {})
+    response = Response(content=cached.body, status_code=cached.status_code, headers=headers)
+    task = _emit_usage(provider, request, started, cached.body, cached.headers.get("content-encoding"),
+                       cached.status_code, request_model, cache_hit=True)
+    return _with_background(response, task)
+
+
+def _cacheable_copy(upstream_resp: httpx.Response, raw: bytes):
+    kept = {k: v for k, v in upstream_resp.headers.items() if k.lower() in ("content-type", "content-encoding")}
+    return response_cache.CachedResponse(body=raw, status_code=upstream_resp.status_code, headers=kept)
+
+
+@router.api_route("/gateway/{provider}/{path:path}", methods=["GET", "POST", "PUT", "PATCH", "DELETE"])
+async def proxy(provider: str, path: str, request: Request):
+    """Forward a provider API call and relay the upstream response verbatim."""
+    started = time.perf_counter()
+    provider = provider.lower()
+    base_url, headers, connection_id = await _prepare_upstream(provider, request)
+
+    url = f"/{path}"
+    if request.url.query:
+        url = f"{url}?{request.url.query}"
+
+    body = await request.body()
+    cache = key = payload = None
+    may_write = False
+    if settings.RESPONSE_CACHE_ENABLED and response_cache.is_cacheable_path(request.method, url.split("?", 1)[0]):
+        payload = _json_object(body)
+        if payload is not None and not payload.get("stream"):
+            may_read, may_write = response_cache.cache_policy(request.headers)
+            cache = response_cache.get_response_cache()
+            key = response_cache.cache_key(provider, base_url + url, payload, _cache_scope(request, connection_id))
+            cached = await cache.get(key) if may_read else None
+            if cached is not None:
+                return _cached_reply(provider, request, started, cached, "exact-hit", payload.get("model"))
+
+    upstream_resp = await _send_upstream(provider, base_url, request.method, url, headers, body)
+    response, raw = await _relay(upstream_resp)
+    if cache is not None and may_write and raw is not None and upstream_resp.status_code == 200:
+        await cache.set(key, _cacheable_copy(upstream_resp, raw))
+    if payload is not None or raw is None:
+        # Generation calls (and streams) are usage; skip model listings and the like
+        task = _emit_usage(provider, request, started, raw, upstream_resp.headers.get("content-encoding"),
+                           upstream_resp.status_code, (payload or {}).get("model"))
+        _with_background(response, task)
+    return response
+
+
+def _optimize_path(provider: str, model: Optional[str]) -> Optional[str]:
+    if provider == "openai":
+        return "/v1/chat/completions"
+    if provider == "claude":
+        return "/v1/messages"
+    if provider == "gemini" and model:
+        return f"/v1beta/models/{model}:generateContent"
+    if provider == "azure" and model:
+        return f"/openai/deployments/{model}/chat/completions"
+    return None
+
+
+@router.post("/optimize")
+async def optimize(request: Request):
+    """Chat completion through the exact-match and semantic caches.
+
+    The provider is chosen with ``?provider=`` (or ``X-BIMO-PROVIDER``) and
+    defaults to OpenAI; the body is the provider's native chat request and
+    is forwarded unchanged on a cache miss. Non-streaming 200 responses are
+    stored in both caches.
+    """
+    started = time.perf_counter()
+    provider = (request.query_params.get("provider") or request.headers.get("X-BIMO-PROVIDER") or "openai").lower()
+    body = await request.body()
+    payload = _json_object(body)
+    if payload is None:
+        raise _gateway_error(400, "INVALID_JSON", "request body must be a JSON object")
+
+    model = payload.get("model") or request.query_params.get("model")
+    path = _optimize_path(provider, model)
+    if not path:
+        raise _gateway_error(400, "UNSUPPORTED_PROVIDER", f"optimize does not support provider '{provider}'")
+    base_url, headers, connection_id = await _prepare_upstream(provider, request)
+
+    # Forward everything except our own routing parameters (e.g. Azure's api-version)
+    query = [(k, v) for k, v in request.query_params.multi_items() if k not in ("provider", "model")]
+    url = f"{path}?{urlencode(query)}" if query else path
+
+    may_read, may_write = response_cache.cache_policy(request.headers)
+    scope = _cache_scope(request, connection_id)
+    streaming = bool(payload.get("stream"))
+
+    exact = key = None
+    if settings.RESPONSE_CACHE_ENABLED and not streaming and (may_read or may_write):
+        exact = response_cache.get_response_cache()
+        key = response_cache.cache_key(provider, base_url + url, payload, scope)
+        cached = await exact.get(key) if may_read else None
+        if cached is not None:
+            return _cached_reply(provider, request, started, cached, "exact-hit", model)
+
+    semantic = None
+    namespace = text = None
+    if settings.SEMANTIC_CACHE_ENABLED and not streaming and (may_read or may_write):
+        try:
+            from ..services.semantic_cache import SemanticCache, get_semantic_cache, prompt_text
+            semantic = get_semantic_cache()
+            if semantic is not None:
+                namespace = SemanticCache.namespace(scope, model, payload)
+                text = prompt_text(payload)
+            hit = await semantic.lookup(namespace, text) if semantic is not None and may_read else None
+        except Exception as e:
+            # The cache must never take the gateway down; fall through to upstream
+            logger.warning("semantic cache lookup failed: %s", e)
+            semantic, hit = None, None
+        if hit is not None:
+            return _cached_reply(provider, request, started, hit.response, "semantic-hit", model,
+                                 {"X-BIMO-Cache-Similarity": f"{hit.similarity:.4f}"})
+
+    upstream_resp = await _send_upstream(provider, base_url, "POST", url, headers, body)
+    response, raw = await _relay(upstream_resp)
+    if raw is not None and upstream_resp.status_code == 200 and may_write:
+        copy = _cacheable_copy(upstream_resp, raw)
+        if exact is not None:
+            await exact.set(key, copy)
+        if semantic is not None:
+            try:
+                await semantic.store(namespace, text, copy)
+            except Exception as e:
+                logger.warning("semantic cache store failed: %s", e)
+        response.headers["X-BIMO-Cache"] = "miss"
+    task = _emit_usage(provider, request, started, raw, upstream_resp.headers.get("content-encoding"),
+                       upstream_resp.status_code, model)
+    return _with_background(response, task)
@@ -34,11 +34,26 @@ def metrics() -> Response:
     lines = ["# bimo mock metrics"]
     for k, v in REQUEST_STATS.items():
         lines.append(f"bimo_request_stat{{name=\"{k}\"}} {v}")
+    try:
+        from ..services import semantic_cache
+        if semantic_cache._cache is not None:
+            for k, v in semantic_cache._cache.stats.items():
+                lines.append(f"bimo_semantic_cache_stat{{name=\"{k}\"}} {v}")
+            lines.append(f"bimo_semantic_cache_hit_rate {semantic_cache._cache.hit_rate():.4f}")
+    except Exception:
+        pass
+    try:
+        from ..services import bigquery_cache
+        if bigquery_cache._cache is not None:
+            for k, v in bigquery_cache._cache.stats.items():
+                lines.append(f"bimo_bigquery_cache_stat{{name=\"{k}\"}} {v}")
+    except Exception:
+        pass
     return Response("\n".join(lines) + "\n", media_type="text/plain")
 
 
 @router.get('/whoami')
 def whoami(request: Request):
     # Expose simple identity info for debugging: attached api_key role/org
-    ext = getattr(request.scope, 'extensions', {}) or {}
+    ext = request.scope.get('extensions') or {}
     return {"role": ext.get('api_key_role'), "org": ext.get('api_key_org')}
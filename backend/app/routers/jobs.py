@@ -0,0 +1,37 @@
+from typing import Optional
+
+from fastapi import APIRouter, Header, HTTPException
+from fastapi.responses import StreamingResponse
+
+from ..services import jobs
+from ..settings import settings
+
+router = APIRouter(prefix="/jobs", tags=["jobs"])
+
+
+def _job_or_404(job_id: str):
+    job = jobs.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail={"code": "JOB_NOT_FOUND", "message": "job not found or expired"})
+    return job
+
+
+@router.get("/{job_id}")
+def get_job(job_id: str, x_admin_token: Optional[str] = Header(default=None)):
+    """Status, progress and (once finished) the result of a background job."""
+    if x_admin_token != settings.ADMIN_API_KEY:
+        raise HTTPException(status_code=401, detail="unauthorized")
+    return jobs.public(_job_or_404(job_id))
+
+
+@router.get("/{job_id}/events")
+def stream_job_events(job_id: str, x_admin_token: Optional[str] = Header(default=None)):
+    """Server-sent ``progress`` events for a job, ending with a ``done`` event."""
+    if x_admin_token != settings.ADMIN_API_KEY:
+        raise HTTPException(status_code=401, detail="unauthorized")
+    _job_or_404(job_id)
+    return StreamingResponse(
+        jobs.job_events(job_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
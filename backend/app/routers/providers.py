@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Header, HTTPException, Depends, Response
+from fastapi import APIRouter, Header, HTTPException, Depends, Request, Response
 from pydantic import BaseModel
 from ..config import get_default_ai_model
 from typing import Optional, List
@@ -61,31 +61,54 @@ def catalog() -> dict:
     return {"data": items}
 
 @router.get("/connections")
-def connections(page: int = 1, per_page: int = 50, provider_id: Optional[str] = None, db: Session = Depends(get_db), response: Response = None):
-    # Use SQLAlchemy session to fetch provider connections
-    q = db.query(ProviderConnectionSA)
+def connections(page: int = 1, per_page: int = 50, provider_id: Optional[str] = None, cursor: Optional[int] = None, db: Session = Depends(get_db), response: Response = None):
+    """List connections one page at a time.
+
+    Pass ``cursor`` (the ``next_cursor`` from the previous page) for keyset
+    pagination on ``id``; without it ``page`` falls back to OFFSET paging.
+    ``last_used`` comes from a single grouped MAX(created_at) over api_logs
+    for the connections on the page (served by ix_api_logs_connection_created).
+    """
+    from sqlalchemy import func
+    per_page = max(1, min(int(per_page or 50), 200))
+    page = max(1, int(page or 1))
+
+    base = db.query(ProviderConnectionSA)
     if provider_id:
-        q = q.filter(ProviderConnectionSA.provider_id == provider_id)
-    items = q.all()
-    total = len(items)
-    # Return safe view (no encrypted credentials)
+        base = base.filter(ProviderConnectionSA.provider_id == provider_id)
+    # COUNT(*) without materialising rows
+    total = base.with_entities(func.count(ProviderConnectionSA.id)).scalar() or 0
+
+    q = base.order_by(ProviderConnectionSA.id)
+    if cursor is not None:
+        q = q.filter(ProviderConnectionSA.id > cursor)
+    else:
+        q = q.offset((page - 1) * per_page)
+    items = q.limit(per_page).all()
+
     # Compute last_used from ApiLog if available
     try:
         from ..models_sa import ApiLog  # local import to avoid cycles
     except Exception:
         ApiLog = None  # type: ignore
 
+    last_used = {}
+    if ApiLog is not None and items:
+        try:
+            rows = (
+                db.query(ApiLog.connection_id, func.max(ApiLog.created_at))
+                .filter(ApiLog.connection_id.in_([item.id for item in items]))
+                .group_by(ApiLog.connection_id)
+                .all()
+            )
+            last_used = {cid: ts for cid, ts in rows}
+        except Exception:
+            last_used = {}
+
+    # Return safe view (no encrypted credentials)
     data = []
     for item in items:
-        last_used_iso = None
-        if ApiLog is not None:
-            try:
-                # Query latest ApiLog for this connection
-                last = db.query(ApiLog).filter(getattr(ApiLog, 'connection_id') == item.id).order_by(ApiLog.created_at.desc()).first()
-                if last and getattr(last, 'created_at', None):
-                    last_used_iso = last.created_at.isoformat()
-            except Exception:
-                last_used_iso = None
+        ts = last_used.get(item.id)
         data.append({
             "id": item.id,
             "provider_id": item.provider_id,
@@ -94,17 +117,18 @@ def connections(page: int = 1, per_page: int = 50, provider_id: Optional[str] =
             "connection_type": getattr(item, 'connection_type', None),
             "connection_source": getattr(item, 'connection_source', None),
             "display_name": getattr(item, 'display_name', None),
-            "last_used": last_used_iso,
+            "last_used": ts.isoformat() if ts else None,
         })
+    next_cursor = items[-1].id if len(items) == per_page else None
     if response is not None:
         try:
             response.headers["X-Total-Count"] = str(total)
         except Exception:
             pass
-    return {"data": data, "meta": {"page": page, "per_page": per_page, "total": total}}
+    return {"data": data, "meta": {"page": page, "per_page": per_page, "total": total, "next_cursor": next_cursor}}
 
 @router.post("/{provider_id}/connect", status_code=201)
-def connect_provider(provider_id: str, body: ConnectProviderRequest, Idempotency_Key: Optional[str] = Header(default=None), db: Session = Depends(get_db)):
+def connect_provider(provider_id: str, body: ConnectProviderRequest, request: Request, Idempotency_Key: Optional[str] = Header(default=None), db: Session = Depends(get_db)):
     print(f">>> Starting provider connection for: {provider_id}")
     print(f">>> Request body: {body}")
     print(f">>> Idempotency Key: {Idempotency_Key}")
@@ -342,6 +366,8 @@ def connect_provider(provider_id: str, body: ConnectProviderRequest, Idempotency
         connection_type=conn_type,
         connection_source=conn_source,
         display_name=(body.display_name or None),
+        # Owned by the caller's org, whose API keys may then use it through the gateway
+        org_id=(request.scope.get("extensions") or {}).get("api_key_org"),
     )
     print(f">>> Database record created - Provider: {provider_id}, Type: {conn_type}, Source: {conn_source}")
     
@@ -480,29 +506,41 @@ def sync_provider_connection(connection_id: int, x_admin_token: Optional[str] =
     return {"enqueued": True}
 
 
-@router.post("/{connection_id}/sync-now", status_code=200)
+@router.post("/{connection_id}/sync-now", status_code=202)
 def sync_provider_connection_now(connection_id: int, x_admin_token: Optional[str] = Header(default=None)):
+    """Start a sync for one connection and return its job handle immediately.
+
+    Poll ``GET /v1/jobs/{id}`` (or stream ``/v1/jobs/{id}/events``) for
+    progress and the result. A sync already running for the connection is
+    returned instead of starting another.
+    """
     from ..settings import settings as _settings
+    from ..services import jobs
+    from ..workers.executor import QueueFull
+    from ..workers.tasks import start_sync_job
     if x_admin_token != _settings.ADMIN_API_KEY:
         raise HTTPException(status_code=401, detail="unauthorized")
-    # Run synchronously (no Celery required)
-    # Select worker based on provider id
+    db = next(get_db())
     try:
-        db = next(get_db())
+        conn = db.get(ProviderConnectionSA, connection_id)
+        provider = (conn.provider_id or "").lower() if conn else None
+    finally:
+        db.close()
+    if provider is None:
+        raise HTTPException(status_code=404, detail={"code": "CONNECTION_NOT_FOUND", "message": "connection not found"})
+    if provider not in ("gemini", "claude", "azure"):
+        provider = "openai"
+    job, created = jobs.create_job("sync", key=f"sync:{connection_id}", connection_id=connection_id, provider=provider)
+    if created:
         try:
-            conn = db.get(ProviderConnectionSA, connection_id)
-            provider = (conn.provider_id or "").lower() if conn else ""
-        finally:
-            db.close()
-        if provider == "gemini":
-            return sync_gemini_usage_for_connection.run(connection_id)
-        if provider == "claude":
-            return sync_claude_usage_for_connection.run(connection_id)
-        if provider == "azure":
-            return sync_azure_usage_for_connection.run(connection_id)
-        return sync_openai_usage_for_connection.run(connection_id)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+            start_sync_job(job["id"], connection_id, provider)
+        except QueueFull:
+            jobs.update_job(job["id"], status="failed", error="worker queue full")
+            raise HTTPException(status_code=503, detail={"code": "QUEUE_FULL", "message": "sync queue is full, retry later"})
+        except Exception as e:
+            jobs.update_job(job["id"], status="failed", error=str(e))
+            raise HTTPException(status_code=500, detail=str(e))
+    return jobs.public(job)
 
 
 class RotateKeyRequest(BaseModel):
@@ -570,6 +608,12 @@ def rotate_key(connection_id: int, body: RotateKeyRequest, x_admin_token: Option
     conn.encrypted_credentials = encrypt_json(_json.dumps(creds))
     db.add(AuditLog(actor="admin", action="provider_rotate_key", target=str(conn.id), detail=conn.provider_id))
     db.commit()
+    # Drop the gateway's cached copy of the old key
+    try:
+        from .gateway import invalidate_connection_credentials
+        invalidate_connection_credentials(conn.id)
+    except Exception:
+        pass
 
     # Best-effort: enqueue a usage sync so updated key populates data automatically
     try:
@@ -684,6 +728,22 @@ def get_provider_usage(connection_id: int, days: int = 30, db: Session = Depends
             'source': source,
         }
 
+        # Served from the locally synced billing export once a sync has run
+        try:
+            from ..workers.bigquery_sync import local_usage
+            usage = local_usage(db.connection(), conn.id, days=days)
+        except Exception:
+            usage = None
+        if usage is not None:
+            usage['source'] = source
+            return usage
+        if service_account_json and project_id:
+            try:
+                # First call for this connection: start the sync and answer live
+                sync_gemini_usage_for_connection.delay(conn.id)
+            except Exception:
+                pass
+
         if service_account_json and project_id:
             try:
                 from ..services.bigquery_service import BigQueryService
@@ -692,16 +752,18 @@ def get_provider_usage(connection_id: int, days: int = 30, db: Session = Depends
                 return safe_resp
 
             try:
-                bq = BigQueryService(service_account_json, project_id)
-                daily_spend = bq.get_daily_spend(dataset_id=dataset_id, days=days)
-                token_usage = bq.get_token_usage(dataset_id=dataset_id, days=days)
-                monthly_cost = bq.get_monthly_cost(dataset_id=dataset_id)
-                raw = bq.get_raw_usage(dataset_id=dataset_id, days=days)
+                # Client is cached per credentials; aggregates come from one scan
+                bq = BigQueryService(
+                    service_account_json, project_id,
+                    billing_account_id=(creds or {}).get('billing_account_id') or getattr(conn, 'billing_account_id', None),
+                    max_bytes=(creds or {}).get('bigquery_max_bytes'),
+                )
+                usage = bq.get_usage(dataset_id=dataset_id, days=days)
                 return {
-                    'daily_spend': daily_spend or [],
-                    'token_usage': token_usage or {'total_tokens': 0, 'by_day': []},
-                    'monthly_cost': monthly_cost or 0.0,
-                    'raw': raw or [],
+                    'daily_spend': usage.get('daily_spend') or [],
+                    'token_usage': usage.get('token_usage') or {'total_tokens': 0, 'by_day': []},
+                    'monthly_cost': usage.get('monthly_cost') or 0.0,
+                    'raw': usage.get('raw') or [],
                     'source': source,
                 }
             except Exception:
@@ -1,28 +1,73 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request
 from typing import Optional
 from sqlalchemy.orm import Session
 from ..db_sa import get_db
+from ..settings import settings
 
 router = APIRouter(prefix="/spend", tags=["spend"])
 
 
+def _caller_org(request: Request, x_admin_token: Optional[str]) -> Optional[str]:
+    """The calling API key's org; None (every org) only with the admin token."""
+    org_id = (request.scope.get("extensions") or {}).get("api_key_org")
+    if org_id is None and x_admin_token != settings.ADMIN_API_KEY:
+        raise HTTPException(status_code=401, detail={"code": "UNAUTHORIZED", "message": "org API key or admin token required"})
+    return org_id
+
+
 @router.get("/summary")
-def get_spend_summary(db: Session = Depends(get_db)):
-    # Aggregate invoices as a conservative billing-backed summary
-    try:
-        from ..models import Invoice
-        invoices = db.query(Invoice).all()
-        total = sum((i.amount or 0.0) for i in invoices)
-    except Exception:
-        total = 4240.0
-    return {"total": total, "ai": 1680.0, "cloud": 2080.0, "saas": 480.0}
+def get_spend_summary(
+    request: Request,
+    x_admin_token: Optional[str] = Header(default=None),
+    db: Session = Depends(get_db),
+):
+    """Headline spend (billing-backed) plus a per-source ai/cloud/saas breakdown.
+
+    Served from the per-org summary cache; a miss runs two grouped aggregates
+    over invoices and api_logs rather than loading rows. Org API keys see
+    their own org's usage; the all-org aggregate needs the admin token.
+    """
+    from ..services.spend_summary import get_summary_cache
+    org_id = _caller_org(request, x_admin_token)
+    return get_summary_cache().get(org_id, db.connection())
 
 
 @router.get("/trends")
-def get_spend_trends(db: Session = Depends(get_db)):
-    data = [
-        {"date": "2025-01-01", "total": 1200, "ai": 550, "cloud": 450, "saas": 200},
-        {"date": "2025-01-02", "total": 1350, "ai": 600, "cloud": 500, "saas": 250},
-        {"date": "2025-01-03", "total": 1150, "ai": 520, "cloud": 430, "saas": 200},
-    ]
-    return {"data": data, "meta": {}}
+def get_spend_trends(
+    request: Request,
+    from_: Optional[str] = Query(default=None, alias="from"),
+    to: Optional[str] = None,
+    granularity: str = "day",
+    group_by: Optional[str] = None,
+    provider: Optional[str] = None,
+    source: Optional[str] = None,
+    x_admin_token: Optional[str] = Header(default=None),
+    db: Session = Depends(get_db),
+):
+    """Spend time series read from the provider_metrics_* rollups.
+
+    ``from``/``to`` are inclusive dates (or datetimes), ``granularity`` is
+    hour|day|month and ``group_by`` a comma list of provider, category, model,
+    connection_id. Rows are always split by ``source``; ``meta.resolution``
+    reports which rollup table served the query.
+
+    Org API keys only see their own org's spend; reading across orgs needs
+    the admin token.
+    """
+    from ..services import spend_query
+    org_id = _caller_org(request, x_admin_token)
+    try:
+        start, end = spend_query.parse_range(from_, to)
+        data, meta = spend_query.spend_trends(
+            db.connection(),
+            start,
+            end,
+            granularity=granularity,
+            group_by=spend_query.parse_group_by(group_by),
+            provider=provider,
+            source=source,
+            org_id=org_id,
+        )
+    except spend_query.SpendQueryError as e:
+        raise HTTPException(status_code=400, detail={"code": "INVALID_QUERY", "message": str(e)})
+    return {"data": data, "meta": meta}
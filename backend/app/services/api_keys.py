@@ -0,0 +1,146 @@
+"""
+API key resolution for per-request RBAC.
+
+Keys are stored as SHA-256 digests (``apikey.key_hash``, unique index), so a
+lookup is a single indexed equality match and the database never holds a
+usable key. Resolved keys are kept in a bounded in-process LRU:
+
+- known keys for ``API_KEY_CACHE_TTL_SECONDS``;
+- unknown or revoked keys for ``API_KEY_NEGATIVE_TTL_SECONDS``, so repeated
+  requests with a bad key don't each cost a database round trip.
+
+Creating or revoking a key through the admin API invalidates its entry in
+this process; other processes pick the change up when their entry expires,
+which bounds how long a revoked key keeps working elsewhere.
+"""
+import asyncio
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, NamedTuple, Optional, Tuple
+
+from sqlalchemy import select
+
+from ..core import metrics
+from ..models import ApiKey
+from ..settings import settings
+
+_LOOKUPS = metrics.counter("bimo_api_key_lookups_total", "API key resolutions", ["result"])
+
+_MISS = object()
+
+
+class ApiKeyInfo(NamedTuple):
+    id: int
+    role: str
+    org_id: Optional[str]
+    rate_limit: Optional[str]
+
+
+def hash_key(key: str) -> str:
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+def load_key(key_hash: str) -> Optional[ApiKeyInfo]:
+    """Indexed lookup of an active key by digest."""
+    from ..db import engine
+    t = ApiKey.__table__
+    with engine.connect() as conn:
+        row = conn.execute(
+            select(t.c.id, t.c.role, t.c.org_id, t.c.rate_limit)
+            .where(t.c.key_hash == key_hash, t.c.revoked_at.is_(None))
+        ).first()
+    return ApiKeyInfo(row.id, row.role or "analyst", row.org_id, row.rate_limit) if row else None
+
+
+class ApiKeyResolver:
+    """LRU of key digest -> ``ApiKeyInfo`` (or ``None`` for unknown keys)."""
+
+    def __init__(self, ttl_seconds: float, negative_ttl_seconds: float, max_entries: int,
+                 loader: Callable[[str], Optional[ApiKeyInfo]] = load_key) -> None:
+        self.ttl_seconds = ttl_seconds
+        self.negative_ttl_seconds = negative_ttl_seconds
+        self.max_entries = max_entries
+        self.loader = loader
+        self._entries: "OrderedDict[str, Tuple[float, Optional[ApiKeyInfo]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Bumped on invalidation so a lookup racing a revoke is not cached stale
+        self._generation = 0
+
+    def _cached(self, key_hash: str):
+        with self._lock:
+            item = self._entries.get(key_hash)
+            if item is None or item[0] <= time.monotonic():
+                if item is not None:
+                    del self._entries[key_hash]
+                return _MISS, self._generation
+            self._entries.move_to_end(key_hash)
+            return item[1], self._generation
+
+    def _store(self, key_hash: str, info: Optional[ApiKeyInfo], generation: int) -> None:
+        ttl = self.ttl_seconds if info is not None else self.negative_ttl_seconds
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._entries[key_hash] = (time.monotonic() + ttl, info)
+            self._entries.move_to_end(key_hash)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def resolve(self, key: str) -> Optional[ApiKeyInfo]:
+        key_hash = hash_key(key)
+        info, generation = self._cached(key_hash)
+        if info is not _MISS:
+            _LOOKUPS.labels(result="hit" if info is not None else "negative_hit").inc()
+            return info
+        _LOOKUPS.labels(result="miss").inc()
+        info = self.loader(key_hash)
+        self._store(key_hash, info, generation)
+        return info
+
+    async def aresolve(self, key: str) -> Optional[ApiKeyInfo]:
+        """``resolve`` that runs cache misses off the event loop."""
+        key_hash = hash_key(key)
+        info, generation = self._cached(key_hash)
+        if info is not _MISS:
+            _LOOKUPS.labels(result="hit" if info is not None else "negative_hit").inc()
+            return info
+        _LOOKUPS.labels(result="miss").inc()
+        info = await asyncio.to_thread(self.loader, key_hash)
+        self._store(key_hash, info, generation)
+        return info
+
+    def invalidate(self, key_hash: Optional[str] = None) -> None:
+        """Drop one digest's entry, or every entry when ``key_hash`` is None."""
+        with self._lock:
+            self._generation += 1
+            if key_hash is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key_hash, None)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+_resolver: Optional[ApiKeyResolver] = None
+_resolver_lock = threading.Lock()
+
+
+def get_api_key_resolver() -> ApiKeyResolver:
+    global _resolver
+    if _resolver is None:
+        with _resolver_lock:
+            if _resolver is None:
+                _resolver = ApiKeyResolver(
+                    settings.API_KEY_CACHE_TTL_SECONDS,
+                    settings.API_KEY_NEGATIVE_TTL_SECONDS,
+                    settings.API_KEY_CACHE_MAX_ENTRIES,
+                )
+    return _resolver
+
+
+def invalidate_api_key(key_hash: Optional[str] = None) -> None:
+    if _resolver is not None:
+        _resolver.invalidate(key_hash)
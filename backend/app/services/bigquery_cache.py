@@ -0,0 +1,151 @@
+"""
+Result cache for BigQuery billing-export queries.
+
+Billing exports land a few times a day, so query results are kept per
+(project, dataset, query kind, days) and served:
+
+- fresh for ``BIGQUERY_CACHE_TTL_SECONDS``;
+- stale for a further ``BIGQUERY_CACHE_STALE_SECONDS``, returned immediately
+  while a single background refresh replaces the entry;
+- otherwise loaded synchronously.
+
+Loads are single-flight: concurrent callers for the same key wait on the one
+in-flight query instead of issuing their own. Every hit also credits the
+bytes the cached query was billed for to ``bimo_bigquery_cache_bytes_saved_total``.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Executor, Future
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+from ..core import metrics
+
+logger = logging.getLogger(__name__)
+
+# A loader returns (value, bytes billed for the query that produced it)
+Loader = Callable[[], Tuple[Any, int]]
+
+_REQUESTS = metrics.counter("bimo_bigquery_cache_requests_total", "BigQuery result cache lookups", ["kind", "result"])
+_BYTES_SAVED = metrics.counter("bimo_bigquery_cache_bytes_saved_total", "BigQuery bytes billed avoided by cache hits", ["kind"])
+
+
+class _Entry:
+    __slots__ = ("value", "bytes_billed", "fetched_at")
+
+    def __init__(self, value: Any, bytes_billed: int, fetched_at: float) -> None:
+        self.value = value
+        self.bytes_billed = bytes_billed
+        self.fetched_at = fetched_at
+
+
+class ResultCache:
+    def __init__(self, ttl_seconds: float, stale_seconds: float, max_entries: int = 1000,
+                 executor: Optional[Executor] = None) -> None:
+        self.ttl_seconds = ttl_seconds
+        self.stale_seconds = stale_seconds
+        self.max_entries = max_entries
+        self.executor = executor
+        self.stats: Dict[str, int] = {"hits": 0, "stale_hits": 0, "misses": 0, "coalesced": 0, "refreshes": 0, "bytes_saved": 0}
+        self._entries: "OrderedDict[Hashable, _Entry]" = OrderedDict()
+        self._inflight: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, kind: str, loader: Loader) -> Any:
+        now = time.monotonic()
+        leader = False
+        with self._lock:
+            entry = self._entries.get(key)
+            age = now - entry.fetched_at if entry is not None else None
+            if entry is not None and age < self.ttl_seconds:
+                self._entries.move_to_end(key)
+                self._hit(kind, entry, "hit")
+                return entry.value
+            if entry is not None and age < self.ttl_seconds + self.stale_seconds:
+                self._entries.move_to_end(key)
+                self._hit(kind, entry, "stale")
+                if key not in self._inflight:
+                    self._inflight[key] = Future()
+                    self._refresh_in_background(key, kind, loader)
+                return entry.value
+            fut = self._inflight.get(key)
+            if fut is None:
+                fut = self._inflight[key] = Future()
+                leader = True
+                self.stats["misses"] += 1
+            else:
+                self.stats["coalesced"] += 1
+        if not leader:
+            _REQUESTS.labels(kind=kind, result="coalesced").inc()
+            return fut.result()
+        _REQUESTS.labels(kind=kind, result="miss").inc()
+        return self._load(key, loader, fut)
+
+    def _hit(self, kind: str, entry: _Entry, result: str) -> None:
+        self.stats["hits" if result == "hit" else "stale_hits"] += 1
+        self.stats["bytes_saved"] += entry.bytes_billed
+        _REQUESTS.labels(kind=kind, result=result).inc()
+        _BYTES_SAVED.labels(kind=kind).inc(entry.bytes_billed)
+
+    def _load(self, key: Hashable, loader: Loader, fut: Future) -> Any:
+        try:
+            value, bytes_billed = loader()
+        except BaseException as e:
+            with self._lock:
+                self._inflight.pop(key, None)
+            fut.set_exception(e)
+            raise
+        with self._lock:
+            self._entries[key] = _Entry(value, int(bytes_billed or 0), time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._inflight.pop(key, None)
+        fut.set_result(value)
+        return value
+
+    def _refresh_in_background(self, key: Hashable, kind: str, loader: Loader) -> None:
+        fut = self._inflight[key]
+        self.stats["refreshes"] += 1
+
+        def run() -> None:
+            try:
+                self._load(key, loader, fut)
+            except Exception as e:
+                # The stale entry keeps being served until it ages out
+                logger.warning("background refresh of %s failed: %s", kind, e)
+
+        if self.executor is None:
+            threading.Thread(target=run, name="bq-cache-refresh", daemon=True).start()
+        else:
+            self.executor.submit(run)
+
+    def invalidate(self, match: Optional[Callable[[Hashable], bool]] = None) -> None:
+        with self._lock:
+            if match is None:
+                self._entries.clear()
+            else:
+                for key in [k for k in self._entries if match(k)]:
+                    del self._entries[key]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+_cache: Optional[ResultCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_result_cache() -> ResultCache:
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                from ..settings import settings
+                _cache = ResultCache(
+                    settings.BIGQUERY_CACHE_TTL_SECONDS,
+                    settings.BIGQUERY_CACHE_STALE_SECONDS,
+                    settings.BIGQUERY_CACHE_MAX_ENTRIES,
+                )
+    return _cache
@@ -0,0 +1,145 @@
+"""
+Query planning for the GCP billing export.
+
+Builds the SQL used by ``BigQueryService`` so that every query can be pruned:
+
+- the export's ingestion-time partitions are bounded with ``_PARTITIONTIME``
+  (rows are exported after their usage, so usage since a date always lives in
+  partitions since that date);
+- usage filters compare ``usage_start_time`` to a timestamp parameter instead
+  of wrapping the column in ``DATE()``;
+- the wildcard table is narrowed with ``_TABLE_SUFFIX`` to the connection's
+  billing account when it is known.
+
+Values are passed as query parameters, never interpolated. Each query kind
+has one or more candidate plans, cheapest last; ``choose_plan`` dry-runs
+them in order and picks the first whose estimate fits the byte budget,
+raising ``QueryBudgetExceeded`` when none does.
+"""
+import logging
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+
+from ..core import metrics
+
+logger = logging.getLogger(__name__)
+
+# (name, BigQuery type, value)
+Param = Tuple[str, str, Any]
+
+EXPORT_TABLE_PREFIX = "gcp_billing_export_v1_"
+RAW_COLUMNS = (
+    "usage_start_time, usage_end_time, service.description AS service, sku.description AS sku, "
+    "cost, currency, usage.amount AS usage_amount, usage.unit AS usage_unit"
+)
+RAW_DOWNGRADE_DAYS = 7
+# Vertex AI / Gemini bill tokens as SKUs like "... Input Tokens"
+TOKENS_EXPR = "IF(LOWER(sku.description) LIKE '%token%', usage.amount, 0)"
+
+_BYTES_SCANNED = metrics.counter("bimo_bigquery_bytes_scanned_total", "Bytes processed by BigQuery queries", ["kind"])
+_BYTES_ESTIMATED = metrics.histogram(
+    "bimo_bigquery_estimated_bytes", "Dry-run byte estimates of BigQuery queries", ["kind"],
+    buckets=(1e6, 1e7, 1e8, 1e9, 1e10, 1e11, 1e12),
+)
+_GUARDED = metrics.counter("bimo_bigquery_queries_guarded_total", "BigQuery queries downgraded or refused by the byte budget", ["kind", "action"])
+
+
+class QueryBudgetExceeded(Exception):
+    def __init__(self, kind: str, estimated_bytes: int, budget: int) -> None:
+        super().__init__(f"{kind} query would scan {estimated_bytes} bytes (budget {budget})")
+        self.kind = kind
+        self.estimated_bytes = estimated_bytes
+        self.budget = budget
+
+
+class QueryPlan:
+    __slots__ = ("kind", "sql", "params", "note")
+
+    def __init__(self, kind: str, sql: str, params: Sequence[Param], note: str = "") -> None:
+        self.kind = kind
+        self.sql = sql
+        self.params = list(params)
+        self.note = note
+
+    def __repr__(self) -> str:
+        return f"QueryPlan({self.kind!r}, note={self.note!r})"
+
+
+def table_suffix(billing_account_id: str) -> str:
+    """Table-name form of a billing account id (``0123AB-...`` -> ``0123AB_...``)."""
+    return billing_account_id.strip().replace("-", "_").upper()
+
+
+def record_scanned(kind: str, bytes_processed: int) -> None:
+    _BYTES_SCANNED.labels(kind=kind).inc(max(int(bytes_processed or 0), 0))
+
+
+class BillingQueryBuilder:
+    def __init__(self, project_id: str, dataset_id: str, billing_account_id: Optional[str] = None) -> None:
+        self.project_id = project_id
+        self.dataset_id = dataset_id
+        self.billing_account_id = billing_account_id
+
+    @property
+    def table(self) -> str:
+        return f"`{self.project_id}.{self.dataset_id}.{EXPORT_TABLE_PREFIX}*`"
+
+    def _where(self, since: date) -> Tuple[str, List[Param]]:
+        since_ts = datetime.combine(since, time.min, tzinfo=timezone.utc)
+        clauses = ["_PARTITIONTIME >= @since", "usage_start_time >= @since"]
+        params: List[Param] = [("since", "TIMESTAMP", since_ts)]
+        if self.billing_account_id:
+            clauses.insert(0, "_TABLE_SUFFIX = @table_suffix")
+            params.append(("table_suffix", "STRING", table_suffix(self.billing_account_id)))
+        return " AND ".join(clauses), params
+
+    def daily_aggregates(self, days: int, today: date) -> List[QueryPlan]:
+        """Per-day cost/tokens covering the trailing window and the current month."""
+        window_start = today - timedelta(days=int(days))
+        month_start = today.replace(day=1)
+        where, params = self._where(min(window_start, month_start))
+        sql = (
+            f"SELECT DATE(usage_start_time) AS day, SUM(cost) AS cost, SUM({TOKENS_EXPR}) AS tokens, "
+            "DATE(usage_start_time) >= @window_start AS in_window, "
+            "DATE(usage_start_time) >= @month_start AS in_month "
+            f"FROM {self.table} WHERE {where} "
+            "GROUP BY day, in_window, in_month ORDER BY day"
+        )
+        params += [("window_start", "DATE", window_start), ("month_start", "DATE", month_start)]
+        return [QueryPlan("daily_aggregates", sql, params)]
+
+    def monthly_cost(self, today: date) -> List[QueryPlan]:
+        where, params = self._where(today.replace(day=1))
+        sql = f"SELECT SUM(cost) AS total_cost FROM {self.table} WHERE {where}"
+        return [QueryPlan("monthly_cost", sql, params)]
+
+    def raw_usage(self, days: int, today: date, limit: int = 1000) -> List[QueryPlan]:
+        """All columns, then a fixed column set, then a shorter window."""
+        plans = []
+        candidates = [("*", int(days), "")]
+        candidates.append((RAW_COLUMNS, int(days), "columns"))
+        if int(days) > RAW_DOWNGRADE_DAYS:
+            candidates.append((RAW_COLUMNS, RAW_DOWNGRADE_DAYS, f"columns,{RAW_DOWNGRADE_DAYS}d"))
+        for columns, window, note in candidates:
+            where, params = self._where(today - timedelta(days=window))
+            sql = f"SELECT {columns} FROM {self.table} WHERE {where} ORDER BY usage_start_time DESC LIMIT @row_limit"
+            plans.append(QueryPlan("raw_usage", sql, params + [("row_limit", "INT64", int(limit))], note))
+        return plans
+
+
+def choose_plan(plans: Sequence[QueryPlan], estimate: Callable[[QueryPlan], int],
+                budget: Optional[int]) -> Tuple[QueryPlan, int]:
+    """First plan whose dry-run estimate fits ``budget`` (no limit when falsy)."""
+    smallest = None
+    for i, plan in enumerate(plans):
+        estimated = int(estimate(plan) or 0)
+        _BYTES_ESTIMATED.labels(kind=plan.kind).observe(estimated)
+        if not budget or estimated <= budget:
+            if i:
+                _GUARDED.labels(kind=plan.kind, action="downgraded").inc()
+                logger.info("%s downgraded to '%s' (%s bytes, budget %s)", plan.kind, plan.note, estimated, budget)
+            return plan, estimated
+        smallest = estimated if smallest is None else min(smallest, estimated)
+    kind = plans[0].kind
+    _GUARDED.labels(kind=kind, action="refused").inc()
+    raise QueryBudgetExceeded(kind, smallest or 0, int(budget or 0))
@@ -6,37 +6,165 @@ google-cloud-bigquery library and when unavailable provides safe no-op
 responses so the rest of the application can continue to operate.
 
 When BigQuery is available, the class exposes helper methods used by the
-providers router: get_daily_spend, get_token_usage, get_monthly_cost, get_raw_usage.
+providers router: get_usage (everything the usage endpoint needs, in one
+aggregate scan plus the raw-row query run concurrently), and the older
+get_daily_spend, get_token_usage, get_monthly_cost, get_raw_usage.
+
+``bigquery.Client`` objects are cached per (service account, project) and
+dropped after ``BIGQUERY_CLIENT_IDLE_SECONDS`` without use, so a request only
+pays for credential parsing and client construction the first time. Query
+results go through the stale-while-revalidate cache in ``bigquery_cache``.
+
+SQL comes from the planner in ``bigquery_query`` (partition and
+``_TABLE_SUFFIX`` pruning, query parameters); each query is dry-run first and
+downgraded or refused when it would exceed the connection's byte budget.
 """
-from typing import Any, Dict, List
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from ..settings import settings
+from .bigquery_query import BillingQueryBuilder, QueryBudgetExceeded, QueryPlan, choose_plan, record_scanned
+
+logger = logging.getLogger(__name__)
+
+
+def _build_client(service_account_json: Any, project_id: str):
+    try:
+        # Lazy import to avoid forcing the dependency in dev where it's
+        # not needed.
+        from google.cloud import bigquery  # type: ignore
+        from google.oauth2 import service_account  # type: ignore
+        sa_info = json.loads(service_account_json) if isinstance(service_account_json, str) else service_account_json
+        # Construct credentials explicitly from provided service account JSON
+        # and scope them to BigQuery read-only.
+        try:
+            creds = service_account.Credentials.from_service_account_info(
+                sa_info,
+                scopes=["https://www.googleapis.com/auth/bigquery.readonly"],
+            )
+            return bigquery.Client(project=project_id, credentials=creds)
+        except Exception:
+            # As a fallback, attempt default client (useful in dev when SA not required)
+            return bigquery.Client(project=project_id)
+    except Exception:
+        # If BigQuery client isn't available or fails to initialize, methods
+        # will return safe empty shapes.
+        return None
+
+
+def credentials_key(service_account_json: Any, project_id: str) -> str:
+    """Digest identifying a (service account, project) pair; never the secret itself."""
+    raw = service_account_json if isinstance(service_account_json, str) else json.dumps(service_account_json, sort_keys=True)
+    return hashlib.sha256(f"{project_id}|{raw}".encode("utf-8")).hexdigest()
+
+
+class ClientCache:
+    """LRU of BigQuery clients with idle eviction.
+
+    Failed constructions (``None``) are not cached so a transient failure is
+    retried on the next request.
+    """
+
+    def __init__(self, factory: Callable[[Any, str], Any] = _build_client,
+                 idle_seconds: float = 900.0, max_clients: int = 32) -> None:
+        self.factory = factory
+        self.idle_seconds = idle_seconds
+        self.max_clients = max_clients
+        self._clients: "OrderedDict[str, Tuple[Any, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, service_account_json: Any, project_id: str):
+        key = credentials_key(service_account_json, project_id)
+        now = time.monotonic()
+        with self._lock:
+            self._evict_idle(now)
+            item = self._clients.get(key)
+            if item is not None:
+                self._clients[key] = (item[0], now)
+                self._clients.move_to_end(key)
+                return item[0]
+        client = self.factory(service_account_json, project_id)
+        if client is None:
+            return None
+        with self._lock:
+            existing = self._clients.get(key)
+            if existing is not None:
+                # Another request built one concurrently; keep the first
+                self._close(client)
+                client = existing[0]
+            self._clients[key] = (client, now)
+            self._clients.move_to_end(key)
+            while len(self._clients) > self.max_clients:
+                _, (old, _) = self._clients.popitem(last=False)
+                self._close(old)
+        return client
+
+    def invalidate(self, service_account_json: Any, project_id: str) -> None:
+        with self._lock:
+            item = self._clients.pop(credentials_key(service_account_json, project_id), None)
+        if item is not None:
+            self._close(item[0])
+
+    def _evict_idle(self, now: float) -> None:
+        while self._clients:
+            key, (client, last_used) = next(iter(self._clients.items()))
+            if now - last_used < self.idle_seconds:
+                break
+            del self._clients[key]
+            self._close(client)
+
+    @staticmethod
+    def _close(client) -> None:
+        try:
+            client.close()
+        except Exception:
+            pass
+
+    def __len__(self) -> int:
+        return len(self._clients)
+
+
+_clients = ClientCache(
+    idle_seconds=settings.BIGQUERY_CLIENT_IDLE_SECONDS,
+    max_clients=settings.BIGQUERY_CLIENT_MAX,
+)
+# Shared by all services so concurrent queries never spawn unbounded threads
+_query_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="bq-query")
 
 
 class BigQueryService:
-    def __init__(self, service_account_json: str, project_id: str):
+    def __init__(self, service_account_json: str, project_id: str,
+                 billing_account_id: Optional[str] = None, max_bytes: Optional[int] = None):
         self.project_id = project_id
-        self._client = None
+        self.billing_account_id = billing_account_id
+        # Per-connection byte budget for a single query; 0 disables the guard
+        self.max_bytes = settings.BIGQUERY_MAX_BYTES_PER_QUERY if max_bytes is None else int(max_bytes)
+        self._creds_key = credentials_key(service_account_json, project_id)
+        self._client = _clients.get(service_account_json, project_id)
+
+    @staticmethod
+    def _job_config(plan: Optional[QueryPlan] = None, **kwargs):
         try:
-            # Lazy import to avoid forcing the dependency in dev where it's
-            # not needed.
             from google.cloud import bigquery  # type: ignore
-            from google.oauth2 import service_account  # type: ignore
-            import json
-            sa_info = json.loads(service_account_json) if isinstance(service_account_json, str) else service_account_json
-            # Construct credentials explicitly from provided service account JSON
-            # and scope them to BigQuery read-only.
-            try:
-                creds = service_account.Credentials.from_service_account_info(
-                    sa_info,
-                    scopes=["https://www.googleapis.com/auth/bigquery.readonly"],
-                )
-                self._client = bigquery.Client(project=project_id, credentials=creds)
-            except Exception:
-                # As a fallback, attempt default client (useful in dev when SA not required)
-                self._client = bigquery.Client(project=project_id)
         except Exception:
-            # If BigQuery client isn't available or fails to initialize, keep
-            # _client as None and methods will return safe empty shapes.
-            self._client = None
+            return None
+        params = [bigquery.ScalarQueryParameter(name, type_, value) for name, type_, value in (plan.params if plan else [])]
+        return bigquery.QueryJobConfig(query_parameters=params, **kwargs)
+
+    def _query(self, sql: str, plan: Optional[QueryPlan] = None, max_bytes: int = 0) -> Tuple[List[Dict[str, Any]], int]:
+        job_config = self._job_config(plan, maximum_bytes_billed=max_bytes or None) if plan else None
+        query_job = self._client.query(sql, job_config=job_config) if job_config is not None else self._client.query(sql)
+        rows = [dict(row) for row in query_job]
+        if plan is not None:
+            record_scanned(plan.kind, getattr(query_job, 'total_bytes_processed', 0) or 0)
+        return rows, int(getattr(query_job, 'total_bytes_billed', 0) or 0)
 
     def _run_query(self, sql: str) -> List[Dict[str, Any]]:
         """Run a SQL query and return list of rows as dicts.
@@ -45,32 +173,94 @@ class BigQueryService:
         """
         if not self._client:
             return []
-        query_job = self._client.query(sql)
-        return [dict(row) for row in query_job]
+        return self._query(sql)[0]
+
+    def estimate_bytes(self, plan: QueryPlan) -> int:
+        """Bytes the query would process, from a (free) dry run."""
+        job_config = self._job_config(plan, dry_run=True, use_query_cache=False)
+        job = self._client.query(plan.sql, job_config=job_config)
+        return int(getattr(job, 'total_bytes_processed', 0) or 0)
+
+    def _run_plans(self, plans: List[QueryPlan]) -> Tuple[List[Dict[str, Any]], int]:
+        if settings.BIGQUERY_DRY_RUN_ENABLED:
+            plan, _ = choose_plan(plans, self.estimate_bytes, self.max_bytes)
+        else:
+            plan = plans[0]
+        # maximum_bytes_billed makes BigQuery itself enforce the budget
+        return self._query(plan.sql, plan, self.max_bytes)
+
+    def _cached_query(self, dataset_id: str, days: int, plans: List[QueryPlan]) -> List[Dict[str, Any]]:
+        """Run the cheapest acceptable plan through the shared result cache (see bigquery_cache)."""
+        if not self._client:
+            return []
+        kind = plans[0].kind
+        if not settings.BIGQUERY_CACHE_ENABLED:
+            return self._run_plans(plans)[0]
+        from .bigquery_cache import get_result_cache
+        # The credentials digest keeps tenants sharing a project from reading
+        # each other's cached results
+        key = (self._creds_key, self.project_id, dataset_id, self.billing_account_id, kind, days)
+        return get_result_cache().get(key, kind, lambda: self._run_plans(plans))
+
+    def _builder(self, dataset_id: str) -> BillingQueryBuilder:
+        return BillingQueryBuilder(self.project_id, dataset_id, self.billing_account_id)
+
+    @staticmethod
+    def _today() -> date:
+        return datetime.now(timezone.utc).date()
+
+    def _daily_aggregates(self, dataset_id: str, days: int) -> List[Dict[str, Any]]:
+        """One scan producing per-day cost and tokens for both the trailing
+        window and the current month (whichever starts earlier)."""
+        days = int(days)
+        return self._cached_query(dataset_id, days, self._builder(dataset_id).daily_aggregates(days, self._today()))
+
+    @staticmethod
+    def _split_aggregates(rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+        window = [r for r in rows if r.get('in_window')]
+        by_day = [{'day': r.get('day'), 'tokens': r.get('tokens')} for r in window]
+        return {
+            'daily_spend': [{'day': r.get('day'), 'cost': r.get('cost')} for r in window],
+            'token_usage': {'total_tokens': sum([r.get('tokens', 0) or 0 for r in window]), 'by_day': by_day},
+            'monthly_cost': float(sum([r.get('cost') or 0.0 for r in rows if r.get('in_month')])),
+        }
+
+    def get_usage(self, dataset_id: str, days: int = 30) -> Dict[str, Any]:
+        """Daily spend, token usage, month-to-date cost and raw rows.
+
+        The aggregates come from a single scan; the raw-row query runs
+        concurrently with it. Raw rows are dropped, not the whole response,
+        when even the cheapest raw query exceeds the byte budget.
+        """
+        if not self._client:
+            return {'daily_spend': [], 'token_usage': {'total_tokens': 0, 'by_day': []}, 'monthly_cost': 0.0, 'raw': []}
+        raw = _query_pool.submit(self.get_raw_usage, dataset_id, days)
+        try:
+            out = self._split_aggregates(self._daily_aggregates(dataset_id, days))
+        finally:
+            try:
+                raw_rows = raw.result()
+            except QueryBudgetExceeded as e:
+                logger.warning("raw rows query skipped: %s", e)
+                raw_rows = []
+        out['raw'] = raw_rows
+        return out
 
     def get_daily_spend(self, dataset_id: str, days: int = 30) -> List[Dict[str, Any]]:
         # Return empty list when client not present or no data
         if not self._client:
             return []
-        # Placeholder example query; real implementations should match the
-        # billing export schema used in the user's GCP project.
-        sql = f"SELECT DATE(usage_start_time) as day, SUM(cost) as cost FROM `{self.project_id}.{dataset_id}.gcp_billing_export_v1_*` WHERE DATE(usage_start_time) >= DATE_SUB(CURRENT_DATE(), INTERVAL {days} DAY) GROUP BY day ORDER BY day"
-        return self._run_query(sql)
+        return self._split_aggregates(self._daily_aggregates(dataset_id, days))['daily_spend']
 
     def get_token_usage(self, dataset_id: str, days: int = 30) -> Dict[str, Any]:
         if not self._client:
             return {"total_tokens": 0, "by_day": []}
-        # Placeholder - users should adapt to their billing schema
-        sql = f"SELECT DATE(usage_start_time) as day, SUM(tokens) as tokens FROM `{self.project_id}.{dataset_id}.gcp_billing_export_v1_*` WHERE DATE(usage_start_time) >= DATE_SUB(CURRENT_DATE(), INTERVAL {days} DAY) GROUP BY day ORDER BY day"
-        rows = self._run_query(sql)
-        total = sum([r.get('tokens', 0) or 0 for r in rows])
-        return {"total_tokens": total, "by_day": rows}
+        return self._split_aggregates(self._daily_aggregates(dataset_id, days))['token_usage']
 
     def get_monthly_cost(self, dataset_id: str) -> float:
         if not self._client:
             return 0.0
-        sql = f"SELECT SUM(cost) as total_cost FROM `{self.project_id}.{dataset_id}.gcp_billing_export_v1_*` WHERE DATE_TRUNC(DATE(usage_start_time), MONTH) = DATE_TRUNC(CURRENT_DATE(), MONTH)"
-        rows = self._run_query(sql)
+        rows = self._cached_query(dataset_id, 0, self._builder(dataset_id).monthly_cost(self._today()))
         if rows and isinstance(rows, list) and len(rows) > 0:
             return float(rows[0].get('total_cost') or 0.0)
         return 0.0
@@ -78,10 +268,4 @@ class BigQueryService:
     def get_raw_usage(self, dataset_id: str, days: int = 30) -> List[Dict[str, Any]]:
         if not self._client:
             return []
-        sql = f"SELECT * FROM `{self.project_id}.{dataset_id}.gcp_billing_export_v1_*` WHERE DATE(usage_start_time) >= DATE_SUB(CURRENT_DATE(), INTERVAL {days} DAY) LIMIT 1000"
-        return self._run_query(sql)
-
-
-
-
-
+        return self._cached_query(dataset_id, int(days), self._builder(dataset_id).raw_usage(int(days), self._today()))
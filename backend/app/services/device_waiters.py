@@ -0,0 +1,160 @@
+"""
+Wake-ups for CLI device-flow long polls.
+
+``POST /v1/cli/device/poll`` with ``wait`` holds the request on an
+in-process registry keyed by ``device_code`` instead of having the CLI poll
+the database every few seconds. ``device_approve`` calls ``notify``, which
+wakes waiters in this process at once and, with ``REDIS_URL`` set,
+publishes the device code on ``CHANNEL`` so the process holding the CLI's
+request (possibly on another node) wakes too. Woken polls re-read the
+device row; the token itself never travels over pub/sub.
+
+At most ``DEVICE_POLL_MAX_WAITERS`` polls wait per process; beyond that
+``register`` returns None and the poll answers immediately, so the CLI falls
+back to interval polling rather than piling up held connections.
+"""
+import asyncio
+import logging
+import threading
+from typing import Dict, Optional, Set
+
+from ..core import metrics
+from ..settings import settings
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "bimo:cli:device-approved"
+
+_WAITERS = metrics.gauge("bimo_device_poll_waiters", "CLI device polls currently held open")
+_WAKEUPS = metrics.counter("bimo_device_poll_wakeups_total", "Device poll outcomes", ["result"])
+
+
+class Waiter:
+    __slots__ = ("device_code", "loop", "event")
+
+    def __init__(self, device_code: str, loop: asyncio.AbstractEventLoop) -> None:
+        self.device_code = device_code
+        self.loop = loop
+        self.event = asyncio.Event()
+
+    async def wait(self, timeout: float) -> bool:
+        """True when woken by an approval, False on timeout."""
+        try:
+            await asyncio.wait_for(self.event.wait(), timeout)
+        except asyncio.TimeoutError:
+            _WAKEUPS.labels(result="timeout").inc()
+            return False
+        _WAKEUPS.labels(result="woken").inc()
+        return True
+
+
+class DeviceWaiters:
+    def __init__(self, max_waiters: int = 1000) -> None:
+        self.max_waiters = max_waiters
+        self._waiters: Dict[str, Set[Waiter]] = {}
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def register(self, device_code: str) -> Optional[Waiter]:
+        """Must be called from the event loop; None when the cap is reached."""
+        waiter = Waiter(device_code, asyncio.get_running_loop())
+        with self._lock:
+            if self._count >= self.max_waiters:
+                _WAKEUPS.labels(result="rejected").inc()
+                return None
+            self._waiters.setdefault(device_code, set()).add(waiter)
+            self._count += 1
+        _WAITERS.inc()
+        return waiter
+
+    def discard(self, waiter: Waiter) -> None:
+        with self._lock:
+            waiters = self._waiters.get(waiter.device_code)
+            if not waiters or waiter not in waiters:
+                return
+            waiters.discard(waiter)
+            if not waiters:
+                del self._waiters[waiter.device_code]
+            self._count -= 1
+        _WAITERS.dec()
+
+    def wake(self, device_code: str) -> int:
+        """Wake this process's waiters for ``device_code``; safe from any thread."""
+        with self._lock:
+            waiters = list(self._waiters.get(device_code, ()))
+        for waiter in waiters:
+            try:
+                waiter.loop.call_soon_threadsafe(waiter.event.set)
+            except RuntimeError:
+                # The waiter's loop has shut down; nothing left to wake
+                pass
+        return len(waiters)
+
+    def __len__(self) -> int:
+        return self._count
+
+
+_registry: Optional[DeviceWaiters] = None
+_registry_lock = threading.Lock()
+_publisher = None
+_listener: Optional[asyncio.Task] = None
+
+
+def get_device_waiters() -> DeviceWaiters:
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = DeviceWaiters(settings.DEVICE_POLL_MAX_WAITERS)
+    return _registry
+
+
+def notify(device_code: str) -> None:
+    """Wake polls for an approved device here and, through Redis, on every node."""
+    global _publisher
+    get_device_waiters().wake(device_code)
+    if not settings.REDIS_URL:
+        return
+    try:
+        if _publisher is None:
+            import redis  # type: ignore
+            _publisher = redis.Redis.from_url(settings.REDIS_URL, socket_timeout=1.0, socket_connect_timeout=1.0)
+        _publisher.publish(CHANNEL, device_code)
+    except Exception as e:
+        # Pollers on other nodes still see the approval when their wait times out
+        logger.warning("device waiter publish failed: %s", e)
+
+
+async def _listen(url: str) -> None:
+    import redis.asyncio as aioredis  # type: ignore
+    registry = get_device_waiters()
+    while True:
+        client = aioredis.from_url(url)
+        try:
+            pubsub = client.pubsub(ignore_subscribe_messages=True)
+            await pubsub.subscribe(CHANNEL)
+            async for message in pubsub.listen():
+                data = message.get("data")
+                if isinstance(data, bytes):
+                    registry.wake(data.decode("utf-8", "replace"))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning("redis subscription lost, retrying: %s", e)
+            await asyncio.sleep(5)
+        finally:
+            try:
+                await client.aclose()
+            except Exception:
+                pass
+
+
+def ensure_listener() -> None:
+    """Start this process's pub/sub subscriber on the running loop (idempotent)."""
+    global _listener
+    if not settings.REDIS_URL:
+        return
+    loop = asyncio.get_running_loop()
+    if _listener is not None and not _listener.done() and _listener.get_loop() is loop:
+        return
+    _listener = loop.create_task(_listen(settings.REDIS_URL))
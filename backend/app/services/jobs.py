@@ -0,0 +1,249 @@
+"""
+Job store for long-running operations started over HTTP.
+
+Endpoints such as ``POST /v1/providers/{id}/sync-now`` create a job, hand
+the work to a background worker and return the job handle immediately;
+clients poll ``GET /v1/jobs/{id}`` or follow ``GET /v1/jobs/{id}/events``
+(server-sent events). Jobs are plain JSON documents kept for
+``JOB_TTL_SECONDS`` after their last update:
+
+- in Redis (``REDIS_URL``) so API processes and Celery workers share them;
+- otherwise in process memory, which is enough for a single dev server.
+
+Work running under ``run_job`` can call ``report_progress`` from anywhere
+down the stack (including asyncio tasks it spawns); outside a job it is a
+no-op. A dedupe ``key`` makes repeated requests for the same work attach to
+the job already in flight instead of starting another.
+"""
+import asyncio
+import contextvars
+import json
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Callable, Dict, Optional, Tuple
+
+from ..core import metrics
+from ..settings import settings
+
+logger = logging.getLogger(__name__)
+
+TERMINAL = ("succeeded", "failed")
+
+_JOBS = metrics.counter("bimo_jobs_total", "Background jobs by kind and final status", ["kind", "status"])
+_DURATION = metrics.histogram(
+    "bimo_job_duration_seconds", "Background job run time", ["kind"],
+    buckets=(1, 5, 15, 60, 300, 900, 3600),
+)
+
+_current_job: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("bimo_current_job", default=None)
+
+
+class MemoryJobStore:
+    """Jobs in an insertion-ordered dict; every write pushes the expiry out."""
+
+    def __init__(self, clock: Callable[[], float] = time.time) -> None:
+        self.clock = clock
+        self._jobs: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._keys: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def _purge(self) -> None:
+        now = self.clock()
+        # Entries are ordered by last write, so expired ones are at the front
+        while self._jobs:
+            job_id, (expires_at, _) = next(iter(self._jobs.items()))
+            if expires_at > now:
+                break
+            del self._jobs[job_id]
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            self._purge()
+            item = self._jobs.get(job_id)
+            return dict(item[1]) if item else None
+
+    def put(self, job: Dict[str, Any], ttl: float) -> None:
+        with self._lock:
+            self._jobs.pop(job["id"], None)
+            self._jobs[job["id"]] = (self.clock() + ttl, dict(job))
+            self._purge()
+
+    def claim_key(self, key: str, job_id: str, ttl: float) -> Optional[str]:
+        """Bind ``key`` to ``job_id`` unless an unfinished job holds it; returns the holder."""
+        with self._lock:
+            holder = self._keys.get(key)
+            item = self._jobs.get(holder) if holder else None
+            if item and item[0] > self.clock() and item[1]["status"] not in TERMINAL:
+                return holder
+            self._keys[key] = job_id
+            return None
+
+    def release_key(self, key: str, job_id: str) -> None:
+        with self._lock:
+            if self._keys.get(key) == job_id:
+                del self._keys[key]
+
+
+class RedisJobStore:
+    PREFIX = "bimo:job:"
+    KEY_PREFIX = "bimo:jobkey:"
+
+    def __init__(self, url: str) -> None:
+        import redis  # type: ignore
+        self._redis = redis.Redis.from_url(url, socket_timeout=1.0, socket_connect_timeout=1.0)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        raw = self._redis.get(self.PREFIX + job_id)
+        return json.loads(raw) if raw else None
+
+    def put(self, job: Dict[str, Any], ttl: float) -> None:
+        self._redis.set(self.PREFIX + job["id"], json.dumps(job, default=str), ex=max(1, int(ttl)))
+
+    def claim_key(self, key: str, job_id: str, ttl: float) -> Optional[str]:
+        name = self.KEY_PREFIX + key
+        for _ in range(3):
+            if self._redis.set(name, job_id, nx=True, ex=max(1, int(ttl))):
+                return None
+            holder = self._redis.get(name)
+            holder = holder.decode() if isinstance(holder, bytes) else holder
+            job = self.get(holder) if holder else None
+            if job is not None and job["status"] not in TERMINAL:
+                return holder
+            # Stale binding (job finished or expired): drop it and retry
+            self._redis.delete(name)
+        return None
+
+    def release_key(self, key: str, job_id: str) -> None:
+        name = self.KEY_PREFIX + key
+        holder = self._redis.get(name)
+        if (holder.decode() if isinstance(holder, bytes) else holder) == job_id:
+            self._redis.delete(name)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_job_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = RedisJobStore(settings.REDIS_URL) if settings.REDIS_URL else MemoryJobStore()
+    return _store
+
+
+def create_job(kind: str, key: Optional[str] = None, **meta: Any) -> Tuple[Dict[str, Any], bool]:
+    """Create a queued job, or return the unfinished job holding ``key`` (``created`` False)."""
+    store = get_job_store()
+    now = time.time()
+    job = {
+        "id": uuid.uuid4().hex, "kind": kind, "key": key, "status": "queued", "seq": 0,
+        "created_at": now, "updated_at": now, "started_at": None, "finished_at": None,
+        "progress": {}, "result": None, "error": None, **meta,
+    }
+    store.put(job, settings.JOB_TTL_SECONDS)
+    if key is not None:
+        holder = store.claim_key(key, job["id"], settings.JOB_TTL_SECONDS)
+        if holder is not None:
+            existing = store.get(holder)
+            if existing is not None:
+                return existing, False
+    return job, True
+
+
+def get_job(job_id: str) -> Optional[Dict[str, Any]]:
+    return get_job_store().get(job_id)
+
+
+def update_job(job_id: str, progress: Optional[Dict[str, Any]] = None, **fields: Any) -> Optional[Dict[str, Any]]:
+    """Merge ``fields`` (and ``progress`` into the progress dict) and bump ``seq``."""
+    store = get_job_store()
+    job = store.get(job_id)
+    if job is None:
+        return None
+    job.update(fields)
+    if progress:
+        job["progress"] = dict(job.get("progress") or {}, **progress)
+    job["seq"] = int(job.get("seq") or 0) + 1
+    job["updated_at"] = time.time()
+    store.put(job, settings.JOB_TTL_SECONDS)
+    if job["status"] in TERMINAL and job.get("key"):
+        store.release_key(job["key"], job_id)
+    return job
+
+
+def report_progress(**progress: Any) -> None:
+    """Attach progress to the job running in this context, if any."""
+    job_id = _current_job.get()
+    if job_id is None:
+        return
+    try:
+        update_job(job_id, progress=progress)
+    except Exception as e:
+        logger.warning("progress update for %s failed: %s", job_id, e)
+
+
+def run_job(job_id: str, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    """Run ``fn`` as job ``job_id``, recording its result or error in the store."""
+    started = time.time()
+    job = update_job(job_id, status="running", started_at=started) or {}
+    kind = job.get("kind") or "job"
+    token = _current_job.set(job_id)
+    try:
+        result = fn(*args, **kwargs)
+    except Exception as e:
+        update_job(job_id, status="failed", error=str(e), finished_at=time.time())
+        _JOBS.labels(kind=kind, status="failed").inc()
+        raise
+    finally:
+        _current_job.reset(token)
+        _DURATION.labels(kind=kind).observe(time.time() - started)
+    # Store a JSON-safe copy; a sync reporting ``synced: False`` is a failed job
+    result = json.loads(json.dumps(result, default=str)) if result is not None else None
+    ok = not (isinstance(result, dict) and result.get("synced") is False)
+    error = None if ok else (result.get("error") or result.get("reason") or "sync failed")
+    status = "succeeded" if ok else "failed"
+    update_job(job_id, status=status, result=result, error=error, finished_at=time.time())
+    _JOBS.labels(kind=kind, status=status).inc()
+    return result
+
+
+def public(job: Dict[str, Any]) -> Dict[str, Any]:
+    """Job as returned by the API."""
+    out = {k: v for k, v in job.items() if k != "key"}
+    out["status_url"] = f"/v1/jobs/{job['id']}"
+    out["events_url"] = f"/v1/jobs/{job['id']}/events"
+    return out
+
+
+def _sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str, separators=(',', ':'))}\n\n"
+
+
+async def job_events(job_id: str, poll_seconds: Optional[float] = None,
+                     keepalive_seconds: float = 15.0) -> AsyncIterator[str]:
+    """Server-sent events: one ``progress`` event per job update, then ``done``."""
+    poll = poll_seconds or settings.JOB_EVENTS_POLL_SECONDS
+    seen = -1
+    quiet = 0.0
+    while True:
+        job = await asyncio.to_thread(get_job, job_id)
+        if job is None:
+            yield _sse("error", {"id": job_id, "message": "job not found or expired"})
+            return
+        if job["seq"] != seen:
+            seen = job["seq"]
+            quiet = 0.0
+            if job["status"] in TERMINAL:
+                yield _sse("done", public(job))
+                return
+            yield _sse("progress", public(job))
+        elif quiet >= keepalive_seconds:
+            quiet = 0.0
+            yield ": keepalive\n\n"
+        await asyncio.sleep(poll)
+        quiet += poll
@@ -0,0 +1,231 @@
+"""Password hashing off the request threadpool.
+
+PBKDF2 is CPU-bound and holds the GIL, so hashing inside sync endpoints lets
+a burst of logins occupy the shared anyio threadpool and stall every other
+route. Hashes and verifications run instead in a small dedicated process
+pool (``PASSWORD_HASH_WORKERS``; 0 runs them on one dedicated thread), with
+admission control in front of it:
+
+- at most ``PASSWORD_HASH_MAX_PENDING`` hashes are queued or running; more
+  are rejected at once (``HashingBusy`` -> 503);
+- a hash that waited longer than ``PASSWORD_HASH_QUEUE_TIMEOUT_SECONDS``
+  before a worker picked it up is dropped unrun, so a backlog drains instead
+  of burning CPU on requests whose clients have likely given up;
+- each client IP and each email may have ``PASSWORD_HASH_MAX_PER_CLIENT``
+  hashes in flight (``TooManyAttempts`` -> 429). The IP is the one
+  ``core.rate_limit.client_ip`` resolves, so behind a load balancer set
+  ``TRUSTED_PROXIES`` or every client shares the proxy's allowance.
+
+Under a login storm login latency degrades to fast rejections while the
+rest of the API keeps its threads.
+"""
+import asyncio
+import logging
+import math
+import multiprocessing
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+from fastapi import HTTPException
+
+from ..core import metrics
+from ..settings import settings
+
+logger = logging.getLogger(__name__)
+
+_HASHES = metrics.counter("bimo_password_hashes_total", "Password hash/verify requests", ["op", "result"])
+_IN_FLIGHT = metrics.gauge("bimo_password_hash_in_flight", "Password hashes queued or running")
+
+_EXPIRED = "__expired__"
+
+
+class HashingBusy(RuntimeError):
+    """The hashing pool is saturated or the request waited past its deadline."""
+
+    status_code = 503
+    code = "AUTH_BUSY"
+
+    def __init__(self, message: str, retry_after: float = 1.0) -> None:
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class TooManyAttempts(HashingBusy):
+    """The client IP or email already has its share of hashes in flight."""
+
+    status_code = 429
+    code = "RATE_LIMITED"
+
+
+def http_error(exc: HashingBusy) -> HTTPException:
+    return HTTPException(
+        status_code=exc.status_code,
+        detail={"code": exc.code, "message": str(exc)},
+        headers={"Retry-After": str(max(1, math.ceil(exc.retry_after)))},
+    )
+
+
+def _mp_context():
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+
+
+def _run(fn: Callable[..., Any], args: tuple, deadline: float) -> Any:
+    # Runs in the worker; wall clock so the deadline means the same in every process
+    if time.time() > deadline:
+        return _EXPIRED
+    return fn(*args)
+
+
+class PasswordHasher:
+    def __init__(self, workers: int = 2, max_pending: int = 64, queue_timeout: float = 2.0,
+                 max_per_client: int = 2) -> None:
+        self.workers = workers
+        self.max_pending = max_pending
+        self.queue_timeout = queue_timeout
+        self.max_per_client = max_per_client
+        self._pool = None
+        self._pending = 0
+        self._clients: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def _executor(self):
+        with self._lock:
+            if self._pool is None:
+                if self.workers > 0:
+                    # Not fork: the API process has running threads (event loop,
+                    # flushers) whose locks a forked child would inherit held
+                    self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=_mp_context())
+                else:
+                    self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="password-hash")
+            return self._pool
+
+    def _admit(self, clients: Tuple[str, ...]) -> None:
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise HashingBusy("authentication is busy, retry shortly", self.queue_timeout)
+            for client in clients:
+                if self._clients.get(client, 0) >= self.max_per_client:
+                    raise TooManyAttempts("too many authentication attempts in progress", 1.0)
+            self._pending += 1
+            for client in clients:
+                self._clients[client] = self._clients.get(client, 0) + 1
+        _IN_FLIGHT.inc()
+
+    def _release(self, clients: Tuple[str, ...]) -> None:
+        with self._lock:
+            self._pending -= 1
+            for client in clients:
+                left = self._clients.get(client, 0) - 1
+                if left > 0:
+                    self._clients[client] = left
+                else:
+                    self._clients.pop(client, None)
+        _IN_FLIGHT.dec()
+
+    def submit(self, fn: Callable[..., Any], args: tuple = (), clients: Iterable[Optional[str]] = ()) -> Future:
+        """Queue ``fn(*args)``; ``clients`` are the in-flight keys it counts against.
+
+        ``fn`` must be picklable (a module-level function) when workers are processes.
+        """
+        keys = tuple(sorted({c for c in clients if c}))
+        self._admit(keys)
+        try:
+            fut = self._executor().submit(_run, fn, args, time.time() + self.queue_timeout)
+        except Exception:
+            self._release(keys)
+            raise
+        fut.add_done_callback(lambda _: self._release(keys))
+        return fut
+
+    def _result(self, op: str, result: Any) -> Any:
+        if result == _EXPIRED:
+            _HASHES.labels(op=op, result="expired").inc()
+            raise HashingBusy("authentication is busy, retry shortly", self.queue_timeout)
+        _HASHES.labels(op=op, result="ok").inc()
+        return result
+
+    def _broken(self, op: str, e: Exception) -> None:
+        # A worker died (OOM, kill); start a fresh pool for the next request
+        with self._lock:
+            self._pool = None
+        _HASHES.labels(op=op, result="error").inc()
+        logger.warning("password hashing pool broken, restarting: %s", e)
+
+    async def call(self, op: str, fn: Callable[..., Any], args: tuple = (), clients: Iterable[Optional[str]] = ()) -> Any:
+        try:
+            fut = self.submit(fn, args, clients)
+        except HashingBusy:
+            _HASHES.labels(op=op, result="rejected").inc()
+            raise
+        try:
+            result = await asyncio.wrap_future(fut)
+        except BrokenProcessPool as e:
+            self._broken(op, e)
+            raise HashingBusy("authentication is busy, retry shortly")
+        return self._result(op, result)
+
+    def call_sync(self, op: str, fn: Callable[..., Any], args: tuple = (), clients: Iterable[Optional[str]] = ()) -> Any:
+        """``call`` for sync endpoints; the waiting thread does not hold the GIL."""
+        try:
+            fut = self.submit(fn, args, clients)
+        except HashingBusy:
+            _HASHES.labels(op=op, result="rejected").inc()
+            raise
+        try:
+            result = fut.result()
+        except BrokenProcessPool as e:
+            self._broken(op, e)
+            raise HashingBusy("authentication is busy, retry shortly")
+        return self._result(op, result)
+
+    def shutdown(self) -> None:
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+
+_hasher: Optional[PasswordHasher] = None
+_hasher_lock = threading.Lock()
+
+
+def get_password_hasher() -> PasswordHasher:
+    global _hasher
+    if _hasher is None:
+        with _hasher_lock:
+            if _hasher is None:
+                _hasher = PasswordHasher(
+                    workers=settings.PASSWORD_HASH_WORKERS,
+                    max_pending=settings.PASSWORD_HASH_MAX_PENDING,
+                    queue_timeout=settings.PASSWORD_HASH_QUEUE_TIMEOUT_SECONDS,
+                    max_per_client=settings.PASSWORD_HASH_MAX_PER_CLIENT,
+                )
+    return _hasher
+
+
+def _keys(ip: Optional[str], email: Optional[str]) -> Tuple[Optional[str], Optional[str]]:
+    return (f"ip:{ip}" if ip else None, f"email:{email.lower()}" if email else None)
+
+
+async def hash_password(password: str, ip: Optional[str] = None, email: Optional[str] = None) -> str:
+    from ..auth import get_password_hash
+    return await get_password_hasher().call("hash", get_password_hash, (password,), _keys(ip, email))
+
+
+async def verify_password(plain: str, hashed: str, ip: Optional[str] = None, email: Optional[str] = None) -> bool:
+    from ..auth import verify_password as _verify
+    return await get_password_hasher().call("verify", _verify, (plain, hashed), _keys(ip, email))
+
+
+def hash_password_sync(password: str, ip: Optional[str] = None, email: Optional[str] = None) -> str:
+    from ..auth import get_password_hash
+    return get_password_hasher().call_sync("hash", get_password_hash, (password,), _keys(ip, email))
+
+
+def shutdown() -> None:
+    if _hasher is not None:
+        _hasher.shutdown()
@@ -0,0 +1,59 @@
+"""
+Approximate list prices used to cost gateway usage events.
+
+Prices are USD per 1M tokens as (input, output). Model names are matched by
+longest prefix so dated snapshots (``gpt-4o-2024-08-06``) resolve to their
+family. These are estimates for `prod` usage; authoritative numbers arrive
+later as `billing` invoices.
+"""
+from typing import Dict, Optional, Tuple
+
+MODEL_PRICES: Dict[str, Tuple[float, float]] = {
+    # OpenAI / Azure OpenAI
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4.1-mini": (0.40, 1.60),
+    "gpt-4.1-nano": (0.10, 0.40),
+    "gpt-4.1": (2.00, 8.00),
+    "gpt-4-turbo": (10.00, 30.00),
+    "gpt-3.5-turbo": (0.50, 1.50),
+    "o1-mini": (1.10, 4.40),
+    "o1": (15.00, 60.00),
+    "o3-mini": (1.10, 4.40),
+    "text-embedding-3-small": (0.02, 0.0),
+    "text-embedding-3-large": (0.13, 0.0),
+    # Anthropic
+    "claude-3-5-haiku": (0.80, 4.00),
+    "claude-3-5-sonnet": (3.00, 15.00),
+    "claude-3-7-sonnet": (3.00, 15.00),
+    "claude-sonnet-4": (3.00, 15.00),
+    "claude-opus-4": (15.00, 75.00),
+    "claude-3-haiku": (0.25, 1.25),
+    "claude-3-opus": (15.00, 75.00),
+    # Google
+    "gemini-1.5-flash": (0.075, 0.30),
+    "gemini-1.5-pro": (1.25, 5.00),
+    "gemini-2.0-flash": (0.10, 0.40),
+    "gemini-2.5-flash": (0.30, 2.50),
+    "gemini-2.5-pro": (1.25, 10.00),
+}
+
+_BY_LENGTH = sorted(MODEL_PRICES, key=len, reverse=True)
+
+
+def model_price(model: Optional[str]) -> Optional[Tuple[float, float]]:
+    if not model:
+        return None
+    name = model.lower().split("/")[-1]
+    for prefix in _BY_LENGTH:
+        if name.startswith(prefix):
+            return MODEL_PRICES[prefix]
+    return None
+
+
+def estimate_cost(model: Optional[str], prompt_tokens: int, completion_tokens: int) -> float:
+    """Estimated USD cost of a call; 0.0 for unknown models."""
+    price = model_price(model)
+    if price is None:
+        return 0.0
+    return (prompt_tokens * price[0] + completion_tokens * price[1]) / 1_000_000
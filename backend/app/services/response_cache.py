@@ -0,0 +1,227 @@
+"""
+Exact-match response cache for gateway generation calls.
+
+Requests are canonicalised (sorted keys, compact separators, transport-only
+fields such as ``stream``/``user`` dropped) and hashed together with the
+provider, upstream path and org. Lookups go through two tiers:
+
+1. an in-process LRU bounded by total bytes, and
+2. a shared Redis tier (``settings.REDIS_URL``) so every worker benefits
+   from a response cached by any other.
+
+Callers opt out per request with ``Cache-Control: no-store`` (neither read
+nor write), ``Cache-Control: no-cache`` (skip the read, still store the fresh
+response) or ``X-BIMO-CACHE: off`` / ``refresh``.
+"""
+import hashlib
+import json
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional, Tuple
+
+from ..core import metrics
+from ..settings import settings
+
+logger = logging.getLogger(__name__)
+
+# Request fields that do not change the completion and must not split the key
+_TRANSPORT_FIELDS = frozenset({"stream", "stream_options", "user", "metadata", "store"})
+
+# Upstream path suffixes whose POST responses are safe to cache
+CACHEABLE_SUFFIXES = (
+    "/chat/completions",
+    "/completions",
+    "/embeddings",
+    "/messages",
+    ":generateContent",
+)
+
+
+@dataclass
+class CachedResponse:
+    body: bytes
+    status_code: int = 200
+    headers: Dict[str, str] = field(default_factory=dict)
+
+
+def canonical_request(payload: Dict[str, Any]) -> str:
+    """Stable JSON form of a request body used for hashing."""
+    trimmed = {k: v for k, v in payload.items() if k not in _TRANSPORT_FIELDS}
+    return json.dumps(trimmed, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+
+
+def cache_key(provider: str, path: str, payload: Dict[str, Any], org_id: Optional[str] = None) -> str:
+    raw = "|".join((org_id or "default", provider, path, canonical_request(payload)))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def cache_policy(headers) -> Tuple[bool, bool]:
+    """Return (may_read, may_write) from request cache headers."""
+    bimo = (headers.get("X-BIMO-CACHE") or "").strip().lower()
+    if bimo in ("off", "bypass", "false", "0", "no"):
+        return False, False
+    cc = (headers.get("Cache-Control") or "").lower()
+    directives = {d.strip() for d in cc.split(",") if d.strip()}
+    if "no-store" in directives:
+        return False, False
+    may_read = "no-cache" not in directives and bimo != "refresh"
+    return may_read, True
+
+
+def is_cacheable_path(method: str, path: str) -> bool:
+    return method.upper() == "POST" and path.rstrip("/").endswith(CACHEABLE_SUFFIXES)
+
+
+def _entry_size(resp: CachedResponse) -> int:
+    return len(resp.body) + sum(len(k) + len(v) for k, v in resp.headers.items())
+
+
+class LRUTier:
+    """In-process LRU bounded by the total size of cached bodies."""
+
+    def __init__(self, max_bytes: int, max_entry_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self.bytes = 0
+        self._data: "OrderedDict[str, Tuple[float, int, CachedResponse]]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        expires_at, size, resp = item
+        if expires_at <= time.time():
+            self._drop(key)
+            return None
+        self._data.move_to_end(key)
+        return resp
+
+    def set(self, key: str, resp: CachedResponse, ttl_seconds: float) -> bool:
+        size = _entry_size(resp)
+        if size > self.max_entry_bytes:
+            return False
+        if key in self._data:
+            self._drop(key)
+        self._data[key] = (time.time() + ttl_seconds, size, resp)
+        self.bytes += size
+        while self.bytes > self.max_bytes and self._data:
+            oldest = next(iter(self._data))
+            self._drop(oldest)
+            _EVICTIONS.inc()
+        return True
+
+    def _drop(self, key: str) -> None:
+        item = self._data.pop(key, None)
+        if item is not None:
+            self.bytes -= item[1]
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class RedisTier:
+    """Shared tier storing ``<json meta>\\n<body>`` blobs with a Redis TTL.
+
+    Redis failures are never fatal: after an error the tier stays disabled
+    for a short back-off period and lookups fall through to the upstream.
+    """
+
+    PREFIX = "bimo:rc:"
+    BACKOFF_SECONDS = 30.0
+
+    def __init__(self, url: str, max_entry_bytes: int) -> None:
+        self.url = url
+        self.max_entry_bytes = max_entry_bytes
+        self._client = None
+        self._down_until = 0.0
+
+    def _redis(self):
+        if self._client is None:
+            import redis.asyncio as aioredis  # type: ignore
+            self._client = aioredis.from_url(self.url, socket_timeout=0.05, socket_connect_timeout=0.2)
+        return self._client
+
+    def _available(self) -> bool:
+        return time.monotonic() >= self._down_until
+
+    def _fail(self, e: Exception) -> None:
+        self._down_until = time.monotonic() + self.BACKOFF_SECONDS
+        logger.warning("response cache redis tier unavailable: %s", e)
+
+    async def get(self, key: str) -> Optional[CachedResponse]:
+        if not self._available():
+            return None
+        try:
+            blob = await self._redis().get(self.PREFIX + key)
+        except Exception as e:
+            self._fail(e)
+            return None
+        if not blob:
+            return None
+        meta, _, body = blob.partition(b"\n")
+        try:
+            info = json.loads(meta)
+        except ValueError:
+            return None
+        return CachedResponse(body=body, status_code=info.get("s", 200), headers=info.get("h") or {})
+
+    async def set(self, key: str, resp: CachedResponse, ttl_seconds: float) -> None:
+        if not self._available() or _entry_size(resp) > self.max_entry_bytes:
+            return
+        meta = json.dumps({"s": resp.status_code, "h": resp.headers}, separators=(",", ":")).encode("utf-8")
+        try:
+            await self._redis().set(self.PREFIX + key, meta + b"\n" + resp.body, ex=max(1, int(ttl_seconds)))
+        except Exception as e:
+            self._fail(e)
+
+
+_LOOKUPS = metrics.counter("bimo_response_cache_lookups_total", "Exact-match response cache lookups", ["tier", "result"])
+_EVICTIONS = metrics.counter("bimo_response_cache_evictions_total", "Exact-match response cache LRU evictions")
+
+
+class ResponseCache:
+    def __init__(self, local: LRUTier, shared: Optional[RedisTier], ttl_seconds: float) -> None:
+        self.local = local
+        self.shared = shared
+        self.ttl_seconds = ttl_seconds
+        self.stats: Dict[str, int] = {"local_hits": 0, "shared_hits": 0, "misses": 0, "stores": 0}
+
+    async def get(self, key: str) -> Optional[CachedResponse]:
+        resp = self.local.get(key)
+        if resp is not None:
+            self.stats["local_hits"] += 1
+            _LOOKUPS.labels(tier="local", result="hit").inc()
+            return resp
+        if self.shared is not None:
+            resp = await self.shared.get(key)
+            if resp is not None:
+                self.stats["shared_hits"] += 1
+                _LOOKUPS.labels(tier="shared", result="hit").inc()
+                # Promote into the local tier for subsequent lookups
+                self.local.set(key, resp, self.ttl_seconds)
+                return resp
+        self.stats["misses"] += 1
+        _LOOKUPS.labels(tier="all", result="miss").inc()
+        return None
+
+    async def set(self, key: str, resp: CachedResponse, ttl_seconds: Optional[float] = None) -> None:
+        ttl = ttl_seconds or self.ttl_seconds
+        if self.local.set(key, resp, ttl):
+            self.stats["stores"] += 1
+        if self.shared is not None:
+            await self.shared.set(key, resp, ttl)
+
+
+_cache: Optional[ResponseCache] = None
+
+
+def get_response_cache() -> ResponseCache:
+    """Build (once) the process-wide exact-match cache from settings."""
+    global _cache
+    if _cache is None:
+        local = LRUTier(settings.RESPONSE_CACHE_MAX_BYTES, settings.RESPONSE_CACHE_MAX_ENTRY_BYTES)
+        shared = RedisTier(settings.REDIS_URL, settings.RESPONSE_CACHE_MAX_ENTRY_BYTES) if settings.REDIS_URL else None
+        _cache = ResponseCache(local, shared, settings.RESPONSE_CACHE_TTL_SECONDS)
+    return _cache
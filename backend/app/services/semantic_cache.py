@@ -0,0 +1,426 @@
+"""
+Semantic response cache for the optimize flow.
+
+Prompts are embedded into fixed-size unit vectors and looked up against prior
+prompts in the same namespace (``<org>:<model>:<params digest>``, where the
+digest covers every request field other than the prompt itself, so a reply
+generated with other sampling settings, tools or output format is never
+reused). When the best cosine similarity clears ``SEMANTIC_CACHE_THRESHOLD``
+the stored completion is returned instead of calling the provider.
+
+Embeddings come from a real embedding model (``OpenAIEmbedder``); without
+one the cache is disabled. ``HashingEmbedder`` is lexical only and must be
+chosen explicitly (dev/tests).
+
+Two index backends are provided:
+
+- ``PgVectorIndex``: Postgres + pgvector, using an HNSW index for approximate
+  nearest-neighbour search (production; docker-compose runs ``ankane/pgvector``).
+  The namespace filter applies to the HNSW candidates, so lookups widen
+  ``hnsw.ef_search`` and use iterative index scans where pgvector has them.
+- ``NumpyIndex``: in-process matrix per namespace, brute-force dot product
+  (SQLite/dev and tests). A cap on entries across all namespaces evicts
+  whole least-recently-used namespaces, so process memory stays bounded
+  however many orgs and models pass through.
+
+Both enforce a TTL per entry and an LRU cap per namespace.
+"""
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from ..core import metrics
+from ..settings import settings
+from .response_cache import CachedResponse
+
+logger = logging.getLogger(__name__)
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+# Request fields that carry the prompt (embedded) or do not change the reply
+_PROMPT_FIELDS = frozenset({"messages", "system", "contents", "prompt", "model", "stream", "stream_options", "user"})
+
+
+@dataclass
+class SemanticHit:
+    response: CachedResponse
+    similarity: float
+
+
+class HashingEmbedder:
+    """Dependency-free embedder using signed feature hashing.
+
+    Words and character trigrams are hashed into ``dim`` buckets and the
+    vector is L2-normalised, so cosine similarity is a dot product. It
+    captures lexical near-duplicates (rephrasings, typos, reordered words),
+    which is the bulk of repetitive support traffic.
+    """
+
+    def __init__(self, dim: int = 256) -> None:
+        self.dim = dim
+
+    def _features(self, text: str) -> List[str]:
+        words = _TOKEN_RE.findall(text.lower())
+        feats = list(words)
+        for w in words:
+            padded = f"#{w}#"
+            feats.extend(padded[i:i + 3] for i in range(len(padded) - 2))
+        return feats
+
+    async def embed(self, text: str) -> np.ndarray:
+        vec = np.zeros(self.dim, dtype=np.float32)
+        for feat in self._features(text):
+            h = int.from_bytes(hashlib.blake2b(feat.encode("utf-8"), digest_size=8).digest(), "little")
+            vec[h % self.dim] += 1.0 if (h >> 63) & 1 else -1.0
+        norm = float(np.linalg.norm(vec))
+        if norm > 0:
+            vec /= norm
+        return vec
+
+
+class OpenAIEmbedder:
+    """Embeds prompts with the OpenAI embeddings API over the gateway pool."""
+
+    def __init__(self, api_key: str, model: str = "text-embedding-3-small", dim: int = 1536) -> None:
+        self.api_key = api_key
+        self.model = model
+        self.dim = dim
+
+    async def embed(self, text: str) -> np.ndarray:
+        from . import upstream
+        client = upstream.pool.client_for(upstream.PROVIDER_BASE_URLS["openai"])
+        r = await client.post(
+            "/v1/embeddings",
+            json={"model": self.model, "input": text[:8000], "dimensions": self.dim},
+            headers={"Authorization": f"Bearer {self.api_key}"},
+        )
+        r.raise_for_status()
+        vec = np.asarray(r.json()["data"][0]["embedding"], dtype=np.float32)
+        norm = float(np.linalg.norm(vec))
+        return vec / norm if norm > 0 else vec
+
+
+class _Namespace:
+    """Row-major embedding matrix plus LRU bookkeeping for one namespace."""
+
+    def __init__(self, dim: int) -> None:
+        self.matrix = np.zeros((16, dim), dtype=np.float32)
+        self.keys: List[str] = []
+        # key -> (row, expires_at, response); ordered oldest-access first
+        self.entries: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def add(self, key: str, vec: np.ndarray, expires_at: float, response: CachedResponse) -> None:
+        if key in self.entries:
+            row = self.entries[key][0]
+        else:
+            row = len(self.keys)
+            if row >= self.matrix.shape[0]:
+                grown = np.zeros((self.matrix.shape[0] * 2, self.matrix.shape[1]), dtype=np.float32)
+                grown[:row] = self.matrix[:row]
+                self.matrix = grown
+            self.keys.append(key)
+        self.matrix[row] = vec
+        self.entries[key] = (row, expires_at, response)
+        self.entries.move_to_end(key)
+
+    def remove(self, key: str) -> None:
+        row = self.entries.pop(key)[0]
+        last = len(self.keys) - 1
+        if row != last:
+            # Swap the last row into the freed slot to keep the matrix dense
+            moved = self.keys[last]
+            self.matrix[row] = self.matrix[last]
+            self.keys[row] = moved
+            _, exp, resp = self.entries[moved]
+            self.entries[moved] = (row, exp, resp)
+        self.keys.pop()
+
+
+class NumpyIndex:
+    """In-process exact nearest-neighbour index (dev/SQLite fallback)."""
+
+    def __init__(self, dim: int, max_entries: int, max_total_entries: Optional[int] = None) -> None:
+        self.dim = dim
+        self.max_entries = max_entries
+        self.max_total_entries = max_total_entries
+        # Ordered least-recently-used namespace first
+        self._namespaces: "OrderedDict[str, _Namespace]" = OrderedDict()
+        self._total = 0
+        self._lock = threading.Lock()
+
+    def _remove(self, ns: _Namespace, key: str) -> None:
+        ns.remove(key)
+        self._total -= 1
+
+    async def search(self, namespace: str, vec: np.ndarray) -> Optional[SemanticHit]:
+        with self._lock:
+            ns = self._namespaces.get(namespace)
+            if ns is None:
+                return None
+            if not ns.keys:
+                del self._namespaces[namespace]
+                return None
+            self._namespaces.move_to_end(namespace)
+            now = time.time()
+            n = len(ns.keys)
+            scores = ns.matrix[:n] @ vec
+            while n:
+                best = int(np.argmax(scores))
+                key = ns.keys[best]
+                _, expires_at, response = ns.entries[key]
+                if expires_at > now:
+                    ns.entries.move_to_end(key)
+                    return SemanticHit(response=response, similarity=float(scores[best]))
+                # Lazily drop expired entries and retry
+                self._remove(ns, key)
+                n = len(ns.keys)
+                scores = ns.matrix[:n] @ vec
+            return None
+
+    async def add(self, namespace: str, key: str, vec: np.ndarray, response: CachedResponse, ttl_seconds: float) -> None:
+        with self._lock:
+            ns = self._namespaces.get(namespace)
+            if ns is None:
+                ns = self._namespaces[namespace] = _Namespace(self.dim)
+            self._namespaces.move_to_end(namespace)
+            before = len(ns.entries)
+            ns.add(key, vec, time.time() + ttl_seconds, response)
+            self._total += len(ns.entries) - before
+            while len(ns.entries) > self.max_entries:
+                self._remove(ns, next(iter(ns.entries)))
+                _EVICTIONS.labels(reason="lru").inc()
+            while self.max_total_entries and self._total > self.max_total_entries:
+                oldest, victim = next(iter(self._namespaces.items()))
+                if victim is ns:
+                    # Only this namespace is left; trim its own oldest entries
+                    self._remove(ns, next(iter(ns.entries)))
+                    _EVICTIONS.labels(reason="lru").inc()
+                    continue
+                del self._namespaces[oldest]
+                self._total -= len(victim.entries)
+                _EVICTIONS.labels(reason="namespace").inc(len(victim.entries))
+
+    def size(self) -> int:
+        with self._lock:
+            return sum(len(ns.keys) for ns in self._namespaces.values())
+
+
+class PgVectorIndex:
+    """pgvector-backed index using an HNSW cosine index (see migration 0007)."""
+
+    TABLE = "semantic_cache_entries"
+
+    def __init__(self, engine, dim: int, max_entries: int, ef_search: int = 200) -> None:
+        self.engine = engine
+        self.dim = dim
+        self.max_entries = max_entries
+        self.ef_search = ef_search
+        self._writes = 0
+        # None until probed; pgvector < 0.8 has no iterative index scans
+        self._iterative: Optional[bool] = None
+
+    @staticmethod
+    def _literal(vec: np.ndarray) -> str:
+        return "[" + ",".join(f"{x:.6f}" for x in vec.tolist()) + "]"
+
+    def _tune_scan(self, conn) -> None:
+        """Keep the HNSW scan going until the namespace filter has matches.
+
+        The ``WHERE namespace`` filter runs on the index's candidates, so with
+        the default ``ef_search`` (40) a small namespace in a large table
+        would find nothing. Settings are transaction-local.
+        """
+        import sqlalchemy as sa
+        conn.execute(sa.text(f"SET LOCAL hnsw.ef_search = {int(self.ef_search)}"))
+        if self._iterative is False:
+            return
+        try:
+            with conn.begin_nested():
+                conn.execute(sa.text("SET LOCAL hnsw.iterative_scan = strict_order"))
+            self._iterative = True
+        except Exception as e:
+            self._iterative = False
+            logger.info("pgvector iterative scans unavailable, using ef_search only: %s", e)
+
+    def _search_sync(self, namespace: str, vec: np.ndarray) -> Optional[SemanticHit]:
+        import sqlalchemy as sa
+        with self.engine.begin() as conn:
+            self._tune_scan(conn)
+            row = conn.execute(
+                sa.text(
+                    f"SELECT id, response, status_code, content_type, content_encoding, "
+                    f"1 - (embedding <=> CAST(:q AS vector)) AS similarity "
+                    f"FROM {self.TABLE} WHERE namespace = :ns AND expires_at > now() "
+                    f"ORDER BY embedding <=> CAST(:q AS vector) LIMIT 1"
+                ),
+                {"q": self._literal(vec), "ns": namespace},
+            ).first()
+            if row is None:
+                return None
+            conn.execute(
+                sa.text(f"UPDATE {self.TABLE} SET last_hit_at = now(), hits = hits + 1 WHERE id = :id"),
+                {"id": row.id},
+            )
+        headers = {}
+        if row.content_type:
+            headers["content-type"] = row.content_type
+        if row.content_encoding:
+            headers["content-encoding"] = row.content_encoding
+        return SemanticHit(
+            response=CachedResponse(body=bytes(row.response), status_code=row.status_code, headers=headers),
+            similarity=float(row.similarity),
+        )
+
+    def _add_sync(self, namespace: str, key: str, vec: np.ndarray, response: CachedResponse, ttl_seconds: float) -> None:
+        import sqlalchemy as sa
+        with self.engine.begin() as conn:
+            conn.execute(
+                sa.text(
+                    f"INSERT INTO {self.TABLE} (namespace, prompt_hash, embedding, response, status_code, "
+                    f"content_type, content_encoding, expires_at, last_hit_at) "
+                    f"VALUES (:ns, :key, CAST(:q AS vector), :body, :status, :ctype, :cenc, "
+                    f"now() + make_interval(secs => :ttl), now()) "
+                    f"ON CONFLICT (namespace, prompt_hash) DO UPDATE SET embedding = EXCLUDED.embedding, "
+                    f"response = EXCLUDED.response, status_code = EXCLUDED.status_code, "
+                    f"content_type = EXCLUDED.content_type, content_encoding = EXCLUDED.content_encoding, "
+                    f"expires_at = EXCLUDED.expires_at, last_hit_at = now()"
+                ),
+                {
+                    "ns": namespace,
+                    "key": key,
+                    "q": self._literal(vec),
+                    "body": response.body,
+                    "status": response.status_code,
+                    "ctype": response.headers.get("content-type"),
+                    "cenc": response.headers.get("content-encoding"),
+                    "ttl": float(ttl_seconds),
+                },
+            )
+            self._writes += 1
+            # Amortise eviction: purge expired rows and trim the namespace
+            # down to max_entries (least recently hit first) every 100 writes.
+            if self._writes % 100 == 0:
+                conn.execute(sa.text(f"DELETE FROM {self.TABLE} WHERE expires_at <= now()"))
+                trimmed = conn.execute(
+                    sa.text(
+                        f"DELETE FROM {self.TABLE} WHERE namespace = :ns AND id IN ("
+                        f"SELECT id FROM {self.TABLE} WHERE namespace = :ns "
+                        f"ORDER BY last_hit_at DESC OFFSET :max)"
+                    ),
+                    {"ns": namespace, "max": self.max_entries},
+                )
+                if trimmed.rowcount:
+                    _EVICTIONS.labels(reason="lru").inc(trimmed.rowcount)
+
+    async def search(self, namespace: str, vec: np.ndarray) -> Optional[SemanticHit]:
+        from fastapi.concurrency import run_in_threadpool
+        return await run_in_threadpool(self._search_sync, namespace, vec)
+
+    async def add(self, namespace: str, key: str, vec: np.ndarray, response: CachedResponse, ttl_seconds: float) -> None:
+        from fastapi.concurrency import run_in_threadpool
+        await run_in_threadpool(self._add_sync, namespace, key, vec, response, ttl_seconds)
+
+
+_LOOKUPS = metrics.counter("bimo_semantic_cache_lookups_total", "Semantic cache lookups", ["result"])
+_EVICTIONS = metrics.counter("bimo_semantic_cache_evictions_total", "Semantic cache evictions", ["reason"])
+
+
+def prompt_text(payload: Dict[str, Any]) -> str:
+    """Flatten an OpenAI/Claude/Gemini request body into the text to embed."""
+    parts: List[str] = []
+    system = payload.get("system")
+    if isinstance(system, str):
+        parts.append(f"system: {system}")
+    for msg in payload.get("messages") or []:
+        if not isinstance(msg, dict):
+            continue
+        content = msg.get("content")
+        if isinstance(content, list):
+            content = " ".join(c.get("text", "") for c in content if isinstance(c, dict))
+        parts.append(f"{msg.get('role', 'user')}: {content or ''}")
+    for item in payload.get("contents") or []:
+        if isinstance(item, dict):
+            text = " ".join(p.get("text", "") for p in item.get("parts") or [] if isinstance(p, dict))
+            parts.append(f"{item.get('role', 'user')}: {text}")
+    if not parts and isinstance(payload.get("prompt"), str):
+        parts.append(payload["prompt"])
+    return "\n".join(parts)
+
+
+class SemanticCache:
+    """Namespace-aware semantic cache over an embedder and an index backend."""
+
+    def __init__(self, embedder, index, threshold: float, ttl_seconds: float) -> None:
+        self.embedder = embedder
+        self.index = index
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.stats: Dict[str, int] = {"hits": 0, "misses": 0, "stores": 0}
+
+    @staticmethod
+    def namespace(org_id: Optional[str], model: Optional[str], payload: Optional[Dict[str, Any]] = None) -> str:
+        """``<org>:<model>:<digest>``; the digest covers the non-prompt request fields."""
+        params = {k: v for k, v in (payload or {}).items() if k not in _PROMPT_FIELDS}
+        digest = hashlib.sha256(json.dumps(params, sort_keys=True, default=str).encode("utf-8")).hexdigest()[:16]
+        return f"{org_id or 'default'}:{model or 'unknown'}:{digest}"
+
+    async def lookup(self, namespace: str, text: str) -> Optional[SemanticHit]:
+        if not text:
+            return None
+        vec = await self.embedder.embed(text)
+        hit = await self.index.search(namespace, vec)
+        if hit is not None and hit.similarity >= self.threshold:
+            self.stats["hits"] += 1
+            _LOOKUPS.labels(result="hit").inc()
+            return hit
+        self.stats["misses"] += 1
+        _LOOKUPS.labels(result="miss").inc()
+        return None
+
+    async def store(self, namespace: str, text: str, response: CachedResponse, ttl_seconds: Optional[float] = None) -> None:
+        if not text:
+            return
+        vec = await self.embedder.embed(text)
+        key = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        await self.index.add(namespace, key, vec, response, ttl_seconds or self.ttl_seconds)
+        self.stats["stores"] += 1
+
+    def hit_rate(self) -> float:
+        total = self.stats["hits"] + self.stats["misses"]
+        return (self.stats["hits"] / total) if total else 0.0
+
+
+_cache: Optional[SemanticCache] = None
+
+
+def get_semantic_cache() -> Optional[SemanticCache]:
+    """Build (once) the process-wide semantic cache from settings.
+
+    None when no embedding model is configured: lexical similarity is not a
+    safe basis for serving another prompt's completion.
+    """
+    global _cache
+    if _cache is not None:
+        return _cache
+    if settings.SEMANTIC_CACHE_EMBEDDER == "hashing":
+        embedder = HashingEmbedder(dim=settings.SEMANTIC_CACHE_DIM)
+    elif settings.SEMANTIC_CACHE_EMBEDDER == "openai" and settings.OPENAI_API_KEY:
+        embedder = OpenAIEmbedder(settings.OPENAI_API_KEY, dim=settings.SEMANTIC_CACHE_DIM)
+    else:
+        return None
+    index = None
+    from ..db import DATABASE_URL, engine
+    if settings.SEMANTIC_CACHE_BACKEND != "memory" and DATABASE_URL.startswith("postgres"):
+        index = PgVectorIndex(engine, embedder.dim, settings.SEMANTIC_CACHE_MAX_ENTRIES, settings.SEMANTIC_CACHE_EF_SEARCH)
+    if index is None:
+        index = NumpyIndex(embedder.dim, settings.SEMANTIC_CACHE_MAX_ENTRIES, settings.SEMANTIC_CACHE_MAX_TOTAL_ENTRIES)
+    _cache = SemanticCache(embedder, index, settings.SEMANTIC_CACHE_THRESHOLD, settings.SEMANTIC_CACHE_TTL_SECONDS)
+    return _cache
@@ -0,0 +1,160 @@
+"""
+Spend time-series queries over the provider_metrics_* rollups.
+
+The planner picks the coarsest rollup table that can answer a request
+exactly: the table's bucket must be no coarser than the requested
+granularity and both range bounds must fall on its bucket boundaries. A
+12-month monthly trend therefore reads at most a few rows per provider and
+source from ``provider_metrics_monthly``, independent of raw event volume;
+a range starting mid-month falls back to the daily table.
+
+``source`` is always part of the grouping - dev estimates, prod gateway
+usage and billing invoices are never summed into one figure.
+"""
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import and_, func, select
+
+from ..models import ProviderMetricsDaily, ProviderMetricsHourly, ProviderMetricsMonthly
+from ..workers.rollups import as_datetime, bucket_expr, truncate
+
+UNITS = ("hour", "day", "month")  # fine -> coarse
+TABLES = {
+    "hour": ProviderMetricsHourly.__table__,
+    "day": ProviderMetricsDaily.__table__,
+    "month": ProviderMetricsMonthly.__table__,
+}
+GROUP_DIMENSIONS = ("provider", "category", "model", "connection_id")
+CATEGORIES = ("ai", "cloud", "saas")
+SOURCES = ("dev", "prod", "billing")
+
+
+class SpendQueryError(ValueError):
+    """Invalid query parameters (mapped to HTTP 400 by the router)."""
+
+
+def plan_resolution(start: datetime, end: datetime, granularity: str) -> str:
+    """Coarsest rollup unit that answers [start, end) at ``granularity``."""
+    if granularity not in UNITS:
+        raise SpendQueryError(f"granularity must be one of {', '.join(UNITS)}")
+    for unit in reversed(UNITS[:UNITS.index(granularity) + 1]):
+        if truncate(start, unit) == start and truncate(end, unit) == end:
+            return unit
+    return "hour"
+
+
+def parse_range(from_: Optional[str], to: Optional[str], default_days: int = 30) -> Tuple[datetime, datetime]:
+    """Turn inclusive ``from``/``to`` (dates or datetimes) into a half-open range."""
+    def parse(value: str, name: str):
+        try:
+            if len(value) == 10:
+                return date.fromisoformat(value)
+            return datetime.fromisoformat(value.replace("Z", "+00:00")).replace(tzinfo=None)
+        except ValueError:
+            raise SpendQueryError(f"`{name}` must be an ISO date or datetime")
+
+    end_value = parse(to, "to") if to else datetime.utcnow().date()
+    if isinstance(end_value, datetime):
+        end = end_value
+    else:
+        # A date `to` includes that whole day
+        end = datetime.combine(end_value, datetime.min.time()) + timedelta(days=1)
+    if from_:
+        start_value = parse(from_, "from")
+        start = start_value if isinstance(start_value, datetime) else datetime.combine(start_value, datetime.min.time())
+    else:
+        start = end - timedelta(days=default_days)
+    if start >= end:
+        raise SpendQueryError("`from` must be before `to`")
+    return start, end
+
+
+def parse_group_by(raw: Optional[str]) -> List[str]:
+    dims = [d.strip() for d in (raw or "").split(",") if d.strip()]
+    for d in dims:
+        if d != "source" and d not in GROUP_DIMENSIONS:
+            raise SpendQueryError(f"group_by accepts source, {', '.join(GROUP_DIMENSIONS)}")
+    return [d for d in GROUP_DIMENSIONS if d in dims]
+
+
+def spend_trends(
+    conn,
+    start: datetime,
+    end: datetime,
+    granularity: str = "day",
+    group_by: Sequence[str] = (),
+    provider: Optional[str] = None,
+    source: Optional[str] = None,
+    org_id: Optional[str] = None,
+) -> Tuple[List[Dict], Dict]:
+    """Return (rows, meta) for a spend time series.
+
+    Rows are keyed by ``date`` + ``source`` + the requested dimensions and
+    carry ``total`` plus an ``ai``/``cloud``/``saas`` breakdown (unless
+    ``category`` is itself a grouping dimension). With ``org_id`` only that
+    org's buckets are read; None reads every org (admin callers).
+    """
+    resolution = plan_resolution(start, end, granularity)
+    table = TABLES[resolution]
+    dialect = conn.dialect.name
+    if resolution == granularity:
+        bucket = table.c.bucket_start.label("bucket")
+    else:
+        bucket = bucket_expr(table.c.bucket_start, granularity, dialect).label("bucket")
+
+    dims = [table.c[d] for d in group_by]
+    pivot = "category" not in group_by
+    keys = [bucket, table.c.source, *dims] + ([table.c.category] if pivot else [])
+    conditions = [table.c.bucket_start >= start, table.c.bucket_start < end]
+    if org_id is not None:
+        conditions.append(table.c.org_id == org_id)
+    if provider:
+        conditions.append(table.c.provider == provider)
+    if source:
+        if source not in SOURCES:
+            raise SpendQueryError(f"source must be one of {', '.join(SOURCES)}")
+        conditions.append(table.c.source == source)
+    stmt = (
+        select(
+            *keys,
+            func.sum(table.c.cost).label("cost"),
+            func.sum(table.c.requests).label("requests"),
+            func.sum(table.c.total_tokens).label("tokens"),
+        )
+        .where(and_(*conditions))
+        .group_by(*keys)
+    )
+
+    rows: Dict[tuple, Dict] = {}
+    for r in conn.execute(stmt).mappings():
+        ts = as_datetime(r["bucket"])
+        label = ts.isoformat() if granularity == "hour" else ts.date().isoformat()
+        key = (label, r["source"]) + tuple(r[d] for d in group_by)
+        row = rows.get(key)
+        if row is None:
+            row = {"date": label, "source": r["source"], **{d: r[d] for d in group_by}, "total": 0.0}
+            if pivot:
+                row.update({c: 0.0 for c in CATEGORIES})
+            row.update({"requests": 0, "tokens": 0})
+            rows[key] = row
+        cost = float(r["cost"] or 0.0)
+        row["total"] += cost
+        row["requests"] += int(r["requests"] or 0)
+        row["tokens"] += int(r["tokens"] or 0)
+        if pivot and r["category"] in CATEGORIES:
+            row[r["category"]] += cost
+
+    data = sorted(rows.values(), key=lambda x: (x["date"], x["source"]) + tuple(str(x[d]) for d in group_by))
+    for row in data:
+        for k in ("total",) + (CATEGORIES if pivot else ()):
+            row[k] = round(row[k], 6)
+    meta = {
+        "from": start.isoformat(),
+        "to": end.isoformat(),
+        "granularity": granularity,
+        "resolution": resolution,
+        "group_by": ["source", *group_by],
+        "rows": len(data),
+    }
+    return data, meta
@@ -0,0 +1,171 @@
+"""
+Spend summary for the dashboard landing page.
+
+Totals come from grouped SQL aggregates (``SUM`` by provider and source over
+``invoice`` and ``api_logs``) mapped onto the ai/cloud/saas categories, and
+are cached per org:
+
+- ``ingest_invoice`` invalidates every entry (invoices are not org-scoped);
+- the usage pipeline adds each flushed batch onto the cached entries it
+  belongs to, so prod/dev figures stay current without re-querying. Each
+  entry remembers the buffer's write sequence its query ran at, so a batch
+  the query already counted is never added again; a summary computed while
+  a batch was being written is not cached at all.
+
+A TTL bounds drift from writes that bypass both paths (manual SQL, other
+processes).
+"""
+import logging
+import threading
+import time
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from sqlalchemy import func, select
+
+from ..core import metrics
+from ..models import ApiLog, Invoice
+from ..settings import settings
+from ..workers.rollups import provider_category
+
+logger = logging.getLogger(__name__)
+
+CATEGORIES = ("ai", "cloud", "saas")
+SOURCES = ("dev", "prod", "billing")
+
+_LOOKUPS = metrics.counter("bimo_spend_summary_cache_total", "Spend summary cache lookups", ["result"])
+
+
+def _empty() -> Dict[str, float]:
+    return {"total": 0.0, **{c: 0.0 for c in CATEGORIES}}
+
+
+def _add(summary: Dict[str, Any], source: str, category: str, amount: float) -> None:
+    bucket = summary["by_source"].setdefault(source, _empty())
+    bucket["total"] += amount
+    if category in bucket:
+        bucket[category] += amount
+
+
+def _finish(summary: Dict[str, Any]) -> Dict[str, Any]:
+    """Headline figures are the authoritative billing numbers."""
+    billing = summary["by_source"].get("billing") or _empty()
+    out = {k: round(v, 6) for k, v in billing.items()}
+    out["source"] = "billing"
+    out["by_source"] = {s: {k: round(v, 6) for k, v in b.items()} for s, b in summary["by_source"].items()}
+    return out
+
+
+def compute_summary(conn, org_id: Optional[str] = None) -> Dict[str, Any]:
+    """Aggregate spend with two grouped queries; rows returned are O(providers x sources)."""
+    summary: Dict[str, Any] = {"by_source": {s: _empty() for s in SOURCES}}
+
+    inv = Invoice.__table__
+    inv_source = func.coalesce(inv.c.source, "billing")
+    for provider, source, amount in conn.execute(
+        select(inv.c.provider, inv_source, func.sum(inv.c.amount)).group_by(inv.c.provider, inv_source)
+    ):
+        _add(summary, source, provider_category(provider), float(amount or 0.0))
+
+    logs = ApiLog.__table__
+    log_source = func.coalesce(logs.c.source, "prod")
+    stmt = select(logs.c.provider, log_source, func.sum(logs.c.cost)).group_by(logs.c.provider, log_source)
+    if org_id is not None:
+        stmt = stmt.where(logs.c.org_id == org_id)
+    for provider, source, cost in conn.execute(stmt):
+        _add(summary, source, provider_category(provider, default="ai"), float(cost or 0.0))
+    return summary
+
+
+class SummaryCache:
+    """Per-org summaries keyed by org id (``None`` = all orgs)."""
+
+    def __init__(self, ttl_seconds: float) -> None:
+        self.ttl_seconds = ttl_seconds
+        # org -> (expires_at, summary, usage sequence the summary was computed at)
+        self._entries: Dict[Optional[str], Tuple[float, Dict[str, Any], Optional[int]]] = {}
+        self._lock = threading.Lock()
+        # Bumped on invalidation so a summary computed concurrently is not cached stale
+        self._generation = 0
+        self._buffer = None
+
+    def watch(self, buffer) -> None:
+        """Fold batches flushed by ``buffer`` (a ``UsageBuffer``) into cached entries."""
+        with self._lock:
+            self._buffer = buffer
+            self._entries.clear()
+        buffer.listeners.append(self.apply_usage)
+
+    def _sequence(self) -> Optional[int]:
+        return self._buffer.sequence if self._buffer is not None else None
+
+    def get(self, org_id: Optional[str], conn) -> Dict[str, Any]:
+        with self._lock:
+            item = self._entries.get(org_id)
+            if item is not None and item[0] > time.monotonic():
+                _LOOKUPS.labels(result="hit").inc()
+                return _finish(item[1])
+            generation = self._generation
+            sequence = self._sequence()
+        _LOOKUPS.labels(result="miss").inc()
+        summary = compute_summary(conn, org_id)
+        with self._lock:
+            # A batch written during the query may or may not be in it; don't guess
+            settled = sequence is None or (sequence % 2 == 0 and sequence == self._sequence())
+            if generation == self._generation and settled:
+                self._entries[org_id] = (time.monotonic() + self.ttl_seconds, summary, sequence)
+        return _finish(summary)
+
+    def invalidate(self, org_id: Optional[str] = None) -> None:
+        """Drop one org's entry, or every entry when ``org_id`` is None."""
+        with self._lock:
+            self._generation += 1
+            if org_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(org_id, None)
+                self._entries.pop(None, None)
+
+    def apply_usage(self, rows: Iterable[Dict[str, Any]]) -> None:
+        """Usage-buffer listener: fold a flushed api_logs batch into cached entries.
+
+        Runs right after the batch committed, so the buffer's sequence is the
+        batch's own; entries computed at or after it already include the rows.
+        """
+        with self._lock:
+            if not self._entries:
+                return
+            batch = self._sequence()
+            for row in rows:
+                cost = float(row.get("cost") or 0.0)
+                if not cost:
+                    continue
+                source = row.get("source") or "prod"
+                category = provider_category(row.get("provider"), default="ai")
+                for key in {None, row.get("org_id")}:
+                    item = self._entries.get(key)
+                    if item is not None and (batch is None or item[2] is None or item[2] < batch):
+                        _add(item[1], source, category, cost)
+
+
+_cache: Optional[SummaryCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_summary_cache() -> SummaryCache:
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                cache = SummaryCache(settings.SPEND_SUMMARY_TTL_SECONDS)
+                try:
+                    from .usage import get_usage_buffer
+                    cache.watch(get_usage_buffer())
+                except Exception as e:
+                    logger.warning("spend summary usage listener not registered: %s", e)
+                _cache = cache
+    return _cache
+
+
+def invalidate_summaries(org_id: Optional[str] = None) -> None:
+    if _cache is not None:
+        _cache.invalidate(org_id)
@@ -0,0 +1,157 @@
+"""
+Long-lived upstream HTTP clients used by the gateway.
+
+Each provider base URL gets its own ``httpx.AsyncClient`` so connection
+pools, keep-alive and HTTP/2 multiplexing are shared across requests instead
+of paying a TCP/TLS handshake per call. Clients are created lazily on first
+use and closed from the application shutdown hook.
+
+HTTP/2 is enabled only when the optional ``h2`` package is installed; the
+pool silently falls back to HTTP/1.1 keep-alive otherwise.
+"""
+import asyncio
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlparse
+
+import httpx
+
+from ..settings import settings
+
+PROVIDER_BASE_URLS: Dict[str, str] = {
+    "openai": "https://api.openai.com",
+    "claude": "https://api.anthropic.com",
+    "gemini": "https://generativelanguage.googleapis.com",
+}
+
+# Azure OpenAI is deployed per resource, so the base URL comes from the
+# connection credentials. Only Azure-owned hosts are accepted to avoid turning
+# the gateway into an open proxy.
+AZURE_HOST_SUFFIXES = (".openai.azure.com", ".cognitiveservices.azure.com")
+
+# Headers that must not be forwarded between hops (RFC 7230 section 6.1) plus
+# those httpx/starlette recompute themselves.
+HOP_BY_HOP_HEADERS = frozenset({
+    "connection",
+    "keep-alive",
+    "proxy-authenticate",
+    "proxy-authorization",
+    "te",
+    "trailers",
+    "transfer-encoding",
+    "upgrade",
+    "host",
+    "content-length",
+})
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401  # type: ignore
+        return True
+    except Exception:
+        return False
+
+
+def resolve_base_url(provider: str, azure_endpoint: Optional[str] = None) -> Optional[str]:
+    """Return the upstream base URL for a provider, or None when unsupported."""
+    provider = (provider or "").lower()
+    if provider == "azure":
+        if not azure_endpoint:
+            return None
+        parsed = urlparse(azure_endpoint if "://" in azure_endpoint else f"https://{azure_endpoint}")
+        host = (parsed.hostname or "").lower()
+        if parsed.scheme != "https" or not host.endswith(AZURE_HOST_SUFFIXES):
+            return None
+        return f"https://{host}"
+    return PROVIDER_BASE_URLS.get(provider)
+
+
+class UpstreamPool:
+    """Registry of pooled ``httpx.AsyncClient`` instances keyed by base URL.
+
+    A client is bound to the event loop that created it; if the pool is used
+    from a different loop (e.g. test clients spinning up their own portal) a
+    fresh client is built for that loop and the old one is closed on its own
+    loop, so its sockets are not leaked.
+    """
+
+    def __init__(self, transport: Optional[httpx.AsyncBaseTransport] = None) -> None:
+        self._transport = transport
+        self._clients: Dict[str, Tuple[httpx.AsyncClient, asyncio.AbstractEventLoop]] = {}
+
+    def _build_client(self, base_url: str) -> httpx.AsyncClient:
+        limits = httpx.Limits(
+            max_connections=settings.GATEWAY_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.GATEWAY_MAX_KEEPALIVE,
+            keepalive_expiry=settings.GATEWAY_KEEPALIVE_EXPIRY,
+        )
+        timeout = httpx.Timeout(settings.GATEWAY_TIMEOUT, connect=settings.GATEWAY_CONNECT_TIMEOUT)
+        kwargs = {
+            "base_url": base_url,
+            "limits": limits,
+            "timeout": timeout,
+            # The gateway forwards bytes verbatim; never let httpx follow
+            # redirects or inject its own default headers.
+            "follow_redirects": False,
+            "headers": {},
+        }
+        if self._transport is not None:
+            kwargs["transport"] = self._transport
+        else:
+            kwargs["http2"] = bool(settings.GATEWAY_HTTP2 and _http2_available())
+        return httpx.AsyncClient(**kwargs)
+
+    def client_for(self, base_url: str) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        entry = self._clients.get(base_url)
+        if entry is not None and entry[1] is loop and not entry[0].is_closed:
+            return entry[0]
+        client = self._build_client(base_url)
+        self._clients[base_url] = (client, loop)
+        if entry is not None and not entry[0].is_closed:
+            _close_on(*entry)
+        return client
+
+    async def aclose(self) -> None:
+        clients = [c for c, _ in self._clients.values()]
+        self._clients.clear()
+        for client in clients:
+            try:
+                await client.aclose()
+            except Exception:
+                pass
+
+
+async def _quiet_close(client: httpx.AsyncClient) -> None:
+    try:
+        await client.aclose()
+    except Exception:
+        pass
+
+
+def _close_on(client: httpx.AsyncClient, loop: asyncio.AbstractEventLoop) -> None:
+    """Close a replaced client on the loop that owns its connections."""
+    if not loop.is_running():
+        # A stopped loop is not ours to drive; a closed one took its transports with it
+        return
+    try:
+        asyncio.run_coroutine_threadsafe(_quiet_close(client), loop)
+    except RuntimeError:
+        pass
+
+
+def filter_headers(headers, drop_prefixes: Tuple[str, ...] = ()) -> Dict[str, str]:
+    """Copy headers, dropping hop-by-hop ones and any with the given prefixes."""
+    out: Dict[str, str] = {}
+    for k, v in headers.items():
+        lk = k.lower()
+        if lk in HOP_BY_HOP_HEADERS:
+            continue
+        if drop_prefixes and lk.startswith(drop_prefixes):
+            continue
+        out[k] = v
+    return out
+
+
+# Process-wide pool shared by the gateway router
+pool = UpstreamPool()
@@ -0,0 +1,394 @@
+"""
+Usage events emitted by the gateway into `api_logs`.
+
+``usage_from_response`` pulls model and token counts out of a provider
+response body (OpenAI/Azure, Anthropic and Gemini shapes). ``record_usage``
+hands the event to a write-behind ``UsageBuffer`` instead of committing one
+row per request:
+
+- events are appended to column arrays under a lock (no ORM objects),
+- a flusher thread writes them in bulk once ``USAGE_FLUSH_SIZE`` events
+  are pending or ``USAGE_FLUSH_INTERVAL_SECONDS`` elapsed, using a
+  multi-row INSERT on SQLite and ``COPY`` on Postgres,
+- when ``USAGE_BUFFER_CAPACITY`` is reached producers block for up to
+  ``USAGE_PUT_TIMEOUT_SECONDS`` (backpressure) before the event is dropped,
+- ``drain()`` flushes everything on shutdown.
+
+Usage accounting is best-effort and never fails a proxied request.
+"""
+import csv
+import io
+import json
+import logging
+import threading
+import time
+import zlib
+from array import array
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from ..core import metrics
+from ..settings import settings
+from .pricing import estimate_cost
+
+logger = logging.getLogger(__name__)
+
+
+def _decode_body(raw: bytes, content_encoding: Optional[str]) -> Optional[Any]:
+    enc = (content_encoding or "").lower().strip()
+    try:
+        if enc == "gzip":
+            raw = zlib.decompress(raw, 16 + zlib.MAX_WBITS)
+        elif enc == "deflate":
+            raw = zlib.decompress(raw)
+        elif enc not in ("", "identity"):
+            # e.g. br: no decoder available here, skip token accounting
+            return None
+        return json.loads(raw)
+    except Exception:
+        return None
+
+
+def usage_from_response(raw: bytes, content_encoding: Optional[str] = None) -> Tuple[Optional[str], int, int]:
+    """Return (model, prompt_tokens, completion_tokens) from a response body."""
+    body = _decode_body(raw, content_encoding)
+    if not isinstance(body, dict):
+        return None, 0, 0
+    model = body.get("model") or body.get("modelVersion")
+    usage = body.get("usage")
+    if isinstance(usage, dict):
+        prompt = usage.get("prompt_tokens", usage.get("input_tokens", 0)) or 0
+        completion = usage.get("completion_tokens", usage.get("output_tokens", 0)) or 0
+        return model, int(prompt), int(completion)
+    meta = body.get("usageMetadata")
+    if isinstance(meta, dict):
+        return model, int(meta.get("promptTokenCount") or 0), int(meta.get("candidatesTokenCount") or 0)
+    return model, 0, 0
+
+
+def build_usage_event(
+    *,
+    provider: str,
+    raw: Optional[bytes],
+    content_encoding: Optional[str] = None,
+    request_model: Optional[str] = None,
+    connection_id: Optional[int] = None,
+    org_id: Optional[str] = None,
+    latency_ms: float = 0.0,
+    status_code: Optional[int] = None,
+    source: str = "prod",
+    cache_hit: bool = False,
+) -> Dict[str, Any]:
+    model, prompt, completion = (None, 0, 0)
+    if raw:
+        model, prompt, completion = usage_from_response(raw, content_encoding)
+    model = model or request_model
+    cost = estimate_cost(model, prompt, completion)
+    return {
+        "connection_id": connection_id,
+        "org_id": org_id,
+        "provider": provider,
+        "model": model,
+        "prompt_tokens": prompt,
+        "completion_tokens": completion,
+        "total_tokens": prompt + completion,
+        # Cache hits cost nothing upstream; the avoided spend is kept separately
+        "cost": 0.0 if cache_hit else cost,
+        "saved_cost": cost if cache_hit else 0.0,
+        "latency_ms": float(latency_ms),
+        "status_code": status_code,
+        "source": source,
+        "cache_hit": cache_hit,
+    }
+
+
+COLUMNS = (
+    "connection_id", "org_id", "provider", "model", "prompt_tokens", "completion_tokens", "total_tokens",
+    "cost", "saved_cost", "latency_ms", "status_code", "source", "cache_hit", "created_at",
+)
+
+
+class UsageEvent:
+    """A single usage event; ``__slots__`` keeps per-event overhead small."""
+
+    __slots__ = COLUMNS
+
+    def __init__(self, connection_id=None, org_id=None, provider=None, model=None, prompt_tokens=0,
+                 completion_tokens=0, total_tokens=0, cost=0.0, saved_cost=0.0, latency_ms=0.0,
+                 status_code=None, source="prod", cache_hit=False, created_at=None) -> None:
+        self.connection_id = connection_id
+        self.org_id = org_id
+        self.provider = provider
+        self.model = model
+        self.prompt_tokens = prompt_tokens
+        self.completion_tokens = completion_tokens
+        self.total_tokens = total_tokens
+        self.cost = cost
+        self.saved_cost = saved_cost
+        self.latency_ms = latency_ms
+        self.status_code = status_code
+        self.source = source
+        self.cache_hit = cache_hit
+        self.created_at = created_at if created_at is not None else time.time()
+
+
+class _Batch:
+    """Column-oriented batch: numeric columns live in typed arrays.
+
+    ``-1`` encodes NULL for the integer id/status columns.
+    """
+
+    __slots__ = ("connection_id", "status_code", "prompt_tokens", "completion_tokens", "total_tokens",
+                 "cache_hit", "cost", "saved_cost", "latency_ms", "created_at",
+                 "org_id", "provider", "model", "source")
+
+    def __init__(self) -> None:
+        self.connection_id = array("q")
+        self.status_code = array("q")
+        self.prompt_tokens = array("q")
+        self.completion_tokens = array("q")
+        self.total_tokens = array("q")
+        self.cache_hit = array("b")
+        self.cost = array("d")
+        self.saved_cost = array("d")
+        self.latency_ms = array("d")
+        self.created_at = array("d")
+        self.org_id: List[Optional[str]] = []
+        self.provider: List[Optional[str]] = []
+        self.model: List[Optional[str]] = []
+        self.source: List[Optional[str]] = []
+
+    def __len__(self) -> int:
+        return len(self.created_at)
+
+    def append(self, ev: UsageEvent) -> None:
+        self.connection_id.append(-1 if ev.connection_id is None else int(ev.connection_id))
+        self.status_code.append(-1 if ev.status_code is None else int(ev.status_code))
+        self.prompt_tokens.append(int(ev.prompt_tokens or 0))
+        self.completion_tokens.append(int(ev.completion_tokens or 0))
+        self.total_tokens.append(int(ev.total_tokens or 0))
+        self.cache_hit.append(1 if ev.cache_hit else 0)
+        self.cost.append(float(ev.cost or 0.0))
+        self.saved_cost.append(float(ev.saved_cost or 0.0))
+        self.latency_ms.append(float(ev.latency_ms or 0.0))
+        self.created_at.append(float(ev.created_at))
+        self.org_id.append(ev.org_id)
+        self.provider.append(ev.provider)
+        self.model.append(ev.model)
+        self.source.append(ev.source)
+
+    def rows(self, start: int = 0, stop: Optional[int] = None) -> List[Dict[str, Any]]:
+        stop = len(self) if stop is None else stop
+        out = []
+        for i in range(start, stop):
+            cid = self.connection_id[i]
+            status = self.status_code[i]
+            out.append({
+                "connection_id": None if cid < 0 else cid,
+                "org_id": self.org_id[i],
+                "provider": self.provider[i],
+                "model": self.model[i],
+                "prompt_tokens": self.prompt_tokens[i],
+                "completion_tokens": self.completion_tokens[i],
+                "total_tokens": self.total_tokens[i],
+                "cost": self.cost[i],
+                "saved_cost": self.saved_cost[i],
+                "latency_ms": self.latency_ms[i],
+                "status_code": None if status < 0 else status,
+                "source": self.source[i],
+                "cache_hit": bool(self.cache_hit[i]),
+                "created_at": datetime.utcfromtimestamp(self.created_at[i]),
+            })
+        return out
+
+
+_ENQUEUED = metrics.counter("bimo_usage_events_enqueued_total", "Usage events accepted into the write-behind buffer", ["source"])
+_DROPPED = metrics.counter("bimo_usage_events_dropped_total", "Usage events dropped", ["reason"])
+_FLUSHED = metrics.counter("bimo_usage_events_flushed_total", "Usage events written to api_logs")
+_FLUSH_SECONDS = metrics.histogram("bimo_usage_flush_seconds", "Time spent writing one usage batch")
+_PENDING = metrics.gauge("bimo_usage_events_pending", "Usage events waiting in the buffer")
+
+
+def _write_sqlalchemy(engine, rows: List[Dict[str, Any]], chunk: int = 500) -> None:
+    """Multi-row INSERT ... VALUES (...), (...) in chunks (SQLite and others)."""
+    from ..models import ApiLog
+    table = ApiLog.__table__
+    with engine.begin() as conn:
+        for i in range(0, len(rows), chunk):
+            conn.execute(table.insert().values(rows[i:i + chunk]))
+
+
+def _write_postgres_copy(engine, rows: List[Dict[str, Any]]) -> None:
+    """Stream the batch through ``COPY api_logs FROM STDIN`` (CSV)."""
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    for r in rows:
+        writer.writerow(["" if r[c] is None else r[c] for c in COLUMNS])
+    buf.seek(0)
+    raw = engine.raw_connection()
+    try:
+        cur = raw.cursor()
+        cur.copy_expert(f"COPY api_logs ({', '.join(COLUMNS)}) FROM STDIN WITH (FORMAT csv)", buf)
+        raw.commit()
+    except Exception:
+        raw.rollback()
+        raise
+    finally:
+        raw.close()
+
+
+class UsageBuffer:
+    """Bounded write-behind buffer flushing usage events into `api_logs`."""
+
+    def __init__(self, engine=None, capacity: int = 50000, flush_size: int = 1000,
+                 flush_interval: float = 1.0, put_timeout: float = 0.5,
+                 writer: Optional[Callable[[List[Dict[str, Any]]], None]] = None,
+                 autostart: bool = True) -> None:
+        self.engine = engine
+        self.capacity = capacity
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self._writer = writer
+        self._autostart = autostart
+        self._batch = _Batch()
+        self._lock = threading.Lock()
+        self._space = threading.Condition(self._lock)
+        self._wake = threading.Event()
+        self._flush_lock = threading.Lock()
+        self._stopped = False
+        self._thread: Optional[threading.Thread] = None
+        # Callbacks run with each successfully written batch (e.g. cache updates)
+        self.listeners: List[Callable[[List[Dict[str, Any]]], None]] = []
+        # Odd while a batch is being written, +2 per batch: lets readers tell
+        # whether a query they ran may already include a batch being announced
+        self.sequence = 0
+
+    def _ensure_started(self) -> None:
+        if self._thread is None and self._autostart:
+            self._thread = threading.Thread(target=self._run, name="usage-flusher", daemon=True)
+            self._thread.start()
+
+    def record(self, event: UsageEvent) -> bool:
+        """Queue an event; blocks up to ``put_timeout`` when the buffer is full."""
+        with self._space:
+            if self._stopped:
+                _DROPPED.labels(reason="stopped").inc()
+                return False
+            if len(self._batch) >= self.capacity:
+                self._wake.set()
+                deadline = time.monotonic() + self.put_timeout
+                while len(self._batch) >= self.capacity:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0 or self._stopped:
+                        _DROPPED.labels(reason="full").inc()
+                        return False
+                    self._space.wait(remaining)
+            self._batch.append(event)
+            pending = len(self._batch)
+        _ENQUEUED.labels(source=event.source or "unknown").inc()
+        _PENDING.set(pending)
+        self._ensure_started()
+        if pending >= self.flush_size:
+            self._wake.set()
+        return True
+
+    def _run(self) -> None:
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.warning("usage flush failed: %s", e)
+            if self._stopped:
+                return
+
+    def _write(self, rows: List[Dict[str, Any]]) -> None:
+        if self._writer is not None:
+            self._writer(rows)
+            return
+        engine = self.engine
+        if engine is None:
+            from ..db import engine
+        if engine.dialect.name == "postgresql":
+            _write_postgres_copy(engine, rows)
+        else:
+            _write_sqlalchemy(engine, rows)
+
+    def flush(self) -> int:
+        """Write everything currently buffered; returns the number of rows written."""
+        with self._flush_lock:
+            with self._space:
+                batch, self._batch = self._batch, _Batch()
+                self._space.notify_all()
+            _PENDING.set(0)
+            if not len(batch):
+                return 0
+            rows = batch.rows()
+            started = time.perf_counter()
+            self.sequence += 1
+            try:
+                self._write(rows)
+            except Exception as e:
+                _DROPPED.labels(reason="write_error").inc(len(rows))
+                logger.warning("failed to write %d usage events: %s", len(rows), e)
+                return 0
+            finally:
+                self.sequence += 1
+            _FLUSH_SECONDS.observe(time.perf_counter() - started)
+            _FLUSHED.inc(len(rows))
+            for listener in list(self.listeners):
+                try:
+                    listener(rows)
+                except Exception as e:
+                    logger.warning("usage listener failed: %s", e)
+            return len(rows)
+
+    def drain(self, timeout: float = 10.0) -> int:
+        """Stop accepting events, flush what is left and stop the flusher."""
+        with self._space:
+            self._stopped = True
+            self._space.notify_all()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        return self.flush()
+
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._batch)
+
+
+_buffer: Optional[UsageBuffer] = None
+_buffer_lock = threading.Lock()
+
+
+def get_usage_buffer() -> UsageBuffer:
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                _buffer = UsageBuffer(
+                    capacity=settings.USAGE_BUFFER_CAPACITY,
+                    flush_size=settings.USAGE_FLUSH_SIZE,
+                    flush_interval=settings.USAGE_FLUSH_INTERVAL_SECONDS,
+                    put_timeout=settings.USAGE_PUT_TIMEOUT_SECONDS,
+                )
+    return _buffer
+
+
+def record_usage(event: Dict[str, Any]) -> bool:
+    """Queue a usage event for the next bulk write into `api_logs`."""
+    try:
+        return get_usage_buffer().record(UsageEvent(**event))
+    except Exception as e:
+        logger.warning("failed to record usage event: %s", e)
+        return False
+
+
+def drain_usage_buffer() -> int:
+    """Flush and stop the process-wide buffer (called on shutdown)."""
+    if _buffer is None:
+        return 0
+    return _buffer.drain()
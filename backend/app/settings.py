@@ -21,6 +21,120 @@ class Settings(BaseSettings):
     # Monitoring
     SENTRY_DSN: str | None = None
     ENABLE_PROMETHEUS: bool = True
+    # Gateway upstream connection pools (per provider)
+    GATEWAY_MAX_CONNECTIONS: int = 200
+    GATEWAY_MAX_KEEPALIVE: int = 100
+    GATEWAY_KEEPALIVE_EXPIRY: float = 60.0
+    GATEWAY_TIMEOUT: float = 120.0
+    GATEWAY_CONNECT_TIMEOUT: float = 5.0
+    GATEWAY_HTTP2: bool = True
+    # Exact-match gateway response cache (in-process LRU + Redis tier)
+    RESPONSE_CACHE_ENABLED: bool = True
+    RESPONSE_CACHE_TTL_SECONDS: int = 3600
+    RESPONSE_CACHE_MAX_BYTES: int = 64 * 1024 * 1024
+    RESPONSE_CACHE_MAX_ENTRY_BYTES: int = 1024 * 1024
+    # Write-behind usage pipeline into api_logs
+    USAGE_BUFFER_CAPACITY: int = 50000
+    USAGE_FLUSH_SIZE: int = 1000
+    USAGE_FLUSH_INTERVAL_SECONDS: float = 1.0
+    USAGE_PUT_TIMEOUT_SECONDS: float = 0.5
+    # provider_metrics_* rollups (workers/rollups.py)
+    ROLLUP_BATCH_SIZE: int = 10000
+    ROLLUP_ID_OVERLAP: int = 1000  # ids re-scanned behind the mark for out-of-order commits
+    ROLLUP_INTERVAL_SECONDS: float = 300.0  # Celery beat, or the in-process scheduler tick
+    # Cached BigQuery clients per (service account, project)
+    BIGQUERY_CLIENT_IDLE_SECONDS: float = 900.0
+    BIGQUERY_CLIENT_MAX: int = 32
+    # BigQuery result cache (stale-while-revalidate)
+    BIGQUERY_CACHE_ENABLED: bool = True
+    BIGQUERY_CACHE_TTL_SECONDS: float = 900.0
+    BIGQUERY_CACHE_STALE_SECONDS: float = 6 * 3600.0
+    BIGQUERY_CACHE_MAX_ENTRIES: int = 1000
+    # Dry-run byte guard; per-connection override via credentials "bigquery_max_bytes" (0 = no limit)
+    BIGQUERY_DRY_RUN_ENABLED: bool = True
+    BIGQUERY_MAX_BYTES_PER_QUERY: int = 10 * 1024 ** 3
+    # Incremental billing export sync (workers/bigquery_sync.py)
+    BIGQUERY_SYNC_INITIAL_DAYS: int = 90
+    BIGQUERY_SYNC_MAX_STREAMS: int = 4
+    # In-process worker pool used when Celery is absent (workers/executor.py)
+    WORKER_POOL_SIZE: int = 8
+    WORKER_QUEUE_MAX: int = 1000
+    # comma-separated provider=max concurrent jobs
+    WORKER_PROVIDER_LIMITS: str = "openai=4,claude=4,gemini=2,azure=4"
+    # Celery (workers/celery_app.py); DevTask.delay dispatches to it when enabled
+    CELERY_ENABLED: bool = False
+    CELERY_BROKER_URL: str | None = None  # defaults to REDIS_URL, then memory://
+    CELERY_RESULT_BACKEND: str | None = None
+    CELERY_PREFETCH_MULTIPLIER: int = 4
+    CELERY_SYNC_BATCH_SIZE: int = 25
+    # comma-separated provider=calls/period for each provider's usage API
+    PROVIDER_API_QUOTAS: str = "openai=300/m,claude=300/m,gemini=60/m,azure=600/m"
+    # Adaptive periodic sync scheduler (workers/scheduler.py)
+    SYNC_SCHEDULER_ENABLED: bool = True  # in-process ticking when Celery beat isn't used
+    SYNC_SCHEDULER_TICK_SECONDS: float = 30.0
+    SYNC_SCHEDULER_BATCH: int = 500  # max syncs claimed per tick
+    SYNC_SEED_INTERVAL_SECONDS: float = 300.0
+    SYNC_LEASE_SECONDS: int = 900
+    SYNC_MIN_INTERVAL_SECONDS: int = 300
+    SYNC_MAX_INTERVAL_SECONDS: int = 86400
+    SYNC_INITIAL_INTERVAL_SECONDS: int = 3600
+    SYNC_TARGET_EVENTS: int = 500  # usage events a sync should typically pick up
+    SYNC_JITTER_FRACTION: float = 0.1
+    # Provider usage/cost API fetchers (workers/usage_fetchers.py)
+    USAGE_FETCH_CONCURRENCY: str = "openai=4,claude=4,azure=2"  # in-flight requests per provider, across all syncs in a process
+    USAGE_FETCH_MAX_RETRIES: int = 5
+    USAGE_FETCH_MAX_RETRY_AFTER: float = 60.0
+    USAGE_FETCH_WINDOW_DAYS: int = 7  # date windows fetched in parallel
+    USAGE_FETCH_INITIAL_DAYS: int = 30
+    USAGE_COST_LOOKBACK_DAYS: int = 3  # costs are re-fetched to pick up restatements
+    # Historical backfills (see workers/backfill.py)
+    BACKFILL_CHUNK_DAYS: int = 7
+    BACKFILL_WORKERS: int = 4  # parallel chunk workers per job
+    BACKFILL_LEASE_SECONDS: int = 900  # a chunk held longer is re-claimed
+    BACKFILL_MAX_ATTEMPTS: int = 3
+    # Background job store for sync-now and similar endpoints (services/jobs.py)
+    JOB_TTL_SECONDS: int = 3600  # kept this long after the last update
+    JOB_EVENTS_POLL_SECONDS: float = 0.5
+    # Billing export file imports (workers/billing_files.py)
+    BILLING_FILE_CHUNK_ROWS: int = 20000
+    BILLING_FILE_WORKERS: int = 4
+    # Rate limiting (core/rate_limit.py); buckets are shared through Redis when REDIS_URL is set
+    ENABLE_RATE_LIMIT: bool = False  # per-client-IP limit on every request
+    RATE_LIMIT_DEFAULT: str = "100/minute"
+    RATE_LIMIT_LEASE_FRACTION: float = 0.05  # max share of a bucket one worker leases at a time
+    # comma-separated proxy IPs/CIDRs (load balancer, ingress) whose
+    # X-Forwarded-For is believed for per-IP limits; empty = use the socket peer
+    TRUSTED_PROXIES: str = ""
+    # get_current_user caches (auth.py); verified tokens are kept until their exp
+    AUTH_TOKEN_CACHE_MAX_ENTRIES: int = 10000
+    AUTH_USER_CACHE_TTL_SECONDS: float = 30.0
+    AUTH_USER_CACHE_MAX_ENTRIES: int = 10000
+    # Password hashing pool (services/passwords.py)
+    PASSWORD_HASH_WORKERS: int = 2  # processes; 0 = one dedicated thread
+    PASSWORD_HASH_MAX_PENDING: int = 64  # queued + running; beyond this signup/login return 503
+    PASSWORD_HASH_QUEUE_TIMEOUT_SECONDS: float = 2.0
+    PASSWORD_HASH_MAX_PER_CLIENT: int = 2  # in-flight hashes per client IP and per email
+    # CLI device-flow long polls (services/device_waiters.py)
+    DEVICE_POLL_MAX_WAIT_SECONDS: float = 30.0
+    DEVICE_POLL_MAX_WAITERS: int = 1000  # per process; over the cap polls answer at once
+    # API key resolution cache (services/api_keys.py)
+    API_KEY_CACHE_TTL_SECONDS: float = 60.0  # also bounds how long a revoked key works in other processes
+    API_KEY_NEGATIVE_TTL_SECONDS: float = 30.0
+    API_KEY_CACHE_MAX_ENTRIES: int = 10000
+    # Per-org /v1/spend/summary cache (invalidated on invoice ingest)
+    SPEND_SUMMARY_TTL_SECONDS: int = 300
+    # Semantic cache for /v1/optimize
+    SEMANTIC_CACHE_ENABLED: bool = True
+    SEMANTIC_CACHE_BACKEND: str = "auto"  # auto | memory (auto uses pgvector on Postgres)
+    # openai | hashing. The cache is off when the openai embedder has no
+    # OPENAI_API_KEY; hashing is lexical only (dev/tests), never a fallback.
+    SEMANTIC_CACHE_EMBEDDER: str = "openai"
+    SEMANTIC_CACHE_DIM: int = 256
+    SEMANTIC_CACHE_THRESHOLD: float = 0.92
+    SEMANTIC_CACHE_TTL_SECONDS: int = 24 * 3600
+    SEMANTIC_CACHE_MAX_ENTRIES: int = 5000  # per namespace (org + model + request params)
+    SEMANTIC_CACHE_MAX_TOTAL_ENTRIES: int = 100000  # in-process index only; LRU namespaces are evicted past it
+    SEMANTIC_CACHE_EF_SEARCH: int = 200  # pgvector HNSW candidate list per lookup
 
     class Config:
         env_file = ".env"
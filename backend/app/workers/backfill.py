@@ -0,0 +1,323 @@
+"""Resumable historical usage backfills.
+
+A backfill imports a connection's usage/cost history for a past date range.
+The range is split into ``backfill_chunk`` rows (``BACKFILL_CHUNK_DAYS``
+each) that workers claim with a conditional update and a lease, so several
+workers share one job and a crashed worker's chunk is picked up again once
+its lease runs out. A chunk's usage rows are inserted into ``api_logs`` in
+the same transaction that marks the chunk done: a chunk is imported exactly
+once, and a resumed job only fetches the chunks that are not done yet.
+
+The job row carries a worker lease too, renewed whenever workers are
+dispatched or claim a chunk. ``resume_jobs`` takes over only jobs whose
+lease has lapsed, so a periodic resume re-dispatches a job at most once per
+lease period instead of adding ``BACKFILL_WORKERS`` tasks on every tick.
+
+While a job is active the incremental sync leaves everything before the
+job's ``range_end`` alone (see ``usage_fetchers._usage_floor``). When the
+last chunk finishes, the usage watermark is moved to ``range_end`` and the
+connection's scheduled sync is made due, which hands the connection over to
+the incremental sync without a gap or an overlap.
+"""
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import func, insert, select
+
+from ..core import metrics
+from ..models import ApiLog, BackfillChunk, BackfillJob, ProviderConnection, SyncSchedule
+from ..settings import settings
+from . import usage_fetchers
+
+logger = logging.getLogger(__name__)
+
+_JOBS = BackfillJob.__table__
+_CHUNKS = BackfillChunk.__table__
+_LOGS = ApiLog.__table__
+_CONNECTIONS = ProviderConnection.__table__
+_SCHEDULE = SyncSchedule.__table__
+
+ACTIVE = ("queued", "running")
+
+_CHUNKS_TOTAL = metrics.counter("bimo_backfill_chunks_total", "Backfill chunks processed", ["provider", "result"])
+_ROWS = metrics.counter("bimo_backfill_rows_total", "Usage rows imported by backfills", ["provider"])
+
+
+class BackfillError(ValueError):
+    pass
+
+
+class BackfillActive(BackfillError):
+    pass
+
+
+def _midnight(ts: datetime) -> datetime:
+    return ts.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def create_job(connection_id: int, start: datetime, end: Optional[datetime] = None,
+               chunk_days: Optional[int] = None, engine=None) -> Dict[str, Any]:
+    """Plan a backfill of [start, end) for one connection.
+
+    ``end`` defaults to the oldest usage the connection already has (or
+    today) so a backfill never overlaps imported data.
+    """
+    if engine is None:
+        from ..db import engine
+    chunk_days = int(chunk_days or settings.BACKFILL_CHUNK_DAYS)
+    if chunk_days < 1:
+        raise BackfillError("chunk_days must be at least 1")
+    with engine.begin() as conn:
+        provider = conn.execute(select(_CONNECTIONS.c.provider_id).where(_CONNECTIONS.c.id == connection_id)).scalar()
+        if provider is None:
+            raise LookupError(f"connection {connection_id} not found")
+        provider = provider.lower()
+        if provider not in usage_fetchers.FETCHERS:
+            raise BackfillError(f"backfills are not supported for {provider}")
+        active = conn.execute(
+            select(_JOBS.c.id).where(_JOBS.c.connection_id == connection_id, _JOBS.c.status.in_(ACTIVE))
+        ).scalar()
+        if active is not None:
+            raise BackfillActive(f"backfill {active} is already active for connection {connection_id}")
+        limit = _midnight(datetime.utcnow())
+        oldest = conn.execute(select(func.min(_LOGS.c.created_at)).where(_LOGS.c.connection_id == connection_id)).scalar()
+        if oldest is not None:
+            limit = min(limit, _midnight(oldest))
+        start = _midnight(start)
+        end = min(_midnight(end), limit) if end is not None else limit
+        if start >= end:
+            raise BackfillError(f"nothing to backfill before {end.date().isoformat()}")
+        windows = usage_fetchers.split_windows(start, end, chunk_days)
+        job_id = conn.execute(insert(_JOBS).values(
+            connection_id=connection_id, provider=provider, range_start=start, range_end=end,
+            chunk_days=chunk_days, status="queued", chunks_total=len(windows), chunks_done=0, rows=0,
+            created_at=datetime.utcnow(),
+        )).inserted_primary_key[0]
+        conn.execute(insert(_CHUNKS), [
+            {"job_id": job_id, "idx": i, "chunk_start": ws, "chunk_end": we, "status": "pending", "attempts": 0, "rows": 0}
+            for i, (ws, we) in enumerate(windows)
+        ])
+    return progress(job_id, engine=engine)
+
+
+def claim_chunk(conn, job_id: int, now: Optional[datetime] = None) -> Optional[Dict[str, Any]]:
+    """Lease the next pending (or abandoned) chunk of a job to this caller."""
+    now = now or datetime.utcnow()
+    claimable = (_CHUNKS.c.status == "pending") | ((_CHUNKS.c.status == "running") & (_CHUNKS.c.lease_until < now))
+    candidates = conn.execute(
+        select(_CHUNKS).where(_CHUNKS.c.job_id == job_id, claimable).order_by(_CHUNKS.c.idx)
+    ).mappings().all()
+    lease = now + timedelta(seconds=settings.BACKFILL_LEASE_SECONDS)
+    for row in candidates:
+        won = conn.execute(
+            _CHUNKS.update()
+            .where(_CHUNKS.c.id == row["id"], _CHUNKS.c.status == row["status"], _CHUNKS.c.attempts == row["attempts"])
+            .values(status="running", attempts=row["attempts"] + 1, lease_until=lease)
+        ).rowcount
+        if won:
+            conn.execute(_JOBS.update().where(_JOBS.c.id == job_id).values(worker_lease_until=lease))
+            conn.execute(_JOBS.update().where(_JOBS.c.id == job_id, _JOBS.c.status == "queued")
+                         .values(status="running", started_at=now))
+            return dict(row, attempts=row["attempts"] + 1)
+    return None
+
+
+def _source(connection_id: int, engine) -> str:
+    with engine.connect() as conn:
+        source = conn.execute(select(_CONNECTIONS.c.connection_source).where(_CONNECTIONS.c.id == connection_id)).scalar()
+    return source if source in ("dev", "prod") else "prod"
+
+
+def run_chunk(job: Dict[str, Any], chunk: Dict[str, Any], engine=None, transport=None,
+              base_urls: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    """Fetch one claimed chunk and commit its rows together with its completion."""
+    if engine is None:
+        from ..db import engine
+    connection_id, provider = job["connection_id"], job["provider"]
+    start, end = chunk["chunk_start"], chunk["chunk_end"]
+    rows: List[Dict[str, Any]] = []
+    try:
+        _, creds = usage_fetchers._load_connection(connection_id)
+        stats = asyncio.run(usage_fetchers.fetch_range(
+            connection_id, provider, creds, start, end,
+            lambda page: rows.extend(r for r in page if r["start"] < end),
+            usage_fetchers.cost_sink(provider),
+            usage_since=start, transport=transport, base_urls=base_urls,
+        ))
+    except Exception as e:
+        _fail_chunk(engine, job, chunk, e)
+        return {"chunk": chunk["idx"], "done": False, "error": str(e)}
+    source = _source(connection_id, engine)
+    logs = usage_fetchers.usage_log_rows(rows, connection_id, provider, source)
+    with engine.begin() as conn:
+        won = conn.execute(
+            _CHUNKS.update()
+            .where(_CHUNKS.c.id == chunk["id"], _CHUNKS.c.status == "running", _CHUNKS.c.attempts == chunk["attempts"])
+            .values(status="done", rows=len(logs), lease_until=None, error=None, finished_at=datetime.utcnow())
+        ).rowcount
+        if not won:
+            # The lease expired and another worker owns the chunk now
+            return {"chunk": chunk["idx"], "done": False, "error": "lease lost"}
+        for i in range(0, len(logs), 500):
+            conn.execute(_LOGS.insert().values(logs[i:i + 500]))
+        conn.execute(_JOBS.update().where(_JOBS.c.id == job["id"]).values(
+            chunks_done=_JOBS.c.chunks_done + 1, rows=_JOBS.c.rows + len(logs),
+        ))
+    _CHUNKS_TOTAL.labels(provider=provider, result="done").inc()
+    _ROWS.labels(provider=provider).inc(len(logs))
+    return {"chunk": chunk["idx"], "done": True, "rows": len(logs), "invoices": stats["cost_rows"]}
+
+
+def _fail_chunk(engine, job: Dict[str, Any], chunk: Dict[str, Any], error: Exception) -> None:
+    """Release the chunk for a retry, or fail the job once attempts run out."""
+    logger.warning("job %s chunk %s failed (attempt %s): %s", job["id"], chunk["idx"], chunk["attempts"], error)
+    final = chunk["attempts"] >= settings.BACKFILL_MAX_ATTEMPTS
+    with engine.begin() as conn:
+        conn.execute(
+            _CHUNKS.update()
+            .where(_CHUNKS.c.id == chunk["id"], _CHUNKS.c.attempts == chunk["attempts"])
+            .values(status="failed" if final else "pending", lease_until=None, error=str(error)[:500])
+        )
+        if final:
+            conn.execute(_JOBS.update().where(_JOBS.c.id == job["id"], _JOBS.c.status.in_(ACTIVE)).values(
+                status="failed", error=f"chunk {chunk['idx']}: {str(error)[:500]}", finished_at=datetime.utcnow(),
+            ))
+    _CHUNKS_TOTAL.labels(provider=job["provider"], result="failed" if final else "retry").inc()
+
+
+def finalize(job_id: int, engine=None, now: Optional[datetime] = None) -> bool:
+    """Mark a fully imported job done and hand the connection to the incremental sync."""
+    if engine is None:
+        from ..db import engine
+    now = now or datetime.utcnow()
+    with engine.begin() as conn:
+        job = conn.execute(select(_JOBS).where(_JOBS.c.id == job_id)).mappings().first()
+        if job is None:
+            return False
+        won = conn.execute(
+            _JOBS.update()
+            .where(_JOBS.c.id == job_id, _JOBS.c.status.in_(ACTIVE), _JOBS.c.chunks_done >= _JOBS.c.chunks_total)
+            .values(status="done", finished_at=now)
+        ).rowcount
+        if not won:
+            return False
+        usage_fetchers.advance_watermark(conn, job["connection_id"], job["range_end"])
+        conn.execute(_SCHEDULE.update().where(_SCHEDULE.c.connection_id == job["connection_id"]).values(next_run_at=now))
+    try:
+        from ..services.spend_summary import invalidate_summaries
+        invalidate_summaries()
+    except Exception:
+        pass
+    return True
+
+
+def work(job_id: int, engine=None, transport=None, base_urls: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    """Claim and run chunks of a job until none are left, then finalize it."""
+    if engine is None:
+        from ..db import engine
+    processed = 0
+    while True:
+        with engine.connect() as conn:
+            job = conn.execute(select(_JOBS).where(_JOBS.c.id == job_id)).mappings().first()
+        if job is None or job["status"] not in ACTIVE:
+            break
+        with engine.begin() as conn:
+            chunk = claim_chunk(conn, job_id)
+        if chunk is None:
+            break
+        run_chunk(dict(job), chunk, engine=engine, transport=transport, base_urls=base_urls)
+        processed += 1
+    finalize(job_id, engine=engine)
+    return dict(progress(job_id, engine=engine), processed=processed)
+
+
+def _dispatch(job_id: int, provider: str, workers: int) -> int:
+    if settings.CELERY_ENABLED:
+        from .celery_app import backfill_work, queue_name
+        for _ in range(workers):
+            backfill_work.apply_async(args=(job_id,), queue=queue_name(provider))
+        return workers
+    from .executor import QueueFull, get_executor
+    started = 0
+    for i in range(workers):
+        try:
+            get_executor().submit("backfill", work, (job_id,), key=("backfill", job_id, i),
+                                  provider=provider, priority=8)
+            started += 1
+        except QueueFull:
+            break
+    return started
+
+
+def start_job(job_id: int, workers: Optional[int] = None, engine=None, now: Optional[datetime] = None) -> int:
+    """Dispatch ``workers`` parallel workers for a job (Celery or the in-process pool)."""
+    if engine is None:
+        from ..db import engine
+    now = now or datetime.utcnow()
+    with engine.begin() as conn:
+        provider = conn.execute(select(_JOBS.c.provider).where(_JOBS.c.id == job_id)).scalar()
+        # Covers the time the tasks wait in the queue before their first claim
+        conn.execute(_JOBS.update().where(_JOBS.c.id == job_id).values(
+            worker_lease_until=now + timedelta(seconds=settings.BACKFILL_LEASE_SECONDS),
+        ))
+    return _dispatch(job_id, provider, max(int(workers or settings.BACKFILL_WORKERS), 1))
+
+
+def resume_jobs(engine=None, now: Optional[datetime] = None) -> int:
+    """Restart workers for active jobs left without any (e.g. after a restart).
+
+    A job is resumed only when it has claimable chunks and its worker lease
+    has lapsed; taking the lease is a conditional update, so concurrent
+    schedulers resume a job once.
+    """
+    if engine is None:
+        from ..db import engine
+    now = now or datetime.utcnow()
+    claimable = (_CHUNKS.c.status == "pending") | ((_CHUNKS.c.status == "running") & (_CHUNKS.c.lease_until < now))
+    lapsed = _JOBS.c.worker_lease_until.is_(None) | (_JOBS.c.worker_lease_until < now)
+    lease = now + timedelta(seconds=settings.BACKFILL_LEASE_SECONDS)
+    resumed = []
+    with engine.begin() as conn:
+        jobs = conn.execute(
+            select(_JOBS.c.id, _JOBS.c.provider).where(
+                _JOBS.c.status.in_(ACTIVE),
+                lapsed,
+                _JOBS.c.id.in_(select(_CHUNKS.c.job_id).where(claimable)),
+            )
+        ).all()
+        for job_id, provider in jobs:
+            won = conn.execute(
+                _JOBS.update().where(_JOBS.c.id == job_id, lapsed).values(worker_lease_until=lease)
+            ).rowcount
+            if won:
+                resumed.append((job_id, provider))
+    for job_id, provider in resumed:
+        _dispatch(job_id, provider, max(int(settings.BACKFILL_WORKERS), 1))
+    return len(resumed)
+
+
+def progress(job_id: int, engine=None, now: Optional[datetime] = None) -> Optional[Dict[str, Any]]:
+    """Job status with completion percentage and a naive ETA from the chunk rate so far."""
+    if engine is None:
+        from ..db import engine
+    now = now or datetime.utcnow()
+    with engine.connect() as conn:
+        job = conn.execute(select(_JOBS).where(_JOBS.c.id == job_id)).mappings().first()
+    if job is None:
+        return None
+    total, done = job["chunks_total"] or 0, job["chunks_done"] or 0
+    elapsed = eta = None
+    if job["started_at"] is not None:
+        elapsed = ((job["finished_at"] or now) - job["started_at"]).total_seconds()
+        if job["status"] == "running" and done:
+            eta = elapsed / done * (total - done)
+    return {
+        "id": job["id"], "connection_id": job["connection_id"], "provider": job["provider"],
+        "status": job["status"], "from": job["range_start"].date().isoformat(),
+        "to": job["range_end"].date().isoformat(), "chunk_days": job["chunk_days"],
+        "chunks_total": total, "chunks_done": done, "rows": job["rows"],
+        "percent": round(100.0 * done / total, 1) if total else 100.0,
+        "elapsed_seconds": elapsed, "eta_seconds": eta, "error": job["error"],
+    }
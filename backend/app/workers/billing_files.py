@@ -0,0 +1,419 @@
+"""Streaming import of provider billing export files into `invoice`.
+
+Supports AWS Cost and Usage Reports (legacy ``lineItem/...`` and CUR 2.0
+``line_item_...`` columns), GCP billing exports and Azure cost exports as
+CSV, JSONL (optionally gzip-compressed) or Parquet (requires ``pyarrow``).
+
+The file is read record by record and cut into chunks of
+``BILLING_FILE_CHUNK_ROWS``; at most two chunks per worker are in flight, so
+memory stays bounded regardless of file size. Each chunk is mapped to invoice
+payloads and written through ``billing_ingest.ingest_invoices`` (upsert +
+one commit) in a worker process.
+
+Progress is checkpointed in ``ingest_checkpoint`` as the number of leading
+records whose chunks are all committed. Re-running the same file (same path,
+size and mtime) resumes after that point; chunks that finished out of order
+beyond it are simply upserted again.
+
+Usage::
+
+    python -m app.workers.billing_files --provider aws cur-2026-09.csv.gz
+"""
+import csv
+import gzip
+import hashlib
+import io
+import json
+import logging
+import os
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from sqlalchemy import insert, select
+
+from ..core import metrics
+from ..models import IngestCheckpoint
+from ..settings import settings
+from .billing_ingest import MAX_REPORTED_ERRORS, ingest_invoices
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ("csv", "jsonl", "parquet")
+
+_CHECKPOINTS = IngestCheckpoint.__table__
+_CHUNKS = metrics.counter("bimo_billing_file_chunks_total", "Billing export chunks processed", ["provider", "result"])
+
+
+@dataclass(frozen=True)
+class ColumnMap:
+    """Where a provider's export keeps the fields an invoice row needs.
+
+    Each entry lists candidate column names, first present wins. Without a
+    line-item id column the row id is a hash of the record minus its
+    ``volatile`` columns (set per export run, not per line item), which
+    keeps re-imports and re-exports of the same rows idempotent.
+    """
+    amount: Tuple[str, ...]
+    currency: Tuple[str, ...]
+    start: Tuple[str, ...]
+    end: Tuple[str, ...] = ()
+    line_id: Tuple[str, ...] = ()
+    date_formats: Tuple[str, ...] = ()
+    volatile: Tuple[str, ...] = ()
+
+
+COLUMN_MAPS: Dict[str, ColumnMap] = {
+    "aws": ColumnMap(
+        amount=("lineItem/UnblendedCost", "line_item_unblended_cost"),
+        currency=("lineItem/CurrencyCode", "line_item_currency_code"),
+        start=("lineItem/UsageStartDate", "line_item_usage_start_date"),
+        end=("lineItem/UsageEndDate", "line_item_usage_end_date"),
+        line_id=("identity/LineItemId", "identity_line_item_id"),
+    ),
+    "gcp": ColumnMap(
+        amount=("cost",),
+        currency=("currency",),
+        start=("usage_start_time",),
+        end=("usage_end_time",),
+        volatile=("export_time", "_PARTITIONTIME", "_PARTITIONDATE"),
+    ),
+    "azure": ColumnMap(
+        amount=("CostInBillingCurrency", "costInBillingCurrency", "PreTaxCost", "Cost"),
+        currency=("BillingCurrencyCode", "billingCurrency", "BillingCurrency", "Currency"),
+        start=("Date", "date", "UsageDateTime"),
+        date_formats=("%m/%d/%Y",),
+    ),
+}
+
+
+def detect_format(path: str) -> str:
+    name = path.lower()
+    if name.endswith(".gz"):
+        name = name[:-3]
+    if name.endswith(".csv"):
+        return "csv"
+    if name.endswith((".jsonl", ".ndjson", ".json")):
+        return "jsonl"
+    if name.endswith(".parquet"):
+        return "parquet"
+    raise ValueError(f"cannot infer format of {path}; pass one of {', '.join(FORMATS)}")
+
+
+def file_key(path: str) -> str:
+    """Identity of an export file; a rewritten file gets a fresh checkpoint."""
+    st = os.stat(path)
+    raw = f"{os.path.abspath(path)}|{st.st_size}|{st.st_mtime_ns}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+# --- readers ---------------------------------------------------------------
+
+def _open_text(path: str) -> io.TextIOBase:
+    raw = open(path, "rb")
+    magic = raw.read(2)
+    raw.seek(0)
+    stream = gzip.GzipFile(fileobj=raw) if magic == b"\x1f\x8b" else raw
+    return io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+
+
+def _flatten(record: Dict[str, Any], prefix: str = "") -> Dict[str, Any]:
+    """Nested JSON/Parquet structs become dotted columns, as in CSV exports."""
+    out: Dict[str, Any] = {}
+    for k, v in record.items():
+        name = f"{prefix}{k}"
+        if isinstance(v, dict):
+            out.update(_flatten(v, name + "."))
+        else:
+            out[name] = v
+    return out
+
+
+def _iter_parquet(path: str, skip: int) -> Iterator[Dict[str, Any]]:
+    try:
+        import pyarrow.parquet as pq  # type: ignore
+    except ImportError:
+        raise RuntimeError("Parquet import requires pyarrow (pip install pyarrow)")
+    pf = pq.ParquetFile(path)
+    groups, offset = [], 0
+    for i in range(pf.metadata.num_row_groups):
+        n = pf.metadata.row_group(i).num_rows
+        if offset + n > skip:
+            groups.append(i)
+        else:
+            offset += n  # whole row group already imported: never decoded
+    to_drop = skip - offset
+    for batch in pf.iter_batches(batch_size=10000, row_groups=groups):
+        for record in batch.to_pylist():
+            if to_drop > 0:
+                to_drop -= 1
+                continue
+            yield _flatten(record)
+
+
+def iter_records(path: str, fmt: str, skip: int = 0) -> Iterator[Dict[str, Any]]:
+    """Yield flat dict records one at a time, after the first ``skip``."""
+    if fmt == "parquet":
+        yield from _iter_parquet(path, skip)
+        return
+    if fmt not in FORMATS:
+        raise ValueError(f"unsupported format: {fmt}")
+    with _open_text(path) as fh:
+        if fmt == "csv":
+            rows: Iterator[Dict[str, Any]] = csv.DictReader(fh)
+        else:
+            rows = (_flatten(json.loads(line)) for line in fh if line.strip())
+        for i, record in enumerate(rows):
+            if i >= skip:
+                yield record
+
+
+# --- mapping ---------------------------------------------------------------
+
+def _first(record: Dict[str, Any], names: Sequence[str]) -> Any:
+    for name in names:
+        value = record.get(name)
+        if value not in (None, ""):
+            return value
+    return None
+
+
+def _date(value: Any, formats: Sequence[str]) -> Any:
+    if isinstance(value, str) and formats:
+        for fmt in formats:
+            try:
+                return datetime.strptime(value, fmt)
+            except ValueError:
+                continue
+    return value
+
+
+def map_record(cmap: ColumnMap, record: Dict[str, Any]) -> Dict[str, Any]:
+    """Turn one export record into an `ingest_invoices` payload."""
+    start = _first(record, cmap.start)
+    line_id = _first(record, cmap.line_id)
+    if line_id is not None:
+        # Line item ids repeat across hourly/daily intervals
+        invoice_id = f"{line_id}:{start or ''}"
+    else:
+        identity = {k: v for k, v in record.items() if k not in cmap.volatile}
+        digest = hashlib.sha256(json.dumps(identity, sort_keys=True, default=str).encode("utf-8"))
+        invoice_id = digest.hexdigest()[:40]
+    return {
+        "invoice_id": invoice_id,
+        "amount": _first(record, cmap.amount),
+        "currency": _first(record, cmap.currency) or "USD",
+        "period_start": _date(start, cmap.date_formats),
+        "period_end": _date(_first(record, cmap.end), cmap.date_formats),
+    }
+
+
+# Engines opened by worker processes, by database URL
+_worker_engines: Dict[str, Any] = {}
+
+
+def _chunk_engine(target):
+    """``target`` is the caller's engine (inline) or its URL (worker processes)."""
+    if not isinstance(target, str):
+        return target
+    engine = _worker_engines.get(target)
+    if engine is None:
+        from sqlalchemy import create_engine
+        connect_args = {"check_same_thread": False} if target.startswith("sqlite") else {}
+        engine = _worker_engines[target] = create_engine(target, connect_args=connect_args)
+    return engine
+
+
+def _ingest_chunk(provider: str, source: str, records: List[Dict[str, Any]], target=None) -> Dict[str, Any]:
+    """Worker entry point: map and upsert one chunk in a single transaction."""
+    cmap = COLUMN_MAPS[provider]
+    payloads = [map_record(cmap, r) for r in records]
+    return ingest_invoices(provider, payloads, source=source, chunk_size=max(1, len(payloads)),
+                           engine=_chunk_engine(target), raise_errors=True)
+
+
+def _init_worker() -> None:
+    # Forked workers must not reuse the parent's pooled DB connections
+    try:
+        from ..db import engine
+        engine.dispose(close=False)
+    except Exception:
+        pass
+    for engine in _worker_engines.values():
+        engine.dispose(close=False)
+
+
+class _InlineExecutor:
+    """Runs chunks in the calling process (``workers=0``; tests, tiny files)."""
+
+    def submit(self, fn, *args) -> Future:
+        fut: Future = Future()
+        try:
+            fut.set_result(fn(*args))
+        except Exception as e:
+            fut.set_exception(e)
+        return fut
+
+    def shutdown(self, wait: bool = True) -> None:
+        pass
+
+
+# --- checkpoints -----------------------------------------------------------
+
+def _load_checkpoint(engine, key: str, path: str, provider: str) -> Dict[str, Any]:
+    with engine.begin() as conn:
+        row = conn.execute(select(_CHECKPOINTS).where(_CHECKPOINTS.c.file_key == key)).mappings().first()
+        if row is not None:
+            return dict(row)
+        now = datetime.utcnow()
+        conn.execute(insert(_CHECKPOINTS).values(
+            file_key=key, path=os.path.abspath(path), provider=provider, status="running",
+            next_row=0, rows_ingested=0, rows_rejected=0, created_at=now, updated_at=now,
+        ))
+        return dict(conn.execute(select(_CHECKPOINTS).where(_CHECKPOINTS.c.file_key == key)).mappings().first())
+
+
+def _save_checkpoint(engine, key: str, **values) -> None:
+    values["updated_at"] = datetime.utcnow()
+    with engine.begin() as conn:
+        conn.execute(_CHECKPOINTS.update().where(_CHECKPOINTS.c.file_key == key).values(**values))
+
+
+def ingest_file(
+    path: str,
+    provider: str,
+    fmt: Optional[str] = None,
+    source: str = "billing",
+    chunk_rows: Optional[int] = None,
+    workers: Optional[int] = None,
+    engine=None,
+) -> Dict[str, Any]:
+    """Import (or resume importing) one billing export file.
+
+    Returns the checkpoint summary: status, next_row, rows_ingested,
+    rows_rejected and the first validation errors. A chunk failure stops
+    submitting new chunks and leaves the checkpoint ``failed`` at the last
+    contiguous committed record.
+    """
+    if provider not in COLUMN_MAPS:
+        raise ValueError(f"no column map for provider {provider!r}; expected one of {', '.join(COLUMN_MAPS)}")
+    if engine is None:
+        from ..db import engine
+    fmt = fmt or detect_format(path)
+    chunk_rows = max(1, int(chunk_rows or settings.BILLING_FILE_CHUNK_ROWS))
+    workers = settings.BILLING_FILE_WORKERS if workers is None else max(0, int(workers))
+    key = file_key(path)
+
+    state = _load_checkpoint(engine, key, path, provider)
+    if state["status"] == "done":
+        return {**_summary(state), "resumed": False, "errors": []}
+    resumed_from = int(state["next_row"])
+    next_row = resumed_from
+    ingested, rejected = int(state["rows_ingested"]), int(state["rows_rejected"])
+    errors: List[Dict[str, Any]] = []
+    failure: Optional[str] = None
+    # first_row -> (rows, ingested, rejected) of chunks committed beyond the
+    # contiguous prefix. Their counts join the totals only with the prefix:
+    # a resume re-imports them, and would otherwise count them twice.
+    finished: Dict[int, Tuple[int, int, int]] = {}
+    in_flight: Dict[Future, Tuple[int, int]] = {}
+
+    def collect(done) -> None:
+        nonlocal next_row, ingested, rejected, failure
+        advanced = False
+        for fut in done:
+            first_row, n = in_flight.pop(fut)
+            try:
+                res = fut.result()
+            except Exception as e:
+                failure = failure or f"rows {first_row}-{first_row + n - 1}: {e}"
+                _CHUNKS.labels(provider=provider, result="failed").inc()
+                continue
+            _CHUNKS.labels(provider=provider, result="ok").inc()
+            for err in res["errors"]:
+                if len(errors) < MAX_REPORTED_ERRORS and err.get("index") is not None:
+                    errors.append({**err, "row": first_row + err["index"]})
+            finished[first_row] = (n, res["inserted"] + res["updated"], res["rejected"])
+        while next_row in finished:
+            n, chunk_ingested, chunk_rejected = finished.pop(next_row)
+            next_row += n
+            ingested += chunk_ingested
+            rejected += chunk_rejected
+            advanced = True
+        if advanced:
+            _save_checkpoint(engine, key, next_row=next_row, rows_ingested=ingested, rows_rejected=rejected)
+
+    executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) if workers else _InlineExecutor()
+    # Chunks go to the same database as the checkpoints; processes get the URL
+    target = engine.url.render_as_string(hide_password=False) if workers else engine
+    max_in_flight = max(1, workers * 2)
+    try:
+        chunk: List[Dict[str, Any]] = []
+        first_row = resumed_from
+        records = iter_records(path, fmt, skip=resumed_from)
+        while failure is None:
+            record = next(records, None)
+            if record is not None:
+                chunk.append(record)
+            if chunk and (record is None or len(chunk) >= chunk_rows):
+                in_flight[executor.submit(_ingest_chunk, provider, source, chunk, target)] = (first_row, len(chunk))
+                first_row += len(chunk)
+                chunk = []
+                while len(in_flight) >= max_in_flight:
+                    collect(wait(list(in_flight), return_when=FIRST_COMPLETED).done)
+            if record is None:
+                break
+        while in_flight:
+            collect(wait(list(in_flight), return_when=FIRST_COMPLETED).done)
+    except Exception as e:
+        failure = failure or str(e)
+    finally:
+        executor.shutdown(wait=True)
+
+    status = "failed" if failure else "done"
+    _save_checkpoint(engine, key, status=status, error=failure, next_row=next_row,
+                     rows_ingested=ingested, rows_rejected=rejected)
+    if not failure:
+        logger.info("imported %s (%d rows, %d rejected)", path, ingested, rejected)
+        try:
+            from ..services.spend_summary import invalidate_summaries
+            invalidate_summaries()
+        except Exception:
+            pass
+    else:
+        logger.warning("import of %s stopped at row %d: %s", path, next_row, failure)
+    return {
+        "status": status,
+        "next_row": next_row,
+        "rows_ingested": ingested,
+        "rows_rejected": rejected,
+        "error": failure,
+        "resumed": resumed_from > 0,
+        "errors": errors,
+    }
+
+
+def _summary(state: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: state[k] for k in ("status", "next_row", "rows_ingested", "rows_rejected", "error")}
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Import a billing export file into the invoice table.")
+    parser.add_argument("path")
+    parser.add_argument("--provider", required=True, choices=sorted(COLUMN_MAPS))
+    parser.add_argument("--format", dest="fmt", choices=FORMATS)
+    parser.add_argument("--source", default="billing", choices=("dev", "prod", "billing"))
+    parser.add_argument("--chunk-rows", type=int, default=None)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args(argv)
+    res = ingest_file(args.path, args.provider, fmt=args.fmt, source=args.source,
+                      chunk_rows=args.chunk_rows, workers=args.workers)
+    print(json.dumps(res, default=str, indent=2))
+    return 0 if res["status"] == "done" else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,95 +1,285 @@
-from typing import Optional, Dict
-from ..db_sa import get_db
+"""Billing invoice ingestion.
 
+Invoices are upserted on ``(provider, provider_invoice_id)`` (unique index
+``ux_invoice_provider_invoice_id``), so re-delivering an invoice - a corrected
+amount, a re-run backfill - updates the existing row instead of duplicating
+spend. ``ingest_invoices`` is the bulk path: payloads are validated in one
+columnar pass, de-duplicated within the batch (last one wins) and written
+with one multi-row upsert and one commit per chunk. A re-delivered invoice
+that omits a field (amount, currency, billing period) keeps the stored value.
+"""
+import logging
+import math
+import uuid
+from datetime import date, datetime
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
 
-def ingest_invoice(provider: str, invoice_payload: Dict, source: str = "billing") -> Dict[str, Optional[int]]:
-    """Ingest an invoice payload and persist a minimal Invoice record.
+from sqlalchemy import and_, bindparam, func, insert, select
+
+from ..core import metrics
+from ..models import Invoice
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 1000
+MAX_REPORTED_ERRORS = 50
+
+_TABLE = Invoice.__table__
+_PERIOD_COLUMNS = ("period_start", "period_end")
+# Left NULL by normalize_invoices when a payload omits them; updates keep the stored value
+_OPTIONAL_COLUMNS = ("amount", "currency") + _PERIOD_COLUMNS
+_DEFAULTS = {"amount": 0.0, "currency": "USD"}
+_ROWS = metrics.counter("bimo_invoice_ingest_rows_total", "Invoices processed by billing ingest", ["provider", "result"])
+
+
+def _invoice_id(payload: Dict) -> Optional[str]:
+    pid = payload.get("id") or payload.get("invoice_id") or payload.get("provider_invoice_id")
+    return str(pid) if pid not in (None, "") else None
 
-    This function is intentionally defensive: it validates basic fields and
-    writes a conservative record to the `invoice` table. It returns the
-    created invoice id when successful.
+
+def _as_timestamp(value: Any) -> Optional[datetime]:
+    if value in (None, ""):
+        return None
+    if isinstance(value, datetime):
+        return value.replace(tzinfo=None)
+    if isinstance(value, date):
+        return datetime(value.year, value.month, value.day)
+    if isinstance(value, (int, float)):
+        return datetime.utcfromtimestamp(value)
+    return datetime.fromisoformat(str(value).replace("Z", "+00:00")).replace(tzinfo=None)
+
+
+def normalize_invoices(provider: str, payloads: Sequence[Dict], source: str = "billing") -> Tuple[List[Dict], List[Dict]]:
+    """Validate raw invoice payloads column by column.
+
+    Returns (rows, errors). Rows are ready for insertion and unique on
+    provider_invoice_id (a later payload for the same id replaces an earlier
+    one, except for the fields it omits); fields in ``_OPTIONAL_COLUMNS``
+    that a payload omits are ``None``. Each error is
+    ``{"index", "invoice_id", "message"}``.
     """
-    try:
-        db = next(get_db())
-    except Exception:
-        # Fallback: try to create a lightweight session directly from engine
+    n = len(payloads)
+    ids = [_invoice_id(p) if isinstance(p, dict) else None for p in payloads]
+    bad: Dict[int, str] = {i: "invoice must be an object" for i, p in enumerate(payloads) if not isinstance(p, dict)}
+    for i in range(n):
+        if i not in bad and ids[i] is None:
+            bad[i] = "missing invoice id"
+
+    amounts: List[Optional[float]] = [None] * n
+    for i, p in enumerate(payloads):
+        if i in bad or p.get("amount") in (None, ""):
+            continue
         try:
-            import logging as _logging
-            _logging.getLogger(__name__)
-            from ..db import engine
-            from sqlmodel import Session as SQLSession, SQLModel
-            # Ensure tables exist in dev/test when migrations are not run
-            try:
-                SQLModel.metadata.create_all(engine)
-            except Exception:
-                pass
-            db = SQLSession(engine)
-        except Exception as e:
-            try:
-                import logging
-                logging.exception("billing_ingest: failed to acquire DB session fallback: %s", e)
-            except Exception:
-                pass
-            return {"invoice_id": None}
-    # Ensure invoice table exists (defensive; helpful in test/dev environments)
-    try:
-        from ..db import engine
-        from ..models import SQLModel
-        SQLModel.metadata.create_all(engine)
-    except Exception:
-        pass
+            amounts[i] = float(p["amount"])
+            if not math.isfinite(amounts[i]):
+                raise ValueError
+        except (TypeError, ValueError):
+            bad[i] = "amount must be a finite number"
 
-    try:
-        from ..models import Invoice
-        pid = invoice_payload.get("id") or invoice_payload.get("invoice_id") or invoice_payload.get("provider_invoice_id")
-        amount = float(invoice_payload.get("amount", 0.0) or 0.0)
-        currency = invoice_payload.get("currency") or invoice_payload.get("currency_code") or "USD"
-        period_start = invoice_payload.get("period_start")
-        period_end = invoice_payload.get("period_end")
-
-        inv = Invoice(
-            provider=provider,
-            provider_invoice_id=pid,
-            amount=amount,
-            currency=currency,
-            period_start=period_start,
-            period_end=period_end,
-            source=source,
+    currencies: List[Optional[str]] = [None] * n
+    for i, p in enumerate(payloads):
+        if i in bad:
+            continue
+        cur = p.get("currency") or p.get("currency_code")
+        if cur is None:
+            continue
+        if not isinstance(cur, str) or len(cur.strip()) != 3:
+            bad[i] = "currency must be a 3-letter code"
+        else:
+            currencies[i] = cur.strip().upper()
+
+    starts: List[Optional[datetime]] = [None] * n
+    ends: List[Optional[datetime]] = [None] * n
+    for i, p in enumerate(payloads):
+        if i in bad:
+            continue
+        try:
+            starts[i] = _as_timestamp(p.get("period_start"))
+            ends[i] = _as_timestamp(p.get("period_end"))
+        except (TypeError, ValueError, OverflowError, OSError):
+            bad[i] = "period_start/period_end must be ISO dates"
+            continue
+        if starts[i] and ends[i] and ends[i] < starts[i]:
+            bad[i] = "period_end is before period_start"
+
+    now = datetime.utcnow()
+    latest: Dict[str, Dict] = {}
+    for i in range(n):
+        if i in bad:
+            continue
+        previous = latest.get(ids[i])
+        latest[ids[i]] = {
+            "provider": provider,
+            "provider_invoice_id": ids[i],
+            "amount": amounts[i],
+            "currency": currencies[i],
+            "period_start": starts[i],
+            "period_end": ends[i],
+            "source": source,
+            "created_at": now,
+        }
+        if previous is not None:
+            for c in _OPTIONAL_COLUMNS:
+                if latest[ids[i]][c] is None:
+                    latest[ids[i]][c] = previous[c]
+    errors = [{"index": i, "invoice_id": ids[i], "message": msg} for i, msg in sorted(bad.items())]
+    return list(latest.values()), errors
+
+
+def _upsert_statement(dialect: str):
+    """Multi-row INSERT .. ON CONFLICT DO UPDATE where the dialect supports it."""
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        return None
+    stmt = dialect_insert(_TABLE)
+    set_ = {c: stmt.excluded[c] for c in ("amount", "currency", "source")}
+    set_.update({c: func.coalesce(stmt.excluded[c], _TABLE.c[c]) for c in _PERIOD_COLUMNS})
+    return stmt.on_conflict_do_update(
+        index_elements=[_TABLE.c.provider, _TABLE.c.provider_invoice_id],
+        set_=set_,
+    )
+
+
+def _write_chunk(conn, provider: str, rows: List[Dict]) -> Tuple[int, int, List[datetime]]:
+    """Upsert one chunk; returns (inserted, updated, hours whose rollups changed)."""
+    existing = {
+        pid: (start or created)
+        for pid, start, created in conn.execute(
+            select(_TABLE.c.provider_invoice_id, _TABLE.c.period_start, _TABLE.c.created_at).where(and_(
+                _TABLE.c.provider == provider,
+                _TABLE.c.provider_invoice_id.in_([r["provider_invoice_id"] for r in rows]),
+            ))
         )
-        db.add(inv)
-        db.commit()
-        db.refresh(inv)
-        # If no numeric PK available (e.g., in some test shims), fall back to provider_invoice_id
-        invoice_id = getattr(inv, "id", None)
-        if invoice_id is None:
-            # ensure there is a provider_invoice_id to return
-            import uuid
-            if not pid:
-                pid = uuid.uuid4().hex
-                try:
-                    inv.provider_invoice_id = pid
-                    db.add(inv)
-                    db.commit()
-                    db.refresh(inv)
-                except Exception:
-                    pass
-            return {"invoice_id": pid}
-        return {"invoice_id": invoice_id}
-    except Exception as e:
+    }
+    # New invoices take the column defaults for omitted fields; the upsert
+    # only covers one inserted concurrently since the read above.
+    fresh = [
+        {**r, **{c: v for c, v in _DEFAULTS.items() if r[c] is None}}
+        for r in rows if r["provider_invoice_id"] not in existing
+    ]
+    if fresh:
+        stmt = _upsert_statement(conn.dialect.name)
+        conn.execute(stmt if stmt is not None else insert(_TABLE), fresh)
+    known = [
+        {"b_pid": r["provider_invoice_id"], "b_source": r["source"], **{f"b_{c}": r[c] for c in _OPTIONAL_COLUMNS}}
+        for r in rows if r["provider_invoice_id"] in existing
+    ]
+    if known:
+        conn.execute(
+            _TABLE.update()
+            .where(and_(_TABLE.c.provider == provider, _TABLE.c.provider_invoice_id == bindparam("b_pid")))
+            .values(
+                source=bindparam("b_source"),
+                **{c: func.coalesce(bindparam(f"b_{c}", type_=_TABLE.c[c].type), _TABLE.c[c]) for c in _OPTIONAL_COLUMNS},
+            ),
+            known,
+        )
+    # Updated rows keep their id, so the rollup high-water mark will not see
+    # them: rebuild the buckets they moved out of and into now.
+    touched: List[datetime] = []
+    for r in rows:
+        old = existing.get(r["provider_invoice_id"])
+        if old is not None:
+            touched.append(old)
+            touched.append(r["period_start"] or old)
+    updated = sum(1 for r in rows if r["provider_invoice_id"] in existing)
+    return len(rows) - updated, updated, touched
+
+
+def ingest_invoices(
+    provider: str,
+    payloads: Iterable[Dict],
+    source: str = "billing",
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    engine=None,
+    raise_errors: bool = False,
+) -> Dict[str, Any]:
+    """Validate and upsert many invoices, committing once per chunk.
+
+    A failing chunk is rolled back and reported (or re-raised with
+    ``raise_errors``); chunks already committed stay committed, and
+    re-running the same payload is safe.
+    """
+    if engine is None:
+        from ..db import engine
+    payloads = list(payloads)
+    rows, errors = normalize_invoices(provider, payloads, source=source)
+    result: Dict[str, Any] = {
+        "received": len(payloads),
+        "inserted": 0,
+        "updated": 0,
+        "rejected": len(errors),
+        # Valid payloads superseded by a later one with the same id in this batch
+        "duplicates": len(payloads) - len(errors) - len(rows),
+        "errors": [],
+    }
+    touched: List[datetime] = []
+    chunk_size = max(1, int(chunk_size or DEFAULT_CHUNK_SIZE))
+    for i in range(0, len(rows), chunk_size):
+        chunk = rows[i:i + chunk_size]
         try:
-            db.rollback()
-        except Exception:
-            pass
+            with engine.begin() as conn:
+                inserted, updated, hours = _write_chunk(conn, provider, chunk)
+        except Exception as e:
+            if raise_errors:
+                raise
+            logger.warning("invoice chunk %d (%d invoices) failed: %s", i // chunk_size, len(chunk), e)
+            result["rejected"] += len(chunk)
+            errors.append({"index": None, "invoice_id": chunk[0]["provider_invoice_id"], "message": f"chunk failed: {e}"})
+            continue
+        result["inserted"] += inserted
+        result["updated"] += updated
+        touched.extend(hours)
+
+    if touched:
         try:
-            import logging
-            logging.exception("billing_ingest: exception while ingesting invoice: %s", e)
-        except Exception:
-            pass
-        return {"invoice_id": None}
-    finally:
+            from .rollups import rebuild
+            with engine.begin() as conn:
+                rebuild(conn, touched)
+        except Exception as e:
+            logger.warning("rollup refresh after invoice ingest failed: %s", e)
+    if result["inserted"] or result["updated"]:
         try:
-            db.close()
+            from ..services.spend_summary import invalidate_summaries
+            invalidate_summaries()
         except Exception:
             pass
 
+    for key in ("inserted", "updated", "rejected"):
+        _ROWS.labels(provider=provider, result=key).inc(result[key])
+    result["errors"] = errors[:MAX_REPORTED_ERRORS]
+    return result
 
+
+def ingest_invoice(provider: str, invoice_payload: Dict, source: str = "billing") -> Dict[str, Optional[int]]:
+    """Ingest a single invoice payload and return its row id.
+
+    Payloads without an id get a generated ``provider_invoice_id``. Uses the
+    same upsert as the bulk path, so a repeated invoice id updates the row.
+    """
+    try:
+        payload = dict(invoice_payload or {})
+        if _invoice_id(payload) is None:
+            payload["provider_invoice_id"] = uuid.uuid4().hex
+        res = ingest_invoices(provider, [payload], source=source)
+        if res["errors"]:
+            logger.warning("invoice rejected: %s", res["errors"][0]["message"])
+            return {"invoice_id": None}
+        from ..db import engine
+        with engine.connect() as conn:
+            invoice_id = conn.execute(
+                select(_TABLE.c.id).where(and_(
+                    _TABLE.c.provider == provider,
+                    _TABLE.c.provider_invoice_id == _invoice_id(payload),
+                ))
+            ).scalar()
+        return {"invoice_id": invoice_id}
+    except Exception as e:
+        try:
+            logger.exception("exception while ingesting invoice: %s", e)
+        except Exception:
+            pass
+        return {"invoice_id": None}
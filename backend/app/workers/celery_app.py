@@ -0,0 +1,137 @@
+"""Celery application for provider usage syncs.
+
+Started by ``celery -A app.workers.celery_app worker`` (see infra/docker-compose.yml).
+
+Each provider has its own queue (``sync.<provider>``) so a slow or throttled
+provider never starves the others, and workers can be pinned to queues with
+``-Q`` to scale one provider independently. Tasks sync a batch of
+connections per invocation; the task rate limit is derived from the
+provider's API quota (``PROVIDER_API_QUOTAS``) divided by the batch size, so
+a worker never issues more provider calls than the quota allows.
+
+The broker defaults to ``CELERY_BROKER_URL``, then ``REDIS_URL``, then
+``memory://`` which keeps the app importable and testable without Redis.
+"""
+from typing import Any, Dict, List, Optional
+
+from celery import Celery
+from kombu import Queue
+
+from ..settings import settings
+
+PROVIDERS = ("openai", "claude", "gemini", "azure")
+DEFAULT_QUEUE = "default"
+
+
+def queue_name(provider: str) -> str:
+    return f"sync.{provider}"
+
+
+def parse_quotas(raw: str) -> Dict[str, str]:
+    """``"openai=300/m,gemini=60/m"`` -> ``{"openai": "300/m", "gemini": "60/m"}``."""
+    quotas: Dict[str, str] = {}
+    for item in (raw or "").split(","):
+        name, _, value = item.partition("=")
+        if name.strip() and value.strip():
+            quotas[name.strip().lower()] = value.strip()
+    return quotas
+
+
+def task_rate_limit(quota: Optional[str], batch_size: int) -> Optional[str]:
+    """Celery rate limit for batch tasks given a per-connection call quota.
+
+    ``"300/m"`` with batches of 25 allows 12 batch tasks per minute.
+    """
+    if not quota:
+        return None
+    count, _, unit = quota.partition("/")
+    try:
+        per_task = max(int(count) // max(batch_size, 1), 1)
+    except ValueError:
+        return None
+    return f"{per_task}/{unit or 's'}"
+
+
+celery_app = Celery(
+    "bimo",
+    broker=settings.CELERY_BROKER_URL or settings.REDIS_URL or "memory://",
+    backend=settings.CELERY_RESULT_BACKEND or "cache+memory://",
+)
+celery_app.conf.update(
+    task_queues=[Queue(DEFAULT_QUEUE)] + [Queue(queue_name(p)) for p in PROVIDERS],
+    task_default_queue=DEFAULT_QUEUE,
+    task_routes={f"bimo.sync.{p}": {"queue": queue_name(p)} for p in PROVIDERS},
+    # Syncs mostly wait on provider APIs; a few prefetched batches keep each
+    # worker busy without hoarding work another node could take
+    worker_prefetch_multiplier=settings.CELERY_PREFETCH_MULTIPLIER,
+    task_acks_late=True,
+    task_reject_on_worker_lost=True,
+    task_serializer="json",
+    result_serializer="json",
+    accept_content=["json"],
+    result_expires=3600,
+    beat_schedule={
+        "sync-scheduler-tick": {"task": "bimo.scheduler.tick", "schedule": settings.SYNC_SCHEDULER_TICK_SECONDS},
+        "provider-metrics-rollups": {"task": "bimo.rollups", "schedule": settings.ROLLUP_INTERVAL_SECONDS},
+    },
+)
+
+
+def sync_batch(provider: str, connection_ids: List[int], source: str = "prod") -> Dict[str, Any]:
+    """Sync connections one after another; a failing connection doesn't stop the batch.
+
+    Each run is recorded in the sync schedule (see scheduler.run_scheduled).
+    """
+    from .scheduler import run_scheduled
+    results = [run_scheduled(connection_id, provider, source) for connection_id in connection_ids]
+    failed = sum(1 for r in results if not (r or {}).get("synced"))
+    return {"provider": provider, "connections": len(connection_ids), "failed": failed, "results": results}
+
+
+def _register_sync_task(provider: str, rate_limit: Optional[str]):
+    def run(connection_ids: List[int], source: str = "prod") -> Dict[str, Any]:
+        return sync_batch(provider, connection_ids, source)
+
+    run.__name__ = f"sync_{provider}_batch"
+    return celery_app.task(name=f"bimo.sync.{provider}", rate_limit=rate_limit)(run)
+
+
+_quotas = parse_quotas(settings.PROVIDER_API_QUOTAS)
+sync_tasks = {
+    p: _register_sync_task(p, task_rate_limit(_quotas.get(p), settings.CELERY_SYNC_BATCH_SIZE))
+    for p in PROVIDERS
+}
+
+
+def enqueue_sync(provider: str, connection_ids: List[int], source: str = "prod") -> List[Any]:
+    """Send ``connection_ids`` to the provider's queue in batches."""
+    task = sync_tasks[provider]
+    size = max(settings.CELERY_SYNC_BATCH_SIZE, 1)
+    ids = list(connection_ids)
+    return [task.apply_async(args=(ids[i:i + size],), kwargs={"source": source}) for i in range(0, len(ids), size)]
+
+
+@celery_app.task(name="bimo.scheduler.tick")
+def scheduler_tick() -> Dict[str, int]:
+    from .scheduler import tick
+    return tick()
+
+
+@celery_app.task(name="bimo.jobs.sync")
+def sync_job(job_id: str, connection_id: int, provider: str, source: str = "prod") -> Any:
+    """A sync-now job; progress and result go to the shared job store."""
+    from .tasks import run_sync_job
+    return run_sync_job(job_id, connection_id, provider, source)
+
+
+@celery_app.task(name="bimo.backfill.work")
+def backfill_work(job_id: int) -> Dict[str, Any]:
+    """One backfill worker; ``start_job`` sends several to the provider's queue."""
+    from .backfill import work
+    return work(job_id)
+
+
+@celery_app.task(name="bimo.rollups")
+def rollups() -> Dict[str, int]:
+    from .rollups import run_rollups
+    return run_rollups()
@@ -0,0 +1,161 @@
+"""In-process task executor used when Celery is not running.
+
+A fixed pool of worker threads drains a bounded priority queue (lower
+``priority`` runs first, FIFO within a priority). Submitting a job whose
+``(task, connection_id)`` key is already queued or running returns the
+existing future instead of scheduling a duplicate sync. Each provider may
+have at most ``provider_limits[provider]`` jobs running at once; jobs over
+the cap are parked and re-queued as that provider's running jobs finish,
+so they never hold a worker thread while waiting.
+"""
+import itertools
+import logging
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Callable, Deque, Dict, Hashable, Optional
+
+from ..core import metrics
+
+logger = logging.getLogger(__name__)
+
+_DEPTH = metrics.gauge("bimo_worker_queue_depth", "Jobs waiting in the in-process worker queue")
+_WAIT = metrics.histogram(
+    "bimo_worker_wait_seconds", "Time jobs spend queued before running", ["task"],
+    buckets=(0.01, 0.05, 0.1, 0.5, 1, 5, 15, 60, 300),
+)
+_JOBS = metrics.counter("bimo_worker_jobs_total", "In-process worker jobs", ["task", "result"])
+
+
+class QueueFull(RuntimeError):
+    """The executor queue is at capacity; the caller should retry later."""
+
+
+class _Job:
+    __slots__ = ("name", "fn", "args", "kwargs", "key", "provider", "future", "enqueued_at")
+
+    def __init__(self, name, fn, args, kwargs, key, provider) -> None:
+        self.name = name
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.key = key
+        self.provider = provider
+        self.future: Future = Future()
+        self.enqueued_at = time.monotonic()
+
+
+class BoundedExecutor:
+    def __init__(self, workers: int = 4, max_queue: int = 1000,
+                 provider_limits: Optional[Dict[str, int]] = None) -> None:
+        self.workers = workers
+        self.max_queue = max_queue
+        self.provider_limits = dict(provider_limits or {})
+        self._queue: "queue.PriorityQueue" = queue.PriorityQueue()
+        self._seq = itertools.count()
+        self._pending: Dict[Hashable, _Job] = {}
+        self._running: Dict[str, int] = {}
+        self._parked: Dict[str, Deque[tuple]] = {}
+        self._queued = 0
+        self._lock = threading.Lock()
+        self._threads: list = []
+
+    def submit(self, name: str, fn: Callable[..., Any], args: tuple = (), kwargs: Optional[dict] = None,
+               key: Optional[Hashable] = None, provider: Optional[str] = None, priority: int = 5) -> Future:
+        """Queue ``fn(*args, **kwargs)``; returns the job's future.
+
+        Raises ``QueueFull`` when ``max_queue`` jobs are already waiting.
+        """
+        with self._lock:
+            if key is not None and key in self._pending:
+                _JOBS.labels(task=name, result="coalesced").inc()
+                return self._pending[key].future
+            if self._queued >= self.max_queue:
+                _JOBS.labels(task=name, result="rejected").inc()
+                raise QueueFull(f"worker queue full ({self.max_queue} jobs)")
+            job = _Job(name, fn, args, kwargs or {}, key, provider)
+            if key is not None:
+                self._pending[key] = job
+            self._queued += 1
+            _DEPTH.set(self._queued)
+            self._start_workers()
+        self._queue.put((priority, next(self._seq), job))
+        return job.future
+
+    def _start_workers(self) -> None:
+        while len(self._threads) < self.workers:
+            t = threading.Thread(target=self._work, name=f"bimo-worker-{len(self._threads)}", daemon=True)
+            self._threads.append(t)
+            t.start()
+
+    def _work(self) -> None:
+        while True:
+            priority, seq, job = self._queue.get()
+            with self._lock:
+                limit = self.provider_limits.get(job.provider) if job.provider else None
+                if limit and self._running.get(job.provider, 0) >= limit:
+                    self._parked.setdefault(job.provider, deque()).append((priority, seq, job))
+                    continue
+                if job.provider:
+                    self._running[job.provider] = self._running.get(job.provider, 0) + 1
+                self._queued -= 1
+                _DEPTH.set(self._queued)
+            _WAIT.labels(task=job.name).observe(time.monotonic() - job.enqueued_at)
+            try:
+                result = job.fn(*job.args, **job.kwargs)
+            except BaseException as e:
+                _JOBS.labels(task=job.name, result="failed").inc()
+                logger.warning("%s failed: %s", job.name, e)
+                self._finish(job)
+                job.future.set_exception(e)
+            else:
+                _JOBS.labels(task=job.name, result="ok").inc()
+                self._finish(job)
+                job.future.set_result(result)
+
+    def _finish(self, job: _Job) -> None:
+        with self._lock:
+            if job.key is not None and self._pending.get(job.key) is job:
+                del self._pending[job.key]
+            if not job.provider:
+                return
+            self._running[job.provider] -= 1
+            parked = self._parked.get(job.provider)
+            item = parked.popleft() if parked else None
+        if item is not None:
+            self._queue.put(item)
+
+    def depth(self) -> int:
+        return self._queued
+
+
+def parse_limits(raw: str) -> Dict[str, int]:
+    """``"openai=4,gemini=2"`` -> ``{"openai": 4, "gemini": 2}``; bad items are ignored."""
+    limits: Dict[str, int] = {}
+    for item in (raw or "").split(","):
+        name, _, value = item.partition("=")
+        try:
+            limits[name.strip().lower()] = int(value)
+        except ValueError:
+            continue
+    return limits
+
+
+_executor: Optional[BoundedExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> BoundedExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                from ..settings import settings
+                _executor = BoundedExecutor(
+                    workers=settings.WORKER_POOL_SIZE,
+                    max_queue=settings.WORKER_QUEUE_MAX,
+                    provider_limits=parse_limits(settings.WORKER_PROVIDER_LIMITS),
+                )
+    return _executor
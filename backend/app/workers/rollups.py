@@ -0,0 +1,363 @@
+"""
+Incremental rollups of api_logs and invoices into provider_metrics_*.
+
+Dashboards read pre-aggregated buckets instead of scanning raw usage:
+
+- ``provider_metrics_hourly``  built from ``api_logs`` and ``invoice``
+- ``provider_metrics_daily``   built from the hourly table
+- ``provider_metrics_monthly`` built from the daily table
+
+Each input stream has a high-water mark (last processed id) in
+``rollup_state``. A run reads only the ids past the mark, collects the hour
+buckets those rows fall into and rebuilds just those buckets (delete +
+re-aggregate), then the enclosing days and months. A row that arrives late -
+an invoice for last month, a usage event flushed after a restart - therefore
+only re-aggregates the buckets it touches. Rebuilding a bucket is idempotent,
+so the reader re-scans a small id overlap behind the mark to pick up rows
+whose transactions committed out of id order.
+
+On Postgres runs are serialised across processes and hosts by a
+transaction-level advisory lock: a run that finds it held skips (the holder
+is doing the same work), and ``rebuild`` calls from ingestion wait for it.
+Other databases fall back to a process-local lock.
+"""
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import and_, case, delete, func, insert, select
+
+from ..core import metrics
+from ..models import (
+    ApiLog,
+    Invoice,
+    ProviderMetricsDaily,
+    ProviderMetricsHourly,
+    ProviderMetricsMonthly,
+    RollupState,
+)
+from ..settings import settings
+
+logger = logging.getLogger(__name__)
+
+# Provider id -> spend category used by the dashboard breakdowns
+PROVIDER_CATEGORIES: Dict[str, str] = {
+    "openai": "ai",
+    "claude": "ai",
+    "anthropic": "ai",
+    "gemini": "ai",
+    "azure_openai": "ai",
+    "azure": "cloud",
+    "gcp": "cloud",
+    "aws": "cloud",
+    "zoom": "saas",
+    "slack": "saas",
+    "github": "saas",
+    "notion": "saas",
+}
+
+# Ranges of affected buckets further apart than this are rebuilt separately
+_MERGE_GAP = {"hour": timedelta(hours=24), "day": timedelta(days=31), "month": timedelta(days=366)}
+
+_HOURLY = ProviderMetricsHourly.__table__
+_DAILY = ProviderMetricsDaily.__table__
+_MONTHLY = ProviderMetricsMonthly.__table__
+_STATE = RollupState.__table__
+_LOGS = ApiLog.__table__
+_INVOICES = Invoice.__table__
+
+_KEY_COLUMNS = ("org_id", "connection_id", "provider", "model", "category", "source")
+_SUM_COLUMNS = (
+    "requests", "prompt_tokens", "completion_tokens", "total_tokens",
+    "cost", "saved_cost", "cache_hits", "latency_ms_sum",
+)
+
+_ROWS = metrics.counter("bimo_rollup_input_rows_total", "Raw rows consumed by the rollup worker", ["stream"])
+_BUCKETS = metrics.counter("bimo_rollup_buckets_rebuilt_total", "Rollup buckets rebuilt", ["resolution"])
+
+_lock = threading.Lock()
+# pg advisory lock key shared by every rollup writer (b"bimoroll" as a bigint)
+_ADVISORY_KEY = 0x62696D6F726F6C6C
+
+
+def provider_category(provider: Optional[str], default: str = "saas") -> str:
+    return PROVIDER_CATEGORIES.get((provider or "").lower(), default)
+
+
+# --- bucket arithmetic -----------------------------------------------------
+
+def truncate(ts: datetime, unit: str) -> datetime:
+    if unit == "hour":
+        return ts.replace(minute=0, second=0, microsecond=0)
+    if unit == "day":
+        return ts.replace(hour=0, minute=0, second=0, microsecond=0)
+    if unit == "month":
+        return ts.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    raise ValueError(f"unknown bucket unit: {unit}")
+
+
+def advance(ts: datetime, unit: str) -> datetime:
+    """Start of the bucket following the one starting at ``ts``."""
+    if unit == "hour":
+        return ts + timedelta(hours=1)
+    if unit == "day":
+        return ts + timedelta(days=1)
+    if ts.month == 12:
+        return ts.replace(year=ts.year + 1, month=1)
+    return ts.replace(month=ts.month + 1)
+
+
+def _ranges(buckets: Iterable[datetime], unit: str) -> List[Tuple[datetime, datetime]]:
+    """Collapse bucket starts into half-open [start, end) ranges to rebuild."""
+    out: List[Tuple[datetime, datetime]] = []
+    for b in sorted(set(buckets)):
+        end = advance(b, unit)
+        if out and b - out[-1][1] <= _MERGE_GAP[unit]:
+            out[-1] = (out[-1][0], max(out[-1][1], end))
+        else:
+            out.append((b, end))
+    return out
+
+
+def bucket_expr(column, unit: str, dialect: str):
+    if dialect == "sqlite":
+        fmt = {"hour": "%Y-%m-%d %H:00:00", "day": "%Y-%m-%d 00:00:00", "month": "%Y-%m-01 00:00:00"}[unit]
+        return func.strftime(fmt, column)
+    return func.date_trunc(unit, column)
+
+
+def as_datetime(value) -> datetime:
+    if isinstance(value, datetime):
+        return value.replace(tzinfo=None)
+    return datetime.fromisoformat(str(value))
+
+
+# --- high-water marks ------------------------------------------------------
+
+def _read_mark(conn, name: str) -> int:
+    value = conn.execute(select(_STATE.c.last_id).where(_STATE.c.name == name)).scalar()
+    return int(value or 0)
+
+
+def _write_mark(conn, name: str, last_id: int) -> None:
+    now = datetime.utcnow()
+    updated = conn.execute(
+        _STATE.update().where(_STATE.c.name == name).values(last_id=last_id, updated_at=now)
+    ).rowcount
+    if not updated:
+        conn.execute(insert(_STATE).values(name=name, last_id=last_id, updated_at=now))
+
+
+def _scan_new(conn, table, ts_column, mark: int, overlap: int, batch_size: int) -> Tuple[Set[datetime], int, int]:
+    """Hours touched by rows past ``mark`` (plus the re-scan overlap).
+
+    Returns (hours, new_mark, rows_past_mark).
+    """
+    hours: Set[datetime] = set()
+    last_id = max(0, mark - overlap)
+    new_mark, fresh = mark, 0
+    while True:
+        rows = conn.execute(
+            select(table.c.id, ts_column)
+            .where(table.c.id > last_id)
+            .order_by(table.c.id)
+            .limit(batch_size)
+        ).all()
+        for row_id, ts in rows:
+            if ts is not None:
+                hours.add(truncate(as_datetime(ts), "hour"))
+            if row_id > mark:
+                fresh += 1
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        new_mark = max(new_mark, last_id)
+        if len(rows) < batch_size:
+            break
+    return hours, new_mark, fresh
+
+
+# --- aggregation -----------------------------------------------------------
+
+def _hourly_from_logs(conn, start: datetime, end: datetime, dialect: str) -> List[Dict]:
+    bucket = bucket_expr(_LOGS.c.created_at, "hour", dialect).label("bucket_start")
+    source = func.coalesce(_LOGS.c.source, "prod").label("source")
+    provider = func.coalesce(_LOGS.c.provider, "unknown").label("provider")
+    stmt = (
+        select(
+            bucket,
+            _LOGS.c.org_id,
+            _LOGS.c.connection_id,
+            provider,
+            _LOGS.c.model,
+            source,
+            func.count().label("requests"),
+            func.coalesce(func.sum(_LOGS.c.prompt_tokens), 0).label("prompt_tokens"),
+            func.coalesce(func.sum(_LOGS.c.completion_tokens), 0).label("completion_tokens"),
+            func.coalesce(func.sum(_LOGS.c.total_tokens), 0).label("total_tokens"),
+            func.coalesce(func.sum(_LOGS.c.cost), 0.0).label("cost"),
+            func.coalesce(func.sum(_LOGS.c.saved_cost), 0.0).label("saved_cost"),
+            func.sum(case((_LOGS.c.cache_hit, 1), else_=0)).label("cache_hits"),
+            func.coalesce(func.sum(_LOGS.c.latency_ms), 0.0).label("latency_ms_sum"),
+        )
+        .where(and_(_LOGS.c.created_at >= start, _LOGS.c.created_at < end))
+        .group_by(bucket, _LOGS.c.org_id, _LOGS.c.connection_id, provider, _LOGS.c.model, source)
+    )
+    out = []
+    for row in conn.execute(stmt).mappings():
+        item = dict(row)
+        item["bucket_start"] = as_datetime(item["bucket_start"])
+        # Everything in api_logs went through the AI gateway or an AI usage sync
+        item["category"] = provider_category(item["provider"], default="ai")
+        out.append(item)
+    return out
+
+
+def _hourly_from_invoices(conn, start: datetime, end: datetime, dialect: str) -> List[Dict]:
+    # Invoices are attributed to the start of their billing period when known
+    ts = func.coalesce(_INVOICES.c.period_start, _INVOICES.c.created_at)
+    bucket = bucket_expr(ts, "hour", dialect).label("bucket_start")
+    source = func.coalesce(_INVOICES.c.source, "billing").label("source")
+    stmt = (
+        select(
+            bucket,
+            _INVOICES.c.provider,
+            source,
+            func.coalesce(func.sum(_INVOICES.c.amount), 0.0).label("cost"),
+        )
+        .where(and_(ts >= start, ts < end))
+        .group_by(bucket, _INVOICES.c.provider, source)
+    )
+    out = []
+    for row in conn.execute(stmt).mappings():
+        out.append({
+            "bucket_start": as_datetime(row["bucket_start"]),
+            # Provider invoices cover the whole account, not one org
+            "org_id": None,
+            "connection_id": None,
+            "provider": row["provider"],
+            "model": None,
+            "category": provider_category(row["provider"]),
+            "source": row["source"],
+            "requests": 0,
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+            "total_tokens": 0,
+            "cost": float(row["cost"] or 0.0),
+            "saved_cost": 0.0,
+            "cache_hits": 0,
+            "latency_ms_sum": 0.0,
+        })
+    return out
+
+
+def _coarser_from(conn, source_table, unit: str, start: datetime, end: datetime, dialect: str) -> List[Dict]:
+    bucket = bucket_expr(source_table.c.bucket_start, unit, dialect).label("bucket_start")
+    keys = [source_table.c[k] for k in _KEY_COLUMNS]
+    sums = [func.coalesce(func.sum(source_table.c[k]), 0).label(k) for k in _SUM_COLUMNS]
+    stmt = (
+        select(bucket, *keys, *sums)
+        .where(and_(source_table.c.bucket_start >= start, source_table.c.bucket_start < end))
+        .group_by(bucket, *keys)
+    )
+    out = []
+    for row in conn.execute(stmt).mappings():
+        item = dict(row)
+        item["bucket_start"] = as_datetime(item["bucket_start"])
+        out.append(item)
+    return out
+
+
+def _replace(conn, table, start: datetime, end: datetime, rows: List[Dict]) -> None:
+    conn.execute(delete(table).where(and_(table.c.bucket_start >= start, table.c.bucket_start < end)))
+    for i in range(0, len(rows), 500):
+        conn.execute(insert(table), rows[i:i + 500])
+
+
+def _try_lock(conn) -> bool:
+    """Take the rollup advisory lock for this transaction unless someone holds it."""
+    if conn.dialect.name != "postgresql":
+        return True
+    return bool(conn.execute(select(func.pg_try_advisory_xact_lock(_ADVISORY_KEY))).scalar())
+
+
+def rebuild(conn, hours: Iterable[datetime], dialect: Optional[str] = None) -> Dict[str, int]:
+    """Rebuild the hourly buckets in ``hours`` and their enclosing days/months.
+
+    On Postgres this waits for the rollup advisory lock (re-entrant, so
+    ``run_rollups`` holding it already is fine); it is released at commit.
+    """
+    dialect = dialect or conn.dialect.name
+    hours = {truncate(h, "hour") for h in hours}
+    counts = {"hours": 0, "days": 0, "months": 0}
+    if not hours:
+        return counts
+    if conn.dialect.name == "postgresql":
+        conn.execute(select(func.pg_advisory_xact_lock(_ADVISORY_KEY)))
+
+    for start, end in _ranges(hours, "hour"):
+        rows = _hourly_from_logs(conn, start, end, dialect) + _hourly_from_invoices(conn, start, end, dialect)
+        _replace(conn, _HOURLY, start, end, rows)
+        counts["hours"] += int((end - start) / timedelta(hours=1))
+
+    days = {truncate(h, "day") for h in hours}
+    for start, end in _ranges(days, "day"):
+        _replace(conn, _DAILY, start, end, _coarser_from(conn, _HOURLY, "day", start, end, dialect))
+        counts["days"] += (end - start).days
+
+    months = {truncate(d, "month") for d in days}
+    for start, end in _ranges(months, "month"):
+        _replace(conn, _MONTHLY, start, end, _coarser_from(conn, _DAILY, "month", start, end, dialect))
+        counts["months"] += (end.year - start.year) * 12 + end.month - start.month
+
+    for resolution, n in (("hourly", counts["hours"]), ("daily", counts["days"]), ("monthly", counts["months"])):
+        _BUCKETS.labels(resolution=resolution).inc(n)
+    return counts
+
+
+def run_rollups(engine=None, batch_size: Optional[int] = None, overlap: Optional[int] = None) -> Dict[str, int]:
+    """Advance every stream past its high-water mark and rebuild touched buckets.
+
+    Runs in one transaction so the marks only move together with the buckets
+    they account for. A run that finds another one in progress (in this
+    process, or anywhere on Postgres) returns at once with ``skipped``.
+    """
+    if engine is None:
+        from ..db import engine
+    batch_size = batch_size or settings.ROLLUP_BATCH_SIZE
+    overlap = settings.ROLLUP_ID_OVERLAP if overlap is None else overlap
+    streams = (
+        ("api_logs", _LOGS, _LOGS.c.created_at),
+        ("invoice", _INVOICES, func.coalesce(_INVOICES.c.period_start, _INVOICES.c.created_at)),
+    )
+    idle = {"api_logs": 0, "invoice": 0, "hours": 0, "days": 0, "months": 0}
+    if not _lock.acquire(blocking=False):
+        return {**idle, "skipped": True}
+    try:
+        return _run_locked(engine, streams, batch_size, overlap, idle)
+    finally:
+        _lock.release()
+
+
+def _run_locked(engine, streams, batch_size: int, overlap: int, idle: Dict[str, int]) -> Dict[str, int]:
+    with engine.begin() as conn:
+        if not _try_lock(conn):
+            return {**idle, "skipped": True}
+        hours: Set[datetime] = set()
+        marks: Dict[str, int] = {}
+        result: Dict[str, int] = {}
+        for name, table, ts in streams:
+            touched, marks[name], result[name] = _scan_new(conn, table, ts, _read_mark(conn, name), overlap, batch_size)
+            hours |= touched
+            _ROWS.labels(stream=name).inc(result[name])
+        if not any(result.values()):
+            # Nothing past the marks; the overlap is re-checked on the next real batch
+            return {**result, "hours": 0, "days": 0, "months": 0}
+        result.update(rebuild(conn, hours))
+        for name, mark in marks.items():
+            _write_mark(conn, name, mark)
+    if result["hours"]:
+        logger.info("rebuilt %d hourly / %d daily buckets from %d api_logs + %d invoice rows",
+                    result["hours"], result["days"], result["api_logs"], result["invoice"])
+    return result
@@ -0,0 +1,244 @@
+"""Adaptive periodic scheduler for provider usage syncs.
+
+Every connected connection (``status == "connected"``) has a row in
+``sync_schedule`` with its ``next_run_at``; the row is dropped when the
+connection is deleted or leaves that state.
+A tick reads only the due rows through the ``next_run_at`` index (an index
+range scan, not a table scan) and claims each with a conditional update that
+pushes ``next_run_at`` out by a lease, so several scheduler processes can
+tick concurrently without double-dispatching and a crashed sync is retried
+once the lease runs out.
+
+After each sync the connection's activity (usage events seen since the last
+run) updates a smoothed events-per-hour rate, and the next interval is the
+time expected to accumulate ``SYNC_TARGET_EVENTS`` events, clamped between
+``SYNC_MIN_INTERVAL_SECONDS`` (busy production keys) and
+``SYNC_MAX_INTERVAL_SECONDS`` (idle keys). Intervals are jittered and new
+connections are spread uniformly over their first interval, so syncs never
+line up at the top of the hour.
+
+Without Celery the tick also runs the provider_metrics rollups every
+``ROLLUP_INTERVAL_SECONDS`` (Celery beat schedules them otherwise).
+"""
+import logging
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy import func, insert, select
+
+from ..core import metrics
+from ..models import ApiLog, ProviderConnection, SyncSchedule
+from ..settings import settings
+
+logger = logging.getLogger(__name__)
+
+_SCHEDULE = SyncSchedule.__table__
+_CONNECTIONS = ProviderConnection.__table__
+_LOGS = ApiLog.__table__
+
+SMOOTHING = 0.5  # weight of the latest observation in activity_per_hour
+
+_DISPATCHED = metrics.counter("bimo_scheduler_dispatched_total", "Syncs dispatched by the scheduler", ["provider"])
+_LAG = metrics.histogram(
+    "bimo_scheduler_lag_seconds", "How late scheduled syncs are dispatched",
+    buckets=(1, 5, 15, 60, 300, 900, 3600),
+)
+
+_last_seeded = 0.0
+_last_rollup = 0.0
+
+
+def jittered(seconds: float, rng: Callable[[float, float], float] = random.uniform) -> float:
+    j = settings.SYNC_JITTER_FRACTION
+    return seconds * rng(1 - j, 1 + j)
+
+
+def interval_for(activity_per_hour: float) -> int:
+    """Seconds until enough events accumulate for a worthwhile sync."""
+    lo, hi = settings.SYNC_MIN_INTERVAL_SECONDS, settings.SYNC_MAX_INTERVAL_SECONDS
+    if activity_per_hour <= 0:
+        return hi
+    return int(min(max(settings.SYNC_TARGET_EVENTS / activity_per_hour * 3600, lo), hi))
+
+
+def seed(conn, now: Optional[datetime] = None) -> int:
+    """Add schedules for newly connected connections and drop those of
+    deleted or no longer connected ones."""
+    now = now or datetime.utcnow()
+    connected = select(_CONNECTIONS.c.id).where(_CONNECTIONS.c.status == "connected")
+    missing = conn.execute(
+        select(_CONNECTIONS.c.id, _CONNECTIONS.c.provider_id)
+        .select_from(_CONNECTIONS.outerjoin(_SCHEDULE, _SCHEDULE.c.connection_id == _CONNECTIONS.c.id))
+        .where(_SCHEDULE.c.connection_id.is_(None), _CONNECTIONS.c.status == "connected")
+    ).all()
+    interval = settings.SYNC_INITIAL_INTERVAL_SECONDS
+    rows = [
+        {"connection_id": cid, "provider": (provider or "").lower(), "interval_seconds": interval,
+         # Spread first runs over a whole interval instead of all at once
+         "next_run_at": now + timedelta(seconds=random.uniform(0, interval)),
+         "activity_per_hour": 0.0, "failures": 0}
+        for cid, provider in missing
+    ]
+    if rows:
+        conn.execute(insert(_SCHEDULE), rows)
+    conn.execute(_SCHEDULE.delete().where(~_SCHEDULE.c.connection_id.in_(connected)))
+    return len(rows)
+
+
+def claim_due(conn, now: Optional[datetime] = None, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Due schedules, oldest first, each leased to this caller."""
+    now = now or datetime.utcnow()
+    due = conn.execute(
+        select(_SCHEDULE.c.connection_id, _SCHEDULE.c.provider, _SCHEDULE.c.next_run_at)
+        .where(_SCHEDULE.c.next_run_at <= now)
+        .order_by(_SCHEDULE.c.next_run_at)
+        .limit(limit or settings.SYNC_SCHEDULER_BATCH)
+    ).all()
+    lease_until = now + timedelta(seconds=settings.SYNC_LEASE_SECONDS)
+    claimed = []
+    for cid, provider, next_run_at in due:
+        won = conn.execute(
+            _SCHEDULE.update()
+            .where(_SCHEDULE.c.connection_id == cid, _SCHEDULE.c.next_run_at == next_run_at)
+            .values(next_run_at=lease_until)
+        ).rowcount
+        if won:
+            _LAG.observe(max((now - next_run_at).total_seconds(), 0.0))
+            claimed.append({"connection_id": cid, "provider": provider, "due_at": next_run_at})
+    return claimed
+
+
+def record_run(conn, connection_id: int, events: int, ok: bool = True, now: Optional[datetime] = None) -> Optional[datetime]:
+    """Fold a finished sync into the schedule and set the next due time."""
+    now = now or datetime.utcnow()
+    row = conn.execute(select(_SCHEDULE).where(_SCHEDULE.c.connection_id == connection_id)).mappings().first()
+    if row is None:
+        return None
+    if not ok:
+        failures = row["failures"] + 1
+        # Back off from the minimum interval, never past the normal one
+        delay = min(settings.SYNC_MIN_INTERVAL_SECONDS * 2 ** failures, max(row["interval_seconds"], settings.SYNC_MIN_INTERVAL_SECONDS))
+        next_run_at = now + timedelta(seconds=jittered(delay))
+        conn.execute(_SCHEDULE.update().where(_SCHEDULE.c.connection_id == connection_id)
+                     .values(failures=failures, next_run_at=next_run_at))
+        return next_run_at
+    since = row["last_run_at"] or now - timedelta(seconds=row["interval_seconds"])
+    hours = max((now - since).total_seconds() / 3600.0, 1 / 60)
+    activity = SMOOTHING * (events / hours) + (1 - SMOOTHING) * row["activity_per_hour"]
+    interval = interval_for(activity)
+    next_run_at = now + timedelta(seconds=jittered(interval))
+    conn.execute(_SCHEDULE.update().where(_SCHEDULE.c.connection_id == connection_id).values(
+        activity_per_hour=activity, interval_seconds=interval, last_run_at=now,
+        next_run_at=next_run_at, failures=0,
+    ))
+    return next_run_at
+
+
+def _events_since(conn, connection_id: int, since: Optional[datetime]) -> int:
+    q = select(func.count()).select_from(_LOGS).where(_LOGS.c.connection_id == connection_id)
+    if since is not None:
+        q = q.where(_LOGS.c.created_at > since)
+    return int(conn.execute(q).scalar() or 0)
+
+
+def _sync_functions() -> Dict[str, Callable[..., Any]]:
+    from . import tasks
+    return {
+        "openai": tasks._sync_openai_usage_for_connection,
+        "claude": tasks._sync_claude_usage_for_connection,
+        "gemini": tasks._sync_gemini_usage_for_connection,
+        "azure": tasks._sync_azure_usage_for_connection,
+    }
+
+
+def run_scheduled(connection_id: int, provider: str, source: str = "prod", engine=None) -> Dict[str, Any]:
+    """Sync one connection and reschedule it from what the sync saw."""
+    if engine is None:
+        from ..db import engine
+    fn = _sync_functions().get(provider)
+    if fn is None:
+        return {"connection_id": connection_id, "synced": False, "reason": f"no sync for provider {provider}"}
+    with engine.connect() as conn:
+        last = conn.execute(select(_SCHEDULE.c.last_run_at).where(_SCHEDULE.c.connection_id == connection_id)).scalar()
+    try:
+        result = fn(connection_id, source=source) or {}
+        ok = bool(result.get("synced", True))
+    except Exception as e:
+        logger.warning("%s sync for connection %s failed: %s", provider, connection_id, e)
+        result, ok = {"connection_id": connection_id, "synced": False, "error": str(e)}, False
+    with engine.begin() as conn:
+        events = _events_since(conn, connection_id, last) + int(result.get("rows") or 0)
+        record_run(conn, connection_id, events, ok=ok)
+    return result
+
+
+def tick(engine=None, now: Optional[datetime] = None) -> Dict[str, int]:
+    """Seed (at most every SYNC_SEED_INTERVAL_SECONDS), claim due syncs and dispatch them."""
+    global _last_seeded, _last_rollup
+    if engine is None:
+        from ..db import engine
+    seeded = 0
+    seeded_now = time.monotonic() - _last_seeded >= settings.SYNC_SEED_INTERVAL_SECONDS
+    with engine.begin() as conn:
+        if seeded_now:
+            seeded = seed(conn, now)
+            _last_seeded = time.monotonic()
+        claimed = claim_due(conn, now)
+    if seeded_now:
+        # Same cadence: restart backfills whose workers died with a process
+        try:
+            from .backfill import resume_jobs
+            resume_jobs(engine, now)
+        except Exception as e:
+            logger.warning("backfill resume failed: %s", e)
+    if not settings.CELERY_ENABLED and time.monotonic() - _last_rollup >= settings.ROLLUP_INTERVAL_SECONDS:
+        _last_rollup = time.monotonic()
+        try:
+            from .rollups import run_rollups
+            run_rollups(engine)
+        except Exception as e:
+            logger.warning("rollups failed: %s", e)
+    by_provider: Dict[str, List[int]] = {}
+    for item in claimed:
+        by_provider.setdefault(item["provider"], []).append(item["connection_id"])
+    for provider, ids in by_provider.items():
+        _DISPATCHED.labels(provider=provider).inc(len(ids))
+        if settings.CELERY_ENABLED:
+            from .celery_app import enqueue_sync, sync_tasks
+            if provider in sync_tasks:
+                enqueue_sync(provider, ids)
+            continue
+        from .executor import QueueFull, get_executor
+        from .tasks import sync_key
+        for cid in ids:
+            try:
+                get_executor().submit("scheduled_sync", run_scheduled, (cid, provider),
+                                      key=sync_key(cid), provider=provider, priority=6)
+            except QueueFull:
+                # Lease expiry re-offers it on a later tick
+                break
+    return {"seeded": seeded, "dispatched": len(claimed)}
+
+
+_thread: Optional[threading.Thread] = None
+
+
+def start_scheduler() -> None:
+    """Tick in a daemon thread (used when Celery beat is not running)."""
+    global _thread
+    if _thread is not None:
+        return
+
+    def loop() -> None:
+        while True:
+            try:
+                tick()
+            except Exception as e:
+                logger.warning("tick failed: %s", e)
+            time.sleep(settings.SYNC_SCHEDULER_TICK_SECONDS)
+
+    _thread = threading.Thread(target=loop, name="bimo-sync-scheduler", daemon=True)
+    _thread.start()
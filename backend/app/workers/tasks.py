@@ -1,27 +1,54 @@
 """Development shim for background worker tasks.
 
 Provides Task-like objects with .delay(...) and .run(...) used by routers.
-In production this would be backed by Celery; here we run tasks synchronously
-or fire-and-forget on a daemon thread for developer convenience.
+With ``CELERY_ENABLED`` per-connection syncs go to the provider's Celery
+queue (see celery_app.py). Otherwise ``.delay`` hands the call to the bounded
+in-process executor (see executor.py), which coalesces duplicate jobs for
+the same connection and caps concurrency per provider.
 """
-from typing import Any
-import threading
+from typing import Any, Optional
 import time
 
+from ..settings import settings
+from .executor import get_executor
+
+
+def sync_key(connection_id: int) -> tuple:
+    """Executor key shared by every sync path for one connection.
+
+    DevTask syncs, sync-now jobs and scheduled syncs all submit under it, so
+    a connection never has two syncs queued or running in the process.
+    """
+    return ("sync", connection_id)
+
 
 class DevTask:
-    def __init__(self, fn):
+    def __init__(self, fn, provider: Optional[str] = None, priority: int = 5, per_connection: bool = False):
         self.fn = fn
+        self.name = fn.__name__.lstrip("_")
+        self.provider = provider
+        self.priority = priority
+        # True when the first argument is a connection id
+        self.per_connection = per_connection
 
     def delay(self, *args, **kwargs) -> Any:
-        """Start the task in a daemon thread and return immediately."""
-        try:
-            t = threading.Thread(target=self.fn, args=args, kwargs=kwargs, daemon=True)
-            t.start()
-            return True
-        except Exception:
-            # Keep API compatible; callers may fall back to .run()
-            raise
+        """Queue the task and return its future immediately.
+
+        A call for a connection that already has a sync queued or running
+        returns that job's future instead of starting a second sync.
+        Raises ``executor.QueueFull`` when the queue is at capacity.
+        """
+        connection_id = None
+        if self.per_connection:
+            connection_id = kwargs.get("connection_id", args[0] if args else None)
+        if settings.CELERY_ENABLED and self.provider and connection_id is not None:
+            from .celery_app import enqueue_sync
+            return enqueue_sync(self.provider, [connection_id], kwargs.get("source", "prod"))[0]
+        key = sync_key(connection_id) if connection_id is not None else (self.name, None)
+        return get_executor().submit(
+            self.name, self.fn, args, kwargs,
+            key=key, provider=self.provider, priority=self.priority,
+        )
 
     def run(self, *args, **kwargs) -> Any:
         """Run the task synchronously and return its result."""
@@ -30,52 +57,62 @@ class DevTask:
 
 def _sync_openai_usage_for_connection(connection_id: int, source: str = "prod"):
     print(f">>> [dev-worker] syncing OpenAI usage for connection {connection_id} (source={source})")
-    # simulate work
-    time.sleep(0.1)
-    # In a real worker, we'd record metrics and persist source on created rows
     try:
         from prometheus_client import Counter
         _c = Counter('bimo_sync_tasks_total', 'Total sync tasks', ['provider', 'source'])
         _c.labels(provider='openai', source=source).inc()
     except Exception:
         pass
-    return {"connection_id": connection_id, "synced": True, "source": source}
+    # Streams the provider usage/cost APIs into api_logs and invoices
+    from .usage_fetchers import sync_connection
+    result = sync_connection(connection_id, source=source)
+    result["source"] = source
+    return result
 
 
 def _sync_gemini_usage_for_connection(connection_id: int, source: str = "prod"):
     print(f">>> [dev-worker] syncing Gemini usage for connection {connection_id} (source={source})")
-    time.sleep(0.1)
     try:
         from prometheus_client import Counter
         _c = Counter('bimo_sync_tasks_total', 'Total sync tasks', ['provider', 'source'])
         _c.labels(provider='gemini', source=source).inc()
     except Exception:
         pass
-    return {"connection_id": connection_id, "synced": True, "source": source}
+    # Copies new billing export rows into gcp_billing_daily (see bigquery_sync)
+    from .bigquery_sync import sync_connection
+    result = sync_connection(connection_id)
+    result["source"] = source
+    return result
 
 
 def _sync_claude_usage_for_connection(connection_id: int, source: str = "prod"):
     print(f">>> [dev-worker] syncing Claude usage for connection {connection_id} (source={source})")
-    time.sleep(0.1)
     try:
         from prometheus_client import Counter
         _c = Counter('bimo_sync_tasks_total', 'Total sync tasks', ['provider', 'source'])
         _c.labels(provider='claude', source=source).inc()
     except Exception:
         pass
-    return {"connection_id": connection_id, "synced": True, "source": source}
+    # Streams the provider usage/cost APIs into api_logs and invoices
+    from .usage_fetchers import sync_connection
+    result = sync_connection(connection_id, source=source)
+    result["source"] = source
+    return result
 
 
 def _sync_azure_usage_for_connection(connection_id: int, source: str = "prod"):
     print(f">>> [dev-worker] syncing Azure usage for connection {connection_id} (source={source})")
-    time.sleep(0.1)
     try:
         from prometheus_client import Counter
         _c = Counter('bimo_sync_tasks_total', 'Total sync tasks', ['provider', 'source'])
         _c.labels(provider='azure', source=source).inc()
     except Exception:
         pass
-    return {"connection_id": connection_id, "synced": True, "source": source}
+    # Streams the provider usage/cost APIs into api_logs and invoices
+    from .usage_fetchers import sync_connection
+    result = sync_connection(connection_id, source=source)
+    result["source"] = source
+    return result
 
 
 def _sync_openai_usage(source: str = "billing"):
@@ -87,28 +124,63 @@ def _sync_openai_usage(source: str = "billing"):
         _c.labels(provider='openai', source=source).inc()
     except Exception:
         pass
-    # Simulate billing ingestion: create an invoice record when running in dev
+    # Simulate billing ingestion: upsert a dev invoice (idempotent across runs)
     try:
-        from ..db_sa import get_db
-        db = next(get_db())
-        try:
-            from ..models import Invoice
-            inv = Invoice(provider='openai', provider_invoice_id='dev-invoice-1', amount=1.23, currency='USD', source=source)
-            db.add(inv)
-            db.commit()
-        finally:
-            db.close()
+        from .billing_ingest import ingest_invoice
+        ingest_invoice('openai', {'invoice_id': 'dev-invoice-1', 'amount': 1.23, 'currency': 'USD'}, source=source)
     except Exception:
         # Best-effort only in dev environment
         pass
     return {"enqueued": True, "source": source}
 
 
-# Expose Task-like objects matching the original Celery interface used in code
-sync_openai_usage_for_connection = DevTask(_sync_openai_usage_for_connection)
-sync_gemini_usage_for_connection = DevTask(_sync_gemini_usage_for_connection)
-sync_claude_usage_for_connection = DevTask(_sync_claude_usage_for_connection)
-sync_azure_usage_for_connection = DevTask(_sync_azure_usage_for_connection)
-sync_openai_usage = DevTask(_sync_openai_usage)
+def _rollup_provider_metrics():
+    from .rollups import run_rollups
+    return run_rollups()
+
 
+def run_sync_job(job_id: str, connection_id: int, provider: str, source: str = "prod"):
+    """Body of a sync-now job: a scheduled-style sync recorded in the job store."""
+    from ..services.jobs import run_job
+    from .scheduler import run_scheduled
+    return run_job(job_id, run_scheduled, connection_id, provider, source)
 
+
+def start_sync_job(job_id: str, connection_id: int, provider: str, source: str = "prod") -> Any:
+    """Dispatch a sync-now job to the provider's Celery queue or the in-process executor.
+
+    When a sync for the connection is already queued or running the job
+    joins it and records that sync's outcome once it finishes.
+    Raises ``executor.QueueFull`` when the executor queue is at capacity.
+    """
+    if settings.CELERY_ENABLED:
+        from .celery_app import queue_name, sync_job
+        return sync_job.apply_async(args=(job_id, connection_id, provider, source), queue=queue_name(provider))
+    future = get_executor().submit(
+        "sync_job", run_sync_job, (job_id, connection_id, provider, source),
+        key=sync_key(connection_id), provider=provider, priority=3,
+    )
+    future.add_done_callback(lambda f: _settle_joined(job_id, f))
+    return future
+
+
+def _settle_joined(job_id: str, future: Any) -> None:
+    """Record a joined sync's outcome on a job that never ran itself."""
+    from ..services import jobs
+    job = jobs.get_job(job_id)
+    if job is None or job["status"] != "queued":
+        return
+    try:
+        jobs.run_job(job_id, future.result)
+    except Exception:
+        # run_job already marked the job failed
+        pass
+
+
+# Expose Task-like objects matching the original Celery interface used in code
+sync_openai_usage_for_connection = DevTask(_sync_openai_usage_for_connection, provider="openai", per_connection=True)
+sync_gemini_usage_for_connection = DevTask(_sync_gemini_usage_for_connection, provider="gemini", per_connection=True)
+sync_claude_usage_for_connection = DevTask(_sync_claude_usage_for_connection, provider="claude", per_connection=True)
+sync_azure_usage_for_connection = DevTask(_sync_azure_usage_for_connection, provider="azure", per_connection=True)
+sync_openai_usage = DevTask(_sync_openai_usage, provider="openai", priority=7)
+rollup_provider_metrics = DevTask(_rollup_provider_metrics, priority=9)
@@ -0,0 +1,569 @@
+"""Async fetchers for the OpenAI, Anthropic and Azure usage/cost APIs.
+
+One sync runs on a single event loop with pooled ``httpx.AsyncClient``s
+(one per API host, see ``services.upstream.UpstreamPool``). The requested
+range is split into date windows that are fetched in parallel, and within a
+window the usage and cost endpoints are paginated concurrently. Every
+request takes a slot from a process-wide per-provider limit
+(``USAGE_FETCH_CONCURRENCY``, shared by every sync and backfill worker),
+and 429/5xx responses are retried after ``Retry-After`` (or an exponential
+backoff) without holding a slot.
+
+Pages are handed to the sinks as they arrive instead of being collected:
+
+- usage buckets are collected and inserted into ``api_logs`` in the same
+  transaction that advances ``usage_sync_state.usage_through``; only
+  completed buckets past the watermark are written, so a failed sync
+  writes nothing and re-syncs never duplicate tokens;
+- cost buckets go through the bulk invoice upsert with deterministic ids,
+  so the last ``USAGE_COST_LOOKBACK_DAYS`` are simply re-fetched to pick up
+  restated costs.
+
+Base URLs and the HTTP transport can be overridden, which is how the tests
+point fetchers at a mock server.
+"""
+import asyncio
+import email.utils
+import json
+import logging
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+import httpx
+from sqlalchemy import func, insert, select
+
+from ..core import metrics
+from ..models import UsageSyncState
+from ..services.jobs import report_progress
+from ..services.upstream import UpstreamPool
+from ..settings import settings
+from .executor import parse_limits
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+DAY = timedelta(days=1)
+
+_REQUESTS = metrics.counter("bimo_usage_fetch_requests_total", "Provider usage API requests", ["provider", "status"])
+_RETRIES = metrics.counter("bimo_usage_fetch_retries_total", "Provider usage API retries", ["provider", "reason"])
+_ROWS = metrics.counter("bimo_usage_fetch_rows_total", "Rows fetched from provider usage APIs", ["provider", "kind"])
+
+_STATE = UsageSyncState.__table__
+
+UsageSink = Callable[[List[Dict[str, Any]]], Any]
+CostSink = Callable[[List[Dict[str, Any]]], Any]
+
+
+class FetchError(RuntimeError):
+    pass
+
+
+def retry_after_seconds(response: Optional[httpx.Response]) -> Optional[float]:
+    """Seconds to wait from ``Retry-After`` (delta or HTTP date) or Azure's QPU header."""
+    if response is None:
+        return None
+    for name in ("retry-after", "x-ms-ratelimit-microsoft.costmanagement-qpu-retry-after"):
+        raw = response.headers.get(name)
+        if not raw:
+            continue
+        try:
+            return max(float(raw), 0.0)
+        except ValueError:
+            pass
+        try:
+            when = email.utils.parsedate_to_datetime(raw)
+            return max((when - datetime.now(timezone.utc)).total_seconds(), 0.0)
+        except (TypeError, ValueError):
+            pass
+    return None
+
+
+def split_windows(start: datetime, end: datetime, days: int) -> List[Tuple[datetime, datetime]]:
+    """Consecutive [start, end) windows of at most ``days`` days."""
+    step = timedelta(days=max(int(days), 1))
+    out = []
+    cur = start
+    while cur < end:
+        out.append((cur, min(cur + step, end)))
+        cur += step
+    return out
+
+
+def _epoch(ts: datetime) -> int:
+    return int(ts.replace(tzinfo=timezone.utc).timestamp())
+
+
+def _iso(ts: datetime) -> str:
+    return ts.replace(tzinfo=None, microsecond=0).isoformat() + "Z"
+
+
+def _from_epoch(value: Any) -> datetime:
+    return datetime.utcfromtimestamp(int(value))
+
+
+class ProviderSlots:
+    """Process-wide cap on in-flight requests to one provider.
+
+    Syncs run on separate event loops in separate threads, so an
+    ``asyncio.Semaphore`` (bound to one loop) can't be shared; waiters poll a
+    thread semaphore instead, backing off up to 100ms.
+    """
+
+    def __init__(self, limit: int) -> None:
+        self.limit = limit
+        self._sem = threading.Semaphore(limit)
+
+    async def __aenter__(self) -> None:
+        delay = 0.005
+        while not self._sem.acquire(blocking=False):
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 0.1)
+
+    async def __aexit__(self, *exc) -> None:
+        self._sem.release()
+
+
+_slots: Dict[Tuple[str, int], ProviderSlots] = {}
+_slots_lock = threading.Lock()
+
+
+def provider_slots(provider: str) -> ProviderSlots:
+    limit = parse_limits(settings.USAGE_FETCH_CONCURRENCY).get(provider, 4)
+    with _slots_lock:
+        slots = _slots.get((provider, limit))
+        if slots is None:
+            slots = _slots[(provider, limit)] = ProviderSlots(limit)
+        return slots
+
+
+def _from_iso(value: str) -> datetime:
+    ts = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    return ts.astimezone(timezone.utc).replace(tzinfo=None) if ts.tzinfo else ts
+
+
+class ProviderFetcher:
+    """Paginates one provider's usage and cost endpoints for a connection."""
+
+    provider = ""
+    base_url = ""
+
+    def __init__(self, connection_id: int, creds: Dict[str, Any], pool: UpstreamPool,
+                 semaphore: ProviderSlots, base_url: Optional[str] = None) -> None:
+        self.connection_id = connection_id
+        self.creds = creds or {}
+        self.pool = pool
+        self.semaphore = semaphore
+        self.base_url = base_url or self.base_url
+
+    async def headers(self) -> Dict[str, str]:
+        return {}
+
+    async def request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        client = self.pool.client_for(self.base_url)
+        kwargs.setdefault("headers", {}).update(await self.headers())
+        last: Optional[httpx.Response] = None
+        for attempt in range(settings.USAGE_FETCH_MAX_RETRIES + 1):
+            error: Optional[Exception] = None
+            async with self.semaphore:
+                try:
+                    last = await client.request(method, url, **kwargs)
+                except httpx.TransportError as e:
+                    error, last = e, None
+            if last is not None:
+                _REQUESTS.labels(provider=self.provider, status=str(last.status_code)).inc()
+                if last.status_code < 400:
+                    return last
+                if last.status_code not in RETRY_STATUSES:
+                    raise FetchError(f"{self.provider} {url} returned {last.status_code}: {last.text[:200]}")
+            if attempt == settings.USAGE_FETCH_MAX_RETRIES:
+                break
+            delay = retry_after_seconds(last)
+            _RETRIES.labels(provider=self.provider, reason="retry_after" if delay is not None else "backoff").inc()
+            if delay is None:
+                delay = min(2 ** attempt * 0.5, 30.0)
+            # Sleep outside the semaphore so throttled calls don't block others
+            await asyncio.sleep(min(delay, settings.USAGE_FETCH_MAX_RETRY_AFTER))
+        if error is not None and last is None:
+            raise FetchError(f"{self.provider} {url} failed: {error}")
+        raise FetchError(f"{self.provider} {url} still throttled after {settings.USAGE_FETCH_MAX_RETRIES} retries")
+
+    async def usage_pages(self, start: datetime, end: datetime) -> AsyncIterator[List[Dict[str, Any]]]:
+        """Pages of usage rows: ``{"start", "end", "model", "prompt_tokens", "completion_tokens", "requests"}``."""
+        return
+        yield  # pragma: no cover
+
+    async def cost_pages(self, start: datetime, end: datetime) -> AsyncIterator[List[Dict[str, Any]]]:
+        """Pages of invoice payloads for ``ingest_invoices``."""
+        return
+        yield  # pragma: no cover
+
+    def invoice(self, day: datetime, line_item: str, amount: float, currency: str) -> Dict[str, Any]:
+        start = day.replace(hour=0, minute=0, second=0, microsecond=0)
+        return {
+            "invoice_id": f"{self.provider}-usage:{self.connection_id}:{start.date().isoformat()}:{line_item or 'total'}",
+            "amount": amount,
+            "currency": (currency or "USD").upper(),
+            "period_start": start.isoformat(),
+            "period_end": (start + DAY).isoformat(),
+        }
+
+
+class OpenAIFetcher(ProviderFetcher):
+    provider = "openai"
+    base_url = "https://api.openai.com"
+
+    async def headers(self) -> Dict[str, str]:
+        key = self.creds.get("admin_key") or self.creds.get("api_key") or ""
+        return {"Authorization": f"Bearer {key}"}
+
+    async def _pages(self, path: str, params: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+        page = None
+        while True:
+            q = dict(params, **({"page": page} if page else {}))
+            body = (await self.request("GET", path, params=q)).json()
+            yield body
+            page = body.get("next_page")
+            if not body.get("has_more") or not page:
+                return
+
+    async def usage_pages(self, start, end):
+        params = {"start_time": _epoch(start), "end_time": _epoch(end), "bucket_width": "1d",
+                  "group_by": "model", "limit": 31}
+        async for body in self._pages("/v1/organization/usage/completions", params):
+            rows = []
+            for bucket in body.get("data") or []:
+                for r in bucket.get("results") or []:
+                    rows.append({
+                        "start": _from_epoch(bucket["start_time"]), "end": _from_epoch(bucket["end_time"]),
+                        "model": r.get("model"),
+                        "prompt_tokens": int(r.get("input_tokens") or 0),
+                        "completion_tokens": int(r.get("output_tokens") or 0),
+                        "requests": int(r.get("num_model_requests") or 0),
+                    })
+            yield rows
+
+    async def cost_pages(self, start, end):
+        params = {"start_time": _epoch(start), "end_time": _epoch(end), "bucket_width": "1d",
+                  "group_by": "line_item", "limit": 31}
+        async for body in self._pages("/v1/organization/costs", params):
+            out = []
+            for bucket in body.get("data") or []:
+                day = _from_epoch(bucket["start_time"])
+                for r in bucket.get("results") or []:
+                    amount = r.get("amount") or {}
+                    out.append(self.invoice(day, r.get("line_item"), float(amount.get("value") or 0.0), amount.get("currency")))
+            yield out
+
+
+class AnthropicFetcher(ProviderFetcher):
+    provider = "claude"
+    base_url = "https://api.anthropic.com"
+
+    async def headers(self) -> Dict[str, str]:
+        return {
+            "x-api-key": self.creds.get("admin_key") or self.creds.get("api_key") or "",
+            "anthropic-version": "2023-06-01",
+        }
+
+    async def _pages(self, path: str, params: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+        page = None
+        while True:
+            q = dict(params, **({"page": page} if page else {}))
+            body = (await self.request("GET", path, params=q)).json()
+            yield body
+            page = body.get("next_page")
+            if not body.get("has_more") or not page:
+                return
+
+    async def usage_pages(self, start, end):
+        params = {"starting_at": _iso(start), "ending_at": _iso(end), "bucket_width": "1d",
+                  "group_by[]": "model", "limit": 31}
+        async for body in self._pages("/v1/organizations/usage_report/messages", params):
+            rows = []
+            for bucket in body.get("data") or []:
+                for r in bucket.get("results") or []:
+                    cache_creation = r.get("cache_creation") or {}
+                    prompt = (int(r.get("uncached_input_tokens") or 0) + int(r.get("cache_read_input_tokens") or 0)
+                              + sum(int(v or 0) for v in cache_creation.values()))
+                    rows.append({
+                        "start": _from_iso(bucket["starting_at"]), "end": _from_iso(bucket["ending_at"]),
+                        "model": r.get("model"),
+                        "prompt_tokens": prompt,
+                        "completion_tokens": int(r.get("output_tokens") or 0),
+                        "requests": 0,
+                    })
+            yield rows
+
+    async def cost_pages(self, start, end):
+        params = {"starting_at": _iso(start), "ending_at": _iso(end), "group_by[]": "description"}
+        async for body in self._pages("/v1/organizations/cost_report", params):
+            out = []
+            for bucket in body.get("data") or []:
+                day = _from_iso(bucket["starting_at"])
+                for r in bucket.get("results") or []:
+                    # Amounts are decimal strings in cents
+                    cents = float(r.get("amount") or 0.0)
+                    out.append(self.invoice(day, r.get("description"), cents / 100.0, r.get("currency")))
+            yield out
+
+
+class AzureFetcher(ProviderFetcher):
+    """Actual cost per day and meter from the Cost Management query API.
+
+    Azure exposes no token usage here; only costs are synced.
+    """
+
+    provider = "azure"
+    base_url = "https://management.azure.com"
+    login_url = "https://login.microsoftonline.com"
+    api_version = "2023-03-01"
+
+    def __init__(self, *args, login_url: Optional[str] = None, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.login_url = login_url or self.login_url
+        self._token: Optional[Tuple[str, float]] = None
+        self._token_lock = asyncio.Lock()
+
+    async def headers(self) -> Dict[str, str]:
+        async with self._token_lock:
+            if self._token is None or self._token[1] <= time.monotonic():
+                ad = self.creds.get("azureAd") or {}
+                client = self.pool.client_for(self.login_url)
+                r = await client.post(f"/{ad.get('tenantId')}/oauth2/v2.0/token", data={
+                    "grant_type": "client_credentials",
+                    "client_id": ad.get("clientId"),
+                    "client_secret": ad.get("clientSecret"),
+                    "scope": "https://management.azure.com/.default",
+                })
+                if r.status_code != 200:
+                    raise FetchError(f"azure token request returned {r.status_code}")
+                body = r.json()
+                self._token = (body["access_token"], time.monotonic() + float(body.get("expires_in") or 3600) - 60)
+            return {"Authorization": f"Bearer {self._token[0]}"}
+
+    def _scope(self) -> str:
+        ad = self.creds.get("azureAd") or {}
+        scope = self.creds.get("scope") or ad.get("scope")
+        if scope:
+            return "/" + scope.strip("/")
+        sub = self.creds.get("subscriptionId") or ad.get("subscriptionId")
+        if not sub:
+            raise FetchError("azure connection has no subscriptionId or scope")
+        return f"/subscriptions/{sub}"
+
+    async def cost_pages(self, start, end):
+        body = {
+            "type": "ActualCost",
+            "timeframe": "Custom",
+            "timePeriod": {"from": _iso(start), "to": _iso(end - timedelta(seconds=1))},
+            "dataset": {
+                "granularity": "Daily",
+                "aggregation": {"totalCost": {"name": "Cost", "function": "Sum"}},
+                "grouping": [{"type": "Dimension", "name": "MeterSubCategory"}],
+            },
+        }
+        url = f"{self._scope()}/providers/Microsoft.CostManagement/query?api-version={self.api_version}"
+        while url:
+            props = (await self.request("POST", url, json=body)).json().get("properties") or {}
+            cols = [c.get("name") for c in props.get("columns") or []]
+            out = []
+            for row in props.get("rows") or []:
+                rec = dict(zip(cols, row))
+                day = datetime.strptime(str(rec.get("UsageDate")), "%Y%m%d")
+                out.append(self.invoice(day, rec.get("MeterSubCategory"), float(rec.get("Cost") or 0.0), rec.get("Currency")))
+            yield out
+            url = props.get("nextLink")
+
+
+FETCHERS = {"openai": OpenAIFetcher, "claude": AnthropicFetcher, "azure": AzureFetcher}
+
+
+async def fetch_connection(fetcher: ProviderFetcher, start: datetime, end: datetime,
+                           on_usage: UsageSink, on_costs: CostSink, usage_since: Optional[datetime] = None,
+                           window_days: Optional[int] = None, now: Optional[datetime] = None) -> Dict[str, Any]:
+    """Fetch [start, end) in parallel windows, streaming pages into the sinks.
+
+    Only usage buckets that have ended by ``now`` and start at or after
+    ``usage_since`` reach ``on_usage``. Sinks run in a worker thread so
+    database writes overlap the next requests.
+    """
+    now = now or datetime.utcnow()
+    stats = {"usage_rows": 0, "cost_rows": 0, "usage_through": None, "windows": 0}
+
+    async def usage(ws: datetime, we: datetime) -> None:
+        async for page in fetcher.usage_pages(ws, we):
+            rows = [r for r in page if r["end"] <= now and (usage_since is None or r["start"] >= usage_since)]
+            if not rows:
+                continue
+            await asyncio.to_thread(on_usage, rows)
+            stats["usage_rows"] += len(rows)
+            latest = max(r["end"] for r in rows)
+            if stats["usage_through"] is None or latest > stats["usage_through"]:
+                stats["usage_through"] = latest
+
+    async def costs(ws: datetime, we: datetime) -> None:
+        async for page in fetcher.cost_pages(ws, we):
+            if page:
+                await asyncio.to_thread(on_costs, page)
+                stats["cost_rows"] += len(page)
+
+    async def window(ws: datetime, we: datetime) -> None:
+        await asyncio.gather(usage(ws, we), costs(ws, we))
+        done["windows"] += 1
+        report_progress(windows_done=done["windows"], windows_total=len(windows),
+                        usage_rows=stats["usage_rows"], cost_rows=stats["cost_rows"])
+
+    windows = split_windows(start, end, window_days or settings.USAGE_FETCH_WINDOW_DAYS)
+    stats["windows"] = len(windows)
+    done = {"windows": 0}
+    await asyncio.gather(*(window(ws, we) for ws, we in windows))
+    _ROWS.labels(provider=fetcher.provider, kind="usage").inc(stats["usage_rows"])
+    _ROWS.labels(provider=fetcher.provider, kind="cost").inc(stats["cost_rows"])
+    return stats
+
+
+def usage_log_rows(rows: List[Dict[str, Any]], connection_id: int, provider: str, source: str) -> List[Dict[str, Any]]:
+    """``api_logs`` rows for fetched usage buckets."""
+    return [{
+        "connection_id": connection_id, "org_id": None, "provider": provider, "model": r.get("model"),
+        "prompt_tokens": r["prompt_tokens"], "completion_tokens": r["completion_tokens"],
+        "total_tokens": r["prompt_tokens"] + r["completion_tokens"], "cost": 0.0, "saved_cost": 0.0,
+        "latency_ms": 0.0, "status_code": None, "source": source, "cache_hit": False, "created_at": r["start"],
+    } for r in rows]
+
+
+def commit_usage(engine, connection_id: int, provider: str, source: str,
+                 rows: List[Dict[str, Any]], through: Optional[datetime]) -> int:
+    """Insert a sync's usage rows and advance the watermark in one transaction."""
+    if through is None:
+        return 0
+    from ..models import ApiLog
+    logs_table = ApiLog.__table__
+    with engine.begin() as conn:
+        current = conn.execute(
+            select(_STATE.c.usage_through).where(_STATE.c.connection_id == connection_id).with_for_update()
+        ).scalar()
+        # A concurrent sync may have committed some of these buckets already
+        fresh = [r for r in rows if current is None or r["start"] >= current]
+        logs = usage_log_rows(fresh, connection_id, provider, source)
+        for i in range(0, len(logs), 500):
+            conn.execute(logs_table.insert().values(logs[i:i + 500]))
+        advance_watermark(conn, connection_id, through)
+    if logs:
+        from ..services.spend_summary import invalidate_summaries
+        invalidate_summaries()
+    return len(logs)
+
+
+def cost_sink(provider: str) -> CostSink:
+    from .billing_ingest import ingest_invoices
+
+    def write(payloads: List[Dict[str, Any]]) -> None:
+        ingest_invoices(provider, payloads, source="billing", raise_errors=True)
+    return write
+
+
+def _load_connection(connection_id: int) -> Tuple[str, Dict[str, Any]]:
+    from ..crypto import decrypt_json
+    from ..db import get_session
+    from ..models import ProviderConnection
+    db = get_session()
+    try:
+        conn = db.get(ProviderConnection, connection_id)
+        if conn is None:
+            raise LookupError(f"connection {connection_id} not found")
+        raw = decrypt_json(conn.encrypted_credentials)
+        creds = json.loads(raw) if isinstance(raw, str) else (raw or {})
+        return (conn.provider_id or "").lower(), creds
+    finally:
+        db.close()
+
+
+def build_fetcher(provider: str, connection_id: int, creds: Dict[str, Any], pool: UpstreamPool,
+                  base_urls: Optional[Dict[str, str]] = None) -> ProviderFetcher:
+    cls = FETCHERS[provider]
+    kwargs: Dict[str, Any] = {"base_url": (base_urls or {}).get(provider)}
+    if cls is AzureFetcher:
+        kwargs["login_url"] = (base_urls or {}).get("azure_login")
+    return cls(connection_id, creds, pool, provider_slots(provider), **kwargs)
+
+
+async def fetch_range(connection_id: int, provider: str, creds: Dict[str, Any], start: datetime, end: datetime,
+                      on_usage: UsageSink, on_costs: CostSink, usage_since: Optional[datetime] = None,
+                      transport: Optional[httpx.AsyncBaseTransport] = None, base_urls: Optional[Dict[str, str]] = None,
+                      window_days: Optional[int] = None, now: Optional[datetime] = None) -> Dict[str, Any]:
+    """``fetch_connection`` with a client pool that lives for this call only."""
+    pool = UpstreamPool(transport=transport)
+    try:
+        fetcher = build_fetcher(provider, connection_id, creds, pool, base_urls)
+        return await fetch_connection(fetcher, start, end, on_usage, on_costs, usage_since=usage_since,
+                                      window_days=window_days, now=now)
+    finally:
+        await pool.aclose()
+
+
+def _usage_floor(conn, connection_id: int) -> Optional[datetime]:
+    """Usage before this point is owned by the watermark or an active backfill."""
+    from ..models import BackfillJob
+    jobs = BackfillJob.__table__
+    through = conn.execute(select(_STATE.c.usage_through).where(_STATE.c.connection_id == connection_id)).scalar()
+    backfill_end = conn.execute(
+        select(func.max(jobs.c.range_end))
+        .where(jobs.c.connection_id == connection_id, jobs.c.status.in_(("queued", "running")))
+    ).scalar()
+    marks = [m for m in (through, backfill_end) if m is not None]
+    return max(marks) if marks else None
+
+
+async def _sync(connection_id: int, source: str, engine, transport, base_urls,
+                start: Optional[datetime], end: Optional[datetime]) -> Dict[str, Any]:
+    provider, creds = _load_connection(connection_id)
+    if provider not in FETCHERS:
+        return {"connection_id": connection_id, "synced": False, "reason": f"no usage fetcher for {provider}"}
+    with engine.connect() as conn:
+        usage_since = _usage_floor(conn, connection_id)
+    now = datetime.utcnow()
+    end = end or now
+    if start is None:
+        floor = (now - timedelta(days=settings.USAGE_FETCH_INITIAL_DAYS)).replace(hour=0, minute=0, second=0, microsecond=0)
+        start = floor if usage_since is None else max(floor, usage_since - timedelta(days=settings.USAGE_COST_LOOKBACK_DAYS))
+    pending: List[Dict[str, Any]] = []
+    stats = await fetch_range(
+        connection_id, provider, creds, start, end, pending.extend, cost_sink(provider),
+        usage_since=usage_since, transport=transport, base_urls=base_urls, now=now,
+    )
+    # Nothing is written unless every window succeeded; then rows and watermark commit together
+    rows = await asyncio.to_thread(commit_usage, engine, connection_id, provider, source, pending, stats["usage_through"])
+    return {"connection_id": connection_id, "synced": True, "rows": rows,
+            "invoices": stats["cost_rows"], "windows": stats["windows"],
+            "usage_through": stats["usage_through"].isoformat() if stats["usage_through"] else None}
+
+
+def advance_watermark(conn, connection_id: int, through: datetime) -> None:
+    """Move ``usage_sync_state.usage_through`` forward (never back)."""
+    current = conn.execute(select(_STATE.c.usage_through).where(_STATE.c.connection_id == connection_id)).first()
+    values = {"usage_through": through, "updated_at": datetime.utcnow()}
+    if current is None:
+        conn.execute(insert(_STATE).values(connection_id=connection_id, **values))
+    elif current[0] is None or current[0] < through:
+        conn.execute(_STATE.update().where(_STATE.c.connection_id == connection_id).values(**values))
+
+
+def sync_connection(connection_id: int, source: str = "prod", engine=None,
+                    transport: Optional[httpx.AsyncBaseTransport] = None,
+                    base_urls: Optional[Dict[str, str]] = None,
+                    start: Optional[datetime] = None, end: Optional[datetime] = None) -> Dict[str, Any]:
+    """Fetch new usage and recent costs for one connection (blocking).
+
+    ``start``/``end`` override the incremental range; usage already covered
+    by the watermark or by an active backfill job is still skipped.
+    """
+    if engine is None:
+        from ..db import engine
+    try:
+        return asyncio.run(_sync(connection_id, source, engine, transport, base_urls, start, end))
+    except Exception as e:
+        logger.warning("connection %s sync failed: %s", connection_id, e)
+        return {"connection_id": connection_id, "synced": False, "reason": str(e)}
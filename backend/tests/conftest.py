@@ -1,4 +1,6 @@
+import os
 import sys
+import tempfile
 from pathlib import Path
 
 # Ensure the backend package root is on sys.path so tests can import `app` package
@@ -6,4 +8,13 @@ ROOT = Path(__file__).resolve().parents[1]
 if str(ROOT) not in sys.path:
     sys.path.insert(0, str(ROOT))
 
+# Use a throwaway SQLite database unless CI points us at a real one, so test
+# runs never write into the checked-in dev database.
+if not os.getenv("DATABASE_URL"):
+    _TEST_DB = Path(tempfile.mkdtemp(prefix="bimo-tests-")) / "test.db"
+    os.environ["DATABASE_URL"] = f"sqlite:///{_TEST_DB}"
 
+from app.db import engine  # noqa: E402
+from app.models import SQLModel  # noqa: E402
+
+SQLModel.metadata.create_all(engine)
@@ -0,0 +1,57 @@
+import time
+
+from fastapi.testclient import TestClient
+
+from app.db import engine
+from app.main import app
+from app.models import ApiKey
+from app.services import api_keys
+from app.settings import settings
+
+ADMIN = {"X-Admin-Token": settings.ADMIN_API_KEY}
+
+
+def test_resolver_caches_hits_and_unknown_keys():
+    calls = []
+    known = api_keys.ApiKeyInfo(1, "admin", "org-1", None)
+
+    def loader(key_hash):
+        calls.append(key_hash)
+        return known if key_hash == api_keys.hash_key("good") else None
+
+    resolver = api_keys.ApiKeyResolver(ttl_seconds=60, negative_ttl_seconds=0.05, max_entries=2, loader=loader)
+    assert resolver.resolve("good") == known and resolver.resolve("good") == known
+    assert resolver.resolve("bad") is None and resolver.resolve("bad") is None
+    assert len(calls) == 2
+    # Negative entries expire sooner than positive ones
+    time.sleep(0.06)
+    resolver.resolve("bad")
+    resolver.resolve("good")
+    assert len(calls) == 3
+
+    resolver.invalidate(api_keys.hash_key("good"))
+    resolver.resolve("good")
+    assert len(calls) == 4
+    # Bounded: the least recently used digest is evicted
+    resolver.resolve("other")
+    assert len(resolver) == 2
+    resolver.resolve("bad")
+    assert len(calls) == 6
+
+
+def test_created_keys_are_hashed_resolved_and_revocable():
+    client = TestClient(app)
+    created = client.post("/v1/admin/apikeys", headers=ADMIN, json={"org_id": "org-9", "role": "admin"}).json()
+    with engine.connect() as conn:
+        row = conn.execute(ApiKey.__table__.select().where(ApiKey.__table__.c.id == created["id"])).first()
+    assert row.key is None and row.key_hash == api_keys.hash_key(created["key"])
+    assert row.key_prefix == created["key"][:8]
+
+    who = client.get("/v1/whoami", headers={"X-API-Key": created["key"]}).json()
+    assert who == {"role": "admin", "org": "org-9"}
+    assert client.get("/v1/whoami", headers={"Authorization": "Bearer nope"}).json() == {"role": None, "org": None}
+
+    assert client.delete(f"/v1/admin/apikeys/{created['id']}", headers=ADMIN).status_code == 204
+    who = client.get("/v1/whoami", headers={"X-API-Key": created["key"]}).json()
+    assert who == {"role": None, "org": None}
+    assert client.delete("/v1/admin/apikeys/999999", headers=ADMIN).status_code == 404
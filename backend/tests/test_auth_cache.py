@@ -0,0 +1,65 @@
+import asyncio
+import hashlib
+from datetime import timedelta
+
+import pytest
+from fastapi import HTTPException
+from fastapi.security import HTTPAuthorizationCredentials
+
+from app import auth
+from app.db import get_session
+from app.models import User
+
+
+def _user(email):
+    db = get_session()
+    try:
+        user = User(email=email, hashed_password="x")
+        db.add(user)
+        db.commit()
+        return user.id
+    finally:
+        db.close()
+
+
+def _current(token):
+    return asyncio.run(auth.get_current_user(HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)))
+
+
+def test_current_user_is_served_from_the_caches(monkeypatch):
+    user_id = _user("cache@example.com")
+    token = auth.create_access_token({"sub": str(user_id)})
+    decodes, loads = [], []
+    real_decode, real_load = auth.decode_access_token, auth._load_user
+    monkeypatch.setattr(auth, "decode_access_token", lambda t: decodes.append(t) or real_decode(t))
+    monkeypatch.setattr(auth, "_load_user", lambda uid: loads.append(uid) or real_load(uid))
+
+    for _ in range(5):
+        assert _current(token).email == "cache@example.com"
+    assert len(decodes) == 1 and loads == [user_id]
+
+    # Deactivating through the ORM invalidates the cached user immediately
+    db = get_session()
+    try:
+        user = db.get(User, user_id)
+        user.is_active = False
+        db.add(user)
+        db.commit()
+    finally:
+        db.close()
+    with pytest.raises(HTTPException) as exc:
+        _current(token)
+    assert exc.value.status_code == 400 and len(loads) == 2 and len(decodes) == 1
+
+
+def test_cached_tokens_expire_with_the_token():
+    user_id = _user("expiry@example.com")
+    token = auth.create_access_token({"sub": str(user_id)}, expires_delta=timedelta(seconds=60))
+    assert _current(token).id == user_id
+    digest = hashlib.sha256(token.encode()).hexdigest()
+    # The cache entry lives exactly as long as the token itself
+    assert auth._token_cache._data[digest][0] == auth.decode_access_token(token)["exp"]
+
+    with pytest.raises(HTTPException) as exc:
+        _current("not-a-token")
+    assert exc.value.status_code == 401
@@ -0,0 +1,165 @@
+import json
+from datetime import datetime
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import func, select
+
+from app.crypto import encrypt_json
+from app.db import engine, get_session
+from app.main import app
+from app.models import ApiLog, BackfillChunk, ProviderConnection, UsageSyncState
+from app.settings import settings
+from app.workers import backfill, usage_fetchers
+
+DAY = 86400
+
+
+def _connection():
+    db = get_session()
+    try:
+        conn = ProviderConnection(provider_id="openai", encrypted_credentials=encrypt_json(json.dumps({"admin_key": "k"})))
+        db.add(conn)
+        db.commit()
+        return conn.id
+    finally:
+        db.close()
+
+
+def _openai(calls, broken=()):
+    def handler(request: httpx.Request) -> httpx.Response:
+        q = request.url.params
+        start, end = int(q["start_time"]), int(q["end_time"])
+        calls.append((request.url.path.rsplit("/", 1)[-1], datetime.utcfromtimestamp(start)))
+        if datetime.utcfromtimestamp(start) in broken:
+            return httpx.Response(400, json={"error": "boom"})
+        days = range(start - start % DAY, end, DAY)
+        if request.url.path.endswith("/usage/completions"):
+            data = [{"start_time": d, "end_time": d + DAY,
+                     "results": [{"model": "gpt-4o", "input_tokens": 3, "output_tokens": 1, "num_model_requests": 1}]}
+                    for d in days]
+        else:
+            data = [{"start_time": d, "end_time": d + DAY,
+                     "results": [{"line_item": "completions", "amount": {"value": 0.1, "currency": "usd"}}]}
+                    for d in days]
+        return httpx.Response(200, json={"data": data, "has_more": False})
+    return httpx.MockTransport(handler)
+
+
+def _logs(connection_id):
+    t = ApiLog.__table__
+    with engine.connect() as conn:
+        return conn.execute(
+            select(t.c.created_at, func.count()).where(t.c.connection_id == connection_id).group_by(t.c.created_at)
+        ).all()
+
+
+def test_backfill_resumes_after_a_crash_without_refetching_or_duplicating(monkeypatch):
+    monkeypatch.setattr(backfill.settings, "BACKFILL_LEASE_SECONDS", 0)
+    connection_id = _connection()
+    job = backfill.create_job(connection_id, datetime(2026, 6, 1), datetime(2026, 6, 15), chunk_days=5)
+    assert job["status"] == "queued" and job["chunks_total"] == 3
+    with pytest.raises(backfill.BackfillActive):
+        backfill.create_job(connection_id, datetime(2026, 5, 1), datetime(2026, 5, 5))
+    # The incremental sync leaves the backfilled range alone meanwhile
+    with engine.connect() as conn:
+        assert usage_fetchers._usage_floor(conn, connection_id) == datetime(2026, 6, 15)
+
+    calls = []
+    transport = _openai(calls)
+    with engine.begin() as conn:
+        first = backfill.claim_chunk(conn, job["id"])
+    assert backfill.run_chunk(job, first, transport=transport)["rows"] == 5
+    # A worker claims the second chunk and dies before finishing it
+    with engine.begin() as conn:
+        abandoned = backfill.claim_chunk(conn, job["id"])
+    assert abandoned["idx"] == 1
+    assert backfill.progress(job["id"])["percent"] == pytest.approx(33.3)
+
+    calls.clear()
+    done = backfill.work(job["id"], transport=transport)
+    assert done["status"] == "done" and done["chunks_done"] == 3 and done["rows"] == 14
+    assert done["processed"] == 2
+    # Only the unfinished chunks were fetched again
+    assert sorted({start for _, start in calls}) == [datetime(2026, 6, 6), datetime(2026, 6, 11)]
+    logs = _logs(connection_id)
+    assert len(logs) == 14 and all(n == 1 for _, n in logs)
+    with engine.connect() as conn:
+        attempts = conn.execute(select(BackfillChunk.__table__.c.attempts)
+                                .where(BackfillChunk.__table__.c.job_id == job["id"])
+                                .order_by(BackfillChunk.__table__.c.idx)).scalars().all()
+        through = conn.execute(select(UsageSyncState.__table__.c.usage_through)
+                               .where(UsageSyncState.__table__.c.connection_id == connection_id)).scalar()
+    assert attempts == [1, 2, 1]
+    # Handed over to the incremental sync at the end of the range
+    assert through == datetime(2026, 6, 15)
+
+
+def test_backfill_fails_after_max_attempts(monkeypatch):
+    monkeypatch.setattr(backfill.settings, "BACKFILL_MAX_ATTEMPTS", 2)
+    connection_id = _connection()
+    job = backfill.create_job(connection_id, datetime(2026, 3, 1), datetime(2026, 3, 5), chunk_days=2)
+    calls = []
+    res = backfill.work(job["id"], transport=_openai(calls, broken={datetime(2026, 3, 3)}))
+    assert res["status"] == "failed" and res["chunks_done"] == 1
+    assert "chunk 1" in res["error"]
+    assert len(_logs(connection_id)) == 2
+    # A failed job no longer holds back the incremental sync
+    with engine.connect() as conn:
+        assert usage_fetchers._usage_floor(conn, connection_id) is None
+
+
+def test_backfill_range_stops_at_existing_usage():
+    connection_id = _connection()
+    with engine.begin() as conn:
+        conn.execute(ApiLog.__table__.insert().values(connection_id=connection_id, provider="openai",
+                                                     created_at=datetime(2026, 8, 10, 13, 0)))
+    job = backfill.create_job(connection_id, datetime(2026, 8, 1))
+    assert (job["from"], job["to"]) == ("2026-08-01", "2026-08-10")
+    with pytest.raises(backfill.BackfillError):
+        backfill.create_job(connection_id, datetime(2026, 8, 12), datetime(2026, 8, 20))
+
+
+def test_admin_backfill_endpoints(monkeypatch):
+    started = []
+    monkeypatch.setattr(backfill, "start_job", lambda job_id, workers=None: started.append(job_id) or 2)
+    client = TestClient(app)
+    headers = {"X-Admin-Token": settings.ADMIN_API_KEY}
+    connection_id = _connection()
+    res = client.post("/v1/admin/backfills", headers=headers,
+                      json={"connection_id": connection_id, "from": "2026-01-01", "to": "2026-01-15"})
+    assert res.status_code == 202 and res.json()["workers"] == 2 and started == [res.json()["id"]]
+    again = client.post("/v1/admin/backfills", headers=headers, json={"connection_id": connection_id, "from": "2026-01-01"})
+    assert again.status_code == 409 and again.json()["error"]["code"] == "BACKFILL_ACTIVE"
+    got = client.get(f"/v1/admin/backfills/{res.json()['id']}", headers=headers)
+    assert got.json()["chunks_total"] == 2 and got.json()["percent"] == 0.0
+    assert client.get("/v1/admin/backfills/999999", headers=headers).status_code == 404
+
+
+def test_resume_only_redispatches_jobs_whose_workers_are_gone(monkeypatch):
+    from datetime import timedelta
+    dispatched = []
+    monkeypatch.setattr(backfill, "_dispatch", lambda job_id, provider, workers: dispatched.append(job_id) or workers)
+    connection_id = _connection()
+    job = backfill.create_job(connection_id, datetime(2026, 2, 1), datetime(2026, 2, 9), chunk_days=2)
+    now = datetime(2030, 1, 1)
+
+    # Never dispatched (e.g. the process died before start_job): resumed once
+    assert job["id"] in _resumed(now, dispatched)
+    assert job["id"] not in _resumed(now + timedelta(seconds=300), dispatched)
+
+    # A live worker keeps renewing the lease by claiming chunks
+    lease = timedelta(seconds=settings.BACKFILL_LEASE_SECONDS)
+    with engine.begin() as conn:
+        backfill.claim_chunk(conn, job["id"], now=now + lease)
+    assert job["id"] not in _resumed(now + lease + timedelta(seconds=300), dispatched)
+
+    # Once the workers stop renewing it, the job is taken over again
+    assert job["id"] in _resumed(now + 3 * lease, dispatched)
+
+
+def _resumed(now, dispatched):
+    dispatched.clear()
+    backfill.resume_jobs(now=now)
+    return list(dispatched)
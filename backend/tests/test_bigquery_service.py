@@ -0,0 +1,155 @@
+import threading
+from datetime import date
+
+import pytest
+
+from app.services import bigquery_cache, bigquery_query, bigquery_service
+
+
+class DryRun:
+    def __init__(self, total_bytes_processed):
+        self.total_bytes_processed = total_bytes_processed
+
+
+class FakeClient:
+    def __init__(self):
+        self.queries = []
+        self.dry_runs = []
+        self.estimate = lambda sql: 1000
+        self.threads = set()
+        self.closed = False
+
+    def query(self, sql, job_config=None):
+        if job_config is not None and job_config.dry_run:
+            self.dry_runs.append(sql)
+            return DryRun(self.estimate(sql))
+        self.queries.append(sql)
+        self.threads.add(threading.get_ident())
+        if "LIMIT @row_limit" in sql:
+            return [{"service": "Vertex AI", "cost": 1.0}]
+        return [
+            {"day": date(2026, 9, 20), "cost": 4.0, "tokens": 100, "in_window": True, "in_month": False},
+            {"day": date(2026, 10, 1), "cost": 2.0, "tokens": 50, "in_window": False, "in_month": True},
+            {"day": date(2026, 10, 2), "cost": 3.0, "tokens": 70, "in_window": True, "in_month": True},
+        ]
+
+    def close(self):
+        self.closed = True
+
+
+def test_clients_are_cached_per_credentials_and_evicted_when_idle(monkeypatch):
+    built = []
+
+    def factory(sa, project):
+        built.append(project)
+        return FakeClient()
+
+    cache = bigquery_service.ClientCache(factory=factory, idle_seconds=60, max_clients=2)
+    monkeypatch.setattr(bigquery_service, "_clients", cache)
+
+    a1 = bigquery_service.BigQueryService('{"client_email": "a@x"}', "proj-a")
+    a2 = bigquery_service.BigQueryService('{"client_email": "a@x"}', "proj-a")
+    assert a1._client is a2._client and built == ["proj-a"]
+
+    bigquery_service.BigQueryService('{"client_email": "b@x"}', "proj-a")
+    bigquery_service.BigQueryService('{"client_email": "a@x"}', "proj-c")
+    assert built == ["proj-a", "proj-a", "proj-c"]
+    assert len(cache) == 2 and a1._client.closed  # LRU bound
+
+    now = [1000.0]
+    monkeypatch.setattr(bigquery_service.time, "monotonic", lambda: now[0])
+    idle = bigquery_service.ClientCache(factory=factory, idle_seconds=60)
+    first = idle.get('{"client_email": "b@x"}', "proj-a")
+    now[0] += 61
+    idle.get('{"client_email": "z@x"}', "proj-z")
+    assert len(idle) == 1 and first.closed
+
+
+def test_get_usage_runs_one_aggregate_scan_and_raw_query_concurrently(monkeypatch):
+    client = FakeClient()
+    monkeypatch.setattr(bigquery_service, "_clients", bigquery_service.ClientCache(factory=lambda sa, p: client))
+    monkeypatch.setattr(bigquery_cache, "_cache", bigquery_cache.ResultCache(ttl_seconds=60, stale_seconds=60))
+
+    usage = bigquery_service.BigQueryService("{}", "proj").get_usage("billing_export", days=30)
+    assert len(client.queries) == 2 and len(client.dry_runs) == 2
+    assert sum("GROUP BY day" in q for q in client.queries) == 1
+    assert len(client.threads) == 2
+    assert usage["daily_spend"] == [{"day": date(2026, 9, 20), "cost": 4.0}, {"day": date(2026, 10, 2), "cost": 3.0}]
+    assert usage["token_usage"]["total_tokens"] == 170
+    assert usage["monthly_cost"] == 5.0
+    assert usage["raw"] == [{"service": "Vertex AI", "cost": 1.0}]
+
+
+def test_result_cache_serves_stale_and_refreshes_once(monkeypatch):
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+
+    now = [0.0]
+    monkeypatch.setattr(bigquery_cache.time, "monotonic", lambda: now[0])
+    cache = bigquery_cache.ResultCache(ttl_seconds=10, stale_seconds=100)
+    gate = threading.Event()
+    calls = []
+
+    def slow_loader():
+        calls.append(1)
+        gate.wait(5)
+        return f"v{len(calls)}", 1000
+
+    # Concurrent misses share one query
+    with ThreadPoolExecutor(4) as pool:
+        futures = [pool.submit(cache.get, "k", "daily_aggregates", slow_loader) for _ in range(4)]
+        time.sleep(0.05)
+        gate.set()
+        assert {f.result() for f in futures} == {"v1"}
+    assert len(calls) == 1 and cache.stats["coalesced"] == 3
+
+    assert cache.get("k", "daily_aggregates", slow_loader) == "v1"
+    assert cache.stats["bytes_saved"] == 1000
+
+    # Stale: answered immediately from cache, refreshed once in the background
+    now[0] = 50
+    gate.clear()
+    assert cache.get("k", "daily_aggregates", slow_loader) == "v1"
+    assert cache.get("k", "daily_aggregates", slow_loader) == "v1"
+    gate.set()
+    for _ in range(100):
+        if len(calls) == 2 and cache.stats["refreshes"] == 1 and not cache._inflight:
+            break
+        time.sleep(0.01)
+    assert len(calls) == 2 and cache.stats["refreshes"] == 1
+    assert cache.get("k", "daily_aggregates", slow_loader) == "v2"
+
+    # Past the stale window the caller waits for a fresh load
+    now[0] = 500
+    assert cache.get("k", "daily_aggregates", slow_loader) == "v3"
+
+
+def test_planner_prunes_partitions_and_parameterizes():
+    builder = bigquery_query.BillingQueryBuilder("proj", "billing", billing_account_id="0123ab-cdef45-678900")
+    plan = builder.daily_aggregates(30, date(2026, 10, 18))[0]
+    assert "_TABLE_SUFFIX = @table_suffix" in plan.sql and "_PARTITIONTIME >= @since" in plan.sql
+    assert "DATE(usage_start_time) >=" not in plan.sql.split("WHERE")[1]
+    params = {name: value for name, _, value in plan.params}
+    assert params["table_suffix"] == "0123AB_CDEF45_678900"
+    assert params["since"].date() == date(2026, 9, 18)
+    assert params["month_start"] == date(2026, 10, 1)
+
+
+def test_byte_budget_downgrades_then_refuses(monkeypatch):
+    client = FakeClient()
+    monkeypatch.setattr(bigquery_service, "_clients", bigquery_service.ClientCache(factory=lambda sa, p: client))
+    monkeypatch.setattr(bigquery_cache, "_cache", bigquery_cache.ResultCache(ttl_seconds=60, stale_seconds=60))
+
+    # SELECT * is too big; the fixed column set fits
+    client.estimate = lambda sql: 5000 if "SELECT *" in sql else 100
+    svc = bigquery_service.BigQueryService("{}", "proj", max_bytes=1000)
+    assert svc.get_raw_usage("billing_export", days=30) == [{"service": "Vertex AI", "cost": 1.0}]
+    assert len(client.dry_runs) == 2 and "SELECT usage_start_time" in client.queries[-1]
+
+    # Nothing fits: the raw query is refused but the aggregates still answer
+    client.estimate = lambda sql: 100 if "GROUP BY day" in sql else 5000
+    svc = bigquery_service.BigQueryService("{}", "proj", max_bytes=1000)
+    usage = svc.get_usage("billing_export", days=7)
+    assert usage["raw"] == [] and usage["monthly_cost"] == 5.0
+    with pytest.raises(bigquery_query.QueryBudgetExceeded):
+        svc.get_raw_usage("billing_export", days=14)
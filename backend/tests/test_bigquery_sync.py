@@ -0,0 +1,155 @@
+import json
+from datetime import datetime, timedelta, timezone
+
+import pyarrow as pa
+from fastapi.testclient import TestClient
+
+from app.crypto import encrypt_json
+from app.db import engine, get_session
+from app.main import app
+from app.models import ProviderConnection
+from app.workers import bigquery_sync
+
+
+class FakeSource:
+    """In-memory billing export; honours the export_time watermark like the Storage API."""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.restrictions = []
+
+    def read_batches(self, project_id, dataset_id, table_id, fields, row_restriction):
+        self.restrictions.append((table_id, row_restriction))
+        rows = self.rows
+        if row_restriction.startswith("export_time >"):
+            mark = datetime.fromisoformat(row_restriction.split("'")[1]).replace(tzinfo=timezone.utc)
+            rows = [r for r in rows if r["export_time"] > mark]
+        # Two batches to exercise aggregation across batches
+        for part in (rows[: len(rows) // 2], rows[len(rows) // 2:]):
+            yield pa.RecordBatch.from_pylist(part, schema=_SCHEMA)
+
+
+_SCHEMA = pa.schema([
+    ("export_time", pa.timestamp("us", tz="UTC")),
+    ("usage_start_time", pa.timestamp("us", tz="UTC")),
+    ("cost", pa.float64()),
+    ("currency", pa.string()),
+    ("service", pa.struct([("description", pa.string())])),
+    ("sku", pa.struct([("description", pa.string())])),
+    ("usage", pa.struct([("amount", pa.float64()), ("unit", pa.string())])),
+])
+
+
+def _row(exported, day, cost, sku="Gemini Input Tokens", amount=100.0):
+    return {
+        "export_time": exported,
+        "usage_start_time": datetime.combine(day, datetime.min.time(), tzinfo=timezone.utc) + timedelta(hours=3),
+        "cost": cost,
+        "currency": "USD",
+        "service": {"description": "Vertex AI"},
+        "sku": {"description": sku},
+        "usage": {"amount": amount, "unit": "count"},
+    }
+
+
+def _connection():
+    db = get_session()
+    try:
+        conn = ProviderConnection(
+            provider_id="gemini",
+            encrypted_credentials=encrypt_json(json.dumps({"service_account_json": "{}"})),
+            project_id="proj",
+            billing_account_id="0123AB-CDEF45-678900",
+        )
+        db.add(conn)
+        db.commit()
+        return conn.id
+    finally:
+        db.close()
+
+
+def test_sync_is_incremental_and_additive():
+    connection_id = _connection()
+    today = datetime.utcnow().date()
+    t0 = datetime(2026, 10, 1, tzinfo=timezone.utc)
+    source = FakeSource([
+        _row(t0, today, 1.0),
+        _row(t0 + timedelta(minutes=1), today, 2.0),
+        _row(t0 + timedelta(minutes=2), today, 0.5, sku="Storage", amount=7.0),
+    ])
+
+    first = bigquery_sync.sync_connection(connection_id, source=source, engine=engine)
+    assert first["synced"] is True and first["rows"] == 3
+    assert source.restrictions[0][0] == "gcp_billing_export_v1_0123AB_CDEF45_678900"
+    assert source.restrictions[0][1].startswith("usage_start_time >=")
+
+    # Late export for an earlier day plus more usage today; old rows are not re-read
+    source.rows.append(_row(t0 + timedelta(hours=1), today - timedelta(days=1), 4.0))
+    source.rows.append(_row(t0 + timedelta(hours=1), today, 3.0))
+    second = bigquery_sync.sync_connection(connection_id, source=source, engine=engine)
+    assert second["rows"] == 2
+    assert source.restrictions[1][1] == "export_time > TIMESTAMP('2026-10-01 00:02:00.000000')"
+    assert second["export_watermark"] == "2026-10-01T01:00:00"
+
+    assert bigquery_sync.sync_connection(connection_id, source=source, engine=engine)["rows"] == 0
+
+    with engine.connect() as conn:
+        usage = bigquery_sync.local_usage(conn, connection_id, days=30)
+    spend = {d["day"]: d["cost"] for d in usage["daily_spend"]}
+    assert spend == {(today - timedelta(days=1)).isoformat(): 4.0, today.isoformat(): 6.5}
+    assert usage["token_usage"]["total_tokens"] == 400.0
+    tokens_row = next(r for r in usage["raw"] if r["day"] == today.isoformat() and r["sku"] == "Gemini Input Tokens")
+    assert (tokens_row["cost"], tokens_row["rows"]) == (6.0, 3)
+
+
+def test_usage_endpoint_reads_local_rows_after_sync():
+    connection_id = _connection()
+    source = FakeSource([_row(datetime(2026, 10, 2, tzinfo=timezone.utc), datetime.utcnow().date(), 1.25)])
+    bigquery_sync.sync_connection(connection_id, source=source, engine=engine)
+
+    res = TestClient(app).get(f"/v1/providers/{connection_id}/usage")
+    assert res.status_code == 200
+    body = res.json()
+    assert body["daily_spend"] == [{"day": datetime.utcnow().date().isoformat(), "cost": 1.25}]
+    assert body["sync_status"] == "ok" and body["synced_at"]
+
+
+def test_failed_first_sync_keeps_serving_live_data():
+    class Broken:
+        def read_batches(self, *args):
+            raise RuntimeError("export table not found")
+            yield
+
+    connection_id = _connection()
+    result = bigquery_sync.sync_connection(connection_id, source=Broken(), engine=engine)
+    assert result["synced"] is False
+    with engine.connect() as conn:
+        assert bigquery_sync.local_usage(conn, connection_id) is None
+
+    source = FakeSource([_row(datetime(2026, 10, 2, tzinfo=timezone.utc), datetime.utcnow().date(), 2.0)])
+    bigquery_sync.sync_connection(connection_id, source=source, engine=engine)
+    # A later failure does not hide data an earlier success already synced
+    bigquery_sync.sync_connection(connection_id, source=Broken(), engine=engine)
+    with engine.connect() as conn:
+        assert bigquery_sync.local_usage(conn, connection_id)["daily_spend"][0]["cost"] == 2.0
+
+
+def test_overlapping_syncs_do_not_add_the_same_rows_twice():
+    connection_id = _connection()
+    today = datetime.utcnow().date()
+    t0 = datetime(2026, 10, 2, tzinfo=timezone.utc)
+    rows = [_row(t0, today, 1.0, sku="Overlap")]
+
+    class RacingSource(FakeSource):
+        def read_batches(self, *args):
+            batches = list(super().read_batches(*args))
+            if len(self.restrictions) == 1:
+                # A second sync of the same connection starts and finishes meanwhile
+                assert bigquery_sync.sync_connection(connection_id, source=self)["rows"] == 1
+            yield from batches
+
+    res = bigquery_sync.sync_connection(connection_id, source=RacingSource(rows))
+    assert res["superseded"] is True and res["rows"] == 0
+    with engine.connect() as conn:
+        usage = bigquery_sync.local_usage(conn, connection_id)
+    assert [r["cost"] for r in usage["raw"] if r["sku"] == "Overlap"] == [1.0]
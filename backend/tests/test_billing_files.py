@@ -0,0 +1,137 @@
+import csv
+import gzip
+import json
+
+from app.db import get_session
+from app.models import Invoice
+from app.workers import billing_files
+
+
+def _write_cur(path, rows):
+    with gzip.open(path, "wt", newline="") as fh:
+        writer = csv.DictWriter(fh, fieldnames=["identity/LineItemId", "lineItem/UsageStartDate", "lineItem/UsageEndDate",
+                                                "lineItem/UnblendedCost", "lineItem/CurrencyCode"])
+        writer.writeheader()
+        for i in range(rows):
+            writer.writerow({
+                "identity/LineItemId": f"cur-li-{i}",
+                "lineItem/UsageStartDate": "2026-09-01T00:00:00Z",
+                "lineItem/UsageEndDate": "2026-09-01T01:00:00Z",
+                "lineItem/UnblendedCost": "bad" if i == 3 else f"{i / 10:.2f}",
+                "lineItem/CurrencyCode": "USD",
+            })
+
+
+def _cur_invoices():
+    db = get_session()
+    try:
+        return db.query(Invoice).filter(Invoice.provider == "aws", Invoice.provider_invoice_id.like("cur-li-%")).all()
+    finally:
+        db.close()
+
+
+def test_cur_import_checkpoints_and_resumes(tmp_path, monkeypatch):
+    path = str(tmp_path / "cur.csv.gz")
+    _write_cur(path, 25)
+
+    seen = []
+    real_chunk = billing_files._ingest_chunk
+
+    def flaky(provider, source, records, target=None):
+        seen.append(records[0]["identity/LineItemId"])
+        if len(seen) == 2:
+            raise RuntimeError("database went away")
+        return real_chunk(provider, source, records, target)
+
+    monkeypatch.setattr(billing_files, "_ingest_chunk", flaky)
+    first = billing_files.ingest_file(path, "aws", chunk_rows=10, workers=0)
+    assert (first["status"], first["next_row"], first["rows_rejected"]) == ("failed", 10, 1)
+    assert [e["row"] for e in first["errors"]] == [3]
+    assert len(_cur_invoices()) == 9
+
+    second = billing_files.ingest_file(path, "aws", chunk_rows=10, workers=0)
+    assert second["resumed"] is True
+    assert (second["status"], second["next_row"], second["rows_ingested"], second["rows_rejected"]) == ("done", 25, 24, 1)
+    assert seen == ["cur-li-0", "cur-li-10", "cur-li-10", "cur-li-20"]
+
+    invoices = {i.provider_invoice_id: i for i in _cur_invoices()}
+    assert len(invoices) == 24
+    assert invoices["cur-li-12:2026-09-01T00:00:00Z"].amount == 1.2
+
+    # A finished file is not read again
+    assert billing_files.ingest_file(path, "aws", chunk_rows=10, workers=0)["status"] == "done"
+
+
+def test_resume_counts_chunks_finished_out_of_order_once(tmp_path, monkeypatch):
+    path = str(tmp_path / "cur.csv.gz")
+    _write_cur(path, 25)
+    real_chunk = billing_files._ingest_chunk
+    calls = []
+
+    def first_chunk_fails_once(provider, source, records, target=None):
+        calls.append(records[0]["identity/LineItemId"])
+        if calls == ["cur-li-0"]:
+            raise RuntimeError("database went away")
+        return real_chunk(provider, source, records, target)
+
+    # Every chunk is in flight before the first one is collected
+    monkeypatch.setattr(billing_files, "ProcessPoolExecutor", lambda **kw: billing_files._InlineExecutor())
+    monkeypatch.setattr(billing_files, "_ingest_chunk", first_chunk_fails_once)
+    first = billing_files.ingest_file(path, "aws", chunk_rows=10, workers=2)
+    assert (first["status"], first["next_row"], first["rows_ingested"], first["rows_rejected"]) == ("failed", 0, 0, 0)
+
+    second = billing_files.ingest_file(path, "aws", chunk_rows=10, workers=2)
+    assert (second["status"], second["rows_ingested"], second["rows_rejected"]) == ("done", 24, 1)
+    assert calls == ["cur-li-0", "cur-li-10", "cur-li-20", "cur-li-0", "cur-li-10", "cur-li-20"]
+
+
+def test_gcp_jsonl_import_in_worker_processes(tmp_path):
+    path = tmp_path / "gcp.jsonl"
+    with open(path, "w") as fh:
+        for i in range(6):
+            fh.write(json.dumps({
+                "service": {"description": "Compute Engine"},
+                "sku": {"id": f"sku-{i}"},
+                "usage_start_time": "2026-09-02T00:00:00Z",
+                "usage_end_time": "2026-09-02T01:00:00Z",
+                "cost": 0.5,
+                "currency": "USD",
+            }) + "\n")
+    res = billing_files.ingest_file(str(path), "gcp", chunk_rows=2, workers=2)
+    assert (res["status"], res["rows_ingested"]) == ("done", 6)
+
+    db = get_session()
+    try:
+        total = sum(i.amount for i in db.query(Invoice).filter(Invoice.provider == "gcp").all())
+    finally:
+        db.close()
+    assert total == 3.0
+
+
+def test_chunks_are_written_through_the_given_engine(tmp_path):
+    from sqlalchemy import func, select
+    from sqlmodel import SQLModel, create_engine
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'files.db'}", connect_args={"check_same_thread": False})
+    SQLModel.metadata.create_all(engine)
+    path = tmp_path / "gcp.jsonl"
+    with open(path, "w") as fh:
+        for i in range(4):
+            fh.write(json.dumps({"sku": {"id": f"engine-sku-{i}"}, "usage_start_time": "2026-09-03T00:00:00Z",
+                                 "cost": 1.0, "currency": "USD"}) + "\n")
+    for workers in (0, 2):
+        res = billing_files.ingest_file(str(path), "gcp", chunk_rows=2, workers=workers, engine=engine)
+        assert res["status"] == "done"
+        with engine.begin() as conn:
+            conn.execute(billing_files._CHECKPOINTS.delete())
+    with engine.connect() as conn:
+        assert conn.execute(select(func.count()).select_from(Invoice.__table__)).scalar() == 4
+
+
+def test_gcp_row_id_ignores_the_export_time():
+    cmap = billing_files.COLUMN_MAPS["gcp"]
+    row = {"sku.id": "sku-1", "usage_start_time": "2026-09-02T00:00:00Z", "cost": 0.5}
+    first = billing_files.map_record(cmap, {**row, "export_time": "2026-09-02T04:00:00Z"})
+    again = billing_files.map_record(cmap, {**row, "export_time": "2026-09-03T04:00:00Z"})
+    assert first["invoice_id"] == again["invoice_id"]
+    assert billing_files.map_record(cmap, {**row, "cost": 0.7})["invoice_id"] != first["invoice_id"]
@@ -26,3 +26,45 @@ def test_admin_ingest_invoice_roundtrip(monkeypatch):
     assert data.get('invoice_id') is not None
 
 
+
+
+def test_bulk_ingest_upserts_in_chunks(monkeypatch):
+    from app.db import get_session
+    from app.models import Invoice
+    from app.workers import billing_ingest
+
+    invoices = [
+        {"invoice_id": f"bulk-{i}", "amount": i, "currency": "usd", "period_start": "2026-09-01", "period_end": "2026-09-30"}
+        for i in range(2500)
+    ]
+    invoices.append({"invoice_id": "bulk-7", "amount": 70.0})  # later duplicate wins
+    invoices.append({"invoice_id": "bulk-bad", "amount": "n/a"})
+    invoices.append({"amount": 1.0})
+
+    res = billing_ingest.ingest_invoices("aws", invoices, chunk_size=1000)
+    assert (res["inserted"], res["updated"], res["rejected"], res["duplicates"]) == (2500, 0, 2, 1)
+    assert [e["message"] for e in res["errors"]] == ["amount must be a finite number", "missing invoice id"]
+
+    # Re-delivery updates in place instead of duplicating spend
+    client = TestClient(app)
+    from app.settings import settings
+    res = client.post('/v1/admin/ingest/invoices', headers={"X-Admin-Token": settings.ADMIN_API_KEY},
+                      json={"provider": "aws", "invoices": [{"invoice_id": "bulk-1", "amount": 11.5}, {"invoice_id": "bulk-new", "amount": 2},
+                                                            {"invoice_id": "bulk-3", "currency": "eur"}]})
+    assert res.status_code == 200
+    assert (res.json()["inserted"], res.json()["updated"]) == (1, 2)
+
+    db = get_session()
+    try:
+        rows = {i.provider_invoice_id: i for i in db.query(Invoice).filter(Invoice.provider == "aws", Invoice.provider_invoice_id.like("bulk-%")).all()}
+    finally:
+        db.close()
+    assert len(rows) == 2501
+    assert rows["bulk-1"].amount == 11.5 and rows["bulk-7"].amount == 70.0
+    assert rows["bulk-2"].currency == "USD" and rows["bulk-2"].period_start.day == 1
+    # Re-deliveries that omit the amount or currency keep the stored one
+    assert (rows["bulk-1"].currency, rows["bulk-3"].amount, rows["bulk-3"].currency) == ("USD", 3.0, "EUR")
+    assert rows["bulk-new"].amount == 2.0 and rows["bulk-new"].currency == "USD"
+    # Re-deliveries that omit the billing period keep the stored one
+    assert (rows["bulk-1"].period_start.day, rows["bulk-1"].period_end.day) == (1, 30)
+    assert (rows["bulk-7"].period_start.day, rows["bulk-7"].period_end.day) == (1, 30)
@@ -0,0 +1,57 @@
+from celery.contrib.testing.worker import start_worker
+
+from app.workers import celery_app as capp
+from app.workers import scheduler
+
+
+def test_routes_and_rate_limits_follow_provider_quotas():
+    assert capp.task_rate_limit("300/m", 25) == "12/m"
+    assert capp.task_rate_limit("10/s", 25) == "1/s"
+    assert capp.task_rate_limit(None, 25) is None
+    router = capp.celery_app.amqp.router
+    for provider in capp.PROVIDERS:
+        task = capp.sync_tasks[provider]
+        assert router.route({}, task.name)["queue"].name == f"sync.{provider}"
+    assert capp.sync_tasks["gemini"].rate_limit == capp.task_rate_limit(
+        capp.parse_quotas(capp.settings.PROVIDER_API_QUOTAS)["gemini"], capp.settings.CELERY_SYNC_BATCH_SIZE
+    )
+
+
+def test_batches_run_through_in_memory_broker(monkeypatch):
+    calls = []
+
+    def fake_sync(connection_id, source="prod"):
+        calls.append(connection_id)
+        if connection_id == 3:
+            raise RuntimeError("quota exhausted")
+        return {"connection_id": connection_id, "synced": True, "source": source}
+
+    monkeypatch.setattr(scheduler, "_sync_functions", lambda: {"claude": fake_sync})
+    monkeypatch.setattr(capp.settings, "CELERY_SYNC_BATCH_SIZE", 2)
+    monkeypatch.setattr(capp.sync_tasks["claude"], "rate_limit", None)
+
+    with start_worker(capp.celery_app, pool="solo", perform_ping_check=False, queues=["sync.claude"]):
+        results = capp.enqueue_sync("claude", [1, 2, 3, 4, 5], source="dev")
+        batches = [r.get(timeout=10) for r in results]
+
+    assert [b["connections"] for b in batches] == [2, 2, 1]
+    assert sorted(calls) == [1, 2, 3, 4, 5]
+    assert sum(b["failed"] for b in batches) == 1
+
+
+def test_only_per_connection_dev_tasks_go_to_provider_queues(monkeypatch):
+    from app.workers import tasks
+
+    sent, submitted = [], []
+    monkeypatch.setattr(capp.settings, "CELERY_ENABLED", True)
+    monkeypatch.setattr(capp, "enqueue_sync", lambda provider, ids, source="prod": sent.append((provider, ids)) or ["r"])
+
+    class Executor:
+        def submit(self, name, fn, args, kwargs, key=None, provider=None, priority=5):
+            submitted.append(key)
+
+    monkeypatch.setattr(tasks, "get_executor", lambda: Executor())
+    tasks.sync_claude_usage_for_connection.delay(7, source="dev")
+    tasks.sync_openai_usage.delay("billing")
+    assert sent == [("claude", [7])]
+    assert submitted == [("sync_openai_usage", None)]
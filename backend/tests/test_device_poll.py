@@ -0,0 +1,71 @@
+import asyncio
+import threading
+import time
+
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.services import device_waiters, passwords
+from app.services.device_waiters import DeviceWaiters
+from app.services.passwords import PasswordHasher
+from app.settings import settings
+
+
+def test_long_poll_wakes_on_approval(monkeypatch):
+    monkeypatch.setattr(passwords, "_hasher", PasswordHasher(workers=0))
+    monkeypatch.setattr(device_waiters, "_registry", DeviceWaiters(max_waiters=10))
+    client = TestClient(app)
+    start = client.post("/v1/cli/device/start").json()
+
+    # Without wait the poll answers at once, as before
+    assert client.post("/v1/cli/device/poll", json={"device_code": start["device_code"]}).json()["status"] == "pending"
+
+    def approve():
+        deadline = time.time() + 5
+        while not len(device_waiters.get_device_waiters()) and time.time() < deadline:
+            time.sleep(0.01)
+        client.post("/v1/cli/device/approve", json={"user_code": start["user_code"]})
+
+    approver = threading.Thread(target=approve)
+    approver.start()
+    began = time.monotonic()
+    res = client.post("/v1/cli/device/poll", json={"device_code": start["device_code"], "wait": 20}).json()
+    approver.join()
+    assert res["status"] == "approved" and res["access_token"]
+    assert time.monotonic() - began < 5
+    assert len(device_waiters.get_device_waiters()) == 0
+    passwords.shutdown()
+
+
+def test_long_poll_times_out_and_respects_the_waiter_cap(monkeypatch):
+    monkeypatch.setattr(settings, "DEVICE_POLL_MAX_WAIT_SECONDS", 0.2)
+    monkeypatch.setattr(device_waiters, "_registry", DeviceWaiters(max_waiters=0))
+    client = TestClient(app)
+    code = client.post("/v1/cli/device/start").json()["device_code"]
+
+    # Over the cap the poll answers immediately instead of holding the request
+    began = time.monotonic()
+    assert client.post("/v1/cli/device/poll", json={"device_code": code, "wait": 30}).json()["status"] == "pending"
+    assert time.monotonic() - began < 0.2
+
+    monkeypatch.setattr(device_waiters, "_registry", DeviceWaiters(max_waiters=10))
+    began = time.monotonic()
+    assert client.post("/v1/cli/device/poll", json={"device_code": code, "wait": 30}).json()["status"] == "pending"
+    assert 0.2 <= time.monotonic() - began < 2
+
+
+def test_wake_reaches_waiters_from_another_thread():
+    registry = DeviceWaiters(max_waiters=2)
+
+    async def run():
+        first = registry.register("abc")
+        second = registry.register("abc")
+        assert registry.register("xyz") is None
+        threading.Thread(target=registry.wake, args=("abc",)).start()
+        woken = await asyncio.gather(first.wait(2), second.wait(2))
+        registry.discard(first)
+        registry.discard(second)
+        return woken
+
+    assert asyncio.run(run()) == [True, True]
+    assert len(registry) == 0 and registry.wake("abc") == 0
@@ -0,0 +1,179 @@
+import httpx
+from fastapi.testclient import TestClient
+
+from app.db import get_session
+from app.main import app
+from app.models import ApiLog
+from app.services import response_cache, upstream
+from app.services.usage import get_usage_buffer
+
+
+def test_gateway_passes_bodies_through(monkeypatch):
+    """Gateway forwards raw request bytes and relays the upstream response verbatim."""
+    seen = {}
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        seen["url"] = str(request.url)
+        seen["body"] = request.content
+        seen["auth"] = request.headers.get("authorization")
+        seen["bimo"] = request.headers.get("x-bimo-source")
+        return httpx.Response(200, stream=httpx.ByteStream(b'{"id":"cmpl-1",  "usage":{}}'), headers={"content-type": "application/json"})
+
+    monkeypatch.setattr(upstream, "pool", upstream.UpstreamPool(transport=httpx.MockTransport(handler)))
+    client = TestClient(app)
+
+    body = b'{"model": "gpt-4o-mini",   "messages": []}'
+    res = client.post(
+        "/v1/gateway/openai/v1/chat/completions?x=1",
+        content=body,
+        headers={"Authorization": "Bearer sk-test", "Content-Type": "application/json", "X-BIMO-SOURCE": "prod",
+                 "X-BIMO-CACHE": "off"},
+    )
+    assert res.status_code == 200
+    assert res.content == b'{"id":"cmpl-1",  "usage":{}}'
+    assert seen["url"] == "https://api.openai.com/v1/chat/completions?x=1"
+    assert seen["body"] == body
+    assert seen["auth"] == "Bearer sk-test"
+    assert seen["bimo"] is None
+
+
+def test_gateway_rejects_unknown_provider():
+    client = TestClient(app)
+    res = client.post("/v1/gateway/nope/v1/anything", content=b"{}")
+    assert res.status_code == 404
+    assert res.json()["error"]["code"] == "UNSUPPORTED_PROVIDER"
+
+
+def test_gateway_exact_cache_hit_emits_prod_usage(monkeypatch):
+    calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request.content)
+        body = b'{"model":"gpt-4o-mini-2024-07-18","usage":{"prompt_tokens":1000,"completion_tokens":500}}'
+        return httpx.Response(200, stream=httpx.ByteStream(body), headers={"content-type": "application/json"})
+
+    monkeypatch.setattr(upstream, "pool", upstream.UpstreamPool(transport=httpx.MockTransport(handler)))
+    monkeypatch.setattr(response_cache, "_cache", None)
+    client = TestClient(app)
+    headers = {"Authorization": "Bearer sk-cache-test"}
+
+    def call(body, extra=None):
+        return client.post("/v1/gateway/openai/v1/chat/completions", content=body, headers={**headers, **(extra or {})})
+
+    first = call(b'{"model":"gpt-4o-mini","temperature":0,"messages":[{"role":"user","content":"hi"}]}')
+    # Same request with different key order/whitespace and a transport-only field
+    second = call(b'{"messages": [{"content": "hi", "role": "user"}], "temperature": 0, "model": "gpt-4o-mini", "user": "u1"}')
+    assert first.status_code == second.status_code == 200
+    assert second.headers["X-BIMO-Cache"] == "exact-hit"
+    assert second.content == first.content
+    assert len(calls) == 1
+
+    # Opt-outs bypass the read
+    call(b'{"model":"gpt-4o-mini","temperature":0,"messages":[{"role":"user","content":"hi"}]}', {"Cache-Control": "no-cache"})
+    assert len(calls) == 2
+
+    get_usage_buffer().flush()
+    db = get_session()
+    try:
+        rows = db.query(ApiLog).filter(ApiLog.model == "gpt-4o-mini-2024-07-18").order_by(ApiLog.id).all()
+    finally:
+        db.close()
+    assert [r.cache_hit for r in rows[-3:]] == [False, True, False]
+    hit = rows[-2]
+    assert hit.source == "prod"
+    assert hit.cost == 0.0 and hit.saved_cost > 0
+    assert hit.total_tokens == 1500
+
+
+def _org_key(client, org):
+    from app.settings import settings
+    return client.post("/v1/admin/apikeys", headers={"X-Admin-Token": settings.ADMIN_API_KEY},
+                       json={"org_id": org}).json()["key"]
+
+
+def _stored_connection(provider, creds, org):
+    import json
+    from app.crypto import encrypt_json
+    from app.models import ProviderConnection
+    db = get_session()
+    try:
+        conn = ProviderConnection(provider_id=provider, encrypted_credentials=encrypt_json(json.dumps(creds)), org_id=org)
+        db.add(conn)
+        db.commit()
+        return conn.id
+    finally:
+        db.close()
+
+
+def test_stored_connections_require_the_owning_org(monkeypatch):
+    seen = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        seen.append((str(request.url), request.headers.get("authorization"), request.headers.get("api-key")))
+        return httpx.Response(200, stream=httpx.ByteStream(b"{}"), headers={"content-type": "application/json"})
+
+    monkeypatch.setattr(upstream, "pool", upstream.UpstreamPool(transport=httpx.MockTransport(handler)))
+    client = TestClient(app)
+    openai_conn = _stored_connection("openai", {"api_key": "sk-stored"}, "org-a")
+    azure_conn = _stored_connection("azure", {"api_key": "az-stored", "endpoint": "https://mine.openai.azure.com"}, "org-a")
+    key_a, key_b = _org_key(client, "org-a"), _org_key(client, "org-b")
+    url = "/v1/gateway/openai/v1/models"
+
+    anonymous = client.get(url, headers={"X-BIMO-CONNECTION-ID": str(openai_conn)})
+    assert anonymous.status_code == 401
+    other = client.get(url, headers={"X-BIMO-CONNECTION-ID": str(openai_conn), "X-API-Key": key_b})
+    assert other.status_code == 403 and other.json()["error"]["code"] == "CONNECTION_FORBIDDEN"
+    assert seen == []
+
+    own = client.get(url, headers={"X-BIMO-CONNECTION-ID": str(openai_conn), "X-API-Key": key_a})
+    assert own.status_code == 200 and seen[-1][1] == "Bearer sk-stored"
+
+    # The stored key goes to the stored endpoint, whatever the caller asks for
+    client.get("/v1/gateway/azure/openai/models", headers={
+        "X-BIMO-CONNECTION-ID": str(azure_conn), "X-API-Key": key_a,
+        "X-BIMO-AZURE-ENDPOINT": "https://evil.openai.azure.com"})
+    assert seen[-1][0].startswith("https://mine.openai.azure.com/") and seen[-1][2] == "az-stored"
+
+
+def test_connection_header_never_selects_another_tenants_cache(monkeypatch):
+    calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(1)
+        return httpx.Response(200, stream=httpx.ByteStream(b'{"secret":"org-c answer"}'),
+                              headers={"content-type": "application/json"})
+
+    monkeypatch.setattr(upstream, "pool", upstream.UpstreamPool(transport=httpx.MockTransport(handler)))
+    monkeypatch.setattr(response_cache, "_cache", None)
+    client = TestClient(app)
+    conn = _stored_connection("openai", {"api_key": "sk-c"}, "org-c")
+    body = b'{"model":"gpt-4o-mini","messages":[{"role":"user","content":"scoped"}]}'
+    url = "/v1/gateway/openai/v1/chat/completions"
+
+    owner = client.post(url, content=body, headers={"X-BIMO-CONNECTION-ID": str(conn), "X-API-Key": _org_key(client, "org-c")})
+    assert owner.status_code == 200 and len(calls) == 1
+
+    stranger = client.post(url, content=body, headers={"X-BIMO-CONNECTION-ID": str(conn)})
+    assert stranger.status_code == 401 and b"org-c answer" not in stranger.content
+    # Without the header the stranger is scoped to its own credentials and misses
+    own_key = client.post(url, content=body, headers={"Authorization": "Bearer sk-stranger"})
+    assert own_key.headers.get("X-BIMO-Cache") != "exact-hit" and len(calls) == 2
+
+
+def test_bimo_key_is_not_forwarded_with_caller_credentials(monkeypatch):
+    seen = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        seen.append((request.headers.get("authorization"), request.headers.get("x-api-key")))
+        return httpx.Response(200, stream=httpx.ByteStream(b"{}"), headers={"content-type": "application/json"})
+
+    monkeypatch.setattr(upstream, "pool", upstream.UpstreamPool(transport=httpx.MockTransport(handler)))
+    client = TestClient(app)
+    key = _org_key(client, "org-own-creds")
+
+    client.get("/v1/gateway/openai/v1/models", headers={"Authorization": "Bearer sk-own", "X-API-Key": key})
+    assert seen[-1] == ("Bearer sk-own", None)
+
+    # A key Bimo does not know is the caller's Anthropic key
+    client.get("/v1/gateway/claude/v1/models", headers={"X-API-Key": "sk-ant-own"})
+    assert seen[-1] == (None, "sk-ant-own")
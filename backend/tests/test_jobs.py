@@ -0,0 +1,132 @@
+import json
+import threading
+import time
+
+from fastapi.testclient import TestClient
+
+from app.db import get_session
+from app.main import app
+from app.models import ProviderConnection
+from app.services import jobs
+from app.settings import settings
+from app.workers import scheduler
+
+HEADERS = {"X-Admin-Token": settings.ADMIN_API_KEY}
+
+
+def _connection(provider="openai"):
+    db = get_session()
+    try:
+        conn = ProviderConnection(provider_id=provider, encrypted_credentials="x")
+        db.add(conn)
+        db.commit()
+        return conn.id
+    finally:
+        db.close()
+
+
+def _wait(client, job_id, status, timeout=5.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = client.get(f"/v1/jobs/{job_id}", headers=HEADERS).json()
+        if job["status"] == status:
+            return job
+        time.sleep(0.02)
+    raise AssertionError(f"job {job_id} never reached {status}: {job}")
+
+
+def test_sync_now_returns_a_job_and_reports_progress(monkeypatch):
+    monkeypatch.setattr(settings, "JOB_EVENTS_POLL_SECONDS", 0.01)
+    release = threading.Event()
+    calls = []
+
+    def fake_sync(connection_id, source="prod"):
+        calls.append(connection_id)
+        jobs.report_progress(windows_done=1, windows_total=2)
+        release.wait(5)
+        return {"connection_id": connection_id, "synced": True, "rows": 7}
+
+    monkeypatch.setattr(scheduler, "_sync_functions", lambda: {"openai": fake_sync})
+    client = TestClient(app)
+    connection_id = _connection()
+
+    res = client.post(f"/v1/providers/{connection_id}/sync-now", headers=HEADERS)
+    assert res.status_code == 202
+    job = res.json()
+    assert job["status"] in ("queued", "running") and job["status_url"] == f"/v1/jobs/{job['id']}"
+
+    running = _wait(client, job["id"], "running")
+    # A second request attaches to the sync in flight
+    again = client.post(f"/v1/providers/{connection_id}/sync-now", headers=HEADERS).json()
+    assert again["id"] == job["id"]
+
+    deadline = time.time() + 5
+    while running["progress"].get("windows_done") != 1 and time.time() < deadline:
+        running = client.get(f"/v1/jobs/{job['id']}", headers=HEADERS).json()
+    assert running["progress"] == {"windows_done": 1, "windows_total": 2}
+
+    release.set()
+    done = _wait(client, job["id"], "succeeded")
+    assert done["result"]["rows"] == 7 and done["finished_at"] >= done["started_at"]
+    assert calls == [connection_id]
+
+    with client.stream("GET", f"/v1/jobs/{job['id']}/events", headers=HEADERS) as stream:
+        lines = [line for line in stream.iter_lines() if line]
+    assert lines[0] == "event: done"
+    assert json.loads(lines[1][len("data: "):])["status"] == "succeeded"
+
+    # Finished jobs release the connection for a new sync
+    fresh = client.post(f"/v1/providers/{connection_id}/sync-now", headers=HEADERS).json()
+    assert fresh["id"] != job["id"]
+    _wait(client, fresh["id"], "succeeded")
+
+
+def test_failed_sync_and_unknown_jobs(monkeypatch):
+    monkeypatch.setattr(scheduler, "_sync_functions",
+                        lambda: {"openai": lambda cid, source="prod": {"connection_id": cid, "synced": False, "reason": "no key"}})
+    client = TestClient(app)
+    job = client.post(f"/v1/providers/{_connection()}/sync-now", headers=HEADERS).json()
+    failed = _wait(client, job["id"], "failed")
+    assert failed["error"] == "no key"
+    assert client.get("/v1/jobs/nope", headers=HEADERS).status_code == 404
+    assert client.get(f"/v1/jobs/{job['id']}").status_code == 401
+    assert client.post("/v1/providers/999999/sync-now", headers=HEADERS).status_code == 404
+
+
+def test_memory_store_expires_jobs_after_last_update():
+    now = [1000.0]
+    store = jobs.MemoryJobStore(clock=lambda: now[0])
+    store.put({"id": "a", "status": "running"}, ttl=10)
+    store.put({"id": "b", "status": "running"}, ttl=10)
+    assert store.claim_key("sync:1", "a", ttl=10) is None
+    assert store.claim_key("sync:1", "b", ttl=10) == "a"
+    now[0] += 8
+    store.put({"id": "a", "status": "succeeded"}, ttl=10)
+    now[0] += 5
+    assert store.get("b") is None and store.get("a")["status"] == "succeeded"
+    # A finished holder no longer blocks the key
+    assert store.claim_key("sync:1", "c", ttl=10) is None
+
+
+def test_sync_now_joins_a_sync_already_running_for_the_connection(monkeypatch):
+    from app.workers import tasks, usage_fetchers
+    release = threading.Event()
+    calls = []
+
+    def slow_sync(connection_id, source="prod"):
+        calls.append(connection_id)
+        release.wait(5)
+        return {"connection_id": connection_id, "synced": True, "rows": 3}
+
+    monkeypatch.setattr(usage_fetchers, "sync_connection", slow_sync)
+    monkeypatch.setattr(scheduler, "_sync_functions", lambda: {"openai": slow_sync})
+    client = TestClient(app)
+    connection_id = _connection()
+
+    running = tasks.sync_openai_usage_for_connection.delay(connection_id)
+    job = client.post(f"/v1/providers/{connection_id}/sync-now", headers=HEADERS).json()
+    release.set()
+    assert running.result(timeout=5)["rows"] == 3
+    done = _wait(client, job["id"], "succeeded")
+    assert done["result"]["rows"] == 3
+    assert calls == [connection_id]
@@ -0,0 +1,104 @@
+import asyncio
+import threading
+
+import pytest
+
+from app import auth
+from app.db import get_session
+from app.models import User
+from app.services import passwords
+from app.services.passwords import HashingBusy, PasswordHasher, TooManyAttempts
+
+
+def _blocker(release):
+    def wait():
+        release.wait(5)
+        return "done"
+    return wait
+
+
+def test_process_pool_hashes_and_verifies(monkeypatch):
+    hasher = PasswordHasher(workers=1)
+    monkeypatch.setattr(passwords, "_hasher", hasher)
+    try:
+        hashed = asyncio.run(passwords.hash_password("s3cret", ip="10.0.0.1", email="a@example.com"))
+        assert auth.verify_password("s3cret", hashed)
+        assert asyncio.run(passwords.verify_password("s3cret", hashed)) is True
+        assert asyncio.run(passwords.verify_password("wrong", hashed)) is False
+        assert hasher._pending == 0 and hasher._clients == {}
+    finally:
+        hasher.shutdown()
+
+
+def test_admission_limits_per_client_and_overall():
+    hasher = PasswordHasher(workers=0, max_pending=3, max_per_client=2)
+    release = threading.Event()
+    try:
+        first = hasher.submit(_blocker(release), clients=("ip:1", "email:a"))
+        hasher.submit(_blocker(release), clients=("ip:1", "email:b"))
+        with pytest.raises(TooManyAttempts):
+            hasher.submit(_blocker(release), clients=("ip:1", "email:c"))
+        # A rejected attempt does not count against the other keys
+        assert hasher._clients == {"ip:1": 2, "email:a": 1, "email:b": 1}
+        hasher.submit(_blocker(release), clients=("ip:2",))
+        with pytest.raises(HashingBusy) as exc:
+            hasher.submit(_blocker(release), clients=("ip:3",))
+        assert exc.value.status_code == 503
+        release.set()
+        assert first.result(5) == "done"
+    finally:
+        hasher.shutdown()
+
+
+def test_requests_past_the_queue_deadline_are_dropped_unrun():
+    hasher = PasswordHasher(workers=0, queue_timeout=0.05)
+    release = threading.Event()
+    ran = []
+    try:
+        hasher.submit(_blocker(release))
+
+        async def queued():
+            task = asyncio.ensure_future(hasher.call("hash", ran.append, ("late",)))
+            await asyncio.sleep(0.1)
+            release.set()
+            return await task
+
+        with pytest.raises(HashingBusy):
+            asyncio.run(queued())
+        assert ran == [] and hasher._pending == 0
+    finally:
+        hasher.shutdown()
+
+
+def test_aauthenticate_user_verifies_in_the_pool(monkeypatch):
+    monkeypatch.setattr(passwords, "_hasher", PasswordHasher(workers=0))
+    db = get_session()
+    try:
+        db.add(User(email="pool@example.com", hashed_password=auth.get_password_hash("hunter2")))
+        db.commit()
+        assert asyncio.run(auth.aauthenticate_user(db, "pool@example.com", "hunter2")).email == "pool@example.com"
+        assert asyncio.run(auth.aauthenticate_user(db, "pool@example.com", "nope")) is None
+        assert asyncio.run(auth.aauthenticate_user(db, "missing@example.com", "hunter2")) is None
+    finally:
+        db.close()
+        passwords.shutdown()
+
+
+def test_device_approve_hashes_in_the_pool(monkeypatch):
+    from fastapi.testclient import TestClient
+    from app.main import app
+
+    hasher = PasswordHasher(workers=0)
+    monkeypatch.setattr(passwords, "_hasher", hasher)
+    client = TestClient(app)
+    try:
+        start = client.post("/v1/cli/device/start").json()
+        res = client.post("/v1/cli/device/approve", json={"device_code": start["device_code"]})
+        assert res.status_code == 200 and res.json()["status"] == "approved"
+
+        monkeypatch.setattr(hasher, "max_pending", 0)
+        busy = client.post("/v1/cli/device/approve", json={"device_code": client.post("/v1/cli/device/start").json()["device_code"]})
+        assert busy.status_code == 503 and busy.headers["Retry-After"] == "2"
+        assert busy.json()["error"]["code"] == "AUTH_BUSY"
+    finally:
+        hasher.shutdown()
@@ -0,0 +1,38 @@
+from datetime import datetime, timedelta
+
+from fastapi.testclient import TestClient
+
+from app.db import get_session
+from app.main import app
+from app.models import ApiLog, ProviderConnection
+
+
+def test_connections_keyset_pagination_and_last_used():
+    db = get_session()
+    try:
+        conns = [ProviderConnection(provider_id="pagetest", encrypted_credentials="x") for _ in range(3)]
+        db.add_all(conns)
+        db.commit()
+        ids = [c.id for c in conns]
+        now = datetime.utcnow()
+        db.add_all([
+            ApiLog(connection_id=ids[0], created_at=now - timedelta(hours=2), source="prod"),
+            ApiLog(connection_id=ids[0], created_at=now, source="prod"),
+        ])
+        db.commit()
+    finally:
+        db.close()
+
+    client = TestClient(app)
+    first = client.get("/v1/providers/connections", params={"provider_id": "pagetest", "per_page": 2})
+    assert first.status_code == 200
+    assert first.headers["X-Total-Count"] == "3"
+    body = first.json()
+    assert [c["id"] for c in body["data"]] == ids[:2]
+    assert body["data"][0]["last_used"] == now.isoformat()
+    assert body["data"][1]["last_used"] is None
+
+    second = client.get("/v1/providers/connections", params={"provider_id": "pagetest", "per_page": 2,
+                                                             "cursor": body["meta"]["next_cursor"]})
+    assert [c["id"] for c in second.json()["data"]] == ids[2:]
+    assert second.json()["meta"]["next_cursor"] is None
@@ -0,0 +1,117 @@
+import asyncio
+
+from fastapi.testclient import TestClient
+
+from app.core import rate_limit
+from app.core.rate_limit import LocalBuckets, Rate, RateLimiter, parse_rate
+from app.main import app
+from app.settings import settings
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class SharedBuckets:
+    """Stands in for Redis: one LocalBuckets shared by several limiters."""
+
+    def __init__(self, clock):
+        self.buckets = LocalBuckets(clock=clock)
+        self.calls = []
+
+    async def grant(self, key, rate, want=1):
+        self.calls.append(want)
+        return self.buckets.grant(key, rate, want)
+
+
+def test_parse_rate():
+    assert parse_rate("100/minute") == Rate(100, 60.0)
+    assert parse_rate("10 per second") == Rate(10, 1.0)
+    assert parse_rate("5000/h") == Rate(5000, 3600.0)
+    assert parse_rate("30/5m") == Rate(30, 300.0)
+    assert parse_rate("lots") is None and parse_rate("") is None and parse_rate("0/s") is None
+
+
+def test_local_bucket_refills_continuously():
+    clock = Clock()
+    buckets = LocalBuckets(clock=clock)
+    rate = Rate(2, 1.0)
+    assert buckets.grant("k", rate) == (1, 0.0)
+    assert buckets.grant("k", rate) == (1, 0.0)
+    granted, retry = buckets.grant("k", rate)
+    assert granted == 0 and retry == 0.5
+    clock.now += 0.5
+    assert buckets.grant("k", rate)[0] == 1
+
+
+def test_workers_share_one_bucket_through_leases():
+    clock = Clock()
+    shared = SharedBuckets(clock)
+    workers = [RateLimiter(shared, lease_fraction=0.1, clock=clock) for _ in range(3)]
+
+    async def run():
+        allowed = 0
+        for i in range(150):
+            if await workers[i % 3].check("org:acme", "100/minute") == 0.0:
+                allowed += 1
+        return allowed
+
+    # The three workers together never admit more than the shared bucket holds
+    assert asyncio.run(run()) == 100
+    # Leases grew for the hot key, so most checks never reached the shared store
+    assert max(shared.calls) == 10 and len(shared.calls) < 100
+
+    retry = asyncio.run(workers[0].check("org:acme", "100/minute"))
+    assert 0 < retry <= 0.6
+
+
+def test_sparse_traffic_does_not_strand_tokens():
+    clock = Clock()
+    shared = SharedBuckets(clock)
+    limiter = RateLimiter(shared, lease_fraction=0.5, clock=clock)
+
+    async def run():
+        results = []
+        for _ in range(20):
+            results.append(await limiter.check("key:1", "4/minute"))
+            clock.now += 15
+        return results
+
+    assert all(r == 0.0 for r in asyncio.run(run()))
+    assert set(shared.calls) == {1}
+
+
+def test_api_key_limit_returns_429_with_retry_after(monkeypatch):
+    monkeypatch.setattr(settings, "APP_ENV", "prod")
+    monkeypatch.setattr(rate_limit, "_limiter", RateLimiter())
+    client = TestClient(app)
+    created = client.post("/v1/admin/apikeys", headers={"X-Admin-Token": settings.ADMIN_API_KEY},
+                          json={"org_id": "org-rl", "rate_limit": "2/minute"}).json()
+    headers = {"X-API-Key": created["key"]}
+    assert [client.get("/v1/whoami", headers=headers).status_code for _ in range(2)] == [200, 200]
+    res = client.get("/v1/whoami", headers=headers)
+    assert res.status_code == 429 and res.headers["Retry-After"] == "30"
+    assert res.json()["error"]["code"] == "RATE_LIMITED"
+    assert res.headers.get("X-Correlation-ID")
+
+
+def test_client_ip_only_believes_forwarded_headers_from_trusted_proxies(monkeypatch):
+    from types import SimpleNamespace
+    from starlette.datastructures import Headers
+
+    def req(peer, forwarded=None):
+        headers = Headers({"x-forwarded-for": forwarded} if forwarded else {})
+        return SimpleNamespace(client=SimpleNamespace(host=peer), headers=headers)
+
+    monkeypatch.setattr(settings, "TRUSTED_PROXIES", "")
+    assert rate_limit.client_ip(req("203.0.113.9", "1.2.3.4")) == "203.0.113.9"
+
+    monkeypatch.setattr(settings, "TRUSTED_PROXIES", "10.0.0.0/8, 192.168.1.1")
+    # Spoofed left-most entries are skipped; the first untrusted hop from the right wins
+    assert rate_limit.client_ip(req("10.1.2.3", "1.2.3.4, 198.51.100.7, 192.168.1.1")) == "198.51.100.7"
+    assert rate_limit.client_ip(req("10.1.2.3")) == "10.1.2.3"
+    assert rate_limit.client_ip(req("203.0.113.9", "1.2.3.4")) == "203.0.113.9"
@@ -0,0 +1,79 @@
+from datetime import datetime
+
+from sqlalchemy import insert, select
+from sqlmodel import SQLModel, create_engine
+
+from app.models import ApiLog, Invoice, ProviderMetricsDaily, ProviderMetricsHourly, ProviderMetricsMonthly
+from app.workers import rollups
+
+
+def _log(ts, cost, connection_id=1, model="gpt-4o-mini", cache_hit=False):
+    return {
+        "connection_id": connection_id, "provider": "openai", "model": model,
+        "prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15,
+        "cost": cost, "saved_cost": 0.0, "latency_ms": 100.0, "source": "prod",
+        "cache_hit": cache_hit, "created_at": ts,
+    }
+
+
+def _rows(engine, model):
+    table = model.__table__
+    with engine.connect() as conn:
+        return [dict(r) for r in conn.execute(select(table).order_by(table.c.bucket_start, table.c.source)).mappings()]
+
+
+def test_rollups_are_incremental_and_rebuild_late_buckets(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'rollups.db'}")
+    SQLModel.metadata.create_all(engine)
+    logs = ApiLog.__table__
+
+    with engine.begin() as conn:
+        conn.execute(insert(logs), [
+            _log(datetime(2026, 10, 1, 9, 5), 1.0),
+            _log(datetime(2026, 10, 1, 9, 50), 2.0, cache_hit=True),
+            _log(datetime(2026, 10, 1, 10, 15), 4.0),
+        ])
+        conn.execute(insert(Invoice.__table__).values(
+            provider="aws", provider_invoice_id="inv-1", amount=50.0, currency="USD",
+            period_start=datetime(2026, 10, 1), source="billing", created_at=datetime(2026, 10, 2),
+        ))
+
+    first = rollups.run_rollups(engine=engine, batch_size=2)
+    assert (first["api_logs"], first["invoice"]) == (3, 1)
+
+    hourly = _rows(engine, ProviderMetricsHourly)
+    nine = [r for r in hourly if r["bucket_start"] == datetime(2026, 10, 1, 9) and r["source"] == "prod"][0]
+    assert (nine["requests"], nine["cost"], nine["cache_hits"], nine["category"]) == (2, 3.0, 1, "ai")
+    billing = [r for r in hourly if r["source"] == "billing"][0]
+    assert (billing["provider"], billing["category"], billing["cost"]) == ("aws", "cloud", 50.0)
+
+    daily = _rows(engine, ProviderMetricsDaily)
+    assert {(r["source"], r["cost"], r["requests"]) for r in daily} == {("billing", 50.0, 0), ("prod", 7.0, 3)}
+
+    # Nothing new: no rebuild
+    assert rollups.run_rollups(engine=engine)["hours"] == 0
+
+    # A late row for September only rebuilds its own hour/day/month
+    with engine.begin() as conn:
+        conn.execute(insert(logs), [_log(datetime(2026, 9, 30, 23, 59), 8.0)])
+    late = rollups.run_rollups(engine=engine, overlap=0)
+    assert (late["api_logs"], late["hours"], late["days"], late["months"]) == (1, 1, 1, 1)
+
+    monthly = _rows(engine, ProviderMetricsMonthly)
+    assert [(r["bucket_start"].month, r["source"], r["cost"]) for r in monthly] == [
+        (9, "prod", 8.0), (10, "billing", 50.0), (10, "prod", 7.0),
+    ]
+    # October buckets were left untouched and are not duplicated
+    assert len(_rows(engine, ProviderMetricsHourly)) == 4
+
+
+def test_a_run_skips_while_another_holds_the_rollup_lock(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'rollups.db'}")
+    SQLModel.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(insert(ApiLog.__table__), [_log(datetime(2026, 10, 1, 9, 5), 1.0)])
+
+    with rollups._lock:
+        assert rollups.run_rollups(engine=engine)["skipped"] is True
+    assert _rows(engine, ProviderMetricsHourly) == []
+    assert rollups.run_rollups(engine=engine)["api_logs"] == 1
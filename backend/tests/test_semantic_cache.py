@@ -0,0 +1,118 @@
+import json
+
+import httpx
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.services import response_cache, semantic_cache, upstream
+
+
+def test_optimize_serves_near_duplicate_from_semantic_cache(monkeypatch):
+    calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(json.loads(request.content))
+        body = b'{"choices":[{"message":{"content":"Reset it from settings."}}]}'
+        return httpx.Response(200, stream=httpx.ByteStream(body), headers={"content-type": "application/json"})
+
+    monkeypatch.setattr(upstream, "pool", upstream.UpstreamPool(transport=httpx.MockTransport(handler)))
+    cache = semantic_cache.SemanticCache(
+        semantic_cache.HashingEmbedder(dim=256),
+        semantic_cache.NumpyIndex(dim=256, max_entries=10),
+        threshold=0.9,
+        ttl_seconds=60,
+    )
+    monkeypatch.setattr(semantic_cache, "_cache", cache)
+    monkeypatch.setattr(response_cache, "_cache", None)
+    client = TestClient(app)
+
+    def ask(text):
+        payload = {"model": "gpt-4o-mini", "messages": [{"role": "user", "content": text}]}
+        return client.post("/v1/optimize?provider=openai", json=payload, headers={"Authorization": "Bearer sk-test"})
+
+    first = ask("How do I reset my password?")
+    assert first.status_code == 200
+    assert first.headers["X-BIMO-Cache"] == "miss"
+
+    second = ask("how do I reset my password")
+    assert second.status_code == 200
+    assert second.headers["X-BIMO-Cache"] == "semantic-hit"
+    assert second.content == first.content
+    assert len(calls) == 1
+
+    third = ask("What were our cloud costs last month?")
+    assert third.headers["X-BIMO-Cache"] == "miss"
+    assert len(calls) == 2
+    assert cache.stats == {"hits": 1, "misses": 2, "stores": 2}
+
+    # Same prompt with other sampling settings is a different namespace
+    payload = {"model": "gpt-4o-mini", "temperature": 1.5, "messages": [{"role": "user", "content": "How do I reset my password?"}]}
+    fourth = client.post("/v1/optimize?provider=openai", json=payload, headers={"Authorization": "Bearer sk-test"})
+    assert fourth.headers["X-BIMO-Cache"] == "miss"
+    assert len(calls) == 3
+
+
+def test_namespace_covers_request_params_but_not_the_prompt():
+    ns = semantic_cache.SemanticCache.namespace
+    base = {"model": "gpt-4o-mini", "messages": [{"role": "user", "content": "hi"}], "temperature": 0}
+    assert ns("org", "gpt-4o-mini", base) == ns("org", "gpt-4o-mini", {**base, "messages": [], "stream": False})
+    for change in ({"temperature": 1}, {"max_tokens": 5}, {"n": 2}, {"tools": [{"type": "function"}]},
+                   {"tool_choice": "auto"}, {"response_format": {"type": "json_object"}}):
+        assert ns("org", "gpt-4o-mini", {**base, **change}) != ns("org", "gpt-4o-mini", base)
+
+
+def test_semantic_cache_is_off_without_an_embedding_model(monkeypatch):
+    from app.settings import settings
+    monkeypatch.setattr(semantic_cache, "_cache", None)
+    monkeypatch.setattr(settings, "SEMANTIC_CACHE_EMBEDDER", "openai")
+    monkeypatch.setattr(settings, "OPENAI_API_KEY", None)
+    assert semantic_cache.get_semantic_cache() is None
+
+
+def test_numpy_index_evicts_least_recently_used():
+    import asyncio
+    import numpy as np
+
+    index = semantic_cache.NumpyIndex(dim=4, max_entries=2)
+    resp = semantic_cache.CachedResponse(body=b"x")
+    vecs = {k: np.eye(4, dtype=np.float32)[i] for i, k in enumerate("abc")}
+
+    async def run():
+        await index.add("ns", "a", vecs["a"], resp, 60)
+        await index.add("ns", "b", vecs["b"], resp, 60)
+        assert (await index.search("ns", vecs["a"])).similarity == 1.0  # touch "a"
+        await index.add("ns", "c", vecs["c"], resp, 60)  # evicts "b"
+        hit_b = await index.search("ns", vecs["b"])
+        assert hit_b is None or hit_b.similarity < 0.5
+        assert (await index.search("ns", vecs["c"])).similarity == 1.0
+
+    asyncio.run(run())
+    assert index.size() == 2
+
+
+def test_numpy_index_evicts_least_recently_used_namespaces():
+    import asyncio
+    import numpy as np
+
+    index = semantic_cache.NumpyIndex(dim=4, max_entries=3, max_total_entries=4)
+    resp = semantic_cache.CachedResponse(body=b"x")
+    vec = np.eye(4, dtype=np.float32)[0]
+
+    async def run():
+        for ns in ("org-a", "org-b"):
+            await index.add(ns, "k1", vec, resp, 60)
+            await index.add(ns, "k2", vec, resp, 60)
+        assert await index.search("org-a", vec) is not None  # touch org-a
+        await index.add("org-c", "k1", vec, resp, 60)  # over the cap: drops org-b
+        assert await index.search("org-b", vec) is None
+        assert await index.search("org-a", vec) is not None
+        for k in ("k1", "k2", "k3"):
+            await index.add("org-d", k, vec, resp, 60)  # drops org-c, then org-a
+        assert await index.search("org-a", vec) is None
+        # A namespace on its own past the global cap trims its own oldest entries
+        for k in ("k1", "k2", "k3"):
+            await small.add("ns", k, vec, resp, 60)
+
+    small = semantic_cache.NumpyIndex(dim=4, max_entries=3, max_total_entries=2)
+    asyncio.run(run())
+    assert (index.size(), small.size()) == (3, 2)
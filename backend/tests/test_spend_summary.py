@@ -0,0 +1,77 @@
+from fastapi.testclient import TestClient
+
+from app.db import engine
+from app.main import app
+from app.services import spend_summary
+from app.services.usage import UsageBuffer, UsageEvent
+from app.settings import settings
+
+ADMIN = {"X-Admin-Token": settings.ADMIN_API_KEY}
+
+
+def test_spend_summary_is_cached_and_kept_current(monkeypatch):
+    cache = spend_summary.SummaryCache(ttl_seconds=3600)
+    monkeypatch.setattr(spend_summary, "_cache", cache)
+    computed = []
+    real_compute = spend_summary.compute_summary
+    monkeypatch.setattr(spend_summary, "compute_summary", lambda conn, org_id=None: computed.append(org_id) or real_compute(conn, org_id))
+    client = TestClient(app)
+    buf = UsageBuffer(engine=engine, flush_size=1000, flush_interval=60, autostart=False)
+    cache.watch(buf)
+
+    before = client.get("/v1/spend/summary", headers=ADMIN).json()
+    assert before["source"] == "billing"
+    assert set(before["by_source"]) >= {"dev", "prod", "billing"}
+    assert client.get("/v1/spend/summary", headers=ADMIN).json() == before
+    assert computed == [None]
+
+    # Flushed usage is folded into the cached entry without recomputing
+    buf.record(UsageEvent(provider="openai", model="gpt-4o-mini", cost=2.5, source="prod"))
+    buf.drain()
+    after_usage = client.get("/v1/spend/summary", headers=ADMIN).json()
+    assert computed == [None]
+    assert after_usage["by_source"]["prod"]["ai"] == round(before["by_source"]["prod"]["ai"] + 2.5, 6)
+    assert after_usage["total"] == before["total"]
+
+    # Ingesting an invoice invalidates and the next read re-aggregates
+    res = client.post("/v1/admin/ingest/invoice", headers={"X-Admin-Token": settings.ADMIN_API_KEY},
+                      json={"provider": "aws", "invoice": {"invoice_id": "summary-inv-1", "amount": 40.0}})
+    assert res.status_code == 200
+    after_invoice = client.get("/v1/spend/summary", headers=ADMIN).json()
+    assert computed == [None, None]
+    assert after_invoice["cloud"] == round(before["cloud"] + 40.0, 6)
+    assert after_invoice["total"] == round(before["total"] + 40.0, 6)
+    assert after_invoice["by_source"]["prod"] == after_usage["by_source"]["prod"]
+
+
+def test_spend_summary_does_not_double_count_a_batch_it_already_read(monkeypatch):
+    cache = spend_summary.SummaryCache(ttl_seconds=3600)
+    monkeypatch.setattr(spend_summary, "_cache", cache)
+    client = TestClient(app)
+    buf = UsageBuffer(engine=engine, flush_size=1000, flush_interval=60, autostart=False)
+    seen = []
+
+    def read_between_commit_and_listener(rows):
+        # A request that misses the cache after the batch committed but before
+        # the cache's own listener has run
+        cache.invalidate()
+        seen.append(client.get("/v1/spend/summary", headers=ADMIN).json())
+
+    buf.listeners.append(read_between_commit_and_listener)
+    cache.watch(buf)
+    before = client.get("/v1/spend/summary", headers=ADMIN).json()
+    buf.record(UsageEvent(provider="openai", model="gpt-4o-mini", cost=3.25, source="dev"))
+    buf.drain()
+
+    expected = round(before["by_source"]["dev"]["ai"] + 3.25, 6)
+    assert seen[0]["by_source"]["dev"]["ai"] == expected
+    assert client.get("/v1/spend/summary", headers=ADMIN).json()["by_source"]["dev"]["ai"] == expected
+
+
+def test_spend_summary_requires_an_org_key_or_the_admin_token():
+    client = TestClient(app)
+    res = client.get("/v1/spend/summary")
+    assert res.status_code == 401
+    assert res.json()["error"]["code"] == "UNAUTHORIZED"
+    key = client.post("/v1/admin/apikeys", headers=ADMIN, json={"org_id": "summary-org"}).json()["key"]
+    assert client.get("/v1/spend/summary", headers={"X-API-Key": key}).status_code == 200
@@ -0,0 +1,101 @@
+from datetime import datetime
+
+from fastapi.testclient import TestClient
+from sqlalchemy import insert
+from sqlmodel import SQLModel, create_engine
+
+from app.db import engine as app_engine
+from app.main import app
+from app.models import ApiLog, ProviderMetricsDaily, ProviderMetricsHourly, ProviderMetricsMonthly
+from app.services import spend_query
+from app.settings import settings
+from app.workers import rollups
+
+
+def _bucket(ts, provider, category, source, cost):
+    return {"bucket_start": ts, "provider": provider, "category": category, "source": source, "cost": cost, "requests": 1}
+
+
+def test_planner_picks_coarsest_aligned_resolution():
+    plan = spend_query.plan_resolution
+    assert plan(datetime(2026, 1, 1), datetime(2027, 1, 1), "month") == "month"
+    assert plan(datetime(2026, 1, 15), datetime(2027, 1, 1), "month") == "day"
+    assert plan(datetime(2026, 1, 1), datetime(2026, 2, 1), "day") == "day"
+    assert plan(datetime(2026, 1, 1, 6), datetime(2026, 1, 2), "day") == "hour"
+
+
+def test_spend_trends_reads_rollups_and_keeps_sources_apart(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'spend.db'}")
+    SQLModel.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(insert(ProviderMetricsMonthly.__table__), [
+            _bucket(datetime(2026, 1, 1), "openai", "ai", "prod", 10.0),
+            _bucket(datetime(2026, 1, 1), "aws", "cloud", "billing", 100.0),
+            _bucket(datetime(2026, 1, 1), "openai", "ai", "billing", 12.0),
+            _bucket(datetime(2026, 2, 1), "openai", "ai", "prod", 5.0),
+        ])
+        conn.execute(insert(ProviderMetricsDaily.__table__), [
+            _bucket(datetime(2026, 1, 20), "openai", "ai", "prod", 4.0),
+            _bucket(datetime(2026, 2, 3), "openai", "ai", "prod", 5.0),
+        ])
+        conn.execute(insert(ProviderMetricsHourly.__table__), [
+            _bucket(datetime(2026, 2, 3, 7), "openai", "ai", "dev", 0.5),
+        ])
+
+    with engine.connect() as conn:
+        start, end = spend_query.parse_range("2026-01-01", "2026-12-31")
+        data, meta = spend_query.spend_trends(conn, start, end, granularity="month")
+        assert meta["resolution"] == "month"
+        assert [(r["date"], r["source"], r["total"], r["ai"], r["cloud"]) for r in data] == [
+            ("2026-01-01", "billing", 112.0, 12.0, 100.0),
+            ("2026-01-01", "prod", 10.0, 10.0, 0.0),
+            ("2026-02-01", "prod", 5.0, 5.0, 0.0),
+        ]
+
+        # Mid-month start re-buckets daily rows into months
+        start, end = spend_query.parse_range("2026-01-15", "2026-02-28")
+        data, meta = spend_query.spend_trends(conn, start, end, granularity="month", group_by=["provider"])
+        assert meta["resolution"] == "day"
+        assert [(r["date"], r["provider"], r["total"]) for r in data] == [("2026-01-01", "openai", 4.0), ("2026-02-01", "openai", 5.0)]
+
+        start, end = spend_query.parse_range("2026-02-03T06:00:00", "2026-02-03T09:00:00")
+        data, meta = spend_query.spend_trends(conn, start, end, granularity="hour", source="dev")
+        assert meta["resolution"] == "hour"
+        assert [(r["date"], r["source"], r["total"]) for r in data] == [("2026-02-03T07:00:00", "dev", 0.5)]
+
+
+def test_spend_trends_endpoint_validates_params():
+    client = TestClient(app)
+    admin = {"X-Admin-Token": settings.ADMIN_API_KEY}
+    res = client.get("/v1/spend/trends", params={"granularity": "week"}, headers=admin)
+    assert res.status_code == 400
+    assert res.json()["error"]["code"] == "INVALID_QUERY"
+
+    res = client.get("/v1/spend/trends", params={"from": "2026-01-01", "to": "2026-01-31", "group_by": "provider"},
+                     headers=admin)
+    assert res.status_code == 200
+    assert res.json()["meta"]["resolution"] == "day"
+
+
+def test_spend_trends_endpoint_is_scoped_to_the_callers_org():
+    client = TestClient(app)
+    admin = {"X-Admin-Token": settings.ADMIN_API_KEY}
+    with app_engine.begin() as conn:
+        conn.execute(insert(ApiLog.__table__), [
+            {"org_id": org, "provider": "openai", "model": "gpt-4o-mini", "cost": cost, "source": "prod",
+             "created_at": datetime(2031, 3, 5, 10)}
+            for org, cost in (("trends-org-a", 1.5), ("trends-org-b", 40.0))
+        ])
+    rollups.run_rollups(engine=app_engine)
+    params = {"from": "2031-03-05", "to": "2031-03-05"}
+
+    res = client.get("/v1/spend/trends", params=params)
+    assert res.status_code == 401
+
+    key = client.post("/v1/admin/apikeys", headers=admin, json={"org_id": "trends-org-a"}).json()["key"]
+    res = client.get("/v1/spend/trends", params=params, headers={"X-API-Key": key})
+    assert res.status_code == 200
+    assert [(r["date"], r["total"]) for r in res.json()["data"]] == [("2031-03-05", 1.5)]
+
+    res = client.get("/v1/spend/trends", params=params, headers=admin)
+    assert [(r["date"], r["total"]) for r in res.json()["data"]] == [("2031-03-05", 41.5)]
@@ -0,0 +1,128 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, select
+from sqlmodel import SQLModel
+
+from app.models import ApiLog, ProviderConnection, SyncSchedule
+from app.settings import settings
+from app.workers import scheduler
+
+T = SyncSchedule.__table__
+
+
+def _engine(tmp_path, connections):
+    engine = create_engine(f"sqlite:///{tmp_path / 'sched.db'}")
+    SQLModel.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(ProviderConnection.__table__.insert(), [
+            {"provider_id": provider, "encrypted_credentials": "x", "status": "connected", "created_at": datetime.utcnow()}
+            for provider in connections
+        ])
+    return engine
+
+
+def test_seed_spreads_first_runs_and_claims_only_due(tmp_path):
+    engine = _engine(tmp_path, ["openai"] * 200)
+    now = datetime(2026, 10, 18, 12, 0)
+    with engine.begin() as conn:
+        assert scheduler.seed(conn, now) == 200
+        assert scheduler.seed(conn, now) == 0
+        times = [r for (r,) in conn.execute(select(T.c.next_run_at))]
+    # First runs are spread across the initial interval, not bunched at `now`
+    span = settings.SYNC_INITIAL_INTERVAL_SECONDS
+    buckets = {int((t - now).total_seconds() // (span / 4)) for t in times}
+    assert buckets == {0, 1, 2, 3}
+
+    later = now + timedelta(seconds=span / 2)
+    with engine.begin() as conn:
+        claimed = scheduler.claim_due(conn, later)
+        due = [c["due_at"] for c in claimed]
+        assert due == sorted(due) and all(d <= later for d in due)
+        assert 50 < len(claimed) < 150
+        # Leased: the same rows are not handed out again
+        assert scheduler.claim_due(conn, later) == []
+
+
+def test_interval_adapts_to_activity(tmp_path, monkeypatch):
+    monkeypatch.setattr(scheduler, "jittered", lambda s: s)
+    engine = _engine(tmp_path, ["claude", "claude"])
+    now = datetime.utcnow()
+    with engine.begin() as conn:
+        scheduler.seed(conn, now)
+        conn.execute(T.update().values(last_run_at=now - timedelta(hours=1)))
+        conn.execute(ApiLog.__table__.insert(), [
+            {"connection_id": 1, "provider": "claude", "created_at": now - timedelta(minutes=5)} for _ in range(3000)
+        ])
+
+    calls = []
+    monkeypatch.setattr(scheduler, "_sync_functions", lambda: {"claude": lambda cid, source: calls.append(cid) or {"synced": True}})
+    scheduler.run_scheduled(1, "claude", engine=engine)
+    scheduler.run_scheduled(2, "claude", engine=engine)
+
+    with engine.connect() as conn:
+        rows = {r.connection_id: r for r in conn.execute(select(T))}
+    assert calls == [1, 2]
+    # Busy key: ~3000 events/h, smoothed from zero
+    assert rows[1].interval_seconds == scheduler.interval_for(scheduler.SMOOTHING * 3000) < 3600
+    assert rows[2].interval_seconds == settings.SYNC_MAX_INTERVAL_SECONDS  # idle key
+    assert rows[2].next_run_at - rows[2].last_run_at == timedelta(seconds=settings.SYNC_MAX_INTERVAL_SECONDS)
+
+    # Failures back off from the minimum interval
+    monkeypatch.setattr(scheduler, "_sync_functions", lambda: {"claude": lambda cid, source: 1 / 0})
+    scheduler.run_scheduled(1, "claude", engine=engine)
+    with engine.connect() as conn:
+        row = conn.execute(select(T).where(T.c.connection_id == 1)).first()
+    assert row.failures == 1
+
+
+def test_tick_dispatches_claimed_syncs(tmp_path, monkeypatch):
+    engine = _engine(tmp_path, ["azure", "gemini"])
+    submitted = []
+
+    class FakeExecutor:
+        def submit(self, name, fn, args, key=None, provider=None, priority=5):
+            submitted.append((name, args, key, provider))
+
+    from app.workers import executor
+    monkeypatch.setattr(executor, "get_executor", lambda: FakeExecutor())
+    monkeypatch.setattr(scheduler, "_last_seeded", 0.0)
+    monkeypatch.setattr(settings, "SYNC_INITIAL_INTERVAL_SECONDS", 0)
+    res = scheduler.tick(engine=engine, now=datetime.utcnow() + timedelta(seconds=1))
+    assert res == {"seeded": 2, "dispatched": 2}
+    assert sorted(submitted) == [("scheduled_sync", (1, "azure"), ("sync", 1), "azure"),
+                                 ("scheduled_sync", (2, "gemini"), ("sync", 2), "gemini")]
+
+
+def test_seed_schedules_only_connected_connections(tmp_path):
+    engine = _engine(tmp_path, ["openai", "claude"])
+    C = ProviderConnection.__table__
+    now = datetime(2026, 10, 18, 12, 0)
+    with engine.begin() as conn:
+        conn.execute(C.insert().values(provider_id="gemini", encrypted_credentials="x", status="error",
+                                       created_at=datetime.utcnow()))
+        assert scheduler.seed(conn, now) == 2
+        # A connection that leaves "connected" loses its schedule, and gets one back on reconnect
+        conn.execute(C.update().where(C.c.provider_id == "claude").values(status="disconnected"))
+        scheduler.seed(conn, now)
+        assert [p for (p,) in conn.execute(select(T.c.provider))] == ["openai"]
+        conn.execute(C.update().where(C.c.provider_id == "claude").values(status="connected"))
+        assert scheduler.seed(conn, now) == 1
+
+
+def test_tick_runs_rollups_on_their_interval_without_celery(tmp_path, monkeypatch):
+    engine = _engine(tmp_path, ["openai"])
+    runs = []
+    from app.workers import rollups
+    monkeypatch.setattr(rollups, "run_rollups", lambda engine=None: runs.append(engine))
+    monkeypatch.setattr(scheduler, "claim_due", lambda conn, now=None: [])
+    monkeypatch.setattr(settings, "CELERY_ENABLED", False)
+    monkeypatch.setattr(settings, "ROLLUP_INTERVAL_SECONDS", 300.0)
+    monkeypatch.setattr(scheduler, "_last_rollup", 0.0)
+    scheduler.tick(engine=engine)
+    scheduler.tick(engine=engine)
+    assert runs == [engine]
+
+    monkeypatch.setattr(scheduler, "_last_rollup", 0.0)
+    monkeypatch.setattr(settings, "CELERY_ENABLED", True)
+    scheduler.tick(engine=engine)
+    assert runs == [engine]
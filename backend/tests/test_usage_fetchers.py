@@ -0,0 +1,194 @@
+import asyncio
+import json
+from datetime import datetime, timedelta, timezone
+
+import httpx
+
+from app.crypto import encrypt_json
+from app.db import engine, get_session
+from app.models import ApiLog, Invoice, ProviderConnection, UsageSyncState
+from app.workers import usage_fetchers
+
+DAY = 86400
+
+
+def _connection(provider, creds):
+    db = get_session()
+    try:
+        conn = ProviderConnection(provider_id=provider, encrypted_credentials=encrypt_json(json.dumps(creds)))
+        db.add(conn)
+        db.commit()
+        return conn.id
+    finally:
+        db.close()
+
+
+def _usage_logs(connection_id):
+    db = get_session()
+    try:
+        return db.query(ApiLog).filter(ApiLog.connection_id == connection_id).order_by(ApiLog.created_at).all()
+    finally:
+        db.close()
+
+
+def _invoices(prefix):
+    db = get_session()
+    try:
+        return db.query(Invoice).filter(Invoice.provider_invoice_id.like(f"{prefix}%")).all()
+    finally:
+        db.close()
+
+
+def test_openai_sync_paginates_windows_in_parallel_and_honours_retry_after(monkeypatch):
+    monkeypatch.setattr(usage_fetchers.settings, "USAGE_FETCH_INITIAL_DAYS", 10)
+    monkeypatch.setattr(usage_fetchers.settings, "USAGE_FETCH_WINDOW_DAYS", 5)
+    monkeypatch.setattr(usage_fetchers.settings, "USAGE_FETCH_CONCURRENCY", "openai=2")
+    connection_id = _connection("openai", {"admin_key": "sk-admin"})
+    state = {"inflight": 0, "peak": 0, "throttled": False, "calls": 0}
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        assert request.headers["authorization"] == "Bearer sk-admin"
+        state["calls"] += 1
+        state["inflight"] += 1
+        state["peak"] = max(state["peak"], state["inflight"])
+        await asyncio.sleep(0.02)
+        state["inflight"] -= 1
+        if request.url.path.endswith("/usage/completions") and not state["throttled"]:
+            state["throttled"] = True
+            return httpx.Response(429, headers={"Retry-After": "0"}, stream=httpx.ByteStream(b"{}"))
+        q = request.url.params
+        start, end = int(q["start_time"]), int(q["end_time"])
+        days = list(range(start - start % DAY, end, DAY))
+        page = int(q.get("page") or 0)
+        chunk = days[page * 2:page * 2 + 2]
+        if request.url.path.endswith("/usage/completions"):
+            data = [{"start_time": d, "end_time": d + DAY,
+                     "results": [{"model": "gpt-4o", "input_tokens": 10, "output_tokens": 5, "num_model_requests": 1}]}
+                    for d in chunk]
+        else:
+            data = [{"start_time": d, "end_time": d + DAY,
+                     "results": [{"line_item": "completions", "amount": {"value": 0.25, "currency": "usd"}}]}
+                    for d in chunk]
+        more = (page + 1) * 2 < len(days)
+        body = {"data": data, "has_more": more, "next_page": str(page + 1) if more else None}
+        return httpx.Response(200, json=body)
+
+    transport = httpx.MockTransport(handler)
+    first = usage_fetchers.sync_connection(connection_id, source="prod", transport=transport)
+    assert first["synced"] is True and first["windows"] == 3
+    # 10 full days plus today's open bucket, which is skipped until it ends
+    written = _usage_logs(connection_id)
+    assert first["rows"] == 10 and len(written) == 10
+    assert written[0].total_tokens == 15 and written[0].source == "prod"
+    assert state["throttled"] and state["peak"] == 2
+    invoices = _invoices(f"openai-usage:{connection_id}:")
+    assert len(invoices) == 11 and all(i.amount == 0.25 and i.currency == "USD" for i in invoices)
+
+    with engine.connect() as conn:
+        through = conn.execute(
+            UsageSyncState.__table__.select().where(UsageSyncState.__table__.c.connection_id == connection_id)
+        ).first().usage_through
+    assert through == datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+
+    # Next run only re-reads the cost lookback and writes no duplicate usage
+    second = usage_fetchers.sync_connection(connection_id, source="prod", transport=transport)
+    assert second["rows"] == 0 and len(_usage_logs(connection_id)) == 10
+    assert len(_invoices(f"openai-usage:{connection_id}:")) == 11
+
+
+def test_azure_cost_query_follows_next_link(monkeypatch):
+    connection_id = _connection("azure", {"azureAd": {"tenantId": "t1", "clientId": "c", "clientSecret": "s",
+                                                      "subscriptionId": "sub-1"}})
+    token_calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.host == "login.microsoftonline.com":
+            token_calls.append(request.url.path)
+            return httpx.Response(200, json={"access_token": "tok", "expires_in": 3600})
+        assert request.headers["authorization"] == "Bearer tok"
+        assert request.url.path == "/subscriptions/sub-1/providers/Microsoft.CostManagement/query"
+        cols = [{"name": "Cost"}, {"name": "UsageDate"}, {"name": "MeterSubCategory"}, {"name": "Currency"}]
+        if request.url.params.get("skiptoken"):
+            props = {"columns": cols, "rows": [[2.0, 20260902, "gpt-4o", "USD"]], "nextLink": None}
+        else:
+            next_link = str(request.url.copy_merge_params({"skiptoken": "p2"}))
+            props = {"columns": cols, "rows": [[1.5, 20260901, "gpt-4o", "USD"]], "nextLink": next_link}
+        return httpx.Response(200, json={"properties": props})
+
+    res = usage_fetchers.sync_connection(
+        connection_id, transport=httpx.MockTransport(handler),
+        start=datetime(2026, 9, 1), end=datetime(2026, 9, 3),
+    )
+    assert res["synced"] is True and res["invoices"] == 2 and res["rows"] == 0
+    assert token_calls == ["/t1/oauth2/v2.0/token"]
+    amounts = {i.period_start.date().isoformat(): i.amount for i in _invoices(f"azure-usage:{connection_id}:")}
+    assert amounts == {"2026-09-01": 1.5, "2026-09-02": 2.0}
+
+
+def test_failed_window_writes_no_usage_and_keeps_the_watermark(monkeypatch):
+    monkeypatch.setattr(usage_fetchers.settings, "USAGE_FETCH_INITIAL_DAYS", 4)
+    monkeypatch.setattr(usage_fetchers.settings, "USAGE_FETCH_WINDOW_DAYS", 2)
+    connection_id = _connection("openai", {"admin_key": "sk-admin"})
+    fail = {"on": True}
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        start = int(request.url.params["start_time"])
+        if not request.url.path.endswith("/usage/completions"):
+            return httpx.Response(200, json={"data": [], "has_more": False})
+        if fail["on"] and start >= int(datetime.utcnow().timestamp()) - 2 * DAY:
+            return httpx.Response(400, json={"error": "bad window"})
+        data = [{"start_time": d, "end_time": d + DAY,
+                 "results": [{"model": "gpt-4o", "input_tokens": 1, "output_tokens": 1}]}
+                for d in range(start - start % DAY, int(request.url.params["end_time"]), DAY)]
+        return httpx.Response(200, json={"data": data, "has_more": False})
+
+    transport = httpx.MockTransport(handler)
+    failed = usage_fetchers.sync_connection(connection_id, transport=transport)
+    # Earlier windows succeeded, but none of their rows are kept without the watermark
+    assert failed["synced"] is False and _usage_logs(connection_id) == []
+    with engine.connect() as conn:
+        assert conn.execute(UsageSyncState.__table__.select().where(
+            UsageSyncState.__table__.c.connection_id == connection_id)).first() is None
+
+    fail["on"] = False
+    assert usage_fetchers.sync_connection(connection_id, transport=transport)["rows"] == 4
+    assert usage_fetchers.sync_connection(connection_id, transport=transport)["rows"] == 0
+    assert len(_usage_logs(connection_id)) == 4
+
+
+def test_concurrency_limit_is_shared_across_syncs(monkeypatch):
+    import threading
+    import time
+
+    monkeypatch.setattr(usage_fetchers.settings, "USAGE_FETCH_CONCURRENCY", "claude=3")
+    state = {"inflight": 0, "peak": 0}
+    lock = threading.Lock()
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        with lock:
+            state["inflight"] += 1
+            state["peak"] = max(state["peak"], state["inflight"])
+        time.sleep(0.01)
+        with lock:
+            state["inflight"] -= 1
+        return httpx.Response(200, json={"data": [], "has_more": False})
+
+    connections = [_connection("claude", {"admin_key": "sk-ant-admin"}) for _ in range(3)]
+    threads = [threading.Thread(target=usage_fetchers.sync_connection, args=(cid,),
+                                kwargs={"transport": httpx.MockTransport(handler), "start": datetime(2026, 9, 1),
+                                        "end": datetime(2026, 9, 13)})
+               for cid in connections]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    # Three syncs with several windows each never exceed the provider's limit together
+    assert state["peak"] == 3
+
+
+def test_retry_after_parsing():
+    assert usage_fetchers.retry_after_seconds(httpx.Response(429, headers={"Retry-After": "7"})) == 7.0
+    future = datetime.now(timezone.utc) + timedelta(seconds=30)
+    when = future.strftime("%a, %d %b %Y %H:%M:%S GMT")
+    assert 20 < usage_fetchers.retry_after_seconds(httpx.Response(429, headers={"Retry-After": when})) <= 30
+    assert usage_fetchers.retry_after_seconds(httpx.Response(503)) is None
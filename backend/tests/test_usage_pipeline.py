@@ -0,0 +1,26 @@
+from app.db import engine, get_session
+from app.models import ApiLog
+from app.services.usage import UsageBuffer, UsageEvent
+
+
+def test_usage_buffer_applies_backpressure_and_bulk_writes():
+    buf = UsageBuffer(engine=engine, capacity=3, flush_size=1000, flush_interval=60, put_timeout=0.01, autostart=False)
+    flushed = []
+    buf.listeners.append(flushed.append)
+
+    events = [UsageEvent(connection_id=4242, provider="openai", model="gpt-4o-mini", prompt_tokens=i,
+                         completion_tokens=1, total_tokens=i + 1, cost=0.01, source="prod") for i in range(4)]
+    assert [buf.record(e) for e in events] == [True, True, True, False]
+    assert buf.pending() == 3
+
+    assert buf.drain() == 3
+    assert buf.record(events[0]) is False  # stopped after drain
+    assert len(flushed) == 1 and len(flushed[0]) == 3
+
+    db = get_session()
+    try:
+        rows = db.query(ApiLog).filter(ApiLog.connection_id == 4242).order_by(ApiLog.id).all()
+    finally:
+        db.close()
+    assert [r.prompt_tokens for r in rows[-3:]] == [0, 1, 2]
+    assert all(r.source == "prod" and r.cache_hit is False for r in rows[-3:])
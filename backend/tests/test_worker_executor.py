@@ -0,0 +1,59 @@
+import threading
+import time
+
+import pytest
+
+from app.workers.executor import BoundedExecutor, QueueFull, parse_limits
+
+
+def test_duplicate_jobs_coalesce_and_provider_cap_holds():
+    ex = BoundedExecutor(workers=4, provider_limits={"gemini": 1})
+    gate = threading.Event()
+    running = []
+    peak = [0]
+    lock = threading.Lock()
+
+    def sync(connection_id):
+        with lock:
+            running.append(connection_id)
+            peak[0] = max(peak[0], len(running))
+        gate.wait(5)
+        with lock:
+            running.remove(connection_id)
+        return connection_id
+
+    first = ex.submit("sync_gemini", sync, (1,), key=("sync_gemini", 1), provider="gemini")
+    again = ex.submit("sync_gemini", sync, (1,), key=("sync_gemini", 1), provider="gemini")
+    assert again is first
+
+    others = [ex.submit("sync_gemini", sync, (i,), key=("sync_gemini", i), provider="gemini") for i in (2, 3)]
+    time.sleep(0.1)
+    gate.set()
+    assert [f.result(timeout=5) for f in [first] + others] == [1, 2, 3]
+    assert peak[0] == 1
+
+    # Finished jobs no longer coalesce
+    assert ex.submit("sync_gemini", sync, (1,), key=("sync_gemini", 1), provider="gemini") is not first
+
+
+def test_queue_bound_and_priority():
+    ex = BoundedExecutor(workers=1, max_queue=3)
+    gate = threading.Event()
+    order = []
+    blocker = ex.submit("block", gate.wait, (5,))
+    time.sleep(0.05)
+    ex.submit("low", order.append, ("low",), priority=9)
+    ex.submit("high", order.append, ("high",), priority=1)
+    ex.submit("mid", order.append, ("mid",), priority=5)
+    with pytest.raises(QueueFull):
+        ex.submit("overflow", order.append, ("overflow",))
+    gate.set()
+    blocker.result(timeout=5)
+    deadline = time.monotonic() + 5
+    while len(order) < 3 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert order == ["high", "mid", "low"] and ex.depth() == 0
+
+
+def test_parse_limits():
+    assert parse_limits("openai=4, Gemini=2,bad,azure=x") == {"openai": 4, "gemini": 2}
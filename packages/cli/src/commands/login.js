@@ -18,8 +18,9 @@ export function loginCommand() {
         const pollUrl = `${base}/cli/device/poll`;
         const started = Date.now();
         while (true) {
-            await new Promise(r => setTimeout(r, (start.interval || 3) * 1000));
-            const { data: poll } = await http(base).post(pollUrl, { device_code: start.device_code });
+            // Long poll: the server holds the request until approval or `wait` runs out
+            const asked = Date.now();
+            const { data: poll } = await http(base).post(pollUrl, { device_code: start.device_code, wait: 30 });
             if (poll.status === 'approved' && poll.access_token) {
                 await saveConfig({ token: poll.access_token, gatewayUrl: base });
                 console.log('Login successful.');
@@ -30,6 +31,10 @@ export function loginCommand() {
                 process.exit(1);
             }
             process.stdout.write('.');
+            // Older servers (or a busy one) answer at once; fall back to interval polling
+            if (Date.now() - asked < 1000) {
+                await new Promise(r => setTimeout(r, (start.interval || 3) * 1000));
+            }
         }
     });
     return cmd;